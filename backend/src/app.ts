@@ -1,9 +1,16 @@
 import Fastify from 'fastify'
+import { genRequestId } from './utils/request-id.js'
 import prismaPlugin from './plugins/prisma.js'
 import authPlugin from './plugins/auth.js'
 import corsPlugin from './plugins/cors.js'
 import rateLimitPlugin from './plugins/rate-limit.js'
 import errorHandlerPlugin from './plugins/error-handler.js'
+import feedbackQueuePlugin from './plugins/feedback-queue.js'
+import passwordHasherPlugin from './plugins/password-hasher.js'
+import gracefulShutdownPlugin from './plugins/graceful-shutdown.js'
+import historySummariesPlugin from './plugins/history-summaries.js'
+import usageCounterPlugin from './plugins/usage-counter.js'
+import metricsPlugin from './plugins/metrics.js'
 import authRoutes from './routes/auth.js'
 import feynmanRoutes from './routes/feynman.js'
 import layersRoutes from './routes/layers.js'
@@ -14,14 +21,22 @@ export async function buildApp() {
     logger: {
       level: process.env['NODE_ENV'] === 'production' ? 'info' : 'debug',
     },
+    genReqId: genRequestId,
   })
 
   // Plugins
+  // First, so every other hook and handler runs inside the request's timing context
+  await fastify.register(metricsPlugin)
   await fastify.register(corsPlugin)
   await fastify.register(rateLimitPlugin)
   await fastify.register(prismaPlugin)
   await fastify.register(authPlugin)
   await fastify.register(errorHandlerPlugin)
+  await fastify.register(usageCounterPlugin)
+  await fastify.register(feedbackQueuePlugin)
+  await fastify.register(historySummariesPlugin)
+  await fastify.register(passwordHasherPlugin)
+  await fastify.register(gracefulShutdownPlugin)
 
   // Routes
   await fastify.register(authRoutes, { prefix: '/api/v1/auth' })
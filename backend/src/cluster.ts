@@ -0,0 +1,191 @@
+import cluster, { type Worker } from 'node:cluster'
+import { availableParallelism } from 'node:os'
+import type { MetricFamily } from './utils/metrics.js'
+
+// Workers get this long past their own SSE drain before they are killed
+const SHUTDOWN_DRAIN_MS = Number(process.env['SHUTDOWN_DRAIN_MS'] ?? 30_000)
+const KILL_GRACE_MS = 10_000
+const RESPAWN_DELAY_MS = 1000
+// A /metrics scrape renders whichever worker snapshots arrived within this window
+const METRICS_SCRAPE_TIMEOUT_MS = 1000
+
+/** Messages workers exchange through the primary. */
+export type ClusterMessage =
+  // Feedback job progress, so a stream open on one worker sees a job running on another
+  | { type: 'feedback-event'; event: string; payload: unknown }
+  // Queued feedback jobs a retiring worker hands to a live one
+  | { type: 'feedback-requeue'; jobs: Array<{ sessionId: string; userId: string }> }
+  // A worker took on or finished a feedback job, so the primary can re-queue the jobs of one that dies
+  | { type: 'feedback-claim'; sessionId: string; userId: string }
+  | { type: 'feedback-release'; sessionId: string }
+  // A /metrics scrape: the scraped worker asks, the primary collects every worker's snapshot
+  | { type: 'metrics-request'; id: number }
+  | { type: 'metrics-collect'; id: number; requester: number }
+  | { type: 'metrics-snapshot'; id: number; requester: number; families: MetricFamily[] }
+  | { type: 'metrics-snapshots'; id: number; families: MetricFamily[] }
+
+/** CLUSTER_WORKERS: 1 (default) runs a single process, 0 one worker per core. */
+export function getClusterWorkerCount(): number {
+  const configured = Number(process.env['CLUSTER_WORKERS'] ?? 1)
+  if (configured === 0) return availableParallelism()
+  return Number.isFinite(configured) ? Math.max(1, Math.floor(configured)) : 1
+}
+
+/**
+ * Run as the cluster primary: fork `count` workers sharing the listen port,
+ * replace crashed ones, roll through a restart on SIGHUP (new worker up
+ * before the old one drains) and drain everything on SIGTERM / SIGINT.
+ */
+export function runPrimary(count: number): void {
+  const retiring = new Set<Worker>()
+  let restarting = false
+  let stopping = false
+
+  const log = (msg: string, extra: Record<string, unknown> = {}) =>
+    console.info(JSON.stringify({ level: 30, time: Date.now(), pid: process.pid, role: 'primary', ...extra, msg }))
+
+  const liveWorkers = () => Object.values(cluster.workers ?? {}).filter((w): w is Worker => !!w && !retiring.has(w))
+
+  // Feedback jobs each worker holds, keyed by session id, and those waiting for a live worker
+  const feedbackJobs = new Map<string, { worker: Worker; userId: string }>()
+  const orphanedJobs: Array<{ sessionId: string; userId: string }> = []
+
+  function handOffOrphanedJobs() {
+    if (orphanedJobs.length === 0) return
+    const target = liveWorkers().find((w) => w.isConnected())
+    if (!target) return
+    // The target claims each job as it queues it; one it cannot queue is marked failed instead
+    const jobs = orphanedJobs.splice(0)
+    target.send({ type: 'feedback-requeue', jobs } satisfies ClusterMessage)
+    log('Handed feedback jobs to a live worker', { jobs: jobs.length, worker: target.process.pid })
+  }
+
+  // Keyed by requesting worker id and its scrape id
+  const scrapes = new Map<string, { expected: number; families: MetricFamily[]; finish: () => void }>()
+
+  function startScrape(requester: Worker, id: number) {
+    const key = `${requester.id}:${id}`
+    const workers = liveWorkers()
+    const finish = () => {
+      const scrape = scrapes.get(key)
+      if (!scrape) return
+      scrapes.delete(key)
+      clearTimeout(timer)
+      if (requester.isConnected()) requester.send({ type: 'metrics-snapshots', id, families: scrape.families })
+    }
+    const timer = setTimeout(finish, METRICS_SCRAPE_TIMEOUT_MS)
+    scrapes.set(key, { expected: workers.length, families: [], finish })
+    for (const worker of workers) {
+      worker.send({ type: 'metrics-collect', id, requester: requester.id } satisfies ClusterMessage)
+    }
+  }
+
+  cluster.on('exit', (worker, code, signal) => {
+    // A crashed worker, or a retiring one killed past its drain, leaves its sessions `generating`
+    for (const [sessionId, job] of feedbackJobs) {
+      if (job.worker !== worker) continue
+      feedbackJobs.delete(sessionId)
+      if (!stopping) orphanedJobs.push({ sessionId, userId: job.userId })
+    }
+    handOffOrphanedJobs()
+
+    if (retiring.delete(worker) || stopping) return
+    log('Worker exited unexpectedly, respawning', { worker: worker.process.pid, code, signal })
+    setTimeout(() => {
+      if (!stopping) fork().catch(() => {})
+    }, RESPAWN_DELAY_MS)
+  })
+
+  cluster.on('message', (worker, message: ClusterMessage) => {
+    if (message.type === 'feedback-event') {
+      for (const other of liveWorkers()) {
+        if (other !== worker) other.send(message)
+      }
+    } else if (message.type === 'feedback-claim') {
+      feedbackJobs.set(message.sessionId, { worker, userId: message.userId })
+    } else if (message.type === 'feedback-release') {
+      if (feedbackJobs.get(message.sessionId)?.worker === worker) feedbackJobs.delete(message.sessionId)
+    } else if (message.type === 'feedback-requeue') {
+      for (const job of message.jobs) feedbackJobs.delete(job.sessionId)
+      orphanedJobs.push(...message.jobs)
+      handOffOrphanedJobs()
+    } else if (message.type === 'metrics-request') {
+      startScrape(worker, message.id)
+    } else if (message.type === 'metrics-snapshot') {
+      const scrape = scrapes.get(`${message.requester}:${message.id}`)
+      if (!scrape) return
+      scrape.families.push(...message.families)
+      if (--scrape.expected === 0) scrape.finish()
+    }
+  })
+
+  process.on('SIGHUP', () => {
+    rollingRestart().catch((error: Error) => {
+      log('Rolling restart aborted', { err: error.message })
+      restarting = false
+    })
+  })
+
+  for (const signal of ['SIGTERM', 'SIGINT'] as const) {
+    process.once(signal, async () => {
+      stopping = true
+      log('Stopping workers', { signal })
+      await Promise.all(liveWorkers().map(retire))
+      process.exit(0)
+    })
+  }
+
+  Promise.all(Array.from({ length: count }, fork)).then(
+    () => log('Cluster ready', { workers: count }),
+    (error: Error) => {
+      log('Worker failed to start', { err: error.message })
+      stopping = true
+      for (const worker of liveWorkers()) worker.process.kill('SIGTERM')
+      process.exitCode = 1
+    },
+  )
+
+  /** Resolves once the new worker is listening. */
+  function fork(): Promise<Worker> {
+    const worker = cluster.fork()
+    return new Promise((resolve, reject) => {
+      const onExit = () => reject(new Error(`Worker ${worker.process.pid} exited before listening`))
+      worker.once('exit', onExit)
+      worker.once('listening', () => {
+        worker.off('exit', onExit)
+        handOffOrphanedJobs()
+        resolve(worker)
+      })
+    })
+  }
+
+  /** SIGTERM runs the worker's own graceful shutdown; SIGKILL only if it overruns the drain. */
+  function retire(worker: Worker): Promise<void> {
+    retiring.add(worker)
+    return new Promise((resolve) => {
+      const timer = setTimeout(() => worker.process.kill('SIGKILL'), SHUTDOWN_DRAIN_MS + KILL_GRACE_MS)
+      worker.once('exit', () => {
+        clearTimeout(timer)
+        resolve()
+      })
+      worker.process.kill('SIGTERM')
+    })
+  }
+
+  async function rollingRestart() {
+    if (restarting || stopping) return
+    restarting = true
+    const previous = liveWorkers()
+    log('Rolling restart', { workers: previous.length })
+
+    // One at a time, and the replacement listens before the old worker stops taking connections
+    for (const old of previous) {
+      if (stopping) break
+      await fork()
+      await retire(old)
+    }
+
+    restarting = false
+    log('Rolling restart finished')
+  }
+}
@@ -1,4 +1,7 @@
+import cluster from 'node:cluster'
 import { buildApp } from './app.js'
+import { getClusterWorkerCount, runPrimary } from './cluster.js'
+import { prewarmFirstQuestions } from './services/rehearsal-interviewer.js'
 
 async function main() {
   const app = await buildApp()
@@ -13,6 +16,57 @@ async function main() {
     app.log.error(error)
     process.exit(1)
   }
+
+  // SIGTERM from the cluster primary (rolling restart) or the process manager; SIGINT from a terminal
+  for (const signal of ['SIGTERM', 'SIGINT'] as const) {
+    process.once(signal, () => shutdown(app, signal))
+  }
+
+  prewarm(app)
+}
+
+let shuttingDown = false
+
+/** Stop taking requests, let in-flight SSE streams drain, then close plugins. */
+async function shutdown(app: Awaited<ReturnType<typeof buildApp>>, signal: string) {
+  if (shuttingDown) return
+  shuttingDown = true
+  app.log.info({ signal }, 'Shutting down')
+
+  try {
+    await app.close()
+    process.exit(0)
+  } catch (error) {
+    app.log.error(error)
+    process.exit(1)
+  }
+}
+
+/** Warm the opening-question cache in the background; REHEARSAL_PREWARM_SCENARIOS is a JSON array. */
+function prewarm(app: Awaited<ReturnType<typeof buildApp>>) {
+  const raw = process.env['REHEARSAL_PREWARM_SCENARIOS']
+  if (!raw) return
+
+  let parsed: unknown
+  try {
+    parsed = JSON.parse(raw)
+  } catch {
+    parsed = null
+  }
+  if (!Array.isArray(parsed) || !parsed.every((s) => typeof s === 'string')) {
+    app.log.warn('REHEARSAL_PREWARM_SCENARIOS is not a JSON array of strings, skipping prewarm')
+    return
+  }
+
+  prewarmFirstQuestions(parsed).then(
+    ({ warmed, failed }) => app.log.info({ warmed, failed }, 'First-question cache prewarmed'),
+    (error: Error) => app.log.warn({ err: error }, 'First-question prewarm failed'),
+  )
 }
 
-main()
+const workers = getClusterWorkerCount()
+if (workers > 1 && cluster.isPrimary) {
+  runPrimary(workers)
+} else {
+  main()
+}
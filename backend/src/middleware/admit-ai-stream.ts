@@ -0,0 +1,43 @@
+import type { FastifyRequest, FastifyReply } from 'fastify'
+import { failure } from '../utils/response.js'
+import { admitStream } from '../services/ai-limits.js'
+import { estimateRetryAfter, isAiSchedulerSaturated } from '../services/ai-scheduler.js'
+import { circuitRetryAfter } from '../services/ai-resilience.js'
+import { recordRejection, routeLabel } from '../services/metrics.js'
+import { onStreamSettled, resumeSSE } from '../utils/sse.js'
+
+/**
+ * Gate for the SSE routes, run after `authenticate`. A reconnect carrying
+ * Last-Event-ID rejoins its still-running stream and skips the limits, since
+ * it starts no new upstream call. Otherwise refuse fast while the upstream
+ * circuit is open or the global AI queue is full, then apply the per-user
+ * concurrent-stream and token-budget limits.
+ */
+export async function admitAiStream(request: FastifyRequest, reply: FastifyReply) {
+  const lastEventId = request.headers['last-event-id']
+  if (typeof lastEventId === 'string') {
+    if (resumeSSE(reply, lastEventId)) return reply.hijack()
+    return reply.status(410).send(failure('STREAM_EXPIRED', '连接中断时间过长，请重新发起请求'))
+  }
+
+  const circuitWait = circuitRetryAfter()
+  if (circuitWait !== null) {
+    recordRejection('AI_UNAVAILABLE', routeLabel(request))
+    reply.header('Retry-After', String(circuitWait))
+    return reply.status(503).send(failure('AI_UNAVAILABLE', 'AI 服务暂时不可用，请稍后再试'))
+  }
+  if (isAiSchedulerSaturated()) {
+    recordRejection('AI_BUSY', routeLabel(request))
+    reply.header('Retry-After', String(estimateRetryAfter()))
+    return reply.status(429).send(failure('AI_BUSY', '当前 AI 请求较多，请稍后再试'))
+  }
+
+  const admission = await admitStream(request.userId)
+  if (!admission.ok) {
+    recordRejection(admission.code, routeLabel(request))
+    reply.header('Retry-After', String(admission.retryAfter))
+    return reply.status(429).send(failure(admission.code, admission.message))
+  }
+  // A dropped resumable stream holds its slot while it keeps generating for a reconnect
+  onStreamSettled(reply, admission.release)
+}
@@ -1,11 +1,15 @@
 import type { FastifyRequest, FastifyReply } from 'fastify'
 import { failure } from '../utils/response.js'
+import { startPhase } from '../services/metrics.js'
 
 export async function authenticate(request: FastifyRequest, reply: FastifyReply) {
+  const stop = startPhase('auth')
   try {
     const decoded = await request.jwtVerify<{ userId: string }>()
     request.userId = decoded.userId
   } catch {
     return reply.status(401).send(failure('UNAUTHORIZED', '未授权，请先登录'))
+  } finally {
+    stop()
   }
 }
@@ -6,5 +6,6 @@ export default fp(async (fastify: FastifyInstance) => {
   await fastify.register(fastifyCors, {
     origin: process.env['CORS_ORIGIN'] ?? 'http://localhost:5173',
     credentials: true,
+    exposedHeaders: ['X-Request-Id', 'Server-Timing', 'Retry-After'],
   })
 })
@@ -4,8 +4,9 @@ import type { FastifyInstance, FastifyError, FastifyRequest, FastifyReply } from
 import { failure } from '../utils/response.js'
 
 export default fp(async (fastify: FastifyInstance) => {
-  fastify.setErrorHandler((error: FastifyError, _request: FastifyRequest, reply: FastifyReply) => {
-    fastify.log.error(error)
+  fastify.setErrorHandler((error: FastifyError, request: FastifyRequest, reply: FastifyReply) => {
+    // The request logger tags the line with reqId, matching the X-Request-Id the client saw
+    request.log.error(error)
 
     if (error.validation) {
       return reply.status(400).send(failure('VALIDATION_ERROR', '请求参数验证失败'))
@@ -21,6 +22,14 @@ export default fp(async (fastify: FastifyInstance) => {
     }
 
     const statusCode = error.statusCode ?? 500
+
+    // Load-shedding errors (the AI scheduler) carry their own code and a retry hint
+    const { retryAfter } = error as FastifyError & { retryAfter?: number }
+    if (retryAfter !== undefined) {
+      reply.header('Retry-After', String(retryAfter))
+      return reply.status(statusCode).send(failure(error.code, error.message))
+    }
+
     const message = statusCode === 500 ? '服务器内部错误，请稍后重试' : error.message
 
     return reply.status(statusCode).send(failure('INTERNAL_ERROR', message))
@@ -0,0 +1,58 @@
+import fp from 'fastify-plugin'
+import cluster from 'node:cluster'
+import type { FastifyInstance } from 'fastify'
+import * as rehearsalService from '../services/rehearsal.service.js'
+import { enqueueFeedback, stopFeedbackQueue, type FeedbackJob } from '../services/feedback-queue.js'
+import type { ClusterMessage } from '../cluster.js'
+
+export default fp(async (fastify: FastifyInstance) => {
+  const requeue = async (jobs: Array<Pick<FeedbackJob, 'sessionId' | 'userId'>>) => {
+    for (const job of jobs) {
+      try {
+        enqueueFeedback(fastify, job.sessionId, job.userId)
+      } catch {
+        await rehearsalService.setStatus(fastify, job.sessionId, 'failed')
+      }
+    }
+  }
+
+  // Jobs live in memory, so sessions left `generating` by a previous process are re-queued.
+  // In a cluster only the first worker of a fresh start does this; later forks would pick up
+  // sessions their siblings are still generating.
+  fastify.addHook('onReady', async () => {
+    if (cluster.isWorker && cluster.worker?.id !== 1) return
+
+    const sessions = await rehearsalService.getGeneratingSessions(fastify)
+    await requeue(sessions.map((session) => ({ sessionId: session.id, userId: session.userId })))
+    if (sessions.length > 0) {
+      fastify.log.info({ count: sessions.length }, 'Re-queued pending feedback jobs')
+    }
+  })
+
+  if (cluster.isWorker) {
+    process.on('message', (message: ClusterMessage) => {
+      if (message.type !== 'feedback-requeue') return
+      requeue(message.jobs).then(
+        () => fastify.log.info({ count: message.jobs.length }, 'Took over feedback jobs from another worker'),
+        (error: Error) => fastify.log.warn({ err: error }, 'Failed to take over feedback jobs'),
+      )
+    })
+  }
+
+  // Registered after prisma, so this runs before the client disconnects
+  fastify.addHook('onClose', async () => {
+    const dropped = await stopFeedbackQueue()
+    if (dropped.length === 0) return
+
+    if (cluster.isWorker && process.connected) {
+      const message: ClusterMessage = {
+        type: 'feedback-requeue',
+        jobs: dropped.map(({ sessionId, userId }) => ({ sessionId, userId })),
+      }
+      await new Promise<void>((resolve) => process.send!(message, undefined, {}, () => resolve()))
+      fastify.log.info({ handedOff: dropped.length }, 'Feedback jobs handed to another worker')
+    } else {
+      fastify.log.info({ dropped: dropped.length }, 'Feedback jobs left for the next start')
+    }
+  })
+})
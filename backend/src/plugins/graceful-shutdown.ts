@@ -0,0 +1,21 @@
+import fp from 'fastify-plugin'
+import type { FastifyInstance } from 'fastify'
+import { drainStreams, getOpenStreamCount } from '../utils/sse.js'
+
+const SHUTDOWN_DRAIN_MS = Number(process.env['SHUTDOWN_DRAIN_MS'] ?? 30_000)
+
+export default fp(async (fastify: FastifyInstance) => {
+  // preClose runs once Fastify answers new requests with 503, before it waits on open connections
+  fastify.addHook('preClose', async () => {
+    // Stop accepting connections now; in a cluster worker this also stops the primary routing here
+    fastify.server.close()
+    fastify.server.closeIdleConnections()
+
+    const open = getOpenStreamCount()
+    if (open === 0) return
+
+    fastify.log.info({ open, timeoutMs: SHUTDOWN_DRAIN_MS }, 'Draining SSE streams')
+    const cutOff = await drainStreams(SHUTDOWN_DRAIN_MS)
+    fastify.log.info({ finished: open - cutOff, cutOff }, 'SSE streams drained')
+  })
+})
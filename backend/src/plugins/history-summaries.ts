@@ -0,0 +1,32 @@
+import fp from 'fastify-plugin'
+import cluster from 'node:cluster'
+import type { FastifyInstance } from 'fastify'
+import * as feynmanService from '../services/feynman.service.js'
+import * as rehearsalService from '../services/rehearsal.service.js'
+
+export default fp(async (fastify: FastifyInstance) => {
+  fastify.addHook('onReady', async () => {
+    // Awaited, so no request sees a session whose transcript is still only in the old JSON column.
+    // Every worker runs it before listening; each transcript is claimed once, so none is copied twice.
+    const transcripts = await rehearsalService.backfillMessages(fastify)
+    if (transcripts > 0) {
+      fastify.log.info({ sessions: transcripts }, 'Copied rehearsal transcripts into rehearsal_messages')
+    }
+
+    // Rows stored before the totalScore columns existed; in the background so startup is not held up.
+    // Like the feedback re-queue, only the first cluster worker runs it.
+    if (cluster.isWorker && cluster.worker?.id !== 1) return
+
+    Promise.all([
+      feynmanService.backfillTotalScores(fastify),
+      rehearsalService.backfillTotalScores(fastify),
+    ]).then(
+      ([feynman, rehearsal]) => {
+        if (feynman + rehearsal > 0) {
+          fastify.log.info({ feynman, rehearsal }, 'Backfilled history total scores')
+        }
+      },
+      (error: Error) => fastify.log.warn({ err: error }, 'History total score backfill failed'),
+    )
+  })
+})
@@ -0,0 +1,72 @@
+import fp from 'fastify-plugin'
+import type { FastifyInstance, FastifyRequest } from 'fastify'
+import { failure } from '../utils/response.js'
+import { renderMetrics } from '../utils/metrics.js'
+import { REQUEST_ID_HEADER } from '../utils/request-id.js'
+import {
+  collectServerMetrics,
+  createRequestTimings,
+  recordRequest,
+  routeLabel,
+  runWithRequestTimings,
+  serverTimingHeader,
+  startPhase,
+  timingSummary,
+  type RequestTimings,
+} from '../services/metrics.js'
+
+// Optional bearer token for /metrics; unset leaves it open like /health
+const METRICS_TOKEN = process.env['METRICS_TOKEN']
+
+declare module 'fastify' {
+  interface FastifyRequest {
+    timings: RequestTimings | null
+  }
+}
+
+export default fp(async (fastify: FastifyInstance) => {
+  const serializing = new WeakMap<FastifyRequest, () => number>()
+
+  fastify.decorateRequest('timings', null)
+
+  // Prisma and streamChat time their work against the request in this async context.
+  // The request ID (the caller's X-Request-Id when valid) is on every log line as `reqId`.
+  fastify.addHook('onRequest', (request, reply, done) => {
+    reply.header(REQUEST_ID_HEADER, request.id)
+    request.timings = createRequestTimings()
+    runWithRequestTimings(request.timings, done)
+  })
+
+  // Body parsing resumes on the socket's 'end' event, outside the context entered above
+  fastify.addHook('preValidation', (request, _reply, done) => {
+    if (request.timings) runWithRequestTimings(request.timings, done)
+    else done()
+  })
+
+  // Object payloads are serialized between these two hooks
+  fastify.addHook('preSerialization', async (request, _reply, payload) => {
+    serializing.set(request, startPhase('serialize', request.timings ?? undefined))
+    return payload
+  })
+
+  // SSE routes write their headers directly and report timing in a final `timing` event instead
+  fastify.addHook('onSend', async (request, reply, payload) => {
+    serializing.get(request)?.()
+    serializing.delete(request)
+    if (!reply.raw.headersSent) reply.header('Server-Timing', serverTimingHeader(timingSummary(reply)))
+    return payload
+  })
+
+  fastify.addHook('onResponse', async (request, reply) => {
+    if (!request.timings) return
+    recordRequest(request.method, routeLabel(request), reply.statusCode, reply.elapsedTime / 1000, request.timings)
+  })
+
+  fastify.get('/metrics', async (request, reply) => {
+    if (METRICS_TOKEN && request.headers.authorization !== `Bearer ${METRICS_TOKEN}`) {
+      return reply.status(401).send(failure('UNAUTHORIZED', '未授权'))
+    }
+    reply.type('text/plain; version=0.0.4; charset=utf-8')
+    return renderMetrics(await collectServerMetrics())
+  })
+})
@@ -0,0 +1,11 @@
+import fp from 'fastify-plugin'
+import type { FastifyInstance } from 'fastify'
+import { getPasswordHasherStats, stopPasswordHasher } from '../services/password-hasher.js'
+
+export default fp(async (fastify: FastifyInstance) => {
+  fastify.addHook('onClose', async () => {
+    const { completed, rejected, avgWaitMs, avgHashMs } = getPasswordHasherStats()
+    await stopPasswordHasher()
+    fastify.log.info({ completed, rejected, avgWaitMs, avgHashMs }, 'Password hashing workers stopped')
+  })
+})
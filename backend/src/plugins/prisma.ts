@@ -1,6 +1,7 @@
 import fp from 'fastify-plugin'
 import { PrismaClient } from '@prisma/client'
 import type { FastifyInstance } from 'fastify'
+import { recordPrismaQuery, startPhase } from '../services/metrics.js'
 
 declare module 'fastify' {
   interface FastifyInstance {
@@ -9,13 +10,28 @@ declare module 'fastify' {
 }
 
 export default fp(async (fastify: FastifyInstance) => {
-  const prisma = new PrismaClient()
+  const base = new PrismaClient()
+  await base.$connect()
 
-  await prisma.$connect()
+  // Every model query is timed into the query histogram and the calling request's `db` phase
+  const prisma = base.$extends({
+    query: {
+      $allModels: {
+        async $allOperations({ model, operation, args, query }) {
+          const stop = startPhase('db')
+          try {
+            return await query(args)
+          } finally {
+            recordPrismaQuery(model, operation, stop())
+          }
+        },
+      },
+    },
+  }) as unknown as PrismaClient
 
   fastify.decorate('prisma', prisma)
 
   fastify.addHook('onClose', async () => {
-    await prisma.$disconnect()
+    await base.$disconnect()
   })
 })
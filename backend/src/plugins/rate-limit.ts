@@ -1,11 +1,54 @@
 import fp from 'fastify-plugin'
 import rateLimit from '@fastify/rate-limit'
 import type { FastifyInstance } from 'fastify'
+import { closeLimiterStore, getLimiterStore } from '../services/limiter-store.js'
+import { recordRejection, routeLabel } from '../services/metrics.js'
+
+interface RouteInfo {
+  routeInfo?: { method?: string; url?: string }
+}
+
+/**
+ * @fastify/rate-limit store backed by the shared limiter store, so request
+ * limits are counted once across processes when REDIS_URL is set.
+ */
+class SharedRateLimitStore {
+  constructor(
+    _options: unknown,
+    private readonly prefix = 'rl:global:',
+  ) {}
+
+  incr(
+    key: string,
+    callback: (error: Error | null, result?: { current: number; ttl: number }) => void,
+    timeWindow = 60_000,
+  ) {
+    getLimiterStore()
+      .incr(this.prefix + key, timeWindow)
+      .then(({ count, ttlMs }) => callback(null, { current: count, ttl: ttlMs }), (error: Error) => callback(error))
+  }
+
+  child(routeOptions: RouteInfo) {
+    const { method = '', url = '' } = routeOptions.routeInfo ?? {}
+    return new SharedRateLimitStore(routeOptions, `rl:${method}${url}:`)
+  }
+}
 
 export default fp(async (fastify: FastifyInstance) => {
   await fastify.register(rateLimit, {
-    max: 100,
+    max: Number(process.env['RATE_LIMIT_MAX'] ?? 100),
     timeWindow: '1 minute',
+    store: SharedRateLimitStore,
+    // Fail open if Redis is unreachable; the per-user AI limits do the same
+    skipOnError: true,
+    // Route-level configs (AUTH_RATE_LIMIT, AI_RATE_LIMIT) are merged over these options, so this covers them too
+    onExceeded: (request) => recordRejection('RATE_LIMITED', routeLabel(request)),
+  })
+
+  fastify.log.info({ store: getLimiterStore().kind }, 'Rate limiter store ready')
+
+  fastify.addHook('onClose', async () => {
+    await closeLimiterStore()
   })
 })
 
@@ -14,7 +57,8 @@ export default fp(async (fastify: FastifyInstance) => {
  * Usage: { config: { rateLimit: AUTH_RATE_LIMIT } }
  */
 export const AUTH_RATE_LIMIT = {
-  max: 10,
+  // Raised only for load tests such as the e2e --login-storm scenario
+  max: Number(process.env['AUTH_RATE_LIMIT_MAX'] ?? 10),
   timeWindow: '1 minute',
 }
 
@@ -0,0 +1,17 @@
+import fp from 'fastify-plugin'
+import type { FastifyInstance } from 'fastify'
+import { getUsageCounterStats, startUsageFlusher, stopUsageFlusher } from '../services/usage-counter.js'
+
+export default fp(async (fastify: FastifyInstance) => {
+  fastify.addHook('onReady', async () => {
+    startUsageFlusher(fastify)
+  })
+
+  // Registered between prisma and the feedback queue, so this runs after the last feedback jobs
+  // finish and before the client disconnects
+  fastify.addHook('onClose', async () => {
+    const { buffered } = getUsageCounterStats()
+    await stopUsageFlusher(fastify)
+    if (buffered > 0) fastify.log.info({ flushed: buffered }, 'Usage counters flushed')
+  })
+})
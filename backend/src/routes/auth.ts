@@ -1,14 +1,24 @@
-import type { FastifyInstance } from 'fastify'
+import type { FastifyInstance, FastifyReply, FastifyRequest } from 'fastify'
 import { authenticate } from '../middleware/authenticate.js'
 import { register, login, getMe } from '../services/auth.service.js'
-import { success } from '../utils/response.js'
+import { success, failure } from '../utils/response.js'
+import { HASH_RETRY_AFTER_SECONDS, isPasswordHasherSaturated } from '../services/password-hasher.js'
 import { AUTH_RATE_LIMIT } from '../plugins/rate-limit.js'
 
 export default async function authRoutes(fastify: FastifyInstance) {
+  // Shed load before touching the database when every hashing worker is busy and the queue is full
+  const rejectWhenSaturated = async (_request: FastifyRequest, reply: FastifyReply) => {
+    if (isPasswordHasherSaturated()) {
+      reply.header('Retry-After', String(HASH_RETRY_AFTER_SECONDS))
+      return reply.status(503).send(failure('QUEUE_FULL', '当前登录人数过多，请稍后再试'))
+    }
+  }
+
   fastify.post<{
     Body: { email: string; password: string; name: string }
   }>('/register', {
     config: { rateLimit: AUTH_RATE_LIMIT },
+    preHandler: rejectWhenSaturated,
     schema: {
       body: {
         type: 'object',
@@ -31,6 +41,7 @@ export default async function authRoutes(fastify: FastifyInstance) {
     Body: { email: string; password: string }
   }>('/login', {
     config: { rateLimit: AUTH_RATE_LIMIT },
+    preHandler: rejectWhenSaturated,
     schema: {
       body: {
         type: 'object',
@@ -1,9 +1,15 @@
 import type { FastifyInstance } from 'fastify'
 import { authenticate } from '../middleware/authenticate.js'
+import { admitAiStream } from '../middleware/admit-ai-stream.js'
+import { recordTokenUsage } from '../services/ai-limits.js'
+import { recordUsage } from '../services/usage-counter.js'
 import { success, paginated, failure } from '../utils/response.js'
-import { setupSSE, sendSSEEvent, endSSE } from '../utils/sse.js'
+import { setupSSE } from '../utils/sse.js'
+import { parsePageRequest, type PageQuery } from '../utils/pagination.js'
 import * as feynmanService from '../services/feynman.service.js'
 import * as feynmanAnalyzer from '../services/feynman-analyzer.js'
+import * as analysisCache from '../services/analysis-cache.js'
+import { EMPTY_USAGE, type AiUsage } from '../services/ai.service.js'
 import { AI_RATE_LIMIT } from '../plugins/rate-limit.js'
 
 interface CreateSessionBody {
@@ -15,11 +21,14 @@ interface AnalyzeBody {
   starStory: string
 }
 
-interface HistoryQuery {
-  page?: string
-  limit?: string
+interface CachedAnalysis {
+  text: string
+  result: feynmanAnalyzer.FeynmanAnalysisResult
 }
 
+// Cache hits replay the stored model output in slices of this size
+const REPLAY_CHUNK_CHARS = 64
+
 export default async function feynmanRoutes(fastify: FastifyInstance) {
   fastify.addHook('preHandler', authenticate)
 
@@ -41,6 +50,7 @@ export default async function feynmanRoutes(fastify: FastifyInstance) {
 
   fastify.post<{ Body: AnalyzeBody }>('/analyze', {
     config: { rateLimit: AI_RATE_LIMIT },
+    preHandler: admitAiStream,
     schema: {
       body: {
         type: 'object',
@@ -60,17 +70,40 @@ export default async function feynmanRoutes(fastify: FastifyInstance) {
       return reply.status(404).send(failure('NOT_FOUND', '会话不存在'))
     }
 
-    setupSSE(reply)
+    const cacheKey = analysisCache.analysisCacheKey('feynman', starStory)
+    const cached = await analysisCache.getCachedAnalysis<CachedAnalysis>(fastify, cacheKey)
+
+    const sse = setupSSE(reply, { 'X-Cache': cached ? 'HIT' : 'MISS' }, { resumable: true })
 
-    const abortController = new AbortController()
-    request.raw.on('close', () => abortController.abort())
+    const onPart = (part: feynmanAnalyzer.FeynmanPart) => {
+      if (!sse.signal.aborted) {
+        sse.event(part.type, part)
+      }
+    }
 
     try {
-      const result = await feynmanAnalyzer.analyze(starStory, (chunk) => {
-        if (!abortController.signal.aborted) {
-          sendSSEEvent(reply, 'chunk', { type: 'content', content: chunk })
+      let analysis: { result: feynmanAnalyzer.FeynmanAnalysisResult; usage: AiUsage }
+      if (cached) {
+        // Replay through the same parser so a HIT emits score/improvement events in stream order
+        const parser = feynmanAnalyzer.createPartParser(onPart)
+        for (let i = 0; i < cached.text.length && !sse.signal.aborted; i += REPLAY_CHUNK_CHARS) {
+          const slice = cached.text.slice(i, i + REPLAY_CHUNK_CHARS)
+          sse.content(slice)
+          parser.write(slice)
         }
-      }, abortController.signal)
+        analysis = { result: cached.result, usage: EMPTY_USAGE }
+      } else {
+        let text = ''
+        analysis = await feynmanAnalyzer.analyze(starStory, (chunk) => {
+          text += chunk
+          if (!sse.signal.aborted) {
+            sse.content(chunk)
+          }
+        }, onPart, sse.signal, request.userId)
+        await analysisCache.setCachedAnalysis(fastify, 'feynman', cacheKey, { text, result: analysis.result })
+      }
+      const { result, usage } = analysis
+      await recordTokenUsage(request.userId, usage)
 
       await feynmanService.updateSessionResult(
         fastify,
@@ -80,27 +113,26 @@ export default async function feynmanRoutes(fastify: FastifyInstance) {
         result.scores,
       )
 
-      await fastify.prisma.user.update({
-        where: { id: request.userId },
-        data: { usageCount: { increment: 1 } },
-      })
+      recordUsage(fastify, request.userId, 'feynman')
 
-      sendSSEEvent(reply, 'done', { type: 'result', ...result })
+      sse.event('done', { type: 'result', ...result, usage })
     } catch (error) {
-      if (abortController.signal.aborted) return
+      if (sse.signal.aborted) return
       const message = error instanceof Error ? error.message : '分析失败，请重试'
-      sendSSEEvent(reply, 'error', { type: 'error', message })
+      sse.event('error', { type: 'error', message })
     }
 
-    endSSE(reply)
+    sse.end()
   })
 
-  fastify.get<{ Querystring: HistoryQuery }>('/history', async (request) => {
-    const page = Math.max(1, Number(request.query.page) || 1)
-    const limit = Math.min(50, Math.max(1, Number(request.query.limit) || 10))
+  fastify.get<{ Querystring: PageQuery }>('/history', async (request, reply) => {
+    const page = parsePageRequest(request.query)
+    if (!page) {
+      return reply.status(400).send(failure('INVALID_CURSOR', '分页游标无效，请从第一页重新加载'))
+    }
 
-    const { sessions, total } = await feynmanService.getHistory(fastify, request.userId, page, limit)
-    return paginated(sessions, page, limit, total)
+    const { sessions, total, nextCursor } = await feynmanService.getHistory(fastify, request.userId, page)
+    return paginated(sessions, page.page, page.limit, total, nextCursor)
   })
 
   fastify.get<{ Params: { id: string } }>('/session/:id', async (request, reply) => {
@@ -1,9 +1,15 @@
 import type { FastifyInstance } from 'fastify'
 import { authenticate } from '../middleware/authenticate.js'
+import { admitAiStream } from '../middleware/admit-ai-stream.js'
+import { recordTokenUsage } from '../services/ai-limits.js'
+import { recordUsage } from '../services/usage-counter.js'
 import { success, paginated, failure } from '../utils/response.js'
-import { setupSSE, sendSSEEvent, endSSE } from '../utils/sse.js'
+import { setupSSE } from '../utils/sse.js'
+import { parsePageRequest, type PageQuery } from '../utils/pagination.js'
 import * as layersService from '../services/layers.service.js'
 import * as layersAnalyzer from '../services/layers-analyzer.js'
+import * as analysisCache from '../services/analysis-cache.js'
+import { EMPTY_USAGE, type AiUsage } from '../services/ai.service.js'
 import { AI_RATE_LIMIT } from '../plugins/rate-limit.js'
 
 interface CreateSessionBody {
@@ -15,11 +21,6 @@ interface AnalyzeBody {
   inputText: string
 }
 
-interface HistoryQuery {
-  page?: string
-  limit?: string
-}
-
 export default async function layersRoutes(fastify: FastifyInstance) {
   fastify.addHook('preHandler', authenticate)
 
@@ -41,6 +42,7 @@ export default async function layersRoutes(fastify: FastifyInstance) {
 
   fastify.post<{ Body: AnalyzeBody }>('/analyze', {
     config: { rateLimit: AI_RATE_LIMIT },
+    preHandler: admitAiStream,
     schema: {
       body: {
         type: 'object',
@@ -60,24 +62,36 @@ export default async function layersRoutes(fastify: FastifyInstance) {
       return reply.status(404).send(failure('NOT_FOUND', '会话不存在'))
     }
 
-    setupSSE(reply)
+    const cacheKey = analysisCache.analysisCacheKey('layers', inputText)
+    const cached = await analysisCache.getCachedAnalysis<layersAnalyzer.LayersAnalysisResult>(fastify, cacheKey)
 
-    const abortController = new AbortController()
-    request.raw.on('close', () => abortController.abort())
+    const sse = setupSSE(reply, { 'X-Cache': cached ? 'HIT' : 'MISS' }, { resumable: true })
+
+    const onLayer = (layer: layersAnalyzer.Layer) => {
+      if (!sse.signal.aborted) {
+        sse.event('layer', layer)
+      }
+    }
 
     try {
-      const result = await layersAnalyzer.analyze(
-        inputText,
-        (layer) => {
-          if (!abortController.signal.aborted) {
-            sendSSEEvent(reply, 'layer', layer)
-          }
-        },
-        () => {
-          // onDone handled below
-        },
-        abortController.signal,
-      )
+      let analysis: { result: layersAnalyzer.LayersAnalysisResult; usage: AiUsage }
+      if (cached) {
+        cached.layers.forEach(onLayer)
+        analysis = { result: cached, usage: EMPTY_USAGE }
+      } else {
+        analysis = await layersAnalyzer.analyze(
+          inputText,
+          onLayer,
+          () => {
+            // onDone handled below
+          },
+          sse.signal,
+          request.userId,
+        )
+        await analysisCache.setCachedAnalysis(fastify, 'layers', cacheKey, analysis.result)
+      }
+      const { result, usage } = analysis
+      await recordTokenUsage(request.userId, usage)
 
       await layersService.updateSessionResult(
         fastify,
@@ -87,28 +101,27 @@ export default async function layersRoutes(fastify: FastifyInstance) {
         result.suggestions,
       )
 
-      await fastify.prisma.user.update({
-        where: { id: request.userId },
-        data: { usageCount: { increment: 1 } },
-      })
+      recordUsage(fastify, request.userId, 'layers')
 
-      sendSSEEvent(reply, 'suggestions', { suggestions: result.suggestions })
-      sendSSEEvent(reply, 'done', { sessionId, status: 'completed' })
+      sse.event('suggestions', { suggestions: result.suggestions })
+      sse.event('done', { sessionId, status: 'completed', usage })
     } catch (error) {
-      if (abortController.signal.aborted) return
+      if (sse.signal.aborted) return
       const message = error instanceof Error ? error.message : '分析失败，请重试'
-      sendSSEEvent(reply, 'error', { type: 'error', message })
+      sse.event('error', { type: 'error', message })
     }
 
-    endSSE(reply)
+    sse.end()
   })
 
-  fastify.get<{ Querystring: HistoryQuery }>('/history', async (request) => {
-    const page = Math.max(1, Number(request.query.page) || 1)
-    const limit = Math.min(50, Math.max(1, Number(request.query.limit) || 10))
+  fastify.get<{ Querystring: PageQuery }>('/history', async (request, reply) => {
+    const page = parsePageRequest(request.query)
+    if (!page) {
+      return reply.status(400).send(failure('INVALID_CURSOR', '分页游标无效，请从第一页重新加载'))
+    }
 
-    const { sessions, total } = await layersService.getHistory(fastify, request.userId, page, limit)
-    return paginated(sessions, page, limit, total)
+    const { sessions, total, nextCursor } = await layersService.getHistory(fastify, request.userId, page)
+    return paginated(sessions, page.page, page.limit, total, nextCursor)
   })
 
   fastify.get<{ Params: { id: string } }>('/session/:id', async (request, reply) => {
@@ -1,14 +1,25 @@
 import type { FastifyInstance } from 'fastify'
 import { authenticate } from '../middleware/authenticate.js'
+import { admitAiStream } from '../middleware/admit-ai-stream.js'
+import { recordTokenUsage } from '../services/ai-limits.js'
 import { success, paginated, failure } from '../utils/response.js'
-import { setupSSE, sendSSEEvent, endSSE } from '../utils/sse.js'
+import { setupSSE } from '../utils/sse.js'
+import { parsePageRequest, type PageQuery } from '../utils/pagination.js'
 import * as rehearsalService from '../services/rehearsal.service.js'
 import * as rehearsalInterviewer from '../services/rehearsal-interviewer.js'
-import * as rehearsalFeedback from '../services/rehearsal-feedback.js'
+import {
+  enqueueFeedback,
+  isFeedbackQueueFull,
+  onFeedbackPart,
+  onFeedbackSettled,
+  type FeedbackOutcome,
+} from '../services/feedback-queue.js'
 import { AI_RATE_LIMIT } from '../plugins/rate-limit.js'
 
 type InterviewerStyle = 'behavioral' | 'technical' | 'stress'
 
+const FEEDBACK_RETRY_AFTER_SECONDS = '30'
+
 interface CreateSessionBody {
   scenario: string
   interviewerStyle: InterviewerStyle
@@ -19,11 +30,6 @@ interface MessageBody {
   content: string
 }
 
-interface HistoryQuery {
-  page?: string
-  limit?: string
-}
-
 export default async function rehearsalRoutes(fastify: FastifyInstance) {
   fastify.addHook('preHandler', authenticate)
 
@@ -40,24 +46,30 @@ export default async function rehearsalRoutes(fastify: FastifyInstance) {
         },
       },
     },
-  }, async (request) => {
+  }, async (request, reply) => {
     const { scenario, interviewerStyle } = request.body
 
-    const firstQuestion = await rehearsalInterviewer.getFirstQuestion(interviewerStyle, scenario)
+    const { question, cacheHit } = await rehearsalInterviewer.getFirstQuestion(
+      interviewerStyle,
+      scenario,
+      request.userId,
+    )
 
     const result = await rehearsalService.createSession(
       fastify,
       request.userId,
       scenario,
       interviewerStyle,
-      firstQuestion,
+      question,
     )
 
+    reply.header('X-Cache', cacheHit ? 'HIT' : 'MISS')
     return success(result)
   })
 
   fastify.post<{ Body: MessageBody }>('/message', {
     config: { rateLimit: AI_RATE_LIMIT },
+    preHandler: admitAiStream,
     schema: {
       body: {
         type: 'object',
@@ -77,18 +89,15 @@ export default async function rehearsalRoutes(fastify: FastifyInstance) {
       return reply.status(404).send(failure('NOT_FOUND', '会话不存在'))
     }
 
-    if (session.status === 'completed') {
+    if (session.status !== 'active') {
       return reply.status(400).send(failure('SESSION_COMPLETED', '该面试已结束'))
     }
 
-    await rehearsalService.appendMessage(fastify, sessionId, 'user', content)
-
-    const messages = await rehearsalService.getMessages(fastify, sessionId)
+    const history = await rehearsalService.getMessages(fastify, sessionId)
+    const userMessage = await rehearsalService.appendMessage(fastify, sessionId, 'user', content)
+    const messages = [...history, userMessage]
 
-    setupSSE(reply)
-
-    const abortController = new AbortController()
-    request.raw.on('close', () => abortController.abort())
+    const sse = setupSSE(reply, {}, { resumable: true })
 
     try {
       const style = session.interviewerStyle as InterviewerStyle
@@ -102,14 +111,16 @@ export default async function rehearsalRoutes(fastify: FastifyInstance) {
         session.scenario,
         aiMessages,
         (chunk) => {
-          if (!abortController.signal.aborted) {
-            sendSSEEvent(reply, 'chunk', { type: 'content', content: chunk })
+          if (!sse.signal.aborted) {
+            sse.content(chunk)
           }
         },
-        abortController.signal,
+        sse.signal,
+        request.userId,
       )
 
       await rehearsalService.appendMessage(fastify, sessionId, 'assistant', result.content)
+      await recordTokenUsage(request.userId, result.usage)
 
       const userMessageCount = messages.filter((m) => m.role === 'user').length + 1
       const totalRounds = 8
@@ -121,20 +132,21 @@ export default async function rehearsalRoutes(fastify: FastifyInstance) {
         })
       }
 
-      sendSSEEvent(reply, 'done', {
+      sse.event('done', {
         type: 'message',
         content: result.content,
         isInterviewEnd: result.isInterviewEnd,
         roundNumber: userMessageCount,
         totalRounds,
+        usage: result.usage,
       })
     } catch (error) {
-      if (abortController.signal.aborted) return
+      if (sse.signal.aborted) return
       const message = error instanceof Error ? error.message : '面试官响应失败，请重试'
-      sendSSEEvent(reply, 'error', { type: 'error', message })
+      sse.event('error', { type: 'error', message })
     }
 
-    endSSE(reply)
+    sse.end()
   })
 
   fastify.post<{ Params: { sessionId: string } }>('/end/:sessionId', async (request, reply) => {
@@ -149,22 +161,27 @@ export default async function rehearsalRoutes(fastify: FastifyInstance) {
       return success({ feedbackId: sessionId, status: 'already_completed' })
     }
 
-    const messages = await rehearsalService.getMessages(fastify, sessionId)
-    const style = session.interviewerStyle as InterviewerStyle
-
-    const feedback = await rehearsalFeedback.generate(
-      messages.map((m) => ({ role: m.role, content: m.content })),
-      style,
-    )
-
-    await rehearsalService.endSession(fastify, sessionId, feedback)
+    // Feedback is a long model call; queue it and let the client poll or subscribe
+    if (session.status !== 'generating') {
+      if (isFeedbackQueueFull()) {
+        reply.header('Retry-After', FEEDBACK_RETRY_AFTER_SECONDS)
+        return reply.status(503).send(failure('QUEUE_FULL', '反馈生成排队人数过多，请稍后再试'))
+      }
 
-    await fastify.prisma.user.update({
-      where: { id: request.userId },
-      data: { usageCount: { increment: 1 } },
-    })
+      const claimed = await rehearsalService.markFeedbackGenerating(fastify, request.userId, sessionId)
+      if (claimed) {
+        try {
+          enqueueFeedback(fastify, sessionId, request.userId)
+        } catch (error) {
+          await rehearsalService.setStatus(fastify, sessionId, session.status)
+          reply.header('Retry-After', FEEDBACK_RETRY_AFTER_SECONDS)
+          const message = error instanceof Error ? error.message : '反馈生成排队人数过多，请稍后再试'
+          return reply.status(503).send(failure('QUEUE_FULL', message))
+        }
+      }
+    }
 
-    return success({ feedbackId: sessionId, status: 'completed' })
+    return reply.status(202).send(success({ feedbackId: sessionId, status: 'generating' }))
   })
 
   fastify.get<{ Params: { sessionId: string } }>('/feedback/:sessionId', async (request, reply) => {
@@ -173,6 +190,10 @@ export default async function rehearsalRoutes(fastify: FastifyInstance) {
       return reply.status(404).send(failure('NOT_FOUND', '会话不存在'))
     }
 
+    if (session.status === 'failed') {
+      return reply.status(500).send(failure('FEEDBACK_FAILED', '反馈生成失败，请重新结束面试以重试'))
+    }
+
     if (!session.feedback) {
       return reply.status(202).send(success({ status: 'generating', message: '反馈正在生成中，请稍后再试' }))
     }
@@ -180,16 +201,58 @@ export default async function rehearsalRoutes(fastify: FastifyInstance) {
     return success(session.feedback)
   })
 
-  fastify.get<{ Querystring: HistoryQuery }>('/history', async (request) => {
-    const page = Math.max(1, Number(request.query.page) || 1)
-    const limit = Math.min(50, Math.max(1, Number(request.query.limit) || 10))
+  fastify.get<{ Params: { sessionId: string } }>('/feedback/:sessionId/stream', async (request, reply) => {
+    const { sessionId } = request.params
+
+    // Subscribe before reading the session so a job finishing in between is not missed
+    let unsubscribe = () => {}
+    const settled = new Promise<FeedbackOutcome>((resolve) => {
+      unsubscribe = onFeedbackSettled(sessionId, resolve)
+    })
+
+    const session = await rehearsalService.getSession(fastify, request.userId, sessionId)
+    if (!session) {
+      unsubscribe()
+      return reply.status(404).send(failure('NOT_FOUND', '会话不存在'))
+    }
+
+    const sse = setupSSE(reply)
+
+    let outcome: FeedbackOutcome | null = null
+    if (session.feedback) {
+      outcome = { status: 'completed', feedback: session.feedback }
+    } else if (session.status !== 'generating') {
+      outcome = { status: 'failed', message: session.status === 'failed' ? '反馈生成失败，请重新结束面试以重试' : '面试尚未结束' }
+    } else {
+      sse.event('status', { type: 'status', status: 'generating' })
+      const stopParts = onFeedbackPart(sessionId, (part) => sse.event(part.type, part))
+      const disconnected = new Promise<null>((resolve) => reply.raw.on('close', () => resolve(null)))
+      outcome = await Promise.race([settled, disconnected])
+      stopParts()
+    }
+    unsubscribe()
+
+    if (outcome?.status === 'completed') {
+      sse.event('done', { type: 'feedback', feedback: outcome.feedback })
+    } else if (outcome) {
+      sse.event('error', { type: 'error', message: outcome.message })
+    }
+
+    sse.end()
+  })
+
+  fastify.get<{ Querystring: PageQuery }>('/history', async (request, reply) => {
+    const page = parsePageRequest(request.query)
+    if (!page) {
+      return reply.status(400).send(failure('INVALID_CURSOR', '分页游标无效，请从第一页重新加载'))
+    }
 
-    const { sessions, total } = await rehearsalService.getHistory(fastify, request.userId, page, limit)
-    return paginated(sessions, page, limit, total)
+    const { sessions, total, nextCursor } = await rehearsalService.getHistory(fastify, request.userId, page)
+    return paginated(sessions, page.page, page.limit, total, nextCursor)
   })
 
   fastify.get<{ Params: { id: string } }>('/session/:id', async (request, reply) => {
-    const session = await rehearsalService.getSession(fastify, request.userId, request.params.id)
+    const session = await rehearsalService.getSessionWithMessages(fastify, request.userId, request.params.id)
     if (!session) {
       return reply.status(404).send(failure('NOT_FOUND', '会话不存在'))
     }
@@ -0,0 +1,90 @@
+import { getLimiterStore } from './limiter-store.js'
+import type { AiUsage } from './ai.service.js'
+
+const MAX_CONCURRENT_STREAMS = Math.max(0, Number(process.env['AI_MAX_CONCURRENT_STREAMS'] ?? 2))
+const TOKEN_BUDGET = Math.max(0, Number(process.env['AI_TOKEN_BUDGET'] ?? 0))
+const TOKEN_WINDOW_MS = Number(process.env['AI_TOKEN_WINDOW_MS'] ?? 3_600_000)
+// Longer than any stream; a slot leaked by a crashed process frees itself after this
+const STREAM_SLOT_TTL_MS = 10 * 60_000
+const STREAM_RETRY_AFTER_SECONDS = 5
+
+export type StreamAdmission =
+  | { ok: true; release: () => void }
+  | { ok: false; code: 'TOO_MANY_STREAMS' | 'TOKEN_BUDGET_EXCEEDED'; message: string; retryAfter: number }
+
+const counters = { admitted: 0, rejectedStreams: 0, rejectedBudget: 0, tokensRecorded: 0, storeErrors: 0 }
+
+/**
+ * Check the user's token budget and take one of their concurrent-stream
+ * slots. Fails open when the store is unreachable, so an outage degrades to
+ * the per-process request limits instead of taking the AI routes down.
+ */
+export async function admitStream(userId: string): Promise<StreamAdmission> {
+  const store = getLimiterStore()
+  const slotKey = `ai:streams:${userId}`
+
+  try {
+    if (TOKEN_BUDGET > 0) {
+      const { count, ttlMs } = await store.incr(`ai:tokens:${userId}`, TOKEN_WINDOW_MS, 0)
+      if (count >= TOKEN_BUDGET) {
+        counters.rejectedBudget++
+        return {
+          ok: false,
+          code: 'TOKEN_BUDGET_EXCEEDED',
+          message: '本时段 AI 用量已达上限，请稍后再试',
+          retryAfter: Math.max(1, Math.ceil(ttlMs / 1000)),
+        }
+      }
+    }
+
+    if (MAX_CONCURRENT_STREAMS > 0 && !(await store.acquire(slotKey, MAX_CONCURRENT_STREAMS, STREAM_SLOT_TTL_MS))) {
+      counters.rejectedStreams++
+      return {
+        ok: false,
+        code: 'TOO_MANY_STREAMS',
+        message: '同时进行的 AI 分析过多，请等待当前分析完成',
+        retryAfter: STREAM_RETRY_AFTER_SECONDS,
+      }
+    }
+  } catch {
+    counters.storeErrors++
+    return { ok: true, release: () => {} }
+  }
+
+  counters.admitted++
+  let released = MAX_CONCURRENT_STREAMS === 0
+  return {
+    ok: true,
+    release: () => {
+      if (released) return
+      released = true
+      store.release(slotKey).catch(() => {
+        counters.storeErrors++
+      })
+    },
+  }
+}
+
+/** Charge a finished model call against the user's token budget. */
+export async function recordTokenUsage(userId: string, usage: AiUsage): Promise<void> {
+  if (TOKEN_BUDGET === 0) return
+  const tokens = usage.inputTokens + usage.outputTokens + usage.cacheReadTokens + usage.cacheWriteTokens
+  if (tokens === 0) return
+
+  try {
+    await getLimiterStore().incr(`ai:tokens:${userId}`, TOKEN_WINDOW_MS, tokens)
+    counters.tokensRecorded += tokens
+  } catch {
+    counters.storeErrors++
+  }
+}
+
+export function getAiLimitStats() {
+  return {
+    store: getLimiterStore().kind,
+    maxConcurrentStreams: MAX_CONCURRENT_STREAMS,
+    tokenBudget: TOKEN_BUDGET,
+    tokenWindowMs: TOKEN_WINDOW_MS,
+    ...counters,
+  }
+}
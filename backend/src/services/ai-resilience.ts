@@ -0,0 +1,90 @@
+const AI_RETRY_BUDGET_RATIO = Math.max(0, Number(process.env['AI_RETRY_BUDGET_RATIO'] ?? 0.2))
+const AI_RETRY_BUDGET_BURST = Math.max(0, Number(process.env['AI_RETRY_BUDGET_BURST'] ?? 10))
+const AI_BREAKER_THRESHOLD = Math.max(1, Number(process.env['AI_BREAKER_THRESHOLD'] ?? 5))
+const AI_BREAKER_COOLDOWN_MS = Number(process.env['AI_BREAKER_COOLDOWN_MS'] ?? 30_000)
+
+// Retries and hedges draw from one bucket that every call tops up by AI_RETRY_BUDGET_RATIO,
+// so extra attempts stay a fixed share of traffic instead of multiplying an outage
+let retryTokens = AI_RETRY_BUDGET_BURST
+
+type BreakerState = 'closed' | 'open' | 'half-open'
+let state: BreakerState = 'closed'
+let consecutiveFailures = 0
+let openedAt = 0
+let probeStartedAt = 0
+
+const counters = { calls: 0, retries: 0, hedges: 0, budgetExhausted: 0, failFast: 0, opened: 0 }
+
+/** Credit the retry budget for one new call. */
+export function depositRetryBudget(): void {
+  counters.calls++
+  retryTokens = Math.min(AI_RETRY_BUDGET_BURST, retryTokens + AI_RETRY_BUDGET_RATIO)
+}
+
+/** Take one extra attempt from the budget; false when it is spent. */
+export function withdrawRetryBudget(kind: 'retries' | 'hedges'): boolean {
+  if (retryTokens < 1) {
+    counters.budgetExhausted++
+    return false
+  }
+  retryTokens--
+  counters[kind]++
+  return true
+}
+
+/** Seconds until the breaker lets a probe through, or null while calls may go upstream. */
+export function circuitRetryAfter(): number | null {
+  if (state === 'closed') return null
+  const since = state === 'open' ? openedAt : probeStartedAt
+  const waitMs = since + AI_BREAKER_COOLDOWN_MS - Date.now()
+  return waitMs > 0 ? Math.ceil(waitMs / 1000) : null
+}
+
+/**
+ * Throws 503 `AI_UNAVAILABLE` while the breaker is open. Once the cooldown has
+ * passed one call at a time goes through as a probe; its outcome closes or
+ * re-opens the breaker. A probe that never reports frees the slot after
+ * another cooldown.
+ */
+export function assertCircuitClosed(): void {
+  const retryAfter = circuitRetryAfter()
+  if (retryAfter !== null) {
+    counters.failFast++
+    throw Object.assign(new Error('AI 服务暂时不可用，请稍后再试'), {
+      statusCode: 503,
+      code: 'AI_UNAVAILABLE',
+      retryAfter,
+    })
+  }
+  if (state !== 'closed') {
+    state = 'half-open'
+    probeStartedAt = Date.now()
+  }
+}
+
+export function recordUpstreamSuccess(): void {
+  consecutiveFailures = 0
+  state = 'closed'
+}
+
+/** An attempt failed in a way that says the upstream is unhealthy (5xx, 429, connection, no first token). */
+export function recordUpstreamFailure(): void {
+  consecutiveFailures++
+  if (state === 'half-open' || (state === 'closed' && consecutiveFailures >= AI_BREAKER_THRESHOLD)) {
+    state = 'open'
+    openedAt = Date.now()
+    counters.opened++
+  }
+}
+
+export function getAiResilienceStats() {
+  return {
+    breaker: state,
+    consecutiveFailures,
+    breakerThreshold: AI_BREAKER_THRESHOLD,
+    breakerCooldownMs: AI_BREAKER_COOLDOWN_MS,
+    retryBudgetRatio: AI_RETRY_BUDGET_RATIO,
+    retryTokens,
+    ...counters,
+  }
+}
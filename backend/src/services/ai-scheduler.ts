@@ -0,0 +1,182 @@
+const AI_MAX_CONCURRENT = Math.max(1, Number(process.env['AI_MAX_CONCURRENT'] ?? 16))
+const AI_QUEUE_LIMIT = Math.max(0, Number(process.env['AI_QUEUE_LIMIT'] ?? 64))
+const AI_QUEUE_TIMEOUT_MS = Number(process.env['AI_QUEUE_TIMEOUT_MS'] ?? 30_000)
+// Used for Retry-After until some calls have finished
+const DEFAULT_SERVICE_MS = 10_000
+
+/**
+ * Served strictly in this order: a user mid-rehearsal waits on `interactive`,
+ * a new analysis is `analysis`, feedback generation and cache fills are `background`.
+ */
+export const AI_PRIORITIES = ['interactive', 'analysis', 'background'] as const
+export type AiPriority = (typeof AI_PRIORITIES)[number]
+
+export interface AiSlotRequest {
+  priority: AiPriority
+  /** Fair-queuing key; calls shared between users (cached opening questions) go under one key. */
+  userId?: string
+  signal?: AbortSignal
+}
+
+interface Waiter {
+  priority: AiPriority
+  enqueuedAt: number
+  resolve: (release: () => void) => void
+  reject: (error: Error) => void
+  cleanup: () => void
+}
+
+// Per class, each user's waiters in arrival order. Map order is the round-robin order:
+// a user who was just served moves to the back of their class.
+const queues = Object.fromEntries(AI_PRIORITIES.map((p) => [p, new Map<string, Waiter[]>()])) as Record<
+  AiPriority,
+  Map<string, Waiter[]>
+>
+let queued = 0
+let running = 0
+
+const counters = {
+  admitted: 0,
+  rejected: 0,
+  timedOut: 0,
+  cancelled: 0,
+  totalWaitMs: 0,
+  maxWaitMs: 0,
+  finished: 0,
+  totalServiceMs: 0,
+}
+const waitByPriority = Object.fromEntries(AI_PRIORITIES.map((p) => [p, { admitted: 0, totalWaitMs: 0 }])) as Record<
+  AiPriority,
+  { admitted: number; totalWaitMs: number }
+>
+
+function busyError(message: string) {
+  return Object.assign(new Error(message), { statusCode: 429, code: 'AI_BUSY', retryAfter: estimateRetryAfter() })
+}
+
+/** Seconds until a queued call would likely start: the queue ahead, drained at the current service rate. */
+export function estimateRetryAfter(): number {
+  const serviceMs = counters.finished ? counters.totalServiceMs / counters.finished : DEFAULT_SERVICE_MS
+  return Math.max(1, Math.ceil(((queued + 1) * serviceMs) / AI_MAX_CONCURRENT / 1000))
+}
+
+/** True when a new call would be refused; routes check this before opening an SSE stream. */
+export function isAiSchedulerSaturated(): boolean {
+  return running >= AI_MAX_CONCURRENT && queued >= AI_QUEUE_LIMIT
+}
+
+/**
+ * Wait for one of the AI_MAX_CONCURRENT upstream slots. Resolves with a
+ * release function; rejects with a 429 `AI_BUSY` error when the queue is full
+ * or the wait passes AI_QUEUE_TIMEOUT_MS, and with the abort reason when the
+ * caller goes away while queued.
+ */
+export function acquireAiSlot({ priority, userId = 'shared', signal }: AiSlotRequest): Promise<() => void> {
+  if (signal?.aborted) return Promise.reject(new Error('请求已取消'))
+
+  if (running < AI_MAX_CONCURRENT && queued === 0) {
+    return Promise.resolve(start(priority, 0))
+  }
+  if (queued >= AI_QUEUE_LIMIT) {
+    counters.rejected++
+    return Promise.reject(busyError('当前 AI 请求较多，请稍后再试'))
+  }
+
+  return new Promise((resolve, reject) => {
+    const waiter: Waiter = {
+      priority,
+      enqueuedAt: Date.now(),
+      resolve,
+      reject,
+      cleanup: () => {
+        clearTimeout(timer)
+        signal?.removeEventListener('abort', onAbort)
+      },
+    }
+    const timer = setTimeout(() => {
+      remove(userId, waiter)
+      counters.timedOut++
+      reject(busyError('AI 请求排队超时，请稍后再试'))
+    }, AI_QUEUE_TIMEOUT_MS)
+    const onAbort = () => {
+      remove(userId, waiter)
+      counters.cancelled++
+      reject(new Error('请求已取消'))
+    }
+    signal?.addEventListener('abort', onAbort, { once: true })
+
+    const users = queues[priority]
+    users.set(userId, [...(users.get(userId) ?? []), waiter])
+    queued++
+  })
+}
+
+function start(priority: AiPriority, waitMs: number): () => void {
+  running++
+  counters.admitted++
+  counters.totalWaitMs += waitMs
+  counters.maxWaitMs = Math.max(counters.maxWaitMs, waitMs)
+  waitByPriority[priority].admitted++
+  waitByPriority[priority].totalWaitMs += waitMs
+
+  const startedAt = Date.now()
+  let released = false
+  return () => {
+    if (released) return
+    released = true
+    running--
+    counters.finished++
+    counters.totalServiceMs += Date.now() - startedAt
+    dispatch()
+  }
+}
+
+function dispatch() {
+  while (running < AI_MAX_CONCURRENT && queued > 0) {
+    const priority = AI_PRIORITIES.find((p) => queues[p].size > 0)!
+    const users = queues[priority]
+    const [userId, waiters] = users.entries().next().value as [string, Waiter[]]
+    const waiter = waiters.shift()!
+    users.delete(userId)
+    if (waiters.length > 0) users.set(userId, waiters)
+    queued--
+
+    waiter.cleanup()
+    waiter.resolve(start(priority, Date.now() - waiter.enqueuedAt))
+  }
+}
+
+function remove(userId: string, waiter: Waiter) {
+  const users = queues[waiter.priority]
+  const waiters = users.get(userId)
+  const index = waiters?.indexOf(waiter) ?? -1
+  if (!waiters || index === -1) return
+  waiter.cleanup()
+  waiters.splice(index, 1)
+  if (waiters.length === 0) users.delete(userId)
+  queued--
+}
+
+export function getAiSchedulerStats() {
+  const admitted = counters.admitted
+  return {
+    maxConcurrent: AI_MAX_CONCURRENT,
+    queueLimit: AI_QUEUE_LIMIT,
+    queueTimeoutMs: AI_QUEUE_TIMEOUT_MS,
+    running,
+    queued,
+    queuedByPriority: Object.fromEntries(
+      AI_PRIORITIES.map((p) => [p, [...queues[p].values()].reduce((sum, w) => sum + w.length, 0)]),
+    ),
+    admitted,
+    rejected: counters.rejected,
+    timedOut: counters.timedOut,
+    cancelled: counters.cancelled,
+    avgWaitMs: admitted ? counters.totalWaitMs / admitted : 0,
+    maxWaitMs: counters.maxWaitMs,
+    avgWaitMsByPriority: Object.fromEntries(
+      AI_PRIORITIES.map((p) => [p, waitByPriority[p].admitted ? waitByPriority[p].totalWaitMs / waitByPriority[p].admitted : 0]),
+    ),
+    avgServiceMs: counters.finished ? counters.totalServiceMs / counters.finished : 0,
+  }
+}
@@ -1,35 +1,220 @@
 import Anthropic from '@anthropic-ai/sdk'
+import { acquireAiSlot, type AiPriority } from './ai-scheduler.js'
+import {
+  assertCircuitClosed,
+  depositRetryBudget,
+  recordUpstreamFailure,
+  recordUpstreamSuccess,
+  withdrawRetryBudget,
+} from './ai-resilience.js'
+import { recordAiCall, recordAiTokens, startPhase } from './metrics.js'
 
 const client = new Anthropic({
   baseURL: process.env['ANTHROPIC_BASE_URL'] ?? 'https://api.minimaxi.com/anthropic',
   apiKey: process.env['ANTHROPIC_API_KEY'],
+  // Retries are ours (below), so they draw on the retry budget and respect the breaker
+  maxRetries: 0,
 })
 
 const DEFAULT_MODEL = 'MiniMax-M2.5'
 const AI_TIMEOUT_MS = 120_000 // 120s timeout for AI calls
+const AI_FIRST_TOKEN_TIMEOUT_MS = Number(process.env['AI_FIRST_TOKEN_TIMEOUT_MS'] ?? 30_000)
+// 0 disables hedging; otherwise a second request starts if no token has arrived by then
+const AI_HEDGE_DELAY_MS = Math.max(0, Number(process.env['AI_HEDGE_DELAY_MS'] ?? 0))
+const AI_MAX_RETRIES = Math.max(0, Number(process.env['AI_MAX_RETRIES'] ?? 2))
+const RETRY_BASE_DELAY_MS = 200
+
+// Prompt caching is on unless explicitly disabled, e.g. for upstreams that reject cache_control
+const PROMPT_CACHE_ENABLED = process.env['AI_PROMPT_CACHE'] !== 'off'
+
+interface ChatMessage {
+  role: 'user' | 'assistant'
+  content: string
+  /** Mark the prompt up to and including this message as a cache breakpoint. */
+  cache?: boolean
+}
 
 interface StreamChatParams {
   systemPrompt: string
   userMessage: string
-  messages?: Array<{ role: 'user' | 'assistant'; content: string }>
+  messages?: ChatMessage[]
   onChunk: (chunk: string) => void
-  onDone: (fullResponse: string) => void
+  onDone: (fullResponse: string, usage: AiUsage) => void
   signal?: AbortSignal
+  /** Scheduler class and fair-queuing key; see ai-scheduler.ts. */
+  priority: AiPriority
+  userId?: string
+}
+
+export interface AiUsage {
+  inputTokens: number
+  outputTokens: number
+  /** Prompt tokens served from the upstream prompt cache. */
+  cacheReadTokens: number
+  /** Prompt tokens written to the cache on this call (billed at a premium). */
+  cacheWriteTokens: number
+}
+
+export const EMPTY_USAGE: AiUsage = { inputTokens: 0, outputTokens: 0, cacheReadTokens: 0, cacheWriteTokens: 0 }
+
+const usageTotals = { calls: 0, inputTokens: 0, outputTokens: 0, cacheReadTokens: 0, cacheWriteTokens: 0 }
+
+export function getAiUsageStats() {
+  const prompt = usageTotals.inputTokens + usageTotals.cacheReadTokens + usageTotals.cacheWriteTokens
+  return { ...usageTotals, cacheHitRate: prompt ? usageTotals.cacheReadTokens / prompt : 0 }
 }
 
-export async function streamChat(params: StreamChatParams): Promise<void> {
-  const { systemPrompt, userMessage, messages = [], onChunk, onDone, signal } = params
+function cached(text: string): Anthropic.TextBlockParam {
+  return { type: 'text', text, cache_control: { type: 'ephemeral' } }
+}
+
+/**
+ * The system prompt, any caller-marked message and the last history message
+ * are cache breakpoints (4 max upstream). On the next turn of a conversation
+ * the upstream matches the longest cached prefix, so only the new turn is
+ * processed from scratch.
+ */
+function buildRequest(systemPrompt: string, history: ChatMessage[], userMessage: string) {
+  if (!PROMPT_CACHE_ENABLED) {
+    return {
+      system: systemPrompt,
+      messages: [
+        ...history.map((m) => ({ role: m.role, content: m.content })),
+        { role: 'user' as const, content: userMessage },
+      ] satisfies Anthropic.MessageParam[],
+    }
+  }
 
-  const model = process.env['AI_MODEL'] ?? DEFAULT_MODEL
+  const lastIndex = history.length - 1
+  const marked = new Set(history.flatMap((m, i) => (m.cache ? [i] : [])).slice(-2))
+  marked.add(lastIndex)
 
-  const apiMessages: Anthropic.MessageParam[] = [
-    ...messages.map((m) => ({
-      role: m.role as 'user' | 'assistant',
-      content: m.content,
+  const messages: Anthropic.MessageParam[] = [
+    ...history.map((m, i) => ({
+      role: m.role,
+      content: marked.has(i) ? [cached(m.content)] : m.content,
     })),
-    { role: 'user' as const, content: userMessage },
+    { role: 'user', content: userMessage },
   ]
 
+  return { system: [cached(systemPrompt)], messages }
+}
+
+export function getModel(): string {
+  return process.env['AI_MODEL'] ?? DEFAULT_MODEL
+}
+
+/** Errors worth another attempt when they happen before the first token. */
+function isRetryable(error: unknown): boolean {
+  if ((error as { code?: string }).code === 'FIRST_TOKEN_TIMEOUT') return true
+  if (error instanceof Anthropic.APIUserAbortError) return false
+  if (error instanceof Anthropic.APIConnectionError) return true
+  if (error instanceof Anthropic.APIError) {
+    // No status: an `error` event inside the stream (e.g. overloaded)
+    const status = error.status
+    return status === undefined || status === 408 || status === 409 || status === 429 || status >= 500
+  }
+  return false
+}
+
+function backoffMs(retry: number): number {
+  return Math.random() * RETRY_BASE_DELAY_MS * 2 ** retry
+}
+
+type MessageParams = Anthropic.MessageStreamParams
+
+/**
+ * One logical attempt: a request, plus a hedge if no token has arrived after
+ * AI_HEDGE_DELAY_MS. The first to stream a token wins and the other is
+ * cancelled; only the winner's text reaches `onText`. Rejects with a
+ * retryable FIRST_TOKEN_TIMEOUT when nothing streams within
+ * AI_FIRST_TOKEN_TIMEOUT_MS.
+ */
+function hedgedAttempt(
+  body: MessageParams,
+  signal: AbortSignal,
+  onText: (text: string) => void,
+): Promise<Anthropic.Message> {
+  return new Promise((resolve, reject) => {
+    const attempts: AbortController[] = []
+    const timers: NodeJS.Timeout[] = []
+    let winner: AbortController | null = null
+    let pending = 0
+    let settled = false
+
+    const settle = (finish: () => void) => {
+      if (settled) return
+      settled = true
+      for (const timer of timers) clearTimeout(timer)
+      signal.removeEventListener('abort', onAbort)
+      finish()
+    }
+    const abortAll = (except?: AbortController) => {
+      for (const attempt of attempts) if (attempt !== except) attempt.abort()
+    }
+    const onAbort = () => {
+      abortAll()
+      // The overall timeout aborts with its own error; a caller abort has the default reason
+      const reason: unknown = signal.reason
+      settle(() => reject(reason instanceof Error && reason.name !== 'AbortError' ? reason : new Error('请求已取消')))
+    }
+    signal.addEventListener('abort', onAbort, { once: true })
+
+    const launch = () => {
+      const controller = new AbortController()
+      attempts.push(controller)
+      pending++
+
+      const stream = client.messages.stream(body, { signal: controller.signal })
+      stream.on('text', (text) => {
+        if (!winner) {
+          winner = controller
+          abortAll(controller)
+          for (const timer of timers) clearTimeout(timer)
+        }
+        if (winner === controller) onText(text)
+      })
+      stream.finalMessage().then(
+        (message) => {
+          pending--
+          winner ??= controller
+          if (winner !== controller) return
+          recordUpstreamSuccess()
+          settle(() => resolve(message))
+        },
+        (error: unknown) => {
+          pending--
+          // Cancelled: lost the race, timed out, or the caller went away; all accounted for elsewhere
+          if (controller.signal.aborted) return
+          if (isRetryable(error)) recordUpstreamFailure()
+          // Before a winner, a failed attempt only ends the race once nothing else is in flight
+          if (winner === controller || (!winner && pending === 0)) settle(() => reject(error))
+        },
+      )
+    }
+
+    launch()
+    if (AI_HEDGE_DELAY_MS > 0) {
+      timers.push(setTimeout(() => {
+        if (!winner && !settled && withdrawRetryBudget('hedges')) launch()
+      }, AI_HEDGE_DELAY_MS))
+    }
+    timers.push(setTimeout(() => {
+      if (winner) return
+      abortAll()
+      recordUpstreamFailure()
+      settle(() => reject(Object.assign(new Error('AI 响应超时，请重试'), { code: 'FIRST_TOKEN_TIMEOUT' })))
+    }, AI_FIRST_TOKEN_TIMEOUT_MS))
+  })
+}
+
+export async function streamChat(params: StreamChatParams): Promise<AiUsage> {
+  const { systemPrompt, userMessage, messages = [], onChunk, onDone, signal, priority, userId } = params
+
+  const model = getModel()
+
+  const { system, messages: apiMessages } = buildRequest(systemPrompt, messages, userMessage)
+
   const abortController = new AbortController()
 
   // Link external signal if provided
@@ -40,36 +225,83 @@ export async function streamChat(params: StreamChatParams): Promise<void> {
     signal.addEventListener('abort', () => abortController.abort(), { once: true })
   }
 
+  // Fail fast while the upstream is known to be down, before taking a queue slot
+  assertCircuitClosed()
+
+  // Queue time does not count against the upstream timeout
+  const release = await acquireAiSlot({ priority, userId, signal })
+
   // Enforce timeout
-  const timeoutId = setTimeout(() => abortController.abort(), AI_TIMEOUT_MS)
+  const timeoutId = setTimeout(() => abortController.abort(new Error('AI 响应超时，请重试')), AI_TIMEOUT_MS)
+  const stopUpstream = startPhase('upstream')
+  const startedAt = performance.now()
+  let firstTokenAt: number | undefined
+  let answered = false
 
   try {
-    const stream = client.messages.stream(
-      {
-        model,
-        max_tokens: 4096,
-        system: systemPrompt,
-        messages: apiMessages,
-      },
-      { signal: abortController.signal },
-    )
+    depositRetryBudget()
+    const body: MessageParams = { model, max_tokens: 4096, system, messages: apiMessages }
 
     let fullText = ''
-
-    stream.on('text', (text) => {
-      fullText += text
-      onChunk(text)
-    })
-
-    const finalMessage = await stream.finalMessage()
+    let finalMessage: Anthropic.Message
+    for (let retry = 0; ; retry++) {
+      try {
+        finalMessage = await hedgedAttempt(body, abortController.signal, (text) => {
+          firstTokenAt ??= performance.now()
+          fullText += text
+          onChunk(text)
+        })
+        break
+      } catch (error) {
+        // Once text has reached the caller a retry would repeat it
+        const retryable = !fullText && !abortController.signal.aborted && isRetryable(error)
+        if (!retryable || retry >= AI_MAX_RETRIES || !withdrawRetryBudget('retries')) throw error
+        await new Promise((resolve) => setTimeout(resolve, backoffMs(retry)))
+      }
+    }
 
     const contentBlock = finalMessage.content[0]
     if (contentBlock?.type === 'text') {
       fullText = contentBlock.text
     }
 
-    onDone(fullText)
+    const usage: AiUsage = {
+      inputTokens: finalMessage.usage.input_tokens,
+      outputTokens: finalMessage.usage.output_tokens,
+      cacheReadTokens: finalMessage.usage.cache_read_input_tokens ?? 0,
+      cacheWriteTokens: finalMessage.usage.cache_creation_input_tokens ?? 0,
+    }
+    usageTotals.calls++
+    usageTotals.inputTokens += usage.inputTokens
+    usageTotals.outputTokens += usage.outputTokens
+    usageTotals.cacheReadTokens += usage.cacheReadTokens
+    usageTotals.cacheWriteTokens += usage.cacheWriteTokens
+    recordAiTokens({
+      input: usage.inputTokens,
+      output: usage.outputTokens,
+      cache_read: usage.cacheReadTokens,
+      cache_write: usage.cacheWriteTokens,
+    })
+    answered = true
+    recordAiCall(priority, 'ok', {
+      firstTokenSeconds: firstTokenAt === undefined ? undefined : (firstTokenAt - startedAt) / 1000,
+      streamSeconds: firstTokenAt === undefined ? undefined : (performance.now() - firstTokenAt) / 1000,
+      outputTokens: usage.outputTokens,
+    })
+
+    onDone(fullText, usage)
+    return usage
+  } catch (error) {
+    // A throwing onDone is the caller's failure, not the upstream's
+    if (!answered) {
+      recordAiCall(priority, signal?.aborted ? 'aborted' : 'error', {
+        firstTokenSeconds: firstTokenAt === undefined ? undefined : (firstTokenAt - startedAt) / 1000,
+      })
+    }
+    throw error
   } finally {
+    stopUpstream()
     clearTimeout(timeoutId)
+    release()
   }
 }
@@ -0,0 +1,101 @@
+import { createHash } from 'node:crypto'
+import type { FastifyInstance } from 'fastify'
+import { getModel } from './ai.service.js'
+import { LruCache } from '../utils/lru-cache.js'
+import { FEYNMAN_SYSTEM_PROMPT } from '../prompts/feynman-system.js'
+import { LAYERS_SYSTEM_PROMPT } from '../prompts/layers-system.js'
+
+export type AnalysisKind = 'feynman' | 'layers'
+
+const TTL_MS = Number(process.env['ANALYSIS_CACHE_TTL_MS'] ?? 24 * 60 * 60 * 1000)
+const PERSIST = process.env['ANALYSIS_CACHE_PERSIST'] === 'on'
+const PRUNE_EVERY = 100
+
+// Editing a prompt changes its hash, so stale results are never served after a prompt change
+const PROMPT_VERSIONS: Record<AnalysisKind, string> = {
+  feynman: sha256(FEYNMAN_SYSTEM_PROMPT).slice(0, 12),
+  layers: sha256(LAYERS_SYSTEM_PROMPT).slice(0, 12),
+}
+
+const memory = new LruCache<string, unknown>({
+  maxEntries: Number(process.env['ANALYSIS_CACHE_SIZE'] ?? 1000),
+  ttlMs: TTL_MS,
+})
+
+const counters = { memoryHits: 0, persistentHits: 0, misses: 0, writes: 0 }
+
+function sha256(text: string): string {
+  return createHash('sha256').update(text).digest('hex')
+}
+
+/** NFKC folds full-width punctuation and digits; whitespace runs collapse to one space. */
+export function normalizeInput(text: string): string {
+  return text.normalize('NFKC').trim().replace(/\s+/g, ' ')
+}
+
+export function analysisCacheKey(kind: AnalysisKind, input: string): string {
+  return sha256([kind, PROMPT_VERSIONS[kind], getModel(), normalizeInput(input)].join('\0'))
+}
+
+export async function getCachedAnalysis<T>(
+  fastify: FastifyInstance,
+  key: string,
+): Promise<T | undefined> {
+  const hit = memory.get(key)
+  if (hit !== undefined) {
+    counters.memoryHits++
+    return hit as T
+  }
+
+  if (PERSIST) {
+    try {
+      const row = await fastify.prisma.analysisCacheEntry.findUnique({ where: { key } })
+      if (row && row.expiresAt.getTime() > Date.now()) {
+        memory.set(key, row.value, row.expiresAt.getTime() - Date.now())
+        counters.persistentHits++
+        return row.value as T
+      }
+    } catch (error) {
+      fastify.log.warn({ err: error }, 'Analysis cache read failed')
+    }
+  }
+
+  counters.misses++
+  return undefined
+}
+
+/** Store a result in memory and, if enabled, the persistent tier. Never throws. */
+export async function setCachedAnalysis(
+  fastify: FastifyInstance,
+  kind: AnalysisKind,
+  key: string,
+  value: unknown,
+): Promise<void> {
+  memory.set(key, value)
+  counters.writes++
+  if (!PERSIST) return
+
+  const expiresAt = new Date(Date.now() + TTL_MS)
+  try {
+    await fastify.prisma.analysisCacheEntry.upsert({
+      where: { key },
+      create: { key, kind, value: value as object, expiresAt },
+      update: { value: value as object, expiresAt },
+    })
+    if (counters.writes % PRUNE_EVERY === 0) {
+      await fastify.prisma.analysisCacheEntry.deleteMany({ where: { expiresAt: { lt: new Date() } } })
+    }
+  } catch (error) {
+    fastify.log.warn({ err: error }, 'Analysis cache write failed')
+  }
+}
+
+export function getAnalysisCacheStats() {
+  const lookups = counters.memoryHits + counters.persistentHits + counters.misses
+  return {
+    ...counters,
+    persistent: PERSIST,
+    size: memory.size,
+    hitRate: lookups ? (counters.memoryHits + counters.persistentHits) / lookups : 0,
+  }
+}
@@ -1,8 +1,7 @@
-import bcrypt from 'bcrypt'
 import type { FastifyInstance } from 'fastify'
 import { failure } from '../utils/response.js'
-
-const SALT_ROUNDS = 12
+import { hashPassword, verifyPassword } from './password-hasher.js'
+import { getUnflushedUsage, withUsageSnapshot, type UsageFeature } from './usage-counter.js'
 
 export async function register(
   fastify: FastifyInstance,
@@ -10,7 +9,7 @@ export async function register(
   name: string,
   password: string,
 ) {
-  const passwordHash = await bcrypt.hash(password, SALT_ROUNDS)
+  const passwordHash = await hashPassword(password)
 
   const user = await fastify.prisma.user.create({
     data: { email, name, passwordHash },
@@ -32,7 +31,7 @@ export async function login(fastify: FastifyInstance, email: string, password: s
     throw Object.assign(new Error('邮箱或密码错误'), { statusCode: 401, ...failure('INVALID_CREDENTIALS', '邮箱或密码错误') })
   }
 
-  const valid = await bcrypt.compare(password, user.passwordHash)
+  const valid = await verifyPassword(password, user.passwordHash)
   if (!valid) {
     throw Object.assign(new Error('邮箱或密码错误'), { statusCode: 401, ...failure('INVALID_CREDENTIALS', '邮箱或密码错误') })
   }
@@ -45,14 +44,31 @@ export async function login(fastify: FastifyInstance, email: string, password: s
 }
 
 export async function getMe(fastify: FastifyInstance, userId: string) {
-  const user = await fastify.prisma.user.findUnique({
-    where: { id: userId },
-    select: { id: true, email: true, name: true, usageCount: true, createdAt: true },
-  })
+  // Stored totals lag the write-behind buffer by up to one flush, so the buffered delta is added.
+  // Both are read with no flush in progress, so each increment is counted once, in the row or the buffer.
+  const { user, usageByFeature } = await withUsageSnapshot(async () => ({
+    user: await fastify.prisma.user.findUnique({
+      where: { id: userId },
+      select: {
+        id: true,
+        email: true,
+        name: true,
+        usageCount: true,
+        createdAt: true,
+        featureUsage: { select: { feature: true, count: true } },
+      },
+    }),
+    usageByFeature: getUnflushedUsage(userId),
+  }))
 
   if (!user) {
     throw Object.assign(new Error('用户不存在'), { statusCode: 404, ...failure('NOT_FOUND', '用户不存在') })
   }
 
-  return user
+  const unflushed = Object.values(usageByFeature).reduce((sum, n) => sum + n, 0)
+  for (const { feature, count } of user.featureUsage) {
+    if (feature in usageByFeature) usageByFeature[feature as UsageFeature] += count
+  }
+  const { featureUsage: _, ...rest } = user
+  return { ...rest, usageCount: user.usageCount + unflushed, usageByFeature }
 }
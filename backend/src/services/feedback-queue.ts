@@ -0,0 +1,177 @@
+import cluster from 'node:cluster'
+import { EventEmitter } from 'node:events'
+import type { FastifyInstance } from 'fastify'
+import * as rehearsalService from './rehearsal.service.js'
+import * as rehearsalFeedback from './rehearsal-feedback.js'
+import { recordTokenUsage } from './ai-limits.js'
+import { recordUsage } from './usage-counter.js'
+import type { ClusterMessage } from '../cluster.js'
+
+const FEEDBACK_CONCURRENCY = Math.max(1, Number(process.env['FEEDBACK_CONCURRENCY'] ?? 4))
+const FEEDBACK_QUEUE_LIMIT = Math.max(0, Number(process.env['FEEDBACK_QUEUE_LIMIT'] ?? 100))
+
+export interface FeedbackJob {
+  sessionId: string
+  userId: string
+  enqueuedAt: number
+}
+
+export type FeedbackOutcome =
+  | { status: 'completed'; feedback: unknown }
+  | { status: 'failed'; message: string }
+
+const pending: FeedbackJob[] = []
+// Sessions that are waiting or running, so a repeated `end` does not queue twice
+const scheduled = new Set<string>()
+const outcomes = new EventEmitter().setMaxListeners(0)
+let running = 0
+let accepting = true
+let idle: (() => void) | null = null
+
+const counters = { enqueued: 0, completed: 0, failed: 0, rejected: 0, totalWaitMs: 0, totalRunMs: 0 }
+
+// In cluster mode a feedback stream may be open on another worker than the job, so events go via the primary
+if (cluster.isWorker) {
+  process.on('message', (message: ClusterMessage) => {
+    if (message.type === 'feedback-event') outcomes.emit(message.event, message.payload)
+  })
+}
+
+function emit(event: string, payload: unknown) {
+  outcomes.emit(event, payload)
+  if (cluster.isWorker) {
+    process.send?.({ type: 'feedback-event', event, payload } satisfies ClusterMessage)
+  }
+}
+
+export function isFeedbackQueueFull(): boolean {
+  return !accepting || pending.length >= FEEDBACK_QUEUE_LIMIT
+}
+
+/**
+ * Queue feedback generation for a session already marked `generating`.
+ * Throws 503 when the queue is full; the caller should restore the session status.
+ */
+export function enqueueFeedback(fastify: FastifyInstance, sessionId: string, userId: string): void {
+  if (scheduled.has(sessionId)) return
+
+  if (isFeedbackQueueFull()) {
+    counters.rejected++
+    throw Object.assign(new Error('反馈生成排队人数过多，请稍后再试'), { statusCode: 503 })
+  }
+
+  pending.push({ sessionId, userId, enqueuedAt: Date.now() })
+  scheduled.add(sessionId)
+  counters.enqueued++
+  if (cluster.isWorker) {
+    process.send?.({ type: 'feedback-claim', sessionId, userId } satisfies ClusterMessage)
+  }
+  pump(fastify)
+}
+
+/** Subscribe to score/improvement parts of a running job as the model writes them. */
+export function onFeedbackPart(sessionId: string, listener: (part: rehearsalFeedback.FeedbackPart) => void): () => void {
+  const event = `${sessionId}:part`
+  outcomes.on(event, listener)
+  return () => {
+    outcomes.off(event, listener)
+  }
+}
+
+/** Subscribe to the outcome of one session's job. Returns an unsubscribe function. */
+export function onFeedbackSettled(sessionId: string, listener: (outcome: FeedbackOutcome) => void): () => void {
+  outcomes.once(sessionId, listener)
+  return () => {
+    outcomes.off(sessionId, listener)
+  }
+}
+
+export function getFeedbackQueueStats() {
+  const finished = counters.completed + counters.failed
+  return {
+    concurrency: FEEDBACK_CONCURRENCY,
+    queueLimit: FEEDBACK_QUEUE_LIMIT,
+    running,
+    queued: pending.length,
+    enqueued: counters.enqueued,
+    completed: counters.completed,
+    failed: counters.failed,
+    rejected: counters.rejected,
+    avgWaitMs: finished ? counters.totalWaitMs / finished : 0,
+    avgRunMs: finished ? counters.totalRunMs / finished : 0,
+  }
+}
+
+/**
+ * Stop taking work and wait for running jobs. Jobs still queued are dropped
+ * and returned; their sessions stay `generating` and are picked up again on
+ * startup, or by another cluster worker. In a cluster the primary also knows
+ * which jobs each worker holds and re-queues them if the worker dies.
+ */
+export async function stopFeedbackQueue(): Promise<FeedbackJob[]> {
+  accepting = false
+  const dropped = pending.splice(0)
+  for (const job of dropped) scheduled.delete(job.sessionId)
+
+  if (running > 0) {
+    await new Promise<void>((resolve) => {
+      idle = resolve
+    })
+  }
+  return dropped
+}
+
+function pump(fastify: FastifyInstance) {
+  while (accepting && running < FEEDBACK_CONCURRENCY && pending.length > 0) {
+    const job = pending.shift()!
+    running++
+    runJob(fastify, job).finally(() => {
+      running--
+      scheduled.delete(job.sessionId)
+      if (cluster.isWorker) {
+        process.send?.({ type: 'feedback-release', sessionId: job.sessionId } satisfies ClusterMessage)
+      }
+      if (running === 0 && idle) {
+        idle()
+        idle = null
+      }
+      pump(fastify)
+    })
+  }
+}
+
+async function runJob(fastify: FastifyInstance, job: FeedbackJob) {
+  const startedAt = Date.now()
+  counters.totalWaitMs += startedAt - job.enqueuedAt
+
+  try {
+    const session = await rehearsalService.getSession(fastify, job.userId, job.sessionId)
+    if (!session) {
+      throw Object.assign(new Error('会话不存在'), { statusCode: 404 })
+    }
+
+    const messages = await rehearsalService.getMessages(fastify, job.sessionId)
+    const { result: feedback, usage } = await rehearsalFeedback.generate(
+      messages.map((m) => ({ role: m.role, content: m.content })),
+      session.interviewerStyle,
+      (part) => emit(`${job.sessionId}:part`, part),
+      job.userId,
+    )
+
+    await rehearsalService.endSession(fastify, job.sessionId, feedback)
+    await recordTokenUsage(job.userId, usage)
+    recordUsage(fastify, job.userId, 'rehearsal')
+
+    counters.completed++
+    emit(job.sessionId, { status: 'completed', feedback } satisfies FeedbackOutcome)
+  } catch (error) {
+    counters.failed++
+    fastify.log.error({ err: error, sessionId: job.sessionId }, 'Feedback generation failed')
+    await rehearsalService.setStatus(fastify, job.sessionId, 'failed').catch(() => {})
+
+    const message = error instanceof Error ? error.message : '反馈生成失败，请重试'
+    emit(job.sessionId, { status: 'failed', message } satisfies FeedbackOutcome)
+  } finally {
+    counters.totalRunMs += Date.now() - startedAt
+  }
+}
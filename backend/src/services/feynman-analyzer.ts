@@ -1,48 +1,69 @@
-import { streamChat } from './ai.service.js'
+import { streamChat, type AiUsage } from './ai.service.js'
 import { FEYNMAN_SYSTEM_PROMPT } from '../prompts/feynman-system.js'
+import { JsonStreamParser } from '../utils/json-stream.js'
 
-interface FeynmanScores {
+export interface FeynmanScores {
   udi: number
   ddi: number
   cci: number
   total: number
 }
 
-interface FeynmanAnalysisResult {
+interface FeynmanImprovement {
+  issue: string
+  suggestion: string
+  example: string
+}
+
+export interface FeynmanAnalysisResult {
   scores: FeynmanScores
   analysis: Record<string, { score: number; feedback: string; issues: string[] }>
-  improvements: Array<{ issue: string; suggestion: string; example: string }>
+  improvements: FeynmanImprovement[]
   summary: string
 }
 
+/** A piece of the result, emitted as soon as the model has finished writing it. */
+export type FeynmanPart =
+  | { type: 'score'; dimension: keyof FeynmanScores; score: number }
+  | { type: 'improvement'; index: number; improvement: FeynmanImprovement }
+
+/** Parser that reports each score and improvement of a Feynman result as it completes. */
+export function createPartParser(onPart: (part: FeynmanPart) => void): JsonStreamParser {
+  return new JsonStreamParser((path, value) => {
+    if (path.length !== 2) return
+    if (path[0] === 'scores' && typeof value === 'number') {
+      onPart({ type: 'score', dimension: path[1] as keyof FeynmanScores, score: value })
+    } else if (path[0] === 'improvements' && typeof value === 'object' && value !== null) {
+      onPart({ type: 'improvement', index: path[1] as number, improvement: value as FeynmanImprovement })
+    }
+  })
+}
+
 export async function analyze(
   starStory: string,
   onChunk: (chunk: string) => void,
+  onPart: (part: FeynmanPart) => void,
   signal?: AbortSignal,
-): Promise<FeynmanAnalysisResult> {
-  let fullResponse = ''
+  userId?: string,
+): Promise<{ result: FeynmanAnalysisResult; usage: AiUsage }> {
+  const parser = createPartParser(onPart)
 
-  await streamChat({
+  const usage = await streamChat({
     systemPrompt: FEYNMAN_SYSTEM_PROMPT,
     userMessage: `Please analyze the following STAR story:\n\n${starStory}`,
     onChunk: (chunk) => {
       onChunk(chunk)
+      parser.write(chunk)
     },
-    onDone: (response) => {
-      fullResponse = response
-    },
+    onDone: () => {},
     signal,
+    priority: 'analysis',
+    userId,
   })
 
-  const jsonMatch = fullResponse.match(/\{[\s\S]*\}/)
-  if (!jsonMatch) {
-    throw new Error('AI 分析结果解析失败，请重试')
-  }
-
   try {
-    const result: FeynmanAnalysisResult = JSON.parse(jsonMatch[0])
-    return result
+    return { result: parser.end() as unknown as FeynmanAnalysisResult, usage }
   } catch {
-    throw new Error('AI 返回了格式错误的数据，请重试')
+    throw new Error(parser.started ? 'AI 返回了格式错误的数据，请重试' : 'AI 分析结果解析失败，请重试')
   }
 }
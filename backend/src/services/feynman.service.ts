@@ -1,4 +1,7 @@
 import type { FastifyInstance } from 'fastify'
+import { HISTORY_ORDER, keysetWhere, pageWindow, takePage, type PageRequest } from '../utils/pagination.js'
+import { summaryScore } from '../utils/summary.js'
+import { countHistory, invalidateHistoryCount } from './history-counts.js'
 
 export async function createSession(fastify: FastifyInstance, userId: string, title?: string) {
   const session = await fastify.prisma.feynmanSession.create({
@@ -9,28 +12,26 @@ export async function createSession(fastify: FastifyInstance, userId: string, ti
     },
     select: { id: true, createdAt: true },
   })
+  invalidateHistoryCount('feynman', userId)
 
   return { sessionId: session.id, createdAt: session.createdAt }
 }
 
-export async function getHistory(
-  fastify: FastifyInstance,
-  userId: string,
-  page: number,
-  limit: number,
-) {
-  const [sessions, total] = await Promise.all([
+export async function getHistory(fastify: FastifyInstance, userId: string, request: PageRequest) {
+  const [rows, total] = await Promise.all([
     fastify.prisma.feynmanSession.findMany({
-      where: { userId },
-      select: { id: true, title: true, scores: true, createdAt: true },
-      orderBy: { createdAt: 'desc' },
-      skip: (page - 1) * limit,
-      take: limit,
+      where: { userId, ...keysetWhere(request.cursor) },
+      select: { id: true, title: true, totalScore: true, createdAt: true },
+      orderBy: HISTORY_ORDER,
+      ...pageWindow(request),
     }),
-    fastify.prisma.feynmanSession.count({ where: { userId } }),
+    request.withTotal
+      ? countHistory('feynman', userId, () => fastify.prisma.feynmanSession.count({ where: { userId } }))
+      : null,
   ])
 
-  return { sessions, total }
+  const { items: sessions, nextCursor } = takePage(rows, request.limit)
+  return { sessions, total, nextCursor }
 }
 
 export async function getSession(fastify: FastifyInstance, userId: string, sessionId: string) {
@@ -48,6 +49,37 @@ export async function updateSessionResult(
 ) {
   return fastify.prisma.feynmanSession.update({
     where: { id: sessionId },
-    data: { starStory, analysisResult: analysisResult as object, scores: scores as object },
+    data: {
+      starStory,
+      analysisResult: analysisResult as object,
+      scores: scores as object,
+      totalScore: summaryScore(scores),
+    },
   })
 }
+
+/**
+ * Fill `totalScore` for results stored before the column existed. Unanalyzed
+ * sessions have an empty `starStory`, so only analyzed rows are read.
+ */
+export async function backfillTotalScores(fastify: FastifyInstance, batchSize = 200): Promise<number> {
+  let updated = 0
+  let after = ''
+  for (;;) {
+    const rows = await fastify.prisma.feynmanSession.findMany({
+      where: { totalScore: null, starStory: { not: '' }, id: { gt: after } },
+      select: { id: true, scores: true },
+      orderBy: { id: 'asc' },
+      take: batchSize,
+    })
+    if (rows.length === 0) return updated
+
+    for (const row of rows) {
+      const totalScore = summaryScore(row.scores)
+      if (totalScore === null) continue
+      await fastify.prisma.feynmanSession.update({ where: { id: row.id }, data: { totalScore } })
+      updated++
+    }
+    after = rows[rows.length - 1]!.id
+  }
+}
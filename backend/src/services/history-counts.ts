@@ -0,0 +1,28 @@
+import { LruCache } from '../utils/lru-cache.js'
+
+const HISTORY_COUNT_TTL_MS = Number(process.env['HISTORY_COUNT_TTL_MS'] ?? 60_000)
+
+export type HistoryKind = 'feynman' | 'layers' | 'rehearsal'
+
+// Per process: in cluster mode another worker's count can lag by up to the TTL after a create
+const counts = new LruCache<string, number>({ maxEntries: 10_000, ttlMs: HISTORY_COUNT_TTL_MS })
+
+/** History total for a user, from cache when fresh; `count` runs the query on a miss. */
+export async function countHistory(kind: HistoryKind, userId: string, count: () => Promise<number>): Promise<number> {
+  const key = `${kind}:${userId}`
+  const cached = counts.get(key)
+  if (cached !== undefined) return cached
+
+  const total = await count()
+  counts.set(key, total)
+  return total
+}
+
+/** Call after creating a history row so the next page view counts again. */
+export function invalidateHistoryCount(kind: HistoryKind, userId: string): void {
+  counts.delete(`${kind}:${userId}`)
+}
+
+export function getHistoryCountStats() {
+  return { ttlMs: HISTORY_COUNT_TTL_MS, ...counts.stats() }
+}
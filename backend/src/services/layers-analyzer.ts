@@ -1,7 +1,8 @@
-import { streamChat } from './ai.service.js'
+import { streamChat, type AiUsage } from './ai.service.js'
 import { LAYERS_SYSTEM_PROMPT } from '../prompts/layers-system.js'
+import { JsonStreamParser } from '../utils/json-stream.js'
 
-interface Layer {
+export interface Layer {
   layerIndex: number
   title: string
   content: string
@@ -15,7 +16,7 @@ interface Suggestion {
   priority: string
 }
 
-interface LayersAnalysisResult {
+export interface LayersAnalysisResult {
   layers: Layer[]
   suggestions: Suggestion[]
 }
@@ -25,39 +26,35 @@ export async function analyze(
   onLayer: (layer: Layer) => void,
   onDone: () => void,
   signal?: AbortSignal,
-): Promise<LayersAnalysisResult> {
-  let fullResponse = ''
+  userId?: string,
+): Promise<{ result: LayersAnalysisResult; usage: AiUsage }> {
+  // Each layer is emitted as soon as the model closes its object
+  const parser = new JsonStreamParser((path, value) => {
+    if (path.length === 2 && path[0] === 'layers' && typeof value === 'object' && value !== null) {
+      onLayer(value as Layer)
+    }
+  })
 
-  await streamChat({
+  const usage = await streamChat({
     systemPrompt: LAYERS_SYSTEM_PROMPT,
     userMessage: `Please analyze the following career confusion:\n\n${inputText}`,
-    onChunk: () => {
-      // Chunks streamed but we parse at the end for structured data
-    },
-    onDone: (response) => {
-      fullResponse = response
+    onChunk: (chunk) => {
+      parser.write(chunk)
     },
+    onDone: () => {},
     signal,
+    priority: 'analysis',
+    userId,
   })
 
-  const jsonMatch = fullResponse.match(/\{[\s\S]*\}/)
-  if (!jsonMatch) {
-    throw new Error('AI 分析结果解析失败，请重试')
-  }
-
   let result: LayersAnalysisResult
   try {
-    result = JSON.parse(jsonMatch[0])
+    result = parser.end() as unknown as LayersAnalysisResult
   } catch {
-    throw new Error('AI 返回了格式错误的数据，请重试')
-  }
-
-  // Emit each layer for SSE streaming
-  for (const layer of result.layers) {
-    onLayer(layer)
+    throw new Error(parser.started ? 'AI 返回了格式错误的数据，请重试' : 'AI 分析结果解析失败，请重试')
   }
 
   onDone()
 
-  return result
+  return { result, usage }
 }
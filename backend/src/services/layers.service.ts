@@ -1,4 +1,6 @@
 import type { FastifyInstance } from 'fastify'
+import { HISTORY_ORDER, keysetWhere, pageWindow, takePage, type PageRequest } from '../utils/pagination.js'
+import { countHistory, invalidateHistoryCount } from './history-counts.js'
 
 export async function createSession(fastify: FastifyInstance, userId: string, title?: string) {
   const session = await fastify.prisma.layerAnalysis.create({
@@ -9,28 +11,26 @@ export async function createSession(fastify: FastifyInstance, userId: string, ti
     },
     select: { id: true, createdAt: true },
   })
+  invalidateHistoryCount('layers', userId)
 
   return { sessionId: session.id, createdAt: session.createdAt }
 }
 
-export async function getHistory(
-  fastify: FastifyInstance,
-  userId: string,
-  page: number,
-  limit: number,
-) {
-  const [sessions, total] = await Promise.all([
+export async function getHistory(fastify: FastifyInstance, userId: string, request: PageRequest) {
+  const [rows, total] = await Promise.all([
     fastify.prisma.layerAnalysis.findMany({
-      where: { userId },
+      where: { userId, ...keysetWhere(request.cursor) },
       select: { id: true, title: true, createdAt: true },
-      orderBy: { createdAt: 'desc' },
-      skip: (page - 1) * limit,
-      take: limit,
+      orderBy: HISTORY_ORDER,
+      ...pageWindow(request),
     }),
-    fastify.prisma.layerAnalysis.count({ where: { userId } }),
+    request.withTotal
+      ? countHistory('layers', userId, () => fastify.prisma.layerAnalysis.count({ where: { userId } }))
+      : null,
   ])
 
-  return { sessions, total }
+  const { items: sessions, nextCursor } = takePage(rows, request.limit)
+  return { sessions, total, nextCursor }
 }
 
 export async function getSession(fastify: FastifyInstance, userId: string, sessionId: string) {
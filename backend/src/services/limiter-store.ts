@@ -0,0 +1,128 @@
+import { RedisClient } from '../utils/redis-client.js'
+
+/**
+ * Counters behind the HTTP rate limits and the per-user AI limits. The
+ * memory store is per process; the Redis store is shared by every process
+ * pointed at the same REDIS_URL, so limits hold when running more than one.
+ */
+export interface LimiterStore {
+  readonly kind: 'memory' | 'redis'
+  /** Add `amount` to a fixed-window counter; the window starts with the first hit. */
+  incr(key: string, windowMs: number, amount?: number): Promise<{ count: number; ttlMs: number }>
+  /** Take one of `limit` slots. `ttlMs` bounds how long a slot leaked by a crashed process lives. */
+  acquire(key: string, limit: number, ttlMs: number): Promise<boolean>
+  release(key: string): Promise<void>
+  close(): Promise<void>
+}
+
+const KEY_PREFIX = 'mingjing:'
+
+export class MemoryLimiterStore implements LimiterStore {
+  readonly kind = 'memory'
+  private windows = new Map<string, { count: number; resetAt: number }>()
+  private slots = new Map<string, number>()
+  private writes = 0
+
+  async incr(key: string, windowMs: number, amount = 1) {
+    const now = Date.now()
+    let entry = this.windows.get(key)
+    if (!entry || entry.resetAt <= now) {
+      entry = { count: 0, resetAt: now + windowMs }
+      this.windows.set(key, entry)
+    }
+    entry.count += amount
+    if (++this.writes % 1000 === 0) this.sweep(now)
+    return { count: entry.count, ttlMs: entry.resetAt - now }
+  }
+
+  async acquire(key: string, limit: number) {
+    const held = this.slots.get(key) ?? 0
+    if (held >= limit) return false
+    this.slots.set(key, held + 1)
+    return true
+  }
+
+  async release(key: string) {
+    const held = (this.slots.get(key) ?? 0) - 1
+    if (held > 0) this.slots.set(key, held)
+    else this.slots.delete(key)
+  }
+
+  async close() {}
+
+  private sweep(now: number) {
+    for (const [key, entry] of this.windows) {
+      if (entry.resetAt <= now) this.windows.delete(key)
+    }
+  }
+}
+
+// Each script is one atomic round trip, so concurrent processes never interleave a read and its write
+const INCR_SCRIPT = `
+local n = redis.call('INCRBY', KEYS[1], ARGV[1])
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl < 0 then
+  redis.call('PEXPIRE', KEYS[1], ARGV[2])
+  ttl = tonumber(ARGV[2])
+end
+return {n, ttl}`
+
+const ACQUIRE_SCRIPT = `
+local n = redis.call('INCR', KEYS[1])
+if n > tonumber(ARGV[1]) then
+  redis.call('DECR', KEYS[1])
+  return 0
+end
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+return 1`
+
+const RELEASE_SCRIPT = `
+local n = redis.call('DECR', KEYS[1])
+if n <= 0 then redis.call('DEL', KEYS[1]) end
+return n`
+
+export class RedisLimiterStore implements LimiterStore {
+  readonly kind = 'redis'
+  private client: RedisClient
+
+  constructor(url: string) {
+    this.client = new RedisClient(new URL(url))
+  }
+
+  async incr(key: string, windowMs: number, amount = 1) {
+    const [count, ttlMs] = (await this.client.command('EVAL', INCR_SCRIPT, 1, KEY_PREFIX + key, amount, windowMs)) as number[]
+    return { count: count!, ttlMs: ttlMs! }
+  }
+
+  async acquire(key: string, limit: number, ttlMs: number) {
+    return (await this.client.command('EVAL', ACQUIRE_SCRIPT, 1, KEY_PREFIX + key, limit, ttlMs)) === 1
+  }
+
+  async release(key: string) {
+    await this.client.command('EVAL', RELEASE_SCRIPT, 1, KEY_PREFIX + key)
+  }
+
+  async close() {
+    this.client.close()
+  }
+}
+
+let store: LimiterStore | null = null
+
+/** RATE_LIMIT_STORE=memory|redis; defaults to redis when REDIS_URL is set. */
+export function getLimiterStore(): LimiterStore {
+  if (!store) {
+    const redisUrl = process.env['REDIS_URL']
+    const kind = process.env['RATE_LIMIT_STORE'] ?? (redisUrl ? 'redis' : 'memory')
+    if (kind === 'redis' && !redisUrl) {
+      throw new Error('RATE_LIMIT_STORE=redis requires REDIS_URL')
+    }
+    store = kind === 'redis' ? new RedisLimiterStore(redisUrl!) : new MemoryLimiterStore()
+  }
+  return store
+}
+
+export async function closeLimiterStore(): Promise<void> {
+  await store?.close()
+  store = null
+}
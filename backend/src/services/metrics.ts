@@ -0,0 +1,248 @@
+import cluster from 'node:cluster'
+import { AsyncLocalStorage } from 'node:async_hooks'
+import { monitorEventLoopDelay } from 'node:perf_hooks'
+import type { FastifyReply, FastifyRequest } from 'fastify'
+import { Counter, Histogram, gauge, statsGauges, type MetricFamily } from '../utils/metrics.js'
+import { getOpenStreamCount, getSSEResumeStats } from '../utils/sse.js'
+import type { ClusterMessage } from '../cluster.js'
+import { getAiUsageStats } from './ai.service.js'
+import { getAiLimitStats } from './ai-limits.js'
+import { getAiSchedulerStats } from './ai-scheduler.js'
+import { getAiResilienceStats } from './ai-resilience.js'
+import { getAnalysisCacheStats } from './analysis-cache.js'
+import { getFeedbackQueueStats } from './feedback-queue.js'
+import { getFirstQuestionCacheStats } from './rehearsal-interviewer.js'
+import { getHistoryCountStats } from './history-counts.js'
+import { getPasswordHasherStats } from './password-hasher.js'
+import { getUsageCounterStats } from './usage-counter.js'
+
+// Longer than the primary's own wait for worker snapshots (METRICS_SCRAPE_TIMEOUT_MS in cluster.ts)
+const CLUSTER_SCRAPE_TIMEOUT_MS = 2000
+
+const LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+const QUERY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1]
+const FIRST_TOKEN_BUCKETS = [0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60]
+const TOKEN_RATE_BUCKETS = [5, 10, 20, 40, 80, 160, 320, 640]
+
+const httpDuration = new Histogram(
+  'mingjing_http_request_duration_seconds',
+  'Request received to response finished; for SSE routes, to stream closed',
+  LATENCY_BUCKETS,
+)
+const httpPhases = new Counter(
+  'mingjing_http_request_phase_seconds_total',
+  'Wall time requests spent with a database query, upstream AI call or response serialization in flight',
+)
+const prismaDuration = new Histogram('mingjing_prisma_query_duration_seconds', 'Prisma model query time', QUERY_BUCKETS)
+const aiFirstToken = new Histogram(
+  'mingjing_ai_time_to_first_token_seconds',
+  'Upstream slot acquired to first streamed token',
+  FIRST_TOKEN_BUCKETS,
+)
+const aiTokenRate = new Histogram(
+  'mingjing_ai_output_tokens_per_second',
+  'Output tokens per second after the first token',
+  TOKEN_RATE_BUCKETS,
+)
+const aiTokens = new Counter('mingjing_ai_tokens_total', 'Tokens reported by the upstream, by type')
+const aiCalls = new Counter('mingjing_ai_calls_total', 'streamChat calls by priority and outcome')
+const rejections = new Counter(
+  'mingjing_rate_limit_rejections_total',
+  'Requests refused by a request rate limit, per-user AI limit or load shedding, by error code',
+)
+
+const eventLoopDelay = monitorEventLoopDelay({ resolution: 20 })
+eventLoopDelay.enable()
+
+export type RequestPhase = 'auth' | 'db' | 'upstream' | 'serialize'
+export const REQUEST_PHASES: RequestPhase[] = ['auth', 'db', 'upstream', 'serialize']
+// Names in Server-Timing and the SSE `timing` event
+const TIMING_NAMES: Record<RequestPhase, string> = { auth: 'auth', db: 'db', upstream: 'ai', serialize: 'serialize' }
+
+/** Per-request phase totals in ms. Overlapping spans of the same phase count once. */
+export interface RequestTimings {
+  phases: Record<RequestPhase, number>
+  inFlight: Record<RequestPhase, number>
+  since: Record<RequestPhase, number>
+  done: boolean
+}
+
+const requestContext = new AsyncLocalStorage<RequestTimings>()
+
+export function createRequestTimings(): RequestTimings {
+  return {
+    phases: { auth: 0, db: 0, upstream: 0, serialize: 0 },
+    inFlight: { auth: 0, db: 0, upstream: 0, serialize: 0 },
+    since: { auth: 0, db: 0, upstream: 0, serialize: 0 },
+    done: false,
+  }
+}
+
+/** Run the rest of a request's lifecycle with `timings` as the target of `startPhase`. */
+export function runWithRequestTimings(timings: RequestTimings, fn: () => void): void {
+  requestContext.run(timings, fn)
+}
+
+/**
+ * Start timing `phase` for the request this code runs on behalf of (no-op
+ * outside a request, or once it has finished). Returns a stop function that
+ * gives the span's own duration in seconds.
+ */
+export function startPhase(phase: RequestPhase, timings = requestContext.getStore()): () => number {
+  const startedAt = performance.now()
+  if (timings && !timings.done && timings.inFlight[phase]++ === 0) timings.since[phase] = startedAt
+  let stopped = false
+  return () => {
+    const now = performance.now()
+    if (!stopped && timings && !timings.done && --timings.inFlight[phase] === 0) {
+      timings.phases[phase] += now - timings.since[phase]
+    }
+    stopped = true
+    return (now - startedAt) / 1000
+  }
+}
+
+export interface TimingSummary {
+  requestId: string
+  totalMs: number
+  /** ms per phase under its Server-Timing name; spans still open count up to now. */
+  phases: Record<string, number>
+}
+
+/** The request's phase split so far, for Server-Timing and the SSE `timing` event. */
+export function timingSummary(reply: FastifyReply): TimingSummary {
+  const timings = reply.request.timings
+  const now = performance.now()
+  const phases: Record<string, number> = {}
+  for (const phase of REQUEST_PHASES) {
+    const open = timings && timings.inFlight[phase] > 0 ? now - timings.since[phase] : 0
+    phases[TIMING_NAMES[phase]] = Math.round(((timings?.phases[phase] ?? 0) + open) * 100) / 100
+  }
+  return { requestId: reply.request.id, totalMs: Math.round(reply.elapsedTime * 100) / 100, phases }
+}
+
+export function serverTimingHeader({ totalMs, phases }: TimingSummary): string {
+  return [...Object.entries(phases).map(([name, ms]) => `${name};dur=${ms}`), `total;dur=${totalMs}`].join(', ')
+}
+
+/** The route pattern, so label sets stay bounded; 404s share one label. */
+export function routeLabel(request: FastifyRequest): string {
+  return request.routeOptions.url ?? 'unmatched'
+}
+
+export function recordRequest(
+  method: string,
+  route: string,
+  statusCode: number,
+  seconds: number,
+  timings: RequestTimings,
+): void {
+  timings.done = true
+  httpDuration.observe({ method, route, status: String(statusCode) }, seconds)
+  for (const phase of REQUEST_PHASES) {
+    httpPhases.inc({ method, route, phase }, timings.phases[phase] / 1000)
+  }
+}
+
+export function recordPrismaQuery(model: string, operation: string, seconds: number): void {
+  prismaDuration.observe({ model, operation }, seconds)
+}
+
+export function recordAiCall(
+  priority: string,
+  outcome: 'ok' | 'error' | 'aborted',
+  stats: { firstTokenSeconds?: number; streamSeconds?: number; outputTokens?: number } = {},
+): void {
+  aiCalls.inc({ priority, outcome })
+  const { firstTokenSeconds, streamSeconds, outputTokens } = stats
+  if (firstTokenSeconds !== undefined) aiFirstToken.observe({ priority }, firstTokenSeconds)
+  if (streamSeconds && outputTokens) aiTokenRate.observe({ priority }, outputTokens / streamSeconds)
+}
+
+export function recordAiTokens(usage: Record<'input' | 'output' | 'cache_read' | 'cache_write', number>): void {
+  for (const [type, n] of Object.entries(usage)) {
+    if (n > 0) aiTokens.inc({ type }, n)
+  }
+}
+
+export function recordRejection(code: string, route: string): void {
+  rejections.inc({ code, route })
+}
+
+/** This process's metrics: the hot-path instruments above plus every component's stats getter. */
+export function collectMetrics(): MetricFamily[] {
+  const memory = process.memoryUsage()
+  return [
+    httpDuration.collect(),
+    httpPhases.collect(),
+    prismaDuration.collect(),
+    aiFirstToken.collect(),
+    aiTokenRate.collect(),
+    aiTokens.collect(),
+    aiCalls.collect(),
+    rejections.collect(),
+    gauge('mingjing_sse_streams_active', 'SSE streams still writing', [[{}, getOpenStreamCount()]]),
+    gauge('mingjing_process_resident_memory_bytes', 'Resident set size', [[{}, memory.rss]]),
+    gauge('mingjing_process_heap_used_bytes', 'V8 heap in use', [[{}, memory.heapUsed]]),
+    gauge('mingjing_event_loop_delay_p99_seconds', 'Event loop delay p99 since start', [
+      [{}, eventLoopDelay.percentile(99) / 1e9],
+    ]),
+    ...statsGauges('mingjing_sse_resume', 'getSSEResumeStats', getSSEResumeStats()),
+    ...statsGauges('mingjing_ai_usage', 'getAiUsageStats', getAiUsageStats()),
+    ...statsGauges('mingjing_ai_limits', 'getAiLimitStats', getAiLimitStats()),
+    ...statsGauges('mingjing_ai_scheduler', 'getAiSchedulerStats', getAiSchedulerStats()),
+    ...statsGauges('mingjing_ai_resilience', 'getAiResilienceStats', getAiResilienceStats()),
+    ...statsGauges('mingjing_analysis_cache', 'getAnalysisCacheStats', getAnalysisCacheStats()),
+    ...statsGauges('mingjing_first_question_cache', 'getFirstQuestionCacheStats', { ...getFirstQuestionCacheStats() }),
+    ...statsGauges('mingjing_history_counts', 'getHistoryCountStats', getHistoryCountStats()),
+    ...statsGauges('mingjing_feedback_queue', 'getFeedbackQueueStats', getFeedbackQueueStats()),
+    ...statsGauges('mingjing_password_hasher', 'getPasswordHasherStats', getPasswordHasherStats()),
+    ...statsGauges('mingjing_usage_counter', 'getUsageCounterStats', getUsageCounterStats()),
+  ]
+}
+
+function withLabels(families: MetricFamily[], labels: Record<string, string>): MetricFamily[] {
+  return families.map((f) => ({ ...f, samples: f.samples.map((s) => ({ ...s, labels: { ...labels, ...s.labels } })) }))
+}
+
+let nextScrapeId = 0
+const pendingScrapes = new Map<number, (families: MetricFamily[]) => void>()
+
+if (cluster.isWorker) {
+  process.on('message', (message: ClusterMessage) => {
+    if (message.type === 'metrics-collect') {
+      process.send?.({
+        type: 'metrics-snapshot',
+        id: message.id,
+        requester: message.requester,
+        families: withLabels(collectMetrics(), { worker: String(cluster.worker?.id) }),
+      } satisfies ClusterMessage)
+    } else if (message.type === 'metrics-snapshots') {
+      pendingScrapes.get(message.id)?.(message.families)
+    }
+  })
+}
+
+/**
+ * Metrics for the whole server. In a cluster a scrape lands on one worker, so
+ * that worker gathers every live worker's snapshot through the primary, each
+ * labelled `worker`; a worker that does not answer in time is left out.
+ */
+export async function collectServerMetrics(): Promise<MetricFamily[]> {
+  if (!cluster.isWorker || !process.connected) return collectMetrics()
+
+  const id = nextScrapeId++
+  const local = withLabels(collectMetrics(), { worker: String(cluster.worker?.id) })
+  return new Promise((resolve) => {
+    const timer = setTimeout(() => {
+      pendingScrapes.delete(id)
+      resolve(local)
+    }, CLUSTER_SCRAPE_TIMEOUT_MS)
+    pendingScrapes.set(id, (families) => {
+      clearTimeout(timer)
+      pendingScrapes.delete(id)
+      resolve(families)
+    })
+    process.send?.({ type: 'metrics-request', id } satisfies ClusterMessage)
+  })
+}
@@ -0,0 +1,177 @@
+import { Worker } from 'node:worker_threads'
+import { createRequire } from 'node:module'
+import { availableParallelism } from 'node:os'
+import { startPhase } from './metrics.js'
+
+const SALT_ROUNDS = 12
+// bcrypt's async API shares libuv's 4-thread pool with fs/dns/zlib; these threads are ours alone
+const HASH_WORKERS = Math.max(1, Number(process.env['PASSWORD_HASH_WORKERS'] ?? Math.min(4, Math.max(1, availableParallelism() - 1))))
+const HASH_QUEUE_LIMIT = Math.max(0, Number(process.env['PASSWORD_HASH_QUEUE_LIMIT'] ?? 64))
+// Retry-After for register/login refused because hashing is saturated or shutting down
+export const HASH_RETRY_AFTER_SECONDS = 5
+
+// Inline CommonJS so the same code runs under tsx and from dist/ without a separate entry file
+const WORKER_SOURCE = `
+const { parentPort, workerData } = require('node:worker_threads')
+const bcrypt = require(workerData.bcryptPath)
+parentPort.on('message', (job) => {
+  const startedAt = performance.now()
+  try {
+    const result = job.op === 'hash'
+      ? bcrypt.hashSync(job.password, job.rounds)
+      : bcrypt.compareSync(job.password, job.hash)
+    parentPort.postMessage({ id: job.id, result, hashMs: performance.now() - startedAt })
+  } catch (error) {
+    parentPort.postMessage({ id: job.id, error: String(error && error.message || error) })
+  }
+})
+`
+
+type HashRequest = { op: 'hash'; password: string; rounds: number } | { op: 'compare'; password: string; hash: string }
+
+interface HashJob {
+  id: number
+  request: HashRequest
+  enqueuedAt: number
+  resolve: (result: string | boolean) => void
+  reject: (error: Error) => void
+}
+
+interface PoolWorker {
+  worker: Worker
+  job: HashJob | null
+}
+
+interface WorkerReply {
+  id: number
+  result?: string | boolean
+  hashMs?: number
+  error?: string
+}
+
+const bcryptPath = createRequire(import.meta.url).resolve('bcrypt')
+const workers: PoolWorker[] = []
+const pending: HashJob[] = []
+let nextId = 0
+let stopped = false
+
+const counters = { completed: 0, failed: 0, rejected: 0, totalWaitMs: 0, maxWaitMs: 0, totalHashMs: 0 }
+
+export function isPasswordHasherSaturated(): boolean {
+  return stopped || (busyWorkers() === HASH_WORKERS && pending.length >= HASH_QUEUE_LIMIT)
+}
+
+export function hashPassword(password: string): Promise<string> {
+  return timedSubmit({ op: 'hash', password, rounds: SALT_ROUNDS }) as Promise<string>
+}
+
+export function verifyPassword(password: string, hash: string): Promise<boolean> {
+  return timedSubmit({ op: 'compare', password, hash }) as Promise<boolean>
+}
+
+/** Queue wait and hashing both count as the calling request's `auth` time. */
+function timedSubmit(request: HashRequest): Promise<string | boolean> {
+  const stop = startPhase('auth')
+  return submit(request).finally(stop)
+}
+
+export function getPasswordHasherStats() {
+  const finished = counters.completed + counters.failed
+  return {
+    workers: HASH_WORKERS,
+    queueLimit: HASH_QUEUE_LIMIT,
+    busy: busyWorkers(),
+    queued: pending.length,
+    completed: counters.completed,
+    failed: counters.failed,
+    rejected: counters.rejected,
+    avgWaitMs: finished ? counters.totalWaitMs / finished : 0,
+    maxWaitMs: counters.maxWaitMs,
+    avgHashMs: counters.completed ? counters.totalHashMs / counters.completed : 0,
+  }
+}
+
+/** Reject queued jobs and terminate the worker threads. */
+export async function stopPasswordHasher(): Promise<void> {
+  stopped = true
+  for (const job of pending.splice(0)) {
+    job.reject(queueFull('服务正在重启，请稍后再试'))
+  }
+  await Promise.all(workers.splice(0).map(({ worker }) => worker.terminate()))
+}
+
+// Same response as the routes' saturation preHandler, for a queue that fills up after it ran
+function queueFull(message: string): Error {
+  return Object.assign(new Error(message), { statusCode: 503, code: 'QUEUE_FULL', retryAfter: HASH_RETRY_AFTER_SECONDS })
+}
+
+function busyWorkers(): number {
+  return workers.filter((w) => w.job).length
+}
+
+function submit(request: HashRequest): Promise<string | boolean> {
+  if (isPasswordHasherSaturated()) {
+    counters.rejected++
+    return Promise.reject(queueFull('当前登录人数过多，请稍后再试'))
+  }
+
+  return new Promise((resolve, reject) => {
+    pending.push({ id: nextId++, request, enqueuedAt: performance.now(), resolve, reject })
+    dispatch()
+  })
+}
+
+function dispatch() {
+  while (pending.length > 0) {
+    const idle = workers.find((w) => !w.job) ?? (workers.length < HASH_WORKERS ? spawn() : null)
+    if (!idle) return
+
+    const job = pending.shift()!
+    const waitMs = performance.now() - job.enqueuedAt
+    counters.totalWaitMs += waitMs
+    counters.maxWaitMs = Math.max(counters.maxWaitMs, waitMs)
+
+    idle.job = job
+    idle.worker.postMessage({ id: job.id, ...job.request })
+  }
+}
+
+function spawn(): PoolWorker {
+  const entry: PoolWorker = { worker: new Worker(WORKER_SOURCE, { eval: true, workerData: { bcryptPath } }), job: null }
+  // Idle workers must not keep the process alive
+  entry.worker.unref()
+
+  entry.worker.on('message', (reply: WorkerReply) => {
+    const job = entry.job
+    entry.job = null
+    if (job && job.id === reply.id) {
+      if (reply.error !== undefined) {
+        counters.failed++
+        job.reject(new Error(reply.error))
+      } else {
+        counters.completed++
+        counters.totalHashMs += reply.hashMs ?? 0
+        job.resolve(reply.result!)
+      }
+    }
+    dispatch()
+  })
+
+  // A crashed worker fails its job and is replaced on the next dispatch. 'exit' also covers a
+  // worker that stops without an 'error' event, and follows 'error' when there was one.
+  const retire = (error: Error) => {
+    const index = workers.indexOf(entry)
+    if (index !== -1) workers.splice(index, 1)
+    if (entry.job) {
+      counters.failed++
+      entry.job.reject(stopped ? queueFull('服务正在重启，请稍后再试') : error)
+      entry.job = null
+    }
+    if (!stopped) dispatch()
+  }
+  entry.worker.on('error', retire)
+  entry.worker.on('exit', (exitCode) => retire(new Error(`密码处理线程已退出 (code ${exitCode})`)))
+
+  workers.push(entry)
+  return entry
+}
@@ -1,5 +1,6 @@
-import { streamChat } from './ai.service.js'
+import { streamChat, type AiUsage } from './ai.service.js'
 import { REHEARSAL_FEEDBACK_PROMPT } from '../prompts/rehearsal-feedback.js'
+import { JsonStreamParser } from '../utils/json-stream.js'
 
 interface Message {
   role: 'user' | 'assistant'
@@ -21,6 +22,11 @@ interface FeedbackDimension {
   suggestion: string
 }
 
+/** A piece of the feedback, emitted as soon as the model has finished writing it. */
+export type FeedbackPart =
+  | { type: 'score'; dimension: keyof FeedbackScores; score: number }
+  | { type: 'improvement'; index: number; improvement: string }
+
 interface FeedbackResult {
   scores: FeedbackScores
   dimensions: FeedbackDimension[]
@@ -29,31 +35,39 @@ interface FeedbackResult {
   summary: string
 }
 
-export async function generate(messages: Message[], style: string): Promise<FeedbackResult> {
+export async function generate(
+  messages: Message[],
+  style: string,
+  onPart: (part: FeedbackPart) => void = () => {},
+  userId?: string,
+): Promise<{ result: FeedbackResult; usage: AiUsage }> {
   const conversationText = messages
     .map((m) => `${m.role === 'assistant' ? '面试官' : '候选人'}: ${m.content}`)
     .join('\n\n')
 
-  let fullResponse = ''
+  const parser = new JsonStreamParser((path, value) => {
+    if (path.length !== 2) return
+    if (path[0] === 'scores' && typeof value === 'number') {
+      onPart({ type: 'score', dimension: path[1] as keyof FeedbackScores, score: value })
+    } else if (path[0] === 'improvements' && typeof value === 'string') {
+      onPart({ type: 'improvement', index: path[1] as number, improvement: value })
+    }
+  })
 
-  await streamChat({
+  const usage = await streamChat({
     systemPrompt: REHEARSAL_FEEDBACK_PROMPT,
     userMessage: `Interview style: ${style}\n\nFull interview transcript:\n\n${conversationText}`,
-    onChunk: () => {},
-    onDone: (response) => {
-      fullResponse = response
+    onChunk: (chunk) => {
+      parser.write(chunk)
     },
+    onDone: () => {},
+    priority: 'background',
+    userId,
   })
 
-  const jsonMatch = fullResponse.match(/\{[\s\S]*\}/)
-  if (!jsonMatch) {
-    throw new Error('反馈生成失败，请重试')
-  }
-
   try {
-    const result: FeedbackResult = JSON.parse(jsonMatch[0])
-    return result
+    return { result: parser.end() as unknown as FeedbackResult, usage }
   } catch {
-    throw new Error('反馈数据格式错误，请重试')
+    throw new Error(parser.started ? '反馈数据格式错误，请重试' : '反馈生成失败，请重试')
   }
 }
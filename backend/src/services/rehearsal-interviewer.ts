@@ -1,7 +1,10 @@
-import { streamChat } from './ai.service.js'
+import { streamChat, type AiUsage } from './ai.service.js'
+import type { AiPriority } from './ai-scheduler.js'
+import { recordTokenUsage } from './ai-limits.js'
 import { REHEARSAL_BEHAVIORAL_PROMPT } from '../prompts/rehearsal-behavioral.js'
 import { REHEARSAL_TECHNICAL_PROMPT } from '../prompts/rehearsal-technical.js'
 import { REHEARSAL_STRESS_PROMPT } from '../prompts/rehearsal-stress.js'
+import { LruCache } from '../utils/lru-cache.js'
 
 type InterviewerStyle = 'behavioral' | 'technical' | 'stress'
 
@@ -20,28 +23,135 @@ export function getSystemPrompt(style: InterviewerStyle): string {
   return PROMPT_MAP[style]
 }
 
-export async function getFirstQuestion(
+async function generateFirstQuestion(
   style: InterviewerStyle,
   scenario: string,
+  priority: AiPriority,
+  userId?: string,
 ): Promise<string> {
   const systemPrompt = getSystemPrompt(style)
   let question = ''
 
-  await streamChat({
+  const usage = await streamChat({
     systemPrompt,
     userMessage: `面试场景：${scenario}\n\n请开始面试，提出你的第一个问题。`,
     onChunk: () => {},
     onDone: (response) => {
       question = response
     },
+    priority,
+    userId,
   })
+  if (userId) await recordTokenUsage(userId, usage)
 
   return question
 }
 
+// Opening questions only depend on (style, scenario), and most users pick from a
+// small set of scenarios, so cache a small pool of variants per key.
+const variantsSetting = Number.parseInt(process.env['FIRST_QUESTION_VARIANTS'] ?? '', 10)
+const FIRST_QUESTION_VARIANTS = Math.max(1, Number.isFinite(variantsSetting) ? variantsSetting : 3)
+
+const firstQuestionCache = new LruCache<string, string[]>({
+  maxEntries: Number(process.env['FIRST_QUESTION_CACHE_SIZE'] ?? 500),
+  ttlMs: Number(process.env['FIRST_QUESTION_CACHE_TTL_MS'] ?? 6 * 60 * 60 * 1000),
+})
+
+const pendingQuestions = new Map<string, Promise<string>>()
+
+function firstQuestionKey(style: InterviewerStyle, scenario: string): string {
+  return `${style}:${scenario.trim().replace(/\s+/g, ' ').toLowerCase()}`
+}
+
+/**
+ * Generate one more variant for `key`, sharing the call with any concurrent request for it.
+ * `interactive` when a user is waiting on it, `background` for pool fills. The tokens count
+ * against the budget of `userId`, the user whose request caused the call; startup prewarming
+ * has none and shows up only in the process-wide usage totals.
+ */
+function addVariant(
+  key: string,
+  style: InterviewerStyle,
+  scenario: string,
+  priority: AiPriority,
+  userId?: string,
+): Promise<string> {
+  const pending = pendingQuestions.get(key)
+  if (pending) return pending
+
+  const promise = generateFirstQuestion(style, scenario, priority, userId)
+    .then((question) => {
+      const variants = firstQuestionCache.peek(key) ?? []
+      if (question && !variants.includes(question)) {
+        firstQuestionCache.set(key, [...variants, question].slice(-FIRST_QUESTION_VARIANTS))
+      }
+      return question
+    })
+    .finally(() => pendingQuestions.delete(key))
+
+  pendingQuestions.set(key, promise)
+  return promise
+}
+
+export interface FirstQuestionResult {
+  question: string
+  cacheHit: boolean
+}
+
+export async function getFirstQuestion(
+  style: InterviewerStyle,
+  scenario: string,
+  userId: string,
+): Promise<FirstQuestionResult> {
+  const key = firstQuestionKey(style, scenario)
+  const variants = firstQuestionCache.get(key)
+
+  if (!variants?.length) {
+    return { question: await addVariant(key, style, scenario, 'interactive', userId), cacheHit: false }
+  }
+
+  if (variants.length < FIRST_QUESTION_VARIANTS) {
+    // Grow the pool in the background; a failed fill just leaves it smaller
+    addVariant(key, style, scenario, 'background', userId).catch(() => {})
+  }
+
+  const question = variants[Math.floor(Math.random() * variants.length)] ?? variants[0]!
+  return { question, cacheHit: true }
+}
+
+/** Fill the variant pool for every style × scenario; failures are reported, not thrown. */
+export async function prewarmFirstQuestions(
+  scenarios: string[],
+): Promise<{ warmed: number; failed: number }> {
+  const styles = Object.keys(PROMPT_MAP) as InterviewerStyle[]
+  let warmed = 0
+  let failed = 0
+
+  for (const scenario of scenarios) {
+    for (const style of styles) {
+      const key = firstQuestionKey(style, scenario)
+      for (let i = (firstQuestionCache.peek(key)?.length ?? 0); i < FIRST_QUESTION_VARIANTS; i++) {
+        try {
+          await addVariant(key, style, scenario, 'background')
+          warmed++
+        } catch {
+          failed++
+        }
+      }
+    }
+  }
+
+  return { warmed, failed }
+}
+
+export function getFirstQuestionCacheStats() {
+  return firstQuestionCache.stats()
+}
+
 interface RespondResult {
   content: string
   isInterviewEnd: boolean
+  usage: AiUsage
 }
 
 export async function respond(
@@ -50,12 +160,14 @@ export async function respond(
   messages: Message[],
   onChunk: (chunk: string) => void,
   signal?: AbortSignal,
+  userId?: string,
 ): Promise<RespondResult> {
   const systemPrompt = getSystemPrompt(style)
   let fullResponse = ''
 
   const scenarioPrefix = { role: 'user' as const, content: `面试场景：${scenario}` }
-  const scenarioAck = { role: 'assistant' as const, content: '好的，我已了解面试场景。请开始。' }
+  // The scenario pair is identical on every turn, so it ends a cached prefix of its own
+  const scenarioAck = { role: 'assistant' as const, content: '好的，我已了解面试场景。请开始。', cache: true }
 
   const apiMessages = [
     scenarioPrefix,
@@ -66,7 +178,7 @@ export async function respond(
     })),
   ]
 
-  await streamChat({
+  const usage = await streamChat({
     systemPrompt,
     userMessage: apiMessages[apiMessages.length - 1]?.content ?? '',
     messages: apiMessages.slice(0, -1),
@@ -75,6 +187,8 @@ export async function respond(
       fullResponse = response
     },
     signal,
+    priority: 'interactive',
+    userId,
   })
 
   const isInterviewEnd = fullResponse.includes('[INTERVIEW_END]')
@@ -82,5 +196,5 @@ export async function respond(
     ? fullResponse.replace('[INTERVIEW_END]', '').trim()
     : fullResponse
 
-  return { content, isInterviewEnd }
+  return { content, isInterviewEnd, usage }
 }
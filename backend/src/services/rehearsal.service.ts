@@ -1,4 +1,8 @@
+import { Prisma } from '@prisma/client'
 import type { FastifyInstance } from 'fastify'
+import { HISTORY_ORDER, keysetWhere, pageWindow, takePage, type PageRequest } from '../utils/pagination.js'
+import { summaryScore } from '../utils/summary.js'
+import { countHistory, invalidateHistoryCount } from './history-counts.js'
 
 // 8 rounds × 2 messages/round + 1 initial = 17, cap at 20 for safety
 const MAX_MESSAGES = 20
@@ -9,6 +13,27 @@ interface Message {
   timestamp: string
 }
 
+// Everything but the legacy transcript column
+const SESSION_FIELDS = {
+  id: true,
+  userId: true,
+  scenario: true,
+  interviewerStyle: true,
+  messageCount: true,
+  feedback: true,
+  totalScore: true,
+  status: true,
+  createdAt: true,
+} satisfies Prisma.RehearsalSessionSelect
+
+function toMessage(row: { role: string; content: string; createdAt: Date }): Message {
+  return {
+    role: row.role as Message['role'],
+    content: row.content,
+    timestamp: row.createdAt.toISOString(),
+  }
+}
+
 export async function createSession(
   fastify: FastifyInstance,
   userId: string,
@@ -16,70 +41,71 @@ export async function createSession(
   interviewerStyle: string,
   firstQuestion: string,
 ) {
-  const initialMessages: Message[] = [
-    {
-      role: 'assistant',
-      content: firstQuestion,
-      timestamp: new Date().toISOString(),
-    },
-  ]
-
   const session = await fastify.prisma.rehearsalSession.create({
     data: {
       userId,
       scenario,
       interviewerStyle,
-      messages: JSON.parse(JSON.stringify(initialMessages)),
+      messageCount: 1,
+      messages: {
+        create: { seq: 0, role: 'assistant', content: firstQuestion },
+      },
     },
     select: { id: true, createdAt: true },
   })
+  invalidateHistoryCount('rehearsal', userId)
 
   return { sessionId: session.id, firstQuestion, createdAt: session.createdAt }
 }
 
+/**
+ * Append one turn as its own row. The session's messageCount is bumped with a
+ * conditional update, so the MAX_MESSAGES check and the sequence number cost a
+ * single write no matter how long the transcript already is.
+ */
 export async function appendMessage(
   fastify: FastifyInstance,
   sessionId: string,
   role: 'user' | 'assistant',
   content: string,
-) {
-  const session = await fastify.prisma.rehearsalSession.findUnique({
-    where: { id: sessionId },
-    select: { messages: true },
-  })
+): Promise<Message> {
+  return fastify.prisma.$transaction(async (tx) => {
+    let messageCount: number
+    try {
+      const session = await tx.rehearsalSession.update({
+        where: { id: sessionId, messageCount: { lt: MAX_MESSAGES } },
+        data: { messageCount: { increment: 1 } },
+        select: { messageCount: true },
+      })
+      messageCount = session.messageCount
+    } catch (error) {
+      if (error instanceof Prisma.PrismaClientKnownRequestError && error.code === 'P2025') {
+        const exists = await tx.rehearsalSession.count({ where: { id: sessionId } })
+        if (!exists) {
+          throw Object.assign(new Error('会话不存在'), { statusCode: 404 })
+        }
+        throw Object.assign(new Error('对话轮次已达上限，请结束面试'), { statusCode: 400 })
+      }
+      throw error
+    }
 
-  if (!session) {
-    throw Object.assign(new Error('会话不存在'), { statusCode: 404 })
-  }
-
-  const messages = session.messages as unknown as Message[]
-
-  if (messages.length >= MAX_MESSAGES) {
-    throw Object.assign(new Error('对话轮次已达上限，请结束面试'), { statusCode: 400 })
-  }
+    const row = await tx.rehearsalMessage.create({
+      data: { sessionId, seq: messageCount - 1, role, content },
+      select: { role: true, content: true, createdAt: true },
+    })
 
-  const updated = [
-    ...messages,
-    { role, content, timestamp: new Date().toISOString() },
-  ]
-
-  await fastify.prisma.rehearsalSession.update({
-    where: { id: sessionId },
-    data: { messages: JSON.parse(JSON.stringify(updated)) },
+    return toMessage(row)
   })
 }
 
 export async function getMessages(fastify: FastifyInstance, sessionId: string): Promise<Message[]> {
-  const session = await fastify.prisma.rehearsalSession.findUnique({
-    where: { id: sessionId },
-    select: { messages: true },
+  const rows = await fastify.prisma.rehearsalMessage.findMany({
+    where: { sessionId },
+    select: { role: true, content: true, createdAt: true },
+    orderBy: { seq: 'asc' },
   })
 
-  if (!session) {
-    throw Object.assign(new Error('会话不存在'), { statusCode: 404 })
-  }
-
-  return session.messages as unknown as Message[]
+  return rows.map(toMessage)
 }
 
 export async function endSession(
@@ -92,10 +118,42 @@ export async function endSession(
     data: {
       status: 'completed',
       feedback: feedback as object,
+      totalScore: summaryScore((feedback as { scores?: unknown } | null)?.scores),
     },
   })
 }
 
+/**
+ * Claim a session for feedback generation. Returns false if another request
+ * already moved it to `generating`, so concurrent `end` calls queue one job.
+ */
+export async function markFeedbackGenerating(
+  fastify: FastifyInstance,
+  userId: string,
+  sessionId: string,
+): Promise<boolean> {
+  const { count } = await fastify.prisma.rehearsalSession.updateMany({
+    where: { id: sessionId, userId, status: { not: 'generating' } },
+    data: { status: 'generating' },
+  })
+  return count > 0
+}
+
+export async function setStatus(fastify: FastifyInstance, sessionId: string, status: string) {
+  await fastify.prisma.rehearsalSession.update({
+    where: { id: sessionId },
+    data: { status },
+  })
+}
+
+export async function getGeneratingSessions(fastify: FastifyInstance) {
+  return fastify.prisma.rehearsalSession.findMany({
+    where: { status: 'generating' },
+    select: { id: true, userId: true },
+    orderBy: { createdAt: 'asc' },
+  })
+}
+
 export async function getSession(
   fastify: FastifyInstance,
   userId: string,
@@ -103,32 +161,125 @@ export async function getSession(
 ) {
   return fastify.prisma.rehearsalSession.findFirst({
     where: { id: sessionId, userId },
+    select: SESSION_FIELDS,
   })
 }
 
-export async function getHistory(
+export async function getSessionWithMessages(
   fastify: FastifyInstance,
   userId: string,
-  page: number,
-  limit: number,
+  sessionId: string,
 ) {
-  const [sessions, total] = await Promise.all([
+  const session = await fastify.prisma.rehearsalSession.findFirst({
+    where: { id: sessionId, userId },
+    select: {
+      ...SESSION_FIELDS,
+      messages: {
+        select: { role: true, content: true, createdAt: true },
+        orderBy: { seq: 'asc' },
+      },
+    },
+  })
+
+  if (!session) return null
+
+  return { ...session, messages: session.messages.map(toMessage) }
+}
+
+export async function getHistory(fastify: FastifyInstance, userId: string, request: PageRequest) {
+  const [rows, total] = await Promise.all([
     fastify.prisma.rehearsalSession.findMany({
-      where: { userId },
+      where: { userId, ...keysetWhere(request.cursor) },
       select: {
         id: true,
         scenario: true,
         interviewerStyle: true,
         status: true,
-        feedback: true,
+        totalScore: true,
         createdAt: true,
       },
-      orderBy: { createdAt: 'desc' },
-      skip: (page - 1) * limit,
-      take: limit,
+      orderBy: HISTORY_ORDER,
+      ...pageWindow(request),
     }),
-    fastify.prisma.rehearsalSession.count({ where: { userId } }),
+    request.withTotal
+      ? countHistory('rehearsal', userId, () => fastify.prisma.rehearsalSession.count({ where: { userId } }))
+      : null,
   ])
 
-  return { sessions, total }
+  const { items: sessions, nextCursor } = takePage(rows, request.limit)
+  return { sessions, total, nextCursor }
+}
+
+/** Fill `totalScore` for feedback stored before the column existed. */
+export async function backfillTotalScores(fastify: FastifyInstance, batchSize = 200): Promise<number> {
+  let updated = 0
+  let after = ''
+  for (;;) {
+    const rows = await fastify.prisma.rehearsalSession.findMany({
+      where: { totalScore: null, status: 'completed', id: { gt: after } },
+      select: { id: true, feedback: true },
+      orderBy: { id: 'asc' },
+      take: batchSize,
+    })
+    if (rows.length === 0) return updated
+
+    for (const row of rows) {
+      const totalScore = summaryScore((row.feedback as { scores?: unknown } | null)?.scores)
+      if (totalScore === null) continue
+      await fastify.prisma.rehearsalSession.update({ where: { id: row.id }, data: { totalScore } })
+      updated++
+    }
+    after = rows[rows.length - 1]!.id
+  }
+}
+
+/** Turns from the legacy JSON column; timestamps that do not parse fall back to the session's start. */
+function legacyTranscript(value: unknown, fallback: Date) {
+  if (!Array.isArray(value)) return []
+  return value
+    .filter((m): m is Message => (m?.role === 'user' || m?.role === 'assistant') && typeof m.content === 'string')
+    .map((m) => {
+      const createdAt = new Date(m.timestamp)
+      return { role: m.role, content: m.content, createdAt: Number.isNaN(createdAt.getTime()) ? fallback : createdAt }
+    })
+}
+
+/**
+ * Copy transcripts stored before rehearsal_messages existed out of the old
+ * `messages` JSON column. Those sessions have messageCount 0 (new ones start at
+ * 1). Each is claimed by a conditional update in the same transaction as its
+ * rows, so runs in several workers at once copy every transcript exactly once.
+ * The column is cleared on every session handled, empty transcripts included,
+ * so later starts do not scan them again.
+ */
+export async function backfillMessages(fastify: FastifyInstance, batchSize = 200): Promise<number> {
+  const unhandled = { messageCount: 0, legacyMessages: { not: Prisma.DbNull } } satisfies Prisma.RehearsalSessionWhereInput
+  let copied = 0
+  let after = ''
+  for (;;) {
+    const rows = await fastify.prisma.rehearsalSession.findMany({
+      where: { ...unhandled, id: { gt: after } },
+      select: { id: true, legacyMessages: true, createdAt: true },
+      orderBy: { id: 'asc' },
+      take: batchSize,
+    })
+    if (rows.length === 0) return copied
+
+    for (const row of rows) {
+      const transcript = legacyTranscript(row.legacyMessages, row.createdAt)
+      const claimed = await fastify.prisma.$transaction(async (tx) => {
+        const { count } = await tx.rehearsalSession.updateMany({
+          where: { ...unhandled, id: row.id },
+          data: { messageCount: transcript.length, legacyMessages: Prisma.DbNull },
+        })
+        if (count === 0 || transcript.length === 0) return false
+        await tx.rehearsalMessage.createMany({
+          data: transcript.map((m, seq) => ({ sessionId: row.id, seq, ...m })),
+        })
+        return true
+      })
+      if (claimed) copied++
+    }
+    after = rows[rows.length - 1]!.id
+  }
 }
@@ -0,0 +1,201 @@
+import { Prisma } from '@prisma/client'
+import type { FastifyInstance } from 'fastify'
+
+const USAGE_FLUSH_MS = Math.max(100, Number(process.env['USAGE_FLUSH_MS'] ?? 5000))
+const USAGE_FLUSH_SIZE = Math.max(1, Number(process.env['USAGE_FLUSH_SIZE'] ?? 200))
+
+export const USAGE_FEATURES = ['feynman', 'layers', 'rehearsal'] as const
+export type UsageFeature = (typeof USAGE_FEATURES)[number]
+
+type UsageDelta = Map<string, Map<UsageFeature, number>>
+
+// Increments not yet written; `flushing` holds the batch currently being committed
+let pending: UsageDelta = new Map()
+let pendingCount = 0
+let flushing: UsageDelta | null = null
+let inFlight: Promise<void> | null = null
+let timer: NodeJS.Timeout | null = null
+// Reads of stored totals in progress (withUsageSnapshot); a flush waits for them before taking its batch
+let readers = 0
+let readersIdle: Promise<void> = Promise.resolve()
+let releaseReaders = () => {}
+
+const counters = { recorded: 0, flushes: 0, flushedUsers: 0, failedFlushes: 0, droppedUsers: 0, totalFlushMs: 0 }
+
+// The user row is gone (deleted account): retrying the increment can never succeed
+const PERMANENT_ERRORS = new Set(['P2003', 'P2025'])
+
+/**
+ * Count one completed use of a feature. Buffered in memory and written by the
+ * next flush, so the request path never takes a write lock on `users`.
+ */
+export function recordUsage(fastify: FastifyInstance, userId: string, feature: UsageFeature): void {
+  addDelta(pending, userId, feature, 1)
+  pendingCount++
+  counters.recorded++
+  if (pendingCount >= USAGE_FLUSH_SIZE) {
+    flushUsage(fastify).catch(() => {})
+  }
+}
+
+/** Increments this process has counted but not yet committed, for merging into stored totals. */
+export function getUnflushedUsage(userId: string): Record<UsageFeature, number> {
+  const delta = Object.fromEntries(USAGE_FEATURES.map((f) => [f, 0])) as Record<UsageFeature, number>
+  for (const batch of [pending, flushing]) {
+    for (const [feature, n] of batch?.get(userId) ?? []) delta[feature] += n
+  }
+  return delta
+}
+
+/**
+ * Run `read` while no flush is in progress, so totals it reads from the
+ * database plus getUnflushedUsage count every increment exactly once. Reads
+ * wait for a running or waiting flush; a flush waits for reads already started.
+ */
+export async function withUsageSnapshot<T>(read: () => Promise<T>): Promise<T> {
+  while (inFlight) await inFlight
+  if (readers++ === 0) {
+    readersIdle = new Promise((resolve) => {
+      releaseReaders = resolve
+    })
+  }
+  try {
+    return await read()
+  } finally {
+    if (--readers === 0) releaseReaders()
+  }
+}
+
+function userWrites(tx: Prisma.TransactionClient, userId: string, features: Map<UsageFeature, number>) {
+  const total = [...features.values()].reduce((sum, n) => sum + n, 0)
+  return {
+    user: tx.user.updateMany({ where: { id: userId }, data: { usageCount: { increment: total } } }),
+    features: [...features].map(([feature, n]) =>
+      tx.featureUsage.upsert({
+        where: { userId_feature: { userId, feature } },
+        create: { userId, feature, count: n },
+        update: { count: { increment: n } },
+      }),
+    ),
+  }
+}
+
+/**
+ * Write one user's increments on their own after a batch failed. Returns false
+ * when they can never be written because the user no longer exists.
+ */
+async function flushUser(fastify: FastifyInstance, userId: string, features: Map<UsageFeature, number>) {
+  try {
+    return await fastify.prisma.$transaction(async (tx) => {
+      const writes = userWrites(tx, userId, features)
+      if ((await writes.user).count === 0) return false
+      await Promise.all(writes.features)
+      return true
+    })
+  } catch (error) {
+    if (error instanceof Prisma.PrismaClientKnownRequestError && PERMANENT_ERRORS.has(error.code)) return false
+    throw error
+  }
+}
+
+function requeue(userId: string, features: Map<UsageFeature, number>) {
+  for (const [feature, n] of features) {
+    addDelta(pending, userId, feature, n)
+    pendingCount += n
+  }
+}
+
+/**
+ * Write buffered increments in one transaction: the user's total and the
+ * per-feature rows. If that fails, each user is retried in a transaction of
+ * its own, so one bad row cannot hold up everyone else. Increments for users
+ * that no longer exist are dropped; other failures go back into the buffer.
+ */
+export async function flushUsage(fastify: FastifyInstance): Promise<void> {
+  // One flush at a time; a caller arriving mid-flush waits for it and then flushes what is left
+  while (inFlight) await inFlight
+  if (pendingCount === 0) return
+
+  inFlight = (async () => {
+    if (readers > 0) await readersIdle
+
+    const batch = pending
+    pending = new Map()
+    pendingCount = 0
+    flushing = batch
+
+    const startedAt = Date.now()
+    try {
+      await fastify.prisma.$transaction(
+        [...batch].flatMap(([userId, features]) => {
+          const writes = userWrites(fastify.prisma, userId, features)
+          return [writes.user, ...writes.features]
+        }),
+      )
+      counters.flushes++
+      counters.flushedUsers += batch.size
+      counters.totalFlushMs += Date.now() - startedAt
+    } catch (batchError) {
+      counters.failedFlushes++
+      fastify.log.warn({ err: batchError, users: batch.size }, 'Usage batch flush failed, writing per user')
+      let flushed = 0
+      for (const [userId, features] of batch) {
+        try {
+          if (await flushUser(fastify, userId, features)) {
+            flushed++
+          } else {
+            counters.droppedUsers++
+            fastify.log.warn({ userId }, 'Dropped usage increments for a user that no longer exists')
+          }
+        } catch (error) {
+          requeue(userId, features)
+          fastify.log.error({ err: error, userId }, 'Usage flush failed, will retry')
+        }
+      }
+      if (flushed > 0) {
+        counters.flushes++
+        counters.flushedUsers += flushed
+        counters.totalFlushMs += Date.now() - startedAt
+      }
+    } finally {
+      flushing = null
+      inFlight = null
+    }
+  })()
+  await inFlight
+}
+
+export function startUsageFlusher(fastify: FastifyInstance): void {
+  if (timer) return
+  timer = setInterval(() => {
+    flushUsage(fastify).catch(() => {})
+  }, USAGE_FLUSH_MS)
+  timer.unref()
+}
+
+/** Stop the interval and write whatever is still buffered. */
+export async function stopUsageFlusher(fastify: FastifyInstance): Promise<void> {
+  if (timer) clearInterval(timer)
+  timer = null
+  await flushUsage(fastify)
+}
+
+export function getUsageCounterStats() {
+  return {
+    flushIntervalMs: USAGE_FLUSH_MS,
+    flushSize: USAGE_FLUSH_SIZE,
+    buffered: pendingCount,
+    recorded: counters.recorded,
+    flushes: counters.flushes,
+    failedFlushes: counters.failedFlushes,
+    droppedUsers: counters.droppedUsers,
+    avgUsersPerFlush: counters.flushes ? counters.flushedUsers / counters.flushes : 0,
+    avgFlushMs: counters.flushes ? counters.totalFlushMs / counters.flushes : 0,
+  }
+}
+
+function addDelta(delta: UsageDelta, userId: string, feature: UsageFeature, n: number) {
+  const features = delta.get(userId) ?? new Map<UsageFeature, number>()
+  features.set(feature, (features.get(feature) ?? 0) + n)
+  delta.set(userId, features)
+}
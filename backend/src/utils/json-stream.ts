@@ -0,0 +1,201 @@
+export type JsonPath = Array<string | number>
+
+interface Frame {
+  container: Record<string, unknown> | unknown[]
+  path: JsonPath
+  key: string
+}
+
+type State = 'start' | 'value' | 'key' | 'colon' | 'string' | 'literal' | 'after' | 'done' | 'error'
+
+const ESCAPES: Record<string, string> = { b: '\b', f: '\f', n: '\n', r: '\r', t: '\t' }
+const HEX4 = /^[0-9a-fA-F]{4}$/
+const WHITESPACE = new Set([' ', '\t', '\n', '\r'])
+
+/**
+ * Incremental JSON parser for model output.
+ *
+ * Text before the first `{` (prose, a ```json fence) and anything after the
+ * root object closes are ignored. `onValue` fires with the value's path as
+ * soon as each value is complete, innermost first, so callers can stream parts
+ * of a result before the model finishes. `write` never throws; a malformed
+ * document is reported by `end`.
+ */
+export class JsonStreamParser {
+  private state: State = 'start'
+  private stack: Frame[] = []
+  private root: Record<string, unknown> | null = null
+  private buffer = ''
+  private isKey = false
+  private escape: string | null = null
+  private error: Error | null = null
+
+  constructor(private readonly onValue: (path: JsonPath, value: unknown) => void = () => {}) {}
+
+  /** Whether a root object has been seen; false means the output had no JSON at all. */
+  get started(): boolean {
+    return this.state !== 'start'
+  }
+
+  write(chunk: string): void {
+    for (let i = 0; i < chunk.length && this.state !== 'done' && this.state !== 'error'; i++) {
+      try {
+        this.step(chunk[i]!)
+      } catch (error) {
+        this.state = 'error'
+        this.error = error instanceof Error ? error : new Error(String(error))
+      }
+    }
+  }
+
+  /** Return the parsed root object, or throw if the document is missing, malformed or truncated. */
+  end(): Record<string, unknown> {
+    if (this.error) throw this.error
+    if (this.state !== 'done' || !this.root) {
+      throw new SyntaxError(this.started ? 'Unexpected end of JSON input' : 'No JSON object in input')
+    }
+    return this.root
+  }
+
+  private step(ch: string) {
+    switch (this.state) {
+      case 'start':
+        if (ch === '{') this.open({})
+        return
+
+      case 'value':
+        if (WHITESPACE.has(ch)) return
+        if (ch === '{') return this.open({})
+        if (ch === '[') return this.open([])
+        if (ch === '"') return this.beginString(false)
+        if (ch === ']' && this.emptyTop()) return this.close(ch)
+        this.buffer = ch
+        this.state = 'literal'
+        return
+
+      case 'key':
+        if (WHITESPACE.has(ch)) return
+        if (ch === '"') return this.beginString(true)
+        if (ch === '}' && this.emptyTop()) return this.close(ch)
+        throw new SyntaxError(`Expected property name, got '${ch}'`)
+
+      case 'colon':
+        if (WHITESPACE.has(ch)) return
+        if (ch !== ':') throw new SyntaxError(`Expected ':', got '${ch}'`)
+        this.state = 'value'
+        return
+
+      case 'string':
+        return this.stringChar(ch)
+
+      case 'literal':
+        if (ch === ',' || ch === '}' || ch === ']' || WHITESPACE.has(ch)) {
+          // JSON.parse validates numbers and true/false/null
+          this.complete(JSON.parse(this.buffer))
+          this.buffer = ''
+          return this.step(ch)
+        }
+        this.buffer += ch
+        return
+
+      case 'after':
+        if (WHITESPACE.has(ch)) return
+        if (ch === ',') {
+          this.state = Array.isArray(this.top().container) ? 'value' : 'key'
+          return
+        }
+        if (ch === '}' || ch === ']') return this.close(ch)
+        throw new SyntaxError(`Unexpected '${ch}' after value`)
+    }
+  }
+
+  private beginString(isKey: boolean) {
+    this.buffer = ''
+    this.isKey = isKey
+    this.state = 'string'
+  }
+
+  private stringChar(ch: string) {
+    if (this.escape === null) {
+      if (ch === '\\') {
+        this.escape = ''
+      } else if (ch === '"') {
+        const text = this.buffer
+        this.buffer = ''
+        if (this.isKey) {
+          this.top().key = text
+          this.state = 'colon'
+        } else {
+          this.complete(text)
+        }
+      } else {
+        this.buffer += ch
+      }
+      return
+    }
+
+    if (this.escape === '') {
+      if (ch === 'u') {
+        this.escape = 'u'
+        return
+      }
+      this.buffer += ESCAPES[ch] ?? ch
+      this.escape = null
+      return
+    }
+
+    // \uXXXX; surrogate pairs arrive as two escapes and concatenate correctly
+    this.escape += ch
+    if (this.escape.length === 5) {
+      const hex = this.escape.slice(1)
+      // parseInt alone would accept a valid prefix followed by junk, e.g. \u12zz
+      if (!HEX4.test(hex)) throw new SyntaxError(`Bad unicode escape '\\${this.escape}'`)
+      this.buffer += String.fromCharCode(Number.parseInt(hex, 16))
+      this.escape = null
+    }
+  }
+
+  private top(): Frame {
+    return this.stack[this.stack.length - 1]!
+  }
+
+  private emptyTop(): boolean {
+    const { container } = this.top()
+    return Array.isArray(container) ? container.length === 0 : Object.keys(container).length === 0
+  }
+
+  /** Attach `value` to the current container and return its path. */
+  private attach(value: unknown): JsonPath {
+    const frame = this.top()
+    if (Array.isArray(frame.container)) {
+      frame.container.push(value)
+      return [...frame.path, frame.container.length - 1]
+    }
+    frame.container[frame.key] = value
+    return [...frame.path, frame.key]
+  }
+
+  private open(container: Record<string, unknown> | unknown[]) {
+    if (this.stack.length === 0) {
+      this.root = container as Record<string, unknown>
+      this.stack.push({ container, path: [], key: '' })
+    } else {
+      this.stack.push({ container, path: this.attach(container), key: '' })
+    }
+    this.state = Array.isArray(container) ? 'value' : 'key'
+  }
+
+  private close(ch: string) {
+    const frame = this.stack.pop()!
+    if (Array.isArray(frame.container) !== (ch === ']')) {
+      throw new SyntaxError(`Unexpected '${ch}'`)
+    }
+    this.onValue(frame.path, frame.container)
+    this.state = this.stack.length === 0 ? 'done' : 'after'
+  }
+
+  private complete(value: unknown) {
+    this.onValue(this.attach(value), value)
+    this.state = 'after'
+  }
+}
@@ -0,0 +1,86 @@
+interface CacheEntry<V> {
+  value: V
+  expiresAt: number
+}
+
+export interface LruCacheOptions {
+  maxEntries: number
+  ttlMs: number
+}
+
+export interface LruCacheStats {
+  size: number
+  hits: number
+  misses: number
+  evictions: number
+  hitRate: number
+}
+
+/**
+ * Bounded in-memory cache with least-recently-used eviction and per-entry TTL.
+ * Relies on Map preserving insertion order: the first key is always the LRU one.
+ */
+export class LruCache<K, V> {
+  private readonly entries = new Map<K, CacheEntry<V>>()
+  private hits = 0
+  private misses = 0
+  private evictions = 0
+
+  constructor(private readonly options: LruCacheOptions) {}
+
+  get(key: K): V | undefined {
+    const entry = this.lookup(key)
+    if (!entry) {
+      this.misses++
+      return undefined
+    }
+    // Re-insert to mark as most recently used
+    this.entries.delete(key)
+    this.entries.set(key, entry)
+    this.hits++
+    return entry.value
+  }
+
+  /** Read without touching recency or hit/miss counters. */
+  peek(key: K): V | undefined {
+    return this.lookup(key)?.value
+  }
+
+  set(key: K, value: V, ttlMs: number = this.options.ttlMs): void {
+    this.entries.delete(key)
+    this.entries.set(key, { value, expiresAt: Date.now() + ttlMs })
+    while (this.entries.size > this.options.maxEntries) {
+      const oldest = this.entries.keys().next().value as K
+      this.entries.delete(oldest)
+      this.evictions++
+    }
+  }
+
+  delete(key: K): boolean {
+    return this.entries.delete(key)
+  }
+
+  get size(): number {
+    return this.entries.size
+  }
+
+  stats(): LruCacheStats {
+    const lookups = this.hits + this.misses
+    return {
+      size: this.entries.size,
+      hits: this.hits,
+      misses: this.misses,
+      evictions: this.evictions,
+      hitRate: lookups ? this.hits / lookups : 0,
+    }
+  }
+
+  private lookup(key: K): CacheEntry<V> | undefined {
+    const entry = this.entries.get(key)
+    if (entry && entry.expiresAt <= Date.now()) {
+      this.entries.delete(key)
+      return undefined
+    }
+    return entry
+  }
+}
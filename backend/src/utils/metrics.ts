@@ -0,0 +1,152 @@
+export type MetricLabels = Record<string, string>
+
+export interface MetricSample {
+  /** Appended to the family name: '' for counters and gauges, `_bucket` / `_sum` / `_count` for histograms. */
+  suffix: string
+  labels: MetricLabels
+  value: number
+}
+
+/** One metric family in a form that can cross process boundaries (cluster IPC) before rendering. */
+export interface MetricFamily {
+  name: string
+  help: string
+  type: 'counter' | 'gauge' | 'histogram'
+  samples: MetricSample[]
+}
+
+function seriesKey(labels: MetricLabels): string {
+  return JSON.stringify(Object.keys(labels).sort().map((k) => [k, labels[k]]))
+}
+
+export class Counter {
+  private readonly series = new Map<string, { labels: MetricLabels; value: number }>()
+
+  constructor(
+    readonly name: string,
+    readonly help: string,
+  ) {}
+
+  inc(labels: MetricLabels = {}, value = 1): void {
+    const key = seriesKey(labels)
+    const entry = this.series.get(key)
+    if (entry) entry.value += value
+    else this.series.set(key, { labels, value })
+  }
+
+  collect(): MetricFamily {
+    return {
+      name: this.name,
+      help: this.help,
+      type: 'counter',
+      samples: [...this.series.values()].map(({ labels, value }) => ({ suffix: '', labels, value })),
+    }
+  }
+}
+
+/** Cumulative-bucket histogram; `buckets` are upper bounds in ascending order, +Inf is implied. */
+export class Histogram {
+  private readonly series = new Map<string, { labels: MetricLabels; counts: number[]; sum: number; count: number }>()
+
+  constructor(
+    readonly name: string,
+    readonly help: string,
+    private readonly buckets: number[],
+  ) {}
+
+  observe(labels: MetricLabels, value: number): void {
+    const key = seriesKey(labels)
+    let entry = this.series.get(key)
+    if (!entry) {
+      entry = { labels, counts: this.buckets.map(() => 0), sum: 0, count: 0 }
+      this.series.set(key, entry)
+    }
+    const index = this.buckets.findIndex((bound) => value <= bound)
+    if (index !== -1) entry.counts[index]!++
+    entry.sum += value
+    entry.count++
+  }
+
+  collect(): MetricFamily {
+    const samples: MetricSample[] = []
+    for (const { labels, counts, sum, count } of this.series.values()) {
+      let cumulative = 0
+      this.buckets.forEach((bound, i) => {
+        cumulative += counts[i]!
+        samples.push({ suffix: '_bucket', labels: { ...labels, le: String(bound) }, value: cumulative })
+      })
+      samples.push({ suffix: '_bucket', labels: { ...labels, le: '+Inf' }, value: count })
+      samples.push({ suffix: '_sum', labels, value: sum })
+      samples.push({ suffix: '_count', labels, value: count })
+    }
+    return { name: this.name, help: this.help, type: 'histogram', samples }
+  }
+}
+
+export function gauge(name: string, help: string, samples: Array<[MetricLabels, number]>): MetricFamily {
+  return { name, help, type: 'gauge', samples: samples.map(([labels, value]) => ({ suffix: '', labels, value })) }
+}
+
+function snakeCase(key: string): string {
+  return key.replace(/([a-z0-9])([A-Z])/g, '$1_$2').toLowerCase()
+}
+
+/**
+ * Expose a `getXStats()` snapshot as gauges named `<prefix>_<field>`. Numbers
+ * map directly, booleans to 0/1, strings to a `value` label set to 1, and
+ * `fooByBar` maps of numbers to one gauge with a `bar` label.
+ */
+export function statsGauges(prefix: string, source: string, stats: Record<string, unknown>): MetricFamily[] {
+  const families: MetricFamily[] = []
+  for (const [key, value] of Object.entries(stats)) {
+    const name = `${prefix}_${snakeCase(key)}`
+    const help = `${key} from ${source}()`
+    if (typeof value === 'number') {
+      families.push(gauge(name, help, [[{}, value]]))
+    } else if (typeof value === 'boolean') {
+      families.push(gauge(name, help, [[{}, value ? 1 : 0]]))
+    } else if (typeof value === 'string') {
+      families.push(gauge(name, help, [[{ value }, 1]]))
+    } else if (value && typeof value === 'object') {
+      const label = snakeCase(key.match(/By([A-Z]\w*)$/)?.[1] ?? 'key')
+      const entries = Object.entries(value).filter((e): e is [string, number] => typeof e[1] === 'number')
+      families.push(gauge(name, help, entries.map(([k, v]) => [{ [label]: k }, v])))
+    }
+  }
+  return families
+}
+
+function escapeLabel(value: string): string {
+  return value.replace(/\\/g, '\\\\').replace(/\n/g, '\\n').replace(/"/g, '\\"')
+}
+
+function formatValue(value: number): string {
+  if (Number.isNaN(value)) return 'NaN'
+  if (value === Infinity) return '+Inf'
+  if (value === -Infinity) return '-Inf'
+  return String(value)
+}
+
+/**
+ * Prometheus text exposition (format 0.0.4). Families with the same name, e.g.
+ * one per cluster worker, are merged under a single HELP/TYPE header.
+ */
+export function renderMetrics(families: MetricFamily[]): string {
+  const merged = new Map<string, MetricFamily>()
+  for (const family of families) {
+    const existing = merged.get(family.name)
+    if (existing) existing.samples.push(...family.samples)
+    else merged.set(family.name, { ...family, samples: [...family.samples] })
+  }
+
+  const lines: string[] = []
+  for (const { name, help, type, samples } of merged.values()) {
+    lines.push(`# HELP ${name} ${help.replace(/\\/g, '\\\\').replace(/\n/g, '\\n')}`)
+    lines.push(`# TYPE ${name} ${type}`)
+    for (const { suffix, labels, value } of samples) {
+      const pairs = Object.entries(labels).map(([k, v]) => `${k}="${escapeLabel(v)}"`)
+      lines.push(`${name}${suffix}${pairs.length ? `{${pairs.join(',')}}` : ''} ${formatValue(value)}`)
+    }
+  }
+  return lines.join('\n') + '\n'
+}
@@ -0,0 +1,76 @@
+export interface HistoryCursor {
+  createdAt: Date
+  id: string
+}
+
+/** How a history endpoint should page: by offset (`page`) or after a keyset `cursor`. */
+export interface PageRequest {
+  limit: number
+  /** Null in cursor mode. */
+  page: number | null
+  cursor: HistoryCursor | null
+  withTotal: boolean
+}
+
+export interface PageQuery {
+  page?: string
+  limit?: string
+  cursor?: string
+  count?: string
+}
+
+/** Newest first; `id` breaks ties between rows created in the same millisecond. */
+export const HISTORY_ORDER = [{ createdAt: 'desc' as const }, { id: 'desc' as const }]
+
+/**
+ * `?page=&limit=` keeps the offset form and counts by default; `?cursor=`
+ * (empty for the first page) switches to keyset paging without a count
+ * unless `count=true`. Returns null for a cursor that does not decode.
+ */
+export function parsePageRequest(query: PageQuery): PageRequest | null {
+  const limit = Math.min(50, Math.max(1, Number(query.limit) || 10))
+
+  if (query.cursor !== undefined) {
+    const cursor = query.cursor === '' ? null : decodeCursor(query.cursor)
+    if (query.cursor !== '' && !cursor) return null
+    return { limit, page: null, cursor, withTotal: query.count === 'true' }
+  }
+
+  const page = Math.max(1, Number(query.page) || 1)
+  return { limit, page, cursor: null, withTotal: query.count !== 'false' }
+}
+
+/** Rows strictly after the cursor in HISTORY_ORDER; served by the (userId, createdAt desc) indexes. */
+export function keysetWhere(cursor: HistoryCursor | null) {
+  if (!cursor) return {}
+  return {
+    OR: [{ createdAt: { lt: cursor.createdAt } }, { createdAt: cursor.createdAt, id: { lt: cursor.id } }],
+  }
+}
+
+/** Skip/take for a request; one extra row is fetched to tell whether a next page exists. */
+export function pageWindow(request: PageRequest) {
+  return {
+    skip: request.page === null ? 0 : (request.page - 1) * request.limit,
+    take: request.limit + 1,
+  }
+}
+
+export function takePage<T extends { id: string; createdAt: Date }>(rows: T[], limit: number) {
+  if (rows.length <= limit) return { items: rows, nextCursor: null }
+  const items = rows.slice(0, limit)
+  return { items, nextCursor: encodeCursor(items[items.length - 1]!) }
+}
+
+export function encodeCursor(row: HistoryCursor): string {
+  return Buffer.from(`${row.createdAt.getTime()}:${row.id}`).toString('base64url')
+}
+
+export function decodeCursor(value: string): HistoryCursor | null {
+  const decoded = Buffer.from(value, 'base64url').toString()
+  const separator = decoded.indexOf(':')
+  const millis = Number(decoded.slice(0, separator))
+  const id = decoded.slice(separator + 1)
+  if (separator <= 0 || !Number.isSafeInteger(millis) || !id) return null
+  return { createdAt: new Date(millis), id }
+}
@@ -0,0 +1,156 @@
+import { createConnection, type Socket } from 'node:net'
+
+export type RespValue = string | number | null | RespValue[]
+
+interface PendingReply {
+  resolve: (value: RespValue) => void
+  reject: (error: Error) => void
+  settled: boolean
+}
+
+interface Connection {
+  socket: Socket
+  buffer: Buffer
+  pending: PendingReply[]
+}
+
+const COMMAND_TIMEOUT_MS = Number(process.env['REDIS_COMMAND_TIMEOUT_MS'] ?? 1000)
+
+/**
+ * Minimal RESP2 client for the handful of commands the limiter store needs.
+ *
+ * Commands are pipelined on one lazily opened connection and replies are
+ * matched in order. A dropped connection rejects everything in flight and is
+ * reopened by the next command, so callers only have to handle rejections.
+ */
+export class RedisClient {
+  private conn: Connection | null = null
+
+  constructor(private readonly url: URL) {}
+
+  command(...args: Array<string | number>): Promise<RespValue> {
+    const conn = this.conn ?? this.connect()
+    return new Promise((resolve, reject) => {
+      const reply: PendingReply = { resolve, reject, settled: false }
+      // Late replies still arrive in order, so a timed-out slot stays queued and is skipped
+      const timer = setTimeout(() => settle(reply, new Error(`Redis command timed out: ${args[0]}`)), COMMAND_TIMEOUT_MS)
+      reply.resolve = (value) => {
+        clearTimeout(timer)
+        resolve(value)
+      }
+      reply.reject = (error) => {
+        clearTimeout(timer)
+        reject(error)
+      }
+      conn.pending.push(reply)
+      conn.socket.write(encode(args))
+    })
+  }
+
+  /** Drop the connection; anything still in flight is rejected. */
+  close(): void {
+    this.conn?.socket.destroy()
+    this.conn = null
+  }
+
+  private connect(): Connection {
+    const socket = createConnection({ host: this.url.hostname || '127.0.0.1', port: Number(this.url.port || 6379) })
+    socket.setNoDelay(true)
+    const conn: Connection = { socket, buffer: Buffer.alloc(0), pending: [] }
+    this.conn = conn
+
+    socket.on('data', (data) => onData(conn, data))
+    socket.on('error', () => {})
+    socket.on('close', () => {
+      if (this.conn === conn) this.conn = null
+      for (const reply of conn.pending.splice(0)) settle(reply, new Error('Redis connection closed'))
+    })
+
+    // AUTH / SELECT are pipelined ahead of the first command; their replies are dropped
+    const password = decodeURIComponent(this.url.password)
+    if (password) {
+      const username = decodeURIComponent(this.url.username)
+      conn.pending.push(silentReply())
+      socket.write(encode(username ? ['AUTH', username, password] : ['AUTH', password]))
+    }
+    const db = Number(this.url.pathname.slice(1))
+    if (db) {
+      conn.pending.push(silentReply())
+      socket.write(encode(['SELECT', db]))
+    }
+    return conn
+  }
+}
+
+function onData(conn: Connection, data: Buffer) {
+  conn.buffer = conn.buffer.length ? Buffer.concat([conn.buffer, data]) : data
+  let offset = 0
+  while (offset < conn.buffer.length) {
+    const parsed = parse(conn.buffer, offset)
+    if (!parsed) break
+    offset = parsed.next
+    const reply = conn.pending.shift()
+    if (reply) settle(reply, parsed.value)
+  }
+  conn.buffer = conn.buffer.subarray(offset)
+}
+
+function silentReply(): PendingReply {
+  return { resolve: () => {}, reject: () => {}, settled: false }
+}
+
+function settle(reply: PendingReply, result: RespValue | Error) {
+  if (reply.settled) return
+  reply.settled = true
+  if (result instanceof Error) reply.reject(result)
+  else reply.resolve(result)
+}
+
+function encode(args: Array<string | number>): string {
+  let out = `*${args.length}\r\n`
+  for (const arg of args) {
+    const value = String(arg)
+    out += `$${Buffer.byteLength(value)}\r\n${value}\r\n`
+  }
+  return out
+}
+
+/** Parse one reply starting at `offset`; null when the buffer holds only part of it. */
+function parse(buffer: Buffer, offset: number): { value: RespValue | Error; next: number } | null {
+  const lineEnd = buffer.indexOf('\r\n', offset)
+  if (lineEnd === -1) return null
+  const line = buffer.toString('utf8', offset + 1, lineEnd)
+  const next = lineEnd + 2
+
+  switch (String.fromCharCode(buffer[offset]!)) {
+    case '+':
+      return { value: line, next }
+    case '-':
+      return { value: new Error(line), next }
+    case ':':
+      return { value: Number(line), next }
+    case '$': {
+      const length = Number(line)
+      if (length < 0) return { value: null, next }
+      if (buffer.length < next + length + 2) return null
+      return { value: buffer.toString('utf8', next, next + length), next: next + length + 2 }
+    }
+    case '*': {
+      const count = Number(line)
+      if (count < 0) return { value: null, next }
+      const items: RespValue[] = []
+      let error: Error | null = null
+      let cursor = next
+      for (let i = 0; i < count; i++) {
+        const item = parse(buffer, cursor)
+        if (!item) return null
+        if (item.value instanceof Error) error ??= item.value
+        else items.push(item.value)
+        cursor = item.next
+      }
+      return { value: error ?? items, next: cursor }
+    }
+    default:
+      return { value: new Error(`Unexpected RESP type '${String.fromCharCode(buffer[offset]!)}'`), next }
+  }
+}
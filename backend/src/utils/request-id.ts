@@ -0,0 +1,13 @@
+import { randomUUID } from 'node:crypto'
+import type { IncomingMessage } from 'node:http'
+
+export const REQUEST_ID_HEADER = 'X-Request-Id'
+
+// Caller-supplied IDs end up in logs and headers, so only plain tokens are kept
+const REQUEST_ID_PATTERN = /^[\w.:-]{1,128}$/
+
+/** Fastify `genReqId`: reuse a well-formed X-Request-Id from the caller, otherwise a fresh UUID. */
+export function genRequestId(request: IncomingMessage): string {
+  const incoming = request.headers['x-request-id']
+  return typeof incoming === 'string' && REQUEST_ID_PATTERN.test(incoming) ? incoming : randomUUID()
+}
@@ -6,10 +6,17 @@ export function failure(code: string, message: string, details?: unknown) {
   return { success: false as const, error: { code, message, details } }
 }
 
-export function paginated<T>(data: T[], page: number, limit: number, total: number) {
+/** `page` is null for cursor requests, `total` when the count was skipped; `nextCursor` is null on the last page. */
+export function paginated<T>(
+  data: T[],
+  page: number | null,
+  limit: number,
+  total: number | null,
+  nextCursor: string | null = null,
+) {
   return {
     success: true as const,
     data,
-    pagination: { page, limit, total, totalPages: Math.ceil(total / limit) },
+    pagination: { page, limit, total, totalPages: total === null ? null : Math.ceil(total / limit), nextCursor },
   }
 }
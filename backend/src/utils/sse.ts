@@ -1,18 +1,383 @@
+import { randomUUID } from 'node:crypto'
+import { setTimeout as sleep } from 'node:timers/promises'
 import type { FastifyReply } from 'fastify'
+import { routeLabel, startPhase, timingSummary } from '../services/metrics.js'
 
-export function setupSSE(reply: FastifyReply): void {
+// Content deltas are merged into one `chunk` frame per window; 0 disables coalescing
+const COALESCE_MS = Number(process.env['SSE_COALESCE_MS'] ?? 50)
+const COALESCE_BYTES = Number(process.env['SSE_COALESCE_BYTES'] ?? 2048)
+// Comment frames keep proxies from closing streams that are idle, e.g. before a slow first token
+const HEARTBEAT_MS = Number(process.env['SSE_HEARTBEAT_MS'] ?? 15_000)
+// A resumable stream keeps generating this long after its client drops; 0 aborts at once like other streams
+const RESUME_GRACE_MS = Math.max(0, Number(process.env['SSE_RESUME_GRACE_MS'] ?? 30_000))
+// Frames kept per stream for replay; a reconnect that needs older frames is refused
+const RESUME_BUFFER_BYTES = Math.max(0, Number(process.env['SSE_RESUME_BUFFER_BYTES'] ?? 256 * 1024))
+// How long a finished stream can still be replayed to a client that missed its end
+const RESUME_TTL_MS = Math.max(0, Number(process.env['SSE_RESUME_TTL_MS'] ?? 60_000))
+
+// Streams still writing, so shutdown can wait for them before the process exits
+const openStreams = new Set<SSEWriter>()
+// Resumable streams by ID, while generating and for RESUME_TTL_MS after they finish
+const resumable = new Map<string, SSEWriter>()
+// The writer a reply opened, so admission can hold its slot until generation stops
+const writers = new WeakMap<FastifyReply, SSEWriter>()
+
+const resumeStats = {
+  opened: 0,
+  disconnected: 0,
+  resumed: 0,
+  resumeRejected: 0,
+  abandoned: 0,
+  replayedFrames: 0,
+}
+
+interface StreamOwner {
+  userId: string | undefined
+  route: string
+}
+
+/**
+ * Buffered text/event-stream writer.
+ *
+ * `content()` deltas are joined into a single `{ type: 'content' }` chunk event
+ * per time/byte window; the first delta is sent at once so time-to-first-chunk
+ * is unchanged. Other events flush pending content first, so ordering holds.
+ * While the socket is applying backpressure nothing is written until `drain`.
+ *
+ * A resumable writer tags every frame `id: <streamId>:<seq>` and keeps recent
+ * frames. When its client drops, generation carries on for SSE_RESUME_GRACE_MS
+ * so a reconnect sending Last-Event-ID gets the missed frames and the rest of
+ * the stream instead of paying for a new upstream call.
+ */
+export class SSEWriter {
+  readonly id: string | null
+  private readonly aborter = new AbortController()
+  /** Aborted once nobody will read the stream; generation should stop. */
+  readonly signal = this.aborter.signal
+
+  private reply: FastifyReply | null = null
+  private pendingContent = ''
+  private outbox = ''
+  private blocked = false
+  private ending = false
+  private finished = false
+  private settled = false
+  private sentContent = false
+  private seq = 0
+  private frames: Array<{ seq: number; frame: string; bytes: number }> = []
+  private bufferedBytes = 0
+  private onSettle: Array<() => void> = []
+  private flushTimer: NodeJS.Timeout | null = null
+  private heartbeatTimer: NodeJS.Timeout | null = null
+  private graceTimer: NodeJS.Timeout | null = null
+  private lastWriteAt = Date.now()
+
+  constructor(
+    private readonly origin: FastifyReply,
+    private readonly coalesceMs: number,
+    private readonly owner: StreamOwner | null,
+  ) {
+    this.id = owner ? randomUUID() : null
+    openStreams.add(this)
+    writers.set(origin, this)
+    if (this.id) {
+      resumable.set(this.id, this)
+      resumeStats.opened++
+    }
+    this.attach(origin)
+    // The client may have gone while the route was still loading its data
+    if (origin.raw.destroyed) queueMicrotask(() => this.onClose(origin))
+  }
+
+  content(text: string): void {
+    if (this.ending || this.settled) return
+    this.pendingContent += text
+
+    if (!this.sentContent || this.coalesceMs <= 0 || Buffer.byteLength(this.pendingContent) >= COALESCE_BYTES) {
+      this.flushContent()
+    } else if (!this.flushTimer) {
+      this.flushTimer = setTimeout(() => this.flushContent(), this.coalesceMs)
+    }
+  }
+
+  event(event: string, data: unknown): void {
+    if (this.ending || this.settled) return
+    this.flushContent()
+    const stop = startPhase('serialize', this.origin.request.timings ?? undefined)
+    const payload = JSON.stringify(data)
+    stop()
+    this.emit(`event: ${event}\ndata: ${payload}\n\n`)
+  }
+
+  /** Ends with a `timing` event: the request ID and its server-side phase split (what Server-Timing carries elsewhere). */
+  end(): void {
+    if (this.ending || this.settled) return
+    this.event('timing', timingSummary(this.origin))
+    this.ending = true
+    this.flushContent()
+    // Under backpressure the drain handler ends the stream once the backlog is out
+    if (!this.blocked) this.finish()
+  }
+
+  isOwnedBy(userId: string | undefined, route: string): boolean {
+    return !!this.owner && this.owner.userId === userId && this.owner.route === route
+  }
+
+  /**
+   * Move the stream to the client behind `reply` and replay the frames after
+   * `afterSeq`. Returns false, writing nothing, if those frames are gone.
+   */
+  resume(reply: FastifyReply, afterSeq: number): boolean {
+    const oldest = this.frames[0]?.seq ?? this.seq + 1
+    if (this.aborter.signal.aborted || afterSeq > this.seq || afterSeq + 1 < oldest) return false
+
+    if (this.graceTimer) clearTimeout(this.graceTimer)
+    this.graceTimer = null
+    // A client can reconnect before its old connection has noticed the drop
+    const previous = this.reply
+    if (previous) {
+      this.detach()
+      previous.raw.end()
+    }
+
+    writeHeaders(reply, this.coalesceMs)
+    this.attach(reply)
+    const missed = this.frames.filter((f) => f.seq > afterSeq)
+    resumeStats.resumed++
+    resumeStats.replayedFrames += missed.length
+    if (missed.length > 0) this.write(missed.map((f) => f.frame).join(''))
+    this.flushContent()
+    if (this.finished) reply.raw.end()
+    return true
+  }
+
+  /** Run `fn` once the stream stops generating: ended, or abandoned by its client. */
+  whenSettled(fn: () => void): void {
+    if (this.settled) fn()
+    else this.onSettle.push(fn)
+  }
+
+  private attach(reply: FastifyReply) {
+    this.reply = reply
+    this.lastWriteAt = Date.now()
+    reply.raw.on('close', () => this.onClose(reply))
+
+    if (HEARTBEAT_MS > 0 && !this.finished) {
+      this.heartbeatTimer = setInterval(() => {
+        if (Date.now() - this.lastWriteAt >= HEARTBEAT_MS) {
+          this.write(': keepalive\n\n')
+        }
+      }, HEARTBEAT_MS)
+      this.heartbeatTimer.unref()
+    }
+  }
+
+  private detach() {
+    this.reply = null
+    this.blocked = false
+    this.outbox = ''
+    if (this.heartbeatTimer) clearInterval(this.heartbeatTimer)
+    this.heartbeatTimer = null
+  }
+
+  private onClose(reply: FastifyReply) {
+    if (reply !== this.reply) return
+    this.detach()
+    if (this.settled) return
+
+    // Was waiting on drain to end; what is left still goes into the replay buffer
+    if (this.ending) {
+      this.flushContent()
+      this.finish()
+      return
+    }
+    if (!this.id || RESUME_GRACE_MS === 0) {
+      this.abandon()
+      return
+    }
+    resumeStats.disconnected++
+    this.graceTimer = setTimeout(() => this.abandon(), RESUME_GRACE_MS)
+    this.graceTimer.unref()
+  }
+
+  private abandon() {
+    if (this.id) resumeStats.abandoned++
+    this.aborter.abort()
+    this.settle()
+  }
+
+  private finish() {
+    this.finished = true
+    const reply = this.reply
+    this.settle()
+    reply?.raw.end()
+  }
+
+  private settle() {
+    openStreams.delete(this)
+    this.settled = true
+    if (this.flushTimer) clearTimeout(this.flushTimer)
+    if (this.graceTimer) clearTimeout(this.graceTimer)
+    if (this.heartbeatTimer) clearInterval(this.heartbeatTimer)
+    this.flushTimer = null
+    this.graceTimer = null
+    this.heartbeatTimer = null
+
+    if (this.id) {
+      const id = this.id
+      if (this.finished && RESUME_TTL_MS > 0) setTimeout(() => resumable.delete(id), RESUME_TTL_MS).unref()
+      else resumable.delete(id)
+    }
+    for (const fn of this.onSettle.splice(0)) fn()
+  }
+
+  private flushContent() {
+    if (this.flushTimer) {
+      clearTimeout(this.flushTimer)
+      this.flushTimer = null
+    }
+    // Under backpressure keep merging; the drain handler flushes
+    if (!this.pendingContent || this.blocked) return
+
+    const content = this.pendingContent
+    this.pendingContent = ''
+    this.sentContent = true
+    this.emit(`event: chunk\ndata: ${JSON.stringify({ type: 'content', content })}\n\n`)
+  }
+
+  /** Number, keep for replay, and send an event frame. Comment frames go straight to `write`. */
+  private emit(body: string) {
+    if (!this.id) {
+      this.write(body)
+      return
+    }
+
+    const seq = ++this.seq
+    const frame = `id: ${this.id}:${seq}\n${body}`
+    const bytes = Buffer.byteLength(frame)
+    this.frames.push({ seq, frame, bytes })
+    this.bufferedBytes += bytes
+    while (this.bufferedBytes > RESUME_BUFFER_BYTES && this.frames.length > 0) {
+      this.bufferedBytes -= this.frames.shift()!.bytes
+    }
+    this.write(frame)
+  }
+
+  private write(frame: string) {
+    const reply = this.reply
+    // Detached: the frame is only in the replay buffer until a client resumes
+    if (!reply) return
+    this.lastWriteAt = Date.now()
+
+    if (this.blocked) {
+      this.outbox += frame
+      return
+    }
+
+    if (!reply.raw.write(frame)) {
+      this.blocked = true
+      reply.raw.once('drain', () => this.onDrain(reply))
+    }
+  }
+
+  private onDrain(reply: FastifyReply) {
+    if (reply !== this.reply) return
+    this.blocked = false
+    const backlog = this.outbox
+    this.outbox = ''
+    if (backlog) this.write(backlog)
+    this.flushContent()
+    if (this.ending && !this.finished && !this.blocked) this.finish()
+  }
+}
+
+function writeHeaders(reply: FastifyReply, coalesceMs: number, headers: Record<string, string> = {}) {
+  // Headers set through `reply` so far (request ID, CORS) would otherwise be lost with the raw write
   reply.raw.writeHead(200, {
+    ...reply.getHeaders(),
     'Content-Type': 'text/event-stream',
     'Cache-Control': 'no-cache',
     'Connection': 'keep-alive',
     'X-Accel-Buffering': 'no',
+    'X-SSE-Coalesce': coalesceMs > 0 ? `${coalesceMs}ms` : 'off',
+    ...headers,
   })
 }
 
-export function sendSSEEvent(reply: FastifyReply, event: string, data: unknown): void {
-  reply.raw.write(`event: ${event}\ndata: ${JSON.stringify(data)}\n\n`)
+/**
+ * Send SSE headers and return a writer for the stream. Clients may send
+ * `X-SSE-Coalesce: off` to get one frame per delta (used by the benchmarks).
+ * With `resumable`, a client that drops can pick the stream up again through
+ * `resumeSSE`; only the same user on the same route can.
+ */
+export function setupSSE(
+  reply: FastifyReply,
+  headers: Record<string, string> = {},
+  options: { resumable?: boolean } = {},
+): SSEWriter {
+  const coalesceMs = reply.request.headers['x-sse-coalesce'] !== 'off' ? COALESCE_MS : 0
+  writeHeaders(reply, coalesceMs, headers)
+  const owner = options.resumable ? { userId: reply.request.userId, route: routeLabel(reply.request) } : null
+  return new SSEWriter(reply, coalesceMs, owner)
+}
+
+/**
+ * Reattach a reconnecting client to the stream named by its Last-Event-ID
+ * (`<streamId>:<seq>`) and replay what it missed. False, with nothing written,
+ * when this process no longer has the stream, another user or route owns it,
+ * or the frames after `seq` have been dropped from the buffer.
+ */
+export function resumeSSE(reply: FastifyReply, lastEventId: string): boolean {
+  const match = /^([\w-]+):(\d+)$/.exec(lastEventId)
+  const sse = match ? resumable.get(match[1]!) : undefined
+  const ok =
+    !!sse &&
+    sse.isOwnedBy(reply.request.userId, routeLabel(reply.request)) &&
+    sse.resume(reply, Number(match![2]))
+  if (!ok) resumeStats.resumeRejected++
+  return ok
+}
+
+/**
+ * Run `fn` once the stream `reply` opens stops generating. If the connection
+ * closes before the route opened a stream, `fn` runs then.
+ */
+export function onStreamSettled(reply: FastifyReply, fn: () => void): void {
+  reply.raw.once('close', () => {
+    const sse = writers.get(reply)
+    if (sse) sse.whenSettled(fn)
+    else fn()
+  })
 }
 
-export function endSSE(reply: FastifyReply): void {
-  reply.raw.end()
+export function getOpenStreamCount(): number {
+  return openStreams.size
+}
+
+export function getSSEResumeStats() {
+  return {
+    ...resumeStats,
+    retained: resumable.size,
+    graceMs: RESUME_GRACE_MS,
+    bufferBytes: RESUME_BUFFER_BYTES,
+    ttlMs: RESUME_TTL_MS,
+  }
+}
+
+/**
+ * Wait up to `timeoutMs` for open streams to finish, then end the rest with an
+ * error event so clients retry instead of hanging. Returns how many were cut off.
+ */
+export async function drainStreams(timeoutMs: number): Promise<number> {
+  const deadline = Date.now() + timeoutMs
+  while (openStreams.size > 0 && Date.now() < deadline) {
+    await sleep(100)
+  }
+
+  const remaining = [...openStreams]
+  for (const sse of remaining) {
+    sse.event('error', { type: 'error', message: '服务正在重启，请重新发起请求' })
+    sse.end()
+  }
+  return remaining.length
 }
@@ -0,0 +1,5 @@
+/** `scores.total` of a stored result, for the denormalized history columns; null if the model left it out. */
+export function summaryScore(scores: unknown): number | null {
+  const total = (scores as { total?: unknown } | null | undefined)?.total
+  return typeof total === 'number' && Number.isFinite(total) ? Math.round(total) : null
+}
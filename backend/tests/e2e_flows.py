@@ -15,15 +15,100 @@ Usage:
 
   # Against a real running server:
   BASE_URL=http://localhost:3000 python e2e_flows.py
+
+  # Same, with tests and live flows spread over 4 workers (one fresh user per flow)
+  BASE_URL=http://localhost:3000 python e2e_flows.py --workers 4 --pool process
+
+  # Load generation: 20 concurrent virtual users for 60s, ramped up over 10s
+  BASE_URL=http://localhost:3000 python e2e_flows.py --load --users 20 --ramp-up 10 --duration 60
+
+  # Open-model load: 5 new users/sec (capped at 50 in flight)
+  BASE_URL=http://localhost:3000 python e2e_flows.py --load --arrival-rate 5 --users 50
+
+  # SSE latency: time-to-first-chunk / inter-chunk gaps on the three streaming routes
+  BASE_URL=http://localhost:3000 python e2e_flows.py --stream-bench --iterations 20 --users 4
+
+  # Same, once without and once with SSE frame coalescing: frames/sec and CPU per stream
+  BASE_URL=http://localhost:3000 python e2e_flows.py --stream-bench --coalesce both --server-pid "$(pgrep -f dist/index.js)"
+
+  # Rehearsal soak: 40 full interviews, 8 at a time, per-round latency/payload growth
+  BASE_URL=http://localhost:3000 python e2e_flows.py --soak --sessions 40 --users 8 --soak-csv soak.csv
+
+  # Feedback latency: end 30 interviews after 2 turns, 10 at a time, wait on the SSE notification
+  BASE_URL=http://localhost:3000 python e2e_flows.py --feedback-bench --sessions 30 --users 10 --rounds 2
+
+  # Login storm: 5s of /health + history probes, then 30s of 32 clients hammering /auth/login
+  # (start the backend with AUTH_RATE_LIMIT_MAX raised, or most logins are rate limited)
+  BASE_URL=http://localhost:3000 python e2e_flows.py --login-storm --users 32 --duration 30
+
+  # History depth: first and deepest history pages, offset vs cursor, at 20 / 200 / 2000 rows
+  # (seeding creates that many sessions; start the backend with RATE_LIMIT_MAX raised)
+  BASE_URL=http://localhost:3000 python e2e_flows.py --history-bench --depths 20,200,2000 --iterations 20 --analyzed-share 0.25
+
+  # Core scaling: the --load workload at 1, 2 and 4 cluster workers (the harness starts and stops the backend)
+  BASE_URL=http://localhost:3000 python e2e_flows.py --scale-sweep 1,2,4 --users 64 --duration 30 --sweep-csv scale.csv
+
+  # Shared limits: two backends on one Redis, mock upstream slow enough for streams to overlap
+  BASE_URL=http://localhost:3000 python e2e_flows.py --limits-check --targets http://localhost:3000,http://localhost:3002 \
+      --mock-upstream 4010 --token-rate 20
+
+  # Saturation: 4, 16 and 48 analyses in flight for 30s each against a small scheduler
+  # (backend started with AI_MAX_CONCURRENT=4 AI_QUEUE_LIMIT=8 and RATE_LIMIT_MAX / AUTH_RATE_LIMIT_MAX raised)
+  BASE_URL=http://localhost:3000 python e2e_flows.py --saturation --levels 4,16,48 --duration 30 \
+      --mock-upstream 4010 --token-rate 200
+
+  # Upstream resilience: 5% stalled upstream connections, single attempt vs 500ms hedging, then the
+  # upstream fully down (the harness starts the mock upstream and restarts the backend per phase)
+  BASE_URL=http://localhost:3000 python e2e_flows.py --resilience-bench --requests 200 --users 8 \
+      --error-mode stall --error-rate 0.05 --token-rate 400 --hedge-delay 500 --first-token-timeout 5000
+
+  # Flaky connections: 30% of stream connections dropped by the client, restarting the analysis vs
+  # resuming it with Last-Event-ID, counting upstream calls (the harness starts mock upstream and backend)
+  BASE_URL=http://localhost:3000 python e2e_flows.py --flaky-bench --requests 100 --users 8 \
+      --drop-rate 0.3 --token-rate 100
+
+  # Legacy transcripts: seed sessions stored the old way (JSON column, messageCount 0) into the backend's
+  # SQLite database, restart the backend and check the startup copy (the harness starts the backend)
+  BASE_URL=http://localhost:3000 python e2e_flows.py --backfill-check
+
+  # Any live run can export per-endpoint p50/p90/p99, throughput and error rate. Live runs also scrape the
+  # server's /metrics before and after (METRICS_TOKEN if the server sets one) and split each endpoint's
+  # mean latency into db / upstream / serialization time
+  BASE_URL=http://localhost:3000 python e2e_flows.py --load --export latency.json
+
+  # Regression gate: save a baseline once, then fail later runs whose p95 or req/s regress
+  BASE_URL=http://localhost:3000 python e2e_flows.py --load --duration 30 --save-baseline perf-baseline.json
+  BASE_URL=http://localhost:3000 python e2e_flows.py --load --duration 30 --baseline perf-baseline.json
 """
 
+import argparse
+import asyncio
+import csv
 import json
+import math
 import os
+import random
+import re
+import shlex
+import signal
+import sqlite3
+import subprocess
 import sys
+import tempfile
+import time
+import unicodedata
 import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import ContextVar
 from dataclasses import dataclass, field
-from typing import Any
+from datetime import datetime, timezone
+from typing import Any, Callable
 from unittest.mock import MagicMock, patch
+from urllib.request import Request, urlopen
+
+from mock_anthropic import (
+    MockConfig, MockUpstreamThread, PromptCache, add_mock_arguments, config_from_args, prompt_blocks,
+)
 
 # ---------------------------------------------------------------------------
 # Configuration
@@ -43,6 +128,138 @@ if LIVE_MODE:
 # Helpers
 # ---------------------------------------------------------------------------
 
+class LatencyHistogram:
+    """Log-linear latency histogram in microseconds (HDR-style).
+
+    Each power-of-two range is split into 2**(SUB_BUCKET_BITS - 1) linear
+    buckets, so every recorded value keeps ~0.4% relative precision while
+    memory is bounded by the dynamic range (a few thousand buckets for
+    1µs..1h), not by the number of samples.
+    """
+
+    SUB_BUCKET_BITS = 8
+    _HALF = 1 << (SUB_BUCKET_BITS - 1)
+
+    def __init__(self):
+        self.counts: dict[int, int] = {}
+        self.count = 0
+        self.total_us = 0
+        self.min_us = 0
+        self.max_us = 0
+
+    @classmethod
+    def _index(cls, value_us: int) -> int:
+        shift = max(0, value_us.bit_length() - cls.SUB_BUCKET_BITS)
+        return shift * cls._HALF + (value_us >> shift)
+
+    @classmethod
+    def _highest_equivalent(cls, index: int) -> int:
+        if index < 2 * cls._HALF:
+            return index
+        shift = index // cls._HALF - 1
+        return ((index - shift * cls._HALF + 1) << shift) - 1
+
+    def record(self, seconds: float):
+        value_us = max(0, round(seconds * 1_000_000))
+        idx = self._index(value_us)
+        self.counts[idx] = self.counts.get(idx, 0) + 1
+        self.min_us = value_us if self.count == 0 else min(self.min_us, value_us)
+        self.max_us = max(self.max_us, value_us)
+        self.count += 1
+        self.total_us += value_us
+
+    def merge(self, other: "LatencyHistogram"):
+        for idx, n in other.counts.items():
+            self.counts[idx] = self.counts.get(idx, 0) + n
+        if other.count:
+            self.min_us = other.min_us if self.count == 0 else min(self.min_us, other.min_us)
+            self.max_us = max(self.max_us, other.max_us)
+        self.count += other.count
+        self.total_us += other.total_us
+
+    def percentile(self, pct: float) -> float:
+        """Value at `pct` (0-100) in milliseconds; the bucket's upper bound, capped at max."""
+        if not self.count:
+            return 0.0
+        target = max(1, -(-self.count * pct // 100))  # nearest rank
+        seen = 0
+        for idx in sorted(self.counts):
+            seen += self.counts[idx]
+            if seen >= target:
+                return min(self._highest_equivalent(idx), self.max_us) / 1000
+        return self.max_us / 1000
+
+    @property
+    def mean(self) -> float:
+        return self.total_us / self.count / 1000 if self.count else 0.0
+
+    def to_dict(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "meanMs": round(self.mean, 3),
+            "p50Ms": self.percentile(50),
+            "p90Ms": self.percentile(90),
+            "p95Ms": self.percentile(95),
+            "p99Ms": self.percentile(99),
+            "maxMs": self.max_us / 1000,
+        }
+
+
+# Token usage keys reported in the `usage` of SSE done events (see AiUsage in ai.service.ts)
+TOKEN_FIELDS = ("calls", "inputTokens", "outputTokens", "cacheReadTokens", "cacheWriteTokens")
+
+
+def prompt_cache_hit_rate(usage: dict[str, Any]) -> float:
+    """Share of prompt tokens served from the upstream prompt cache."""
+    prompt = sum(int(usage.get(k) or 0) for k in ("inputTokens", "cacheReadTokens", "cacheWriteTokens"))
+    return int(usage.get("cacheReadTokens") or 0) / prompt if prompt else 0.0
+
+
+def is_error_status(status: int) -> bool:
+    """Transport failures (recorded as status 0), 429 and 5xx count as errors.
+
+    Other 4xx are deliberate contract outcomes (401 without a token, 409 on a
+    duplicate register, ...) and would otherwise swamp the error rate.
+    """
+    return status == 0 or status == 429 or status >= 500
+
+
+REQUEST_ID_HEADER = "X-Request-Id"
+# Server-side phases as named in Server-Timing and the SSE `timing` event
+SERVER_PHASES = ("auth", "db", "ai", "serialize")
+SLOWEST_KEPT = 10
+
+
+def new_request_id() -> str:
+    return f"e2e-{uuid.uuid4().hex[:16]}"
+
+
+def parse_server_timing(header: str | None) -> dict[str, float] | None:
+    """`auth;dur=1.2, db;dur=3.4, ..., total;dur=9` → {"auth": 1.2, ..., "total": 9.0} (ms)."""
+    if not header:
+        return None
+    phases: dict[str, float] = {}
+    for metric in header.split(","):
+        name, _, params = metric.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                try:
+                    phases[name.strip()] = float(value)
+                except ValueError:
+                    pass
+    return phases or None
+
+
+@dataclass
+class SlowRequest:
+    endpoint: str
+    status: int
+    seconds: float                      # as the harness saw it
+    request_id: str
+    server: dict[str, float] | None     # Server-Timing / SSE timing phases in ms, "total" included
+
+
 @dataclass
 class TestResult:
     name: str
@@ -53,15 +270,209 @@ class TestResult:
 @dataclass
 class TestReport:
     results: list[TestResult] = field(default_factory=list)
+    timings: dict[tuple[str, int], LatencyHistogram] = field(default_factory=dict)
+    cache: dict[str, dict[str, int]] = field(default_factory=dict)
+    tokens: dict[str, dict[str, int]] = field(default_factory=dict)
+    sizes: dict[str, dict[str, int]] = field(default_factory=dict)
+    slowest: list[SlowRequest] = field(default_factory=list)
+    first_request_at: float | None = None
+    last_response_at: float | None = None
 
     def add(self, name: str, passed: bool, detail: str = ""):
         self.results.append(TestResult(name, passed, detail))
 
+    def merge(self, other: "TestReport"):
+        """Append another report's results and fold in its latency histograms."""
+        self.results.extend(other.results)
+        for key, hist in other.timings.items():
+            self.timings.setdefault(key, LatencyHistogram()).merge(hist)
+        for endpoint, counts in other.cache.items():
+            mine = self.cache.setdefault(endpoint, {"hit": 0, "miss": 0})
+            for outcome, n in counts.items():
+                mine[outcome] += n
+        for endpoint, counts in other.tokens.items():
+            mine = self.tokens.setdefault(endpoint, dict.fromkeys(TOKEN_FIELDS, 0))
+            for key, n in counts.items():
+                mine[key] += n
+        for endpoint, counts in other.sizes.items():
+            mine = self.sizes.setdefault(endpoint, {"responses": 0, "bytes": 0})
+            for key, n in counts.items():
+                mine[key] += n
+        self.slowest = sorted(self.slowest + other.slowest, key=lambda r: r.seconds, reverse=True)[:SLOWEST_KEPT]
+        if other.first_request_at is not None:
+            self.first_request_at = min(filter(None, (self.first_request_at, other.first_request_at)))
+            self.last_response_at = max(filter(None, (self.last_response_at, other.last_response_at)))
+
+    def record_timing(self, endpoint: str, status: int, seconds: float):
+        """Record one request's latency under (endpoint, status); status 0 = transport error."""
+        now = time.perf_counter()
+        if self.first_request_at is None:
+            self.first_request_at = now - seconds
+        self.last_response_at = now
+        hist = self.timings.get((endpoint, status))
+        if hist is None:
+            hist = self.timings[(endpoint, status)] = LatencyHistogram()
+        hist.record(seconds)
+
+    def record_trace(
+        self, endpoint: str, status: int, seconds: float, request_id: str, server: dict[str, float] | None,
+    ):
+        """Keep the request if it is among the SLOWEST_KEPT slowest, with its ID and server-side split."""
+        if len(self.slowest) >= SLOWEST_KEPT and seconds <= self.slowest[-1].seconds:
+            return
+        self.slowest.append(SlowRequest(endpoint, status, seconds, request_id, server))
+        self.slowest.sort(key=lambda r: r.seconds, reverse=True)
+        del self.slowest[SLOWEST_KEPT:]
+
+    def record_cache(self, endpoint: str, header: str | None):
+        """Count an X-Cache HIT/MISS response header; responses without one are ignored."""
+        outcome = (header or "").strip().lower()
+        if outcome in ("hit", "miss"):
+            self.cache.setdefault(endpoint, {"hit": 0, "miss": 0})[outcome] += 1
+
+    def record_size(self, endpoint: str, body_bytes: int | None):
+        """Add one response body's size; None (no Content-Length, e.g. SSE) is ignored."""
+        if body_bytes is not None:
+            totals = self.sizes.setdefault(endpoint, {"responses": 0, "bytes": 0})
+            totals["responses"] += 1
+            totals["bytes"] += body_bytes
+
+    def record_usage(self, endpoint: str, usage: dict[str, Any]):
+        """Add one AI call's token usage (from an SSE done event) to the endpoint's totals."""
+        totals = self.tokens.setdefault(endpoint, dict.fromkeys(TOKEN_FIELDS, 0))
+        totals["calls"] += 1
+        for key in TOKEN_FIELDS[1:]:
+            totals[key] += int(usage.get(key) or 0)
+
+    @property
+    def elapsed(self) -> float:
+        if self.first_request_at is None or self.last_response_at is None:
+            return 0.0
+        return self.last_response_at - self.first_request_at
+
+    def endpoint_summary(self) -> dict[str, dict[str, Any]]:
+        """Per-endpoint latency percentiles, throughput, error rate and per-status detail."""
+        merged: dict[str, LatencyHistogram] = {}
+        errors: dict[str, int] = {}
+        statuses: dict[str, dict[str, Any]] = {}
+        for (endpoint, status), hist in sorted(self.timings.items()):
+            merged.setdefault(endpoint, LatencyHistogram()).merge(hist)
+            if is_error_status(status):
+                errors[endpoint] = errors.get(endpoint, 0) + hist.count
+            statuses.setdefault(endpoint, {})[str(status)] = hist.to_dict()
+
+        elapsed = self.elapsed
+        summary: dict[str, dict[str, Any]] = {}
+        for endpoint, hist in merged.items():
+            summary[endpoint] = {
+                **hist.to_dict(),
+                "errors": errors.get(endpoint, 0),
+                "errorRate": errors.get(endpoint, 0) / hist.count,
+                "throughput": hist.count / elapsed if elapsed else 0.0,
+                "statuses": statuses[endpoint],
+            }
+        for endpoint, counts in self.cache.items():
+            if endpoint in summary:
+                lookups = counts["hit"] + counts["miss"]
+                summary[endpoint]["cache"] = {**counts, "hitRate": counts["hit"] / lookups if lookups else 0.0}
+        for endpoint, totals in self.tokens.items():
+            if endpoint in summary:
+                summary[endpoint]["tokens"] = {**totals, "promptCacheHitRate": prompt_cache_hit_rate(totals)}
+        for endpoint, totals in self.sizes.items():
+            if endpoint in summary and totals["responses"]:
+                summary[endpoint]["meanBytes"] = totals["bytes"] / totals["responses"]
+        return summary
+
+    def print_latency_summary(self):
+        summary = self.endpoint_summary()
+        total = sum(e["count"] for e in summary.values())
+        errors = sum(e["errors"] for e in summary.values())
+        elapsed = self.elapsed
+
+        print("\n" + "=" * 100)
+        print(f"  Latency Report (ms)  --  {total} requests in {elapsed:.1f}s")
+        print("=" * 100)
+        print(f"  {'endpoint':<36}{'count':>7}{'err%':>7}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}{'req/s':>8}"
+              f"{'bytes':>8}  statuses")
+        for endpoint, e in summary.items():
+            codes = " ".join(f"{code if code != '0' else 'ERR'}:{s['count']}" for code, s in e["statuses"].items())
+            size = f"{e['meanBytes']:>8.0f}" if "meanBytes" in e else f"{'-':>8}"
+            print(
+                f"  {endpoint:<36}{e['count']:>7}{e['errorRate'] * 100:>7.1f}"
+                f"{e['p50Ms']:>9.1f}{e['p90Ms']:>9.1f}{e['p99Ms']:>9.1f}{e['maxMs']:>9.1f}"
+                f"{e['throughput']:>8.1f}{size}  {codes}"
+            )
+        print("-" * 100)
+        print(
+            f"  Throughput: {total / elapsed if elapsed else 0:.1f} req/s  |  "
+            f"Error rate: {errors / total * 100 if total else 0:.2f}%  ({errors}/{total})"
+        )
+        for endpoint, e in summary.items():
+            if "cache" in e:
+                c = e["cache"]
+                print(f"  Cache {endpoint}: {c['hitRate'] * 100:.1f}% hit  ({c['hit']} hit / {c['miss']} miss)")
+            if "tokens" in e:
+                t = e["tokens"]
+                print(f"  Prompt cache {endpoint}: {t['promptCacheHitRate'] * 100:.1f}% of prompt tokens read  "
+                      f"(read {t['cacheReadTokens']} / write {t['cacheWriteTokens']} / uncached {t['inputTokens']}, "
+                      f"{t['calls']} calls)")
+        print("=" * 100)
+
+    def print_slowest(self):
+        """The slowest requests with the server's own phase split; `other` is server time outside those phases."""
+        print("\n" + "=" * 118)
+        print("  Slowest Requests (ms; server phases from Server-Timing / the SSE timing event)")
+        print("=" * 118)
+        print(f"  {'endpoint':<32}{'status':>7}{'client':>9}{'server':>9}"
+              + "".join(f"{phase:>10}" for phase in SERVER_PHASES) + f"{'other':>9}  request id")
+        for r in self.slowest:
+            if r.server:
+                phases = "".join(f"{r.server.get(phase, 0.0):>10.1f}" for phase in SERVER_PHASES)
+                total = r.server.get("total", 0.0)
+                other = max(0.0, total - sum(r.server.get(phase, 0.0) for phase in SERVER_PHASES))
+                server = f"{total:>9.1f}{phases}{other:>9.1f}"
+            else:
+                server = f"{'-':>9}" + "".join(f"{'-':>10}" for _ in SERVER_PHASES) + f"{'-':>9}"
+            print(f"  {r.endpoint:<32}{r.status or 'ERR':>7}{r.seconds * 1000:>9.1f}{server}  {r.request_id}")
+        print("=" * 118)
+
+    def export(self, path: str):
+        """Write the latency summary as JSON or CSV (by file extension)."""
+        summary = self.endpoint_summary()
+        if path.endswith(".csv"):
+            columns = ["count", "errors", "errorRate", "throughput", "meanMs", "p50Ms", "p90Ms", "p95Ms", "p99Ms", "maxMs"]
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["endpoint", "status", *columns, "cacheHitRate", "promptCacheHitRate", "meanBytes"])
+                for endpoint, e in summary.items():
+                    writer.writerow([endpoint, "all", *(e[c] for c in columns), e.get("cache", {}).get("hitRate", ""),
+                                     e.get("tokens", {}).get("promptCacheHitRate", ""), e.get("meanBytes", "")])
+                    for status, s in e["statuses"].items():
+                        errs = s["count"] if is_error_status(int(status)) else 0
+                        writer.writerow([endpoint, status, s["count"], errs, errs / s["count"], "",
+                                         s["meanMs"], s["p50Ms"], s["p90Ms"], s["p95Ms"], s["p99Ms"], s["maxMs"]])
+            return
+
+        passed = sum(1 for r in self.results if r.passed)
+        with open(path, "w") as f:
+            json.dump({
+                "generatedAt": datetime.now(timezone.utc).isoformat(),
+                "baseUrl": BASE_URL,
+                "elapsedSeconds": self.elapsed,
+                "tests": {"total": len(self.results), "passed": passed, "failed": len(self.results) - passed},
+                "endpoints": summary,
+            }, f, ensure_ascii=False, indent=2)
+
     def print_summary(self):
         total = len(self.results)
         passed = sum(1 for r in self.results if r.passed)
         failed = total - passed
 
+        if self.timings:
+            self.print_latency_summary()
+        if self.slowest:
+            self.print_slowest()
+
         print("\n" + "=" * 70)
         print(f"  E2E API Contract Test Report")
         print("=" * 70)
@@ -80,7 +491,19 @@ class TestReport:
         return failed
 
 
-report = TestReport()
+class _ReportProxy:
+    """Module-level `report` that routes to the TestReport of the running test.
+
+    Tests and assertion helpers keep calling `report.add(...)`; under the
+    parallel runner each worker sets its own report in `_current_report`.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(_current_report.get(), name)
+
+
+_current_report: ContextVar[TestReport] = ContextVar("e2e_report", default=TestReport())
+report = _ReportProxy()
 
 
 def url(path: str) -> str:
@@ -97,6 +520,50 @@ def auth_headers(token: str | None = None) -> dict[str, str]:
     return {"Authorization": f"Bearer {t}"}
 
 
+# Path segments that are followed by a resource id, e.g. /rehearsal/end/:id
+ID_PARENT_SEGMENTS = {"session", "end", "feedback"}
+
+
+def endpoint_name(method: str, path: str) -> str:
+    """'GET /api/v1/rehearsal/feedback/abc123' → 'GET /rehearsal/feedback/:id'"""
+    parts = path.removeprefix(API_PREFIX).split("/")
+    for i in range(1, len(parts)):
+        if parts[i] and parts[i - 1] in ID_PARENT_SEGMENTS:
+            parts[i] = ":id"
+    return f"{method} {'/'.join(parts)}"
+
+
+def timing_hooks(target: "TestReport", asynchronous: bool = False) -> dict[str, list[Any]]:
+    """httpx event hooks recording each request's time-to-response-headers into `target`."""
+    def on_request(request: "httpx.Request"):
+        request.headers.setdefault(REQUEST_ID_HEADER, new_request_id())
+        request.extensions["e2e_started_at"] = time.perf_counter()
+
+    def on_response(response: "httpx.Response"):
+        started = response.request.extensions.get("e2e_started_at")
+        if started is not None:
+            endpoint = endpoint_name(response.request.method, response.request.url.path)
+            elapsed = time.perf_counter() - started
+            target.record_timing(endpoint, response.status_code, elapsed)
+            target.record_trace(endpoint, response.status_code, elapsed,
+                                response.headers.get(REQUEST_ID_HEADER) or response.request.headers[REQUEST_ID_HEADER],
+                                parse_server_timing(response.headers.get("server-timing")))
+            target.record_cache(endpoint, response.headers.get("x-cache"))
+            length = response.headers.get("content-length")
+            target.record_size(endpoint, int(length) if length is not None else None)
+
+    if not asynchronous:
+        return {"request": [on_request], "response": [on_response]}
+
+    async def on_request_async(request: "httpx.Request"):
+        on_request(request)
+
+    async def on_response_async(response: "httpx.Response"):
+        on_response(response)
+
+    return {"request": [on_request_async], "response": [on_response_async]}
+
+
 # ---------------------------------------------------------------------------
 # Mock response factory
 # ---------------------------------------------------------------------------
@@ -121,7 +588,9 @@ def failure_body(code: str, message: str, details: Any = None) -> dict[str, Any]
     return body
 
 
-def paginated_body(data: list[Any], page: int, limit: int, total: int) -> dict[str, Any]:
+def paginated_body(
+    data: list[Any], page: int | None, limit: int, total: int | None, next_cursor: str | None = None,
+) -> dict[str, Any]:
     return {
         "success": True,
         "data": data,
@@ -129,7 +598,8 @@ def paginated_body(data: list[Any], page: int, limit: int, total: int) -> dict[s
             "page": page,
             "limit": limit,
             "total": total,
-            "totalPages": -(-total // limit),  # ceil division
+            "totalPages": None if total is None else -(-total // limit),  # ceil division
+            "nextCursor": next_cursor,
         },
     }
 
@@ -166,6 +636,7 @@ def assert_paginated_envelope(body: dict[str, Any], test_name: str) -> bool:
         and "limit" in pagination
         and "total" in pagination
         and "totalPages" in pagination
+        and "nextCursor" in pagination
     )
     if not ok:
         report.add(f"{test_name} [paginated envelope]", False, f"Expected paginated envelope, got: {body}")
@@ -246,6 +717,7 @@ def test_auth_me_valid_token():
     body = success_body({
         "id": "u1", "email": "test@example.com", "name": "Test",
         "usageCount": 5, "createdAt": "2026-01-01T00:00:00Z",
+        "usageByFeature": {"feynman": 3, "layers": 0, "rehearsal": 2},
     })
     resp = _mock_response(200, body)
 
@@ -255,6 +727,30 @@ def test_auth_me_valid_token():
     user = data["data"]
     assert "id" in user and "email" in user and "name" in user
     assert "usageCount" in user
+    assert set(user["usageByFeature"]) == {"feynman", "layers", "rehearsal"}
+    assert sum(user["usageByFeature"].values()) == user["usageCount"]
+    report.add(name, True)
+
+
+def test_usage_flush_with_deleted_user():
+    """A usage batch holding a deleted user's increments still writes everyone else's and is not retried forever"""
+    name = "Flow1: Usage flush with a deleted user"
+    # Three users buffered; the batch transaction fails on the deleted one, the per-user retry writes the rest
+    before = parse_metrics("mingjing_usage_counter_flushes 4\nmingjing_usage_counter_failed_flushes 0\n"
+                           "mingjing_usage_counter_dropped_users 0\nmingjing_usage_counter_buffered 3\n")
+    after = parse_metrics("mingjing_usage_counter_flushes 5\nmingjing_usage_counter_failed_flushes 1\n"
+                          "mingjing_usage_counter_dropped_users 1\nmingjing_usage_counter_buffered 0\n")
+    delta = metrics_delta(before, after)
+    assert _metric_total(delta, "mingjing_usage_counter_flushes") == 1, "The surviving users were written"
+    assert _metric_total(delta, "mingjing_usage_counter_dropped_users") == 1
+    assert after[("mingjing_usage_counter_buffered", ())] == 0, "The deleted user's increments are not re-queued"
+
+    resp = _mock_response(200, success_body({
+        "id": "u1", "email": "test@example.com", "name": "Test", "usageCount": 2, "createdAt": "2026-01-01T00:00:00Z",
+        "usageByFeature": {"feynman": 1, "layers": 1, "rehearsal": 0},
+    }))
+    user = resp.json()["data"]
+    assert sum(user["usageByFeature"].values()) == user["usageCount"] == 2
     report.add(name, True)
 
 
@@ -352,6 +848,29 @@ def test_feynman_session_isolation():
     report.add(name, True)
 
 
+def test_feynman_analyze_cache_replay():
+    """Resubmitted text normalizes to the same cache key; a HIT replays chunk → done like a MISS"""
+    name = "Flow2: Feynman analyze cache replay"
+    for _ in range(10):
+        assert normalize_analysis_input(analysis_input(SAMPLE_STAR_STORY, True)) == \
+            normalize_analysis_input(SAMPLE_STAR_STORY)
+    assert normalize_analysis_input(analysis_input(SAMPLE_STAR_STORY, False)) != \
+        normalize_analysis_input(SAMPLE_STAR_STORY)
+
+    def frames(chunks: list[str], usage: dict[str, int]) -> bytes:
+        body = "".join(f"event: chunk\ndata: {json.dumps({'type': 'content', 'content': c})}\n\n" for c in chunks)
+        done = {"type": "result", "scores": {"total": 80}, "usage": usage}
+        return (body + f"event: done\ndata: {json.dumps(done)}\n\n").encode()
+
+    text = '{"scores": {"total": 80}}'
+    miss = SSEParser().feed(frames([text[:5], text[5:12], text[12:]], {"inputTokens": 900}))
+    hit = SSEParser().feed(frames([text], {"inputTokens": 0}))
+    for events in (miss, hit):
+        assert [e.event for e in events][-1] == "done" and {e.event for e in events} == {"chunk", "done"}
+        assert "".join(e.data["content"] for e in events if e.event == "chunk") == text
+    report.add(name, True)
+
+
 # ---------------------------------------------------------------------------
 # Flow 3: Layers
 # ---------------------------------------------------------------------------
@@ -450,15 +969,29 @@ def test_rehearsal_message_completed_session():
 
 
 def test_rehearsal_end_session():
-    """POST /rehearsal/end/:sessionId (authenticated) → 200"""
+    """POST /rehearsal/end/:sessionId (authenticated) → 202, feedback queued"""
     name = "Flow4: Rehearsal end session"
-    body = success_body({"feedbackId": "rs-1", "status": "completed"})
-    resp = _mock_response(200, body)
+    body = success_body({"feedbackId": "rs-1", "status": "generating"})
+    resp = _mock_response(202, body)
 
-    assert resp.status_code == 200
+    assert resp.status_code == 202
     data = resp.json()
     assert_success_envelope(data, name)
-    assert data["data"]["status"] == "completed"
+    assert data["data"]["status"] == "generating"
+    report.add(name, True)
+
+
+def test_rehearsal_end_queue_full():
+    """POST /rehearsal/end/:sessionId (feedback queue full) → 503 + Retry-After"""
+    name = "Flow4: Rehearsal end session (queue full)"
+    resp = _mock_response(503, failure_body("QUEUE_FULL", "反馈生成排队人数过多，请稍后再试"))
+    resp.headers["retry-after"] = "30"
+
+    assert resp.status_code == 503
+    data = resp.json()
+    assert_failure_envelope(data, name)
+    assert data["error"]["code"] == "QUEUE_FULL"
+    assert int(resp.headers["retry-after"]) > 0
     report.add(name, True)
 
 
@@ -478,6 +1011,22 @@ def test_rehearsal_feedback_ready():
     report.add(name, True)
 
 
+def test_rehearsal_feedback_stream():
+    """GET /rehearsal/feedback/:sessionId/stream → status frame, then done with the feedback"""
+    name = "Flow4: Rehearsal feedback stream"
+    feedback = {"scores": {"total": 82}, "summary": "表达清晰"}
+    raw = (
+        b'event: status\ndata: {"type": "status", "status": "generating"}\n\n'
+        + f"event: done\ndata: {json.dumps({'type': 'feedback', 'feedback': feedback})}\n\n".encode()
+    )
+    events = SSEParser().feed(raw)
+
+    assert [e.event for e in events] == ["status", "done"], events
+    assert events[0].data["status"] == "generating"
+    assert events[-1].data["feedback"] == feedback
+    report.add(name, True)
+
+
 def test_rehearsal_feedback_generating():
     """GET /rehearsal/feedback/:sessionId → 202 (still generating)"""
     name = "Flow4: Rehearsal feedback (generating)"
@@ -556,6 +1105,27 @@ def test_paginated_response_format():
     assert p["limit"] == 10
     assert p["total"] == 25
     assert p["totalPages"] == 3  # ceil(25/10)
+    assert p["nextCursor"] is None
+    report.add(name, True)
+
+
+def test_paginated_cursor_format():
+    """?cursor= pages carry an opaque nextCursor; page and (uncounted) total are null"""
+    name = "Flow5: Cursor paginated response format"
+    first = paginated_body([{"id": "3"}, {"id": "2"}], page=None, limit=2, total=None, next_cursor="MTcwMDoy")
+    assert_paginated_envelope(first, name)
+    p = first["pagination"]
+    assert p["page"] is None and p["total"] is None and p["totalPages"] is None
+    assert isinstance(p["nextCursor"], str) and p["nextCursor"]
+
+    # count=true on a cursor request still reports the total
+    last = paginated_body([{"id": "1"}], page=None, limit=2, total=3, next_cursor=None)
+    assert last["pagination"]["totalPages"] == 2 and last["pagination"]["nextCursor"] is None
+
+    bad = _mock_response(400, failure_body("INVALID_CURSOR", "分页游标无效，请从第一页重新加载"))
+    assert bad.status_code == 400
+    assert_failure_envelope(bad.json(), name)
+    assert bad.json()["error"]["code"] == "INVALID_CURSOR"
     report.add(name, True)
 
 
@@ -570,6 +1140,10 @@ def test_error_codes_enumeration():
         "INTERNAL_ERROR",
         "INVALID_CREDENTIALS",
         "SESSION_COMPLETED",
+        "INVALID_CURSOR",
+        "AI_BUSY",
+        "AI_UNAVAILABLE",
+        "STREAM_EXPIRED",
     }
     # Each code must be a non-empty uppercase string
     for code in known_codes:
@@ -578,134 +1152,2841 @@ def test_error_codes_enumeration():
     report.add(name, True)
 
 
+# ---------------------------------------------------------------------------
+# Flow 6: SSE streaming format
+# ---------------------------------------------------------------------------
+
+def test_sse_parser_fragmented_frames():
+    """SSE parser reassembles frames split across arbitrary network reads"""
+    name = "Flow6: SSE parser (fragmented frames)"
+    raw = (
+        'event: chunk\ndata: {"type":"content","content":"你好"}\n\n'
+        ': heartbeat\n\n'
+        'event: chunk\ndata: {"type":"content","content":"world"}\n\n'
+        'event: done\ndata: {"type":"result","summary":"ok"}\n\n'
+    ).encode()
+    parser = SSEParser()
+    events: list[SSEEvent] = []
+    # Feed in 7-byte slices so frames (and a multi-byte UTF-8 char) straddle reads
+    for i in range(0, len(raw), 7):
+        events.extend(parser.feed(raw[i:i + 7]))
+
+    assert [e.event for e in events] == ["chunk", "chunk", "done"], f"Got {[e.event for e in events]}"
+    assert events[0].data == {"type": "content", "content": "你好"}
+    assert events[2].data["type"] == "result"
+    report.add(name, True)
+
+
+def test_sse_stream_event_sequence():
+    """Streaming routes emit chunk* then exactly one terminal done|error event"""
+    name = "Flow6: SSE stream event sequence"
+    parser = SSEParser()
+    events = parser.feed(
+        b'event: chunk\ndata: {"type":"content","content":"a"}\n\n'
+        b'event: error\ndata: {"type":"error","message":"\xe5\x88\x86\xe6\x9e\x90\xe5\xa4\xb1\xe8\xb4\xa5"}\n\n'
+    )
+    terminal = [e for e in events if e.event in SSE_TERMINAL_EVENTS]
+    assert len(terminal) == 1 and events[-1] is terminal[0], "Terminal event must be last and unique"
+    assert terminal[0].data["type"] == "error" and "message" in terminal[0].data
+    report.add(name, True)
+
+
+def test_sse_coalesced_frames():
+    """Coalesced and per-delta streams reassemble to the same text; keepalive comments are not events"""
+    name = "Flow6: SSE coalesced frames"
+    deltas = ["面试", "官：", "请介绍", "一下你", "最近的项目。"]
+
+    def stream(chunks: list[str]) -> bytes:
+        body = ": keepalive\n\n"
+        body += "".join(f"event: chunk\ndata: {json.dumps({'type': 'content', 'content': c})}\n\n" for c in chunks)
+        return (body + 'event: done\ndata: {"type":"message"}\n\n').encode()
+
+    # Coalesced: the first delta goes out alone, the rest share one window
+    raw_off, raw_on = stream(deltas), stream([deltas[0], "".join(deltas[1:])])
+    runs = []
+    for mode, raw in (("off", raw_off), ("on", raw_on)):
+        events = SSEParser().feed(raw)
+        assert events[-1].event == "done" and all(e.event in ("chunk", "done") for e in events)
+        assert "".join(e.data["content"] for e in events if e.event == "chunk") == "".join(deltas)
+        timing = StreamTiming("POST /rehearsal/message", status=200, events=events, bytes=len(raw))
+        runs.append(CoalesceRun(mode, [timing, timing], wall=0.5, client_cpu=0.004, server_cpu=None))
+
+    off, on = runs
+    assert len(off.ok[0].events) == len(deltas) + 1 and len(on.ok[0].events) == 3
+    assert on.frames_per_sec < off.frames_per_sec and on.ok[0].bytes < off.ok[0].bytes
+    assert on.per_stream(on.client_cpu) == 0.002 and on.per_stream(on.server_cpu) is None
+    assert read_process_cpu(os.getpid()) is None or read_process_cpu(os.getpid()) >= 0
+    report.add(name, True)
+
+
+def test_sse_structured_parts():
+    """Feynman streams score/improvement parts before done; they agree with the final result"""
+    name = "Flow6: SSE structured parts"
+    result = {
+        "scores": {"udi": 72, "ddi": 65, "cci": 80, "total": 72.3},
+        "improvements": [{"issue": "缺少量化结果", "suggestion": "补充数据", "example": "P99 从 800ms 降到 180ms"}],
+        "summary": "结构完整",
+    }
+    frames = [("chunk", {"type": "content", "content": '{"scores": {"udi": 72'})]
+    frames += [("score", {"type": "score", "dimension": k, "score": v}) for k, v in result["scores"].items()]
+    frames += [("improvement", {"type": "improvement", "index": 0, "improvement": result["improvements"][0]})]
+    frames += [("done", {"type": "result", **result})]
+    raw = "".join(f"event: {e}\ndata: {json.dumps(d, ensure_ascii=False)}\n\n" for e, d in frames).encode()
+    events = SSEParser().feed(raw)
+
+    parts = [e for e in events if e.event in SSE_PART_EVENTS]
+    done = events[-1]
+    assert done.event == "done" and events.index(parts[-1]) < len(events) - 1, "Parts must precede done"
+    scores = {e.data["dimension"]: e.data["score"] for e in parts if e.event == "score"}
+    assert scores == done.data["scores"], f"Streamed scores {scores} != final {done.data['scores']}"
+    improvements = [e.data["improvement"] for e in parts if e.event == "improvement"]
+    assert improvements == done.data["improvements"]
+    assert [e.data["index"] for e in parts if e.event == "improvement"] == list(range(len(improvements)))
+    report.add(name, True)
+
+
+def test_sse_resume_after_drop():
+    """A stream cut mid-frame resumes from the last delivered event ID with nothing lost or repeated"""
+    name = "Flow6: SSE resume after drop"
+    deltas = ["请", "具体", "说明", "你的", "行动", "和结果。"]
+    frames = [("chunk", {"type": "content", "content": d}) for d in deltas] + [("done", {"type": "message"})]
+    numbered = [
+        f"id: s1:{seq}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+        for seq, (event, data) in enumerate(frames, start=1)
+    ]
+    raw = b": keepalive\n\n".join(numbered)
+
+    # Connection drops partway into the fourth frame: its id line arrived, its data did not
+    cut = raw.index(b"id: s1:4") + len(b"id: s1:4\nevent: ch")
+    before = SSEParser().feed(raw[:cut])
+    last_id = before[-1].id
+    assert last_id == "s1:3" and [e.event for e in before] == ["chunk"] * 3, last_id
+
+    # The server replays the frames after that ID on the reconnect
+    after_seq = int(last_id.rsplit(":", 1)[1])
+    after = SSEParser().feed(b"".join(numbered[after_seq:]))
+    events = before + after
+    assert [e.id for e in events] == [f"s1:{n}" for n in range(1, len(frames) + 1)]
+    assert "".join(e.data["content"] for e in events if e.event == "chunk") == "".join(deltas)
+    assert events[-1].event == "done" and sum(e.event in SSE_TERMINAL_EVENTS for e in events) == 1
+    report.add(name, True)
+
+
+# ---------------------------------------------------------------------------
+# Flow 7: Mock Anthropic upstream
+# ---------------------------------------------------------------------------
+
+FEYNMAN_PROMPT_MARKER = "analyze a STAR story (Situation, Task, Action, Result) ... udi"
+LAYERS_PROMPT_MARKER = "breaking it down into four progressive layers"
+FEEDBACK_PROMPT_MARKER = "You are an interview coach reviewing a completed mock interview."
+
+
+def _mock_stream_text(
+    base_url: str, system: str, messages: list[dict[str, str]], timeout: float = 10,
+) -> tuple[list[str], str]:
+    """POST a streaming Messages request to the mock and return (event names, reassembled text)."""
+    req = Request(f"{base_url}/v1/messages", method="POST", headers={"content-type": "application/json"},
+                  data=json.dumps({"model": "mock", "max_tokens": 4096, "stream": True,
+                                   "system": system, "messages": messages}).encode())
+    parser = SSEParser()
+    events: list[SSEEvent] = []
+    with urlopen(req, timeout=timeout) as resp:
+        while chunk := resp.read1(256):
+            events.extend(parser.feed(chunk))
+    text = "".join(e.data["delta"]["text"] for e in events if e.event == "content_block_delta")
+    return [e.event for e in events], text
+
+
+def _analyzer_parse(text: str) -> dict[str, Any]:
+    """Same extraction the backend analyzers apply: /\\{[\\s\\S]*\\}/ then JSON.parse."""
+    start, end = text.index("{"), text.rindex("}")
+    return json.loads(text[start:end + 1])
+
+
+def test_mock_upstream_analyzer_payloads():
+    """Mock upstream streams canned JSON the Feynman/Layers/feedback analyzers can parse"""
+    name = "Flow7: Mock upstream analyzer payloads"
+    cfg = MockConfig(first_token_delay=0, token_rate=1e6, chunk_size=64, seed=7)
+    user = [{"role": "user", "content": "hi"}]
+    with MockUpstreamThread(cfg) as server:
+        events, text = _mock_stream_text(server.base_url, FEYNMAN_PROMPT_MARKER, user)
+        assert events[0] == "message_start" and events[-1] == "message_stop", f"Bad event order: {events}"
+        feynman = _analyzer_parse(text)
+        assert set(feynman["scores"]) == {"udi", "ddi", "cci", "total"}
+        assert {"analysis", "improvements", "summary"} <= set(feynman)
+
+        _, text = _mock_stream_text(server.base_url, LAYERS_PROMPT_MARKER, user)
+        layers = _analyzer_parse(text)
+        assert [layer["layerIndex"] for layer in layers["layers"]] == [0, 1, 2, 3]
+        assert all({"action", "rationale", "priority"} <= set(s) for s in layers["suggestions"])
+
+        _, text = _mock_stream_text(server.base_url, FEEDBACK_PROMPT_MARKER, user)
+        feedback = _analyzer_parse(text)
+        assert "total" in feedback["scores"] and len(feedback["dimensions"]) == 4
+        assert server.stats.by_kind == {"feynman": 1, "layers": 1, "feedback": 1}
+    report.add(name, True)
+
+
+def test_mock_upstream_error_injection():
+    """Mock upstream injects HTTP errors, mid-stream errors and stalled connections at the configured rate"""
+    name = "Flow7: Mock upstream error injection"
+    cfg = MockConfig(first_token_delay=0, token_rate=1e6, chunk_size=64, error_rate=1.0, error_mode="status")
+    interviewer = [{"role": "user", "content": "面试场景：test"}]
+    with MockUpstreamThread(cfg) as server:
+        try:
+            _mock_stream_text(server.base_url, "You are a behavioral interviewer.", interviewer)
+            raise AssertionError("Expected HTTP 529 from mock upstream")
+        except OSError as e:  # urllib raises HTTPError (an OSError) for 4xx/5xx
+            assert getattr(e, "code", None) == 529, f"Expected 529, got {e}"
+
+        server.config.error_mode = "midstream"
+        events, _ = _mock_stream_text(server.base_url, "You are a behavioral interviewer.", interviewer)
+        assert events[-1] == "error" and "message_stop" not in events, f"Bad event order: {events}"
+
+        # A stall sends nothing at all, not even headers: what hedging and the first-token timeout cover
+        server.config.error_mode = "stall"
+        try:
+            _mock_stream_text(server.base_url, "You are a behavioral interviewer.", interviewer, timeout=0.3)
+            raise AssertionError("Expected the stalled request to time out")
+        except TimeoutError:
+            pass
+        assert server.stats.errors == 3
+    report.add(name, True)
+
+
+def _cached_turn(system: str, history: list[tuple[str, str, bool]], user: str) -> dict[str, Any]:
+    """Build a request the way ai.service.ts does: cached system block, marked history messages."""
+    def block(text: str) -> list[dict[str, Any]]:
+        return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+    last = len(history) - 1
+    return {
+        "model": "mock",
+        "system": block(system),
+        "messages": [
+            {"role": role, "content": block(text) if cache or i == last else text}
+            for i, (role, text, cache) in enumerate(history)
+        ] + [{"role": "user", "content": user}],
+    }
+
+
+def test_mock_upstream_prompt_cache():
+    """Mock prompt cache: later rehearsal turns read the prefix written by earlier ones"""
+    name = "Flow7: Mock upstream prompt cache"
+    cfg = MockConfig()
+    cache = PromptCache()
+    system = "You are a behavioral interviewer. " * 150  # comfortably above cache_min_tokens
+    history = [("user", "面试场景：后端工程师", False), ("assistant", "好的，我已了解面试场景。请开始。", True),
+               ("assistant", "请介绍一个你主导的项目。", False)]
+
+    uncached, read, write = cache.lookup("mock", prompt_blocks(_cached_turn(system, history, "答一")), cfg)
+    assert read == 0 and write > 0 and uncached > 0, (uncached, read, write)
+    first_prefix = write
+
+    history += [("user", "答一", False), ("assistant", "你遇到的最大挑战是什么？", False)]
+    uncached, read, write = cache.lookup("mock", prompt_blocks(_cached_turn(system, history, "答二")), cfg)
+    assert read == first_prefix, (read, first_prefix)
+    assert 0 < write < first_prefix and uncached > 0
+
+    # Same prompt under a different model, or with caching off, never hits
+    assert cache.lookup("other", prompt_blocks(_cached_turn(system, history, "答二")), cfg)[1] == 0
+    plain = {"system": system, "messages": [{"role": "user", "content": "hi"}]}
+    assert cache.lookup("mock", prompt_blocks(plain), cfg)[1:] == (0, 0)
+    report.add(name, True)
+
+
+# ---------------------------------------------------------------------------
+# Flow 8: Latency histogram and report export
+# ---------------------------------------------------------------------------
+
+def test_latency_histogram_precision():
+    """Histogram percentiles stay within ~1% of exact values with bounded buckets"""
+    name = "Flow8: Latency histogram precision"
+    rng = random.Random(42)
+    samples = [rng.lognormvariate(-3, 1) for _ in range(20_000)]  # ~50ms median, long tail
+    hist = LatencyHistogram()
+    for sample in samples:
+        hist.record(sample)
+
+    ordered = sorted(samples)
+    for pct in (50, 90, 99):
+        exact = ordered[int(len(ordered) * pct / 100) - 1] * 1000
+        got = hist.percentile(pct)
+        assert abs(got - exact) / exact < 0.01, f"p{pct}: {got:.3f}ms vs exact {exact:.3f}ms"
+    assert hist.percentile(100) == hist.max_us / 1000 == round(max(samples) * 1e6) / 1000
+    assert len(hist.counts) < 2_000, f"Too many buckets: {len(hist.counts)}"
+
+    halves = LatencyHistogram(), LatencyHistogram()
+    for i, sample in enumerate(samples):
+        halves[i % 2].record(sample)
+    halves[0].merge(halves[1])
+    assert halves[0].counts == hist.counts and halves[0].count == hist.count
+    report.add(name, True)
+
+
+def test_report_endpoint_summary_and_export():
+    """TestReport aggregates timings per endpoint/status and exports JSON and CSV"""
+    name = "Flow8: Report endpoint summary + export"
+    assert endpoint_name("GET", f"{API_PREFIX}/rehearsal/feedback/ck123") == "GET /rehearsal/feedback/:id"
+    assert endpoint_name("POST", f"{API_PREFIX}/feynman/session") == "POST /feynman/session"
+
+    local = TestReport()
+    for _ in range(9):
+        local.record_timing("GET /feynman/history", 200, 0.020)
+    local.record_timing("GET /feynman/history", 429, 0.001)
+    summary = local.endpoint_summary()["GET /feynman/history"]
+    assert summary["count"] == 10 and summary["errors"] == 1
+    assert abs(summary["errorRate"] - 0.1) < 1e-9
+    assert set(summary["statuses"]) == {"200", "429"}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path, csv_path = os.path.join(tmp, "r.json"), os.path.join(tmp, "r.csv")
+        local.export(json_path)
+        local.export(csv_path)
+        with open(json_path) as f:
+            exported = json.load(f)
+        assert exported["endpoints"]["GET /feynman/history"]["p99Ms"] == summary["p99Ms"]
+        with open(csv_path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        assert [(r["endpoint"], r["status"]) for r in rows] == [
+            ("GET /feynman/history", "all"), ("GET /feynman/history", "200"), ("GET /feynman/history", "429"),
+        ]
+    report.add(name, True)
+
+
+def test_report_cache_hit_rate():
+    """X-Cache headers are tallied per endpoint, merged across reports and exported"""
+    name = "Flow8: Report cache hit rate"
+    endpoint = "POST /rehearsal/session"
+    first, second = TestReport(), TestReport()
+    for report_, header in ((first, "MISS"), (first, "HIT"), (second, "hit"), (second, None)):
+        report_.record_timing(endpoint, 200, 0.010)
+        report_.record_cache(endpoint, header)
+    first.merge(second)
+
+    cache = first.endpoint_summary()[endpoint]["cache"]
+    assert (cache["hit"], cache["miss"]) == (2, 1), cache
+    assert abs(cache["hitRate"] - 2 / 3) < 1e-9
+    assert "cache" not in TestReport().endpoint_summary().get(endpoint, {})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "r.csv")
+        first.export(csv_path)
+        with open(csv_path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        assert abs(float(rows[0]["cacheHitRate"]) - 2 / 3) < 1e-9
+    report.add(name, True)
+
+
+def test_report_prompt_cache_usage():
+    """Token usage from SSE done events is summed per endpoint with its prompt-cache hit rate"""
+    name = "Flow8: Report prompt cache usage"
+    endpoint = "POST /rehearsal/message"
+    first, second = TestReport(), TestReport()
+    first.record_timing(endpoint, 200, 0.5)
+    first.record_usage(endpoint, {"inputTokens": 100, "outputTokens": 40, "cacheReadTokens": 0, "cacheWriteTokens": 1500})
+    second.record_usage(endpoint, {"inputTokens": 120, "outputTokens": 40, "cacheReadTokens": 1500,
+                                   "cacheWriteTokens": 200})
+    first.merge(second)
+
+    tokens = first.endpoint_summary()[endpoint]["tokens"]
+    assert tokens["calls"] == 2 and tokens["cacheReadTokens"] == 1500 and tokens["cacheWriteTokens"] == 1700
+    assert abs(tokens["promptCacheHitRate"] - 1500 / 3420) < 1e-9, tokens
+    assert prompt_cache_hit_rate({}) == 0.0
+
+    done = SSEParser().feed(b'event: done\ndata: {"type": "message", "usage": {"cacheReadTokens": 7}}\n\n')
+    timing = StreamTiming(endpoint, status=200, events=done)
+    assert timing.usage == {"cacheReadTokens": 7}
+    report.add(name, True)
+
+
+def test_slowest_requests_with_server_timing():
+    """Server-Timing parses into phases; only the slowest requests are kept, across merged reports"""
+    name = "Flow8: Slowest requests with server timing"
+    assert parse_server_timing("auth;dur=1.5, db;dur=3, ai;dur=0, serialize;dur=0.25, total;dur=7.5") == {
+        "auth": 1.5, "db": 3.0, "ai": 0.0, "serialize": 0.25, "total": 7.5}
+    assert parse_server_timing('cache;desc="hit", db;dur=2') == {"db": 2.0}
+    assert parse_server_timing(None) is None and parse_server_timing("cache") is None
+
+    first, second = TestReport(), TestReport()
+    for i in range(SLOWEST_KEPT + 5):
+        first.record_trace("GET /auth/me", 200, i / 1000, f"first-{i}", {"db": 1.0, "total": 2.0})
+    second.record_trace("POST /feynman/analyze", 200, 9.0, "slow-stream", None)
+    assert len(first.slowest) == SLOWEST_KEPT and first.slowest[0].request_id == f"first-{SLOWEST_KEPT + 4}"
+    first.record_trace("GET /auth/me", 200, 0.0, "too-fast", None)
+    assert all(r.request_id != "too-fast" for r in first.slowest)
+
+    first.merge(second)
+    assert len(first.slowest) == SLOWEST_KEPT
+    assert [r.request_id for r in first.slowest[:2]] == ["slow-stream", f"first-{SLOWEST_KEPT + 4}"]
+    assert first.slowest[-1].request_id == "first-6"
+    report.add(name, True)
+
+
+def test_metrics_phase_breakdown():
+    """/metrics scrapes parse, diff, and split each route's mean latency into auth / db / upstream / serialize / other"""
+    name = "Flow8: Server phase breakdown from /metrics"
+    before = parse_metrics(
+        "# HELP mingjing_http_request_duration_seconds x\n"
+        "# TYPE mingjing_http_request_duration_seconds histogram\n"
+        'mingjing_http_request_duration_seconds_bucket{method="GET",route="/api/v1/feynman/history",status="200",'
+        'le="+Inf"} 10\n'
+        'mingjing_http_request_duration_seconds_sum{method="GET",route="/api/v1/feynman/history",status="200"} 0.1\n'
+        'mingjing_http_request_duration_seconds_count{method="GET",route="/api/v1/feynman/history",status="200"} 10\n'
+        'mingjing_http_request_phase_seconds_total{method="GET",route="/api/v1/feynman/history",phase="db"} 0.05\n'
+        'mingjing_feedback_queue_running 3\n'
+    )
+    after_text = "\n".join([
+        'mingjing_http_request_duration_seconds_sum{method="GET",route="/api/v1/feynman/history",status="200"} 0.5',
+        'mingjing_http_request_duration_seconds_count{method="GET",route="/api/v1/feynman/history",status="200"} 30',
+        # A second cluster worker's series are summed in
+        'mingjing_http_request_duration_seconds_sum{method="GET",route="/api/v1/feynman/history",status="200",'
+        'worker="2"} 0.1',
+        'mingjing_http_request_duration_seconds_count{method="GET",route="/api/v1/feynman/history",status="200",'
+        'worker="2"} 10',
+        'mingjing_http_request_phase_seconds_total{method="GET",route="/api/v1/feynman/history",phase="db"} 0.25',
+        'mingjing_http_request_phase_seconds_total{method="GET",route="/api/v1/feynman/history",phase="serialize"} '
+        '0.03',
+        'mingjing_http_request_duration_seconds_count{method="GET",route="/metrics",status="200"} 2',
+        'mingjing_ai_usage_calls{note="quote \\" and \\\\ survive"} 1',
+    ])
+    after = parse_metrics(after_text)
+    assert after[("mingjing_ai_usage_calls", (("note", 'quote " and \\ survive'),))] == 1
+    assert before[("mingjing_http_request_duration_seconds_bucket", (
+        ("le", "+Inf"), ("method", "GET"), ("route", "/api/v1/feynman/history"), ("status", "200")))] == 10
+
+    breakdown = phase_breakdown(metrics_delta(before, after))
+    assert list(breakdown) == ["GET /feynman/history"], breakdown
+    e = breakdown["GET /feynman/history"]
+    # 30 new requests, 0.5s of latency: 16.7ms mean, of which 6.7ms db and 1ms serialization
+    assert e["count"] == 30
+    assert abs(e["meanMs"] - 500 / 30) < 1e-6
+    assert abs(e["dbMs"] - 200 / 30) < 1e-6 and abs(e["serializeMs"] - 1.0) < 1e-6
+    assert e["upstreamMs"] == 0 and e["authMs"] == 0
+    assert abs(e["otherMs"] - (500 - 200 - 30) / 30) < 1e-6
+    report.add(name, True)
+
+
+def test_report_response_sizes():
+    """Response body sizes are averaged per endpoint; bodies without a known size are skipped"""
+    name = "Flow8: Report response sizes"
+    endpoint = "GET /feynman/history"
+    first, second = TestReport(), TestReport()
+    first.record_timing(endpoint, 200, 0.010)
+    first.record_size(endpoint, 1000)
+    second.record_size(endpoint, 3000)
+    second.record_size(endpoint, None)
+    first.merge(second)
+
+    assert first.endpoint_summary()[endpoint]["meanBytes"] == 2000
+    untracked = TestReport()
+    untracked.record_timing(endpoint, 200, 0.010)
+    assert "meanBytes" not in untracked.endpoint_summary()[endpoint]
+    report.add(name, True)
+
+
+# ---------------------------------------------------------------------------
+# Flow 9: Performance regression gate
+# ---------------------------------------------------------------------------
+
+def test_baseline_regression_gate():
+    """Baseline gate flags p95, throughput and response-size regressions past thresholds only"""
+    name = "Flow9: Baseline regression gate"
+
+    def endpoint(p95: float, rps: float, count: int = 100, size: float | None = None) -> dict[str, Any]:
+        e = {"count": count, "p50Ms": p95 / 2, "p95Ms": p95, "p99Ms": p95 * 1.5, "throughput": rps, "errorRate": 0.0}
+        if size is not None:
+            e["meanBytes"] = size
+        return e
+
+    baseline = {"endpoints": {
+        "GET /feynman/history": endpoint(40.0, 50.0),
+        "GET /auth/me": endpoint(2.0, 50.0, size=200),
+        "POST /feynman/session": endpoint(30.0, 50.0),
+        "POST /rehearsal/session": endpoint(900.0, 5.0, count=5),
+        "GET /layers/history": endpoint(40.0, 50.0, size=2000),
+    }}
+    current = {
+        "GET /feynman/history": endpoint(60.0, 50.0, size=9000),  # p95 +50% → regression; no size in baseline
+        "GET /auth/me": endpoint(5.0, 49.0, size=220),            # +150% but within 5ms slack; +10% bytes → ok
+        "POST /feynman/session": endpoint(31.0, 30.0),            # req/s -40% → regression
+        "POST /rehearsal/session": endpoint(5000.0, 1.0),         # too few samples → skipped
+        "GET /layers/history": endpoint(40.0, 50.0, size=3000),   # bytes +50% → regression
+    }
+    regressions = compare_to_baseline(current, baseline, RegressionThresholds())
+    assert {(r.endpoint, r.metric) for r in regressions} == {
+        ("GET /feynman/history", "p95Ms"), ("POST /feynman/session", "throughput"),
+        ("GET /layers/history", "meanBytes"),
+    }, f"Got {[(r.endpoint, r.metric) for r in regressions]}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "baseline.json")
+        save_baseline(path, current, "load users=1")
+        assert compare_to_baseline(current, load_baseline(path), RegressionThresholds()) == []
+    report.add(name, True)
+
+
+# ---------------------------------------------------------------------------
+# Flow 10: Rehearsal soak analysis
+# ---------------------------------------------------------------------------
+
+def test_soak_growth_exponent():
+    """Soak growth exponent distinguishes linear from quadratic per-round cost"""
+    name = "Flow10: Soak growth exponent"
+    linear = [(n, 12.0 * n) for n in range(1, 11)]
+    quadratic = [(n, 3.0 * n * n + 1) for n in range(1, 11)]
+    flat = [(n, 40.0) for n in range(1, 11)]
+    assert abs(growth_exponent(linear) - 1.0) < 0.01
+    assert 1.8 < growth_exponent(quadratic) < 2.0
+    assert abs(growth_exponent(flat)) < 0.01
+    assert growth_exponent([(1, 5.0)]) == 0.0
+    report.add(name, True)
+
+
+# ---------------------------------------------------------------------------
+# Flow 11: Login storm analysis
+# ---------------------------------------------------------------------------
+
+def test_login_storm_slowdown():
+    """Login storm reports the storm/calm p95 ratio per probe, and None without samples"""
+    name = "Flow11: Login storm slowdown"
+    stats = LoginStormStats()
+    for ms in (2, 3, 4, 5):
+        stats.probe("GET /health", "calm").record(ms / 1000)
+        stats.probe("GET /health", "storm").record(ms * 3 / 1000)
+    ratio = stats.slowdown("GET /health")
+    assert ratio is not None and 2.9 < ratio < 3.1, f"Got {ratio}"
+    assert stats.slowdown("GET /feynman/history") is None
+    report.add(name, True)
+
+
+def test_scale_sweep_efficiency():
+    """Sweep rows fold per-endpoint histograms and compare throughput per worker against the first run"""
+    name = "Flow11: Scale sweep efficiency"
+    run_report = TestReport()
+    for _ in range(98):
+        run_report.record_timing("GET /auth/me", 200, 0.010)
+    run_report.record_timing("GET /auth/me", 503, 0.500)
+    run_report.record_timing("POST /feynman/session", 429, 0.001)
+    run_report.first_request_at, run_report.last_response_at = 0.0, 10.0
+    one = scale_run_from_report(1, run_report)
+    assert (one.requests, one.errors, one.throughput) == (100, 2, 10.0)
+    assert 9.9 < one.p99_ms < 10.1  # nearest rank 99 of 100 over all endpoints
+
+    two = ScaleRun(2, 180, 0, 10.0, 5.0, 20.0)
+    four = ScaleRun(4, 300, 0, 10.0, 5.0, 20.0)
+    speedups = scaling_efficiency([one, two, four])
+    assert speedups[0] == (1.0, 1.0)
+    assert abs(speedups[1][0] - 1.8) < 1e-9 and abs(speedups[1][1] - 0.9) < 1e-9
+    assert abs(speedups[2][1] - 0.75) < 1e-9
+    assert scaling_efficiency([ScaleRun(1, 0, 0, 0.0, 0.0, 0.0), two]) == [(0.0, 0.0), (0.0, 0.0)]
+    report.add(name, True)
+
+
+def test_limit_check_verdicts():
+    """Limits check passes only when some requests got through, none beyond the limit, and some were 429"""
+    name = "Flow11: Shared limit verdicts"
+    check = LimitCheck("streams", 0, 0, 2)
+    for status, code in ((200, None), (200, None), (429, "TOO_MANY_STREAMS"), (429, "TOO_MANY_STREAMS")):
+        _tally(check, status, code, "TOO_MANY_STREAMS")
+    assert check.ok and (check.allowed, check.rejected) == (2, 2)
+    # Per-process counters: every target lets `cap` through
+    _tally(check, 200, None, "TOO_MANY_STREAMS")
+    assert not check.ok
+    # A 429 from the request limiter is not the per-user cap
+    other = LimitCheck("streams", 1, 1, 2)
+    _tally(other, 429, "RATE_LIMITED", "TOO_MANY_STREAMS")
+    assert not other.ok and other.other == {429: 1}
+    assert usage_tokens({"inputTokens": 10, "outputTokens": 5, "cacheReadTokens": 100, "cacheWriteTokens": 1}) == 116
+    report.add(name, True)
+
+
+def test_saturation_verdict():
+    """Saturation passes when admitted p99 plateaus past the first shedding level, not when it keeps growing"""
+    name = "Flow11: Saturation verdict"
+
+    def level(concurrency: int, p99_ms: float, shed: int) -> SaturationLevel:
+        result = SaturationLevel(concurrency, shed=shed, seconds=10.0)
+        for _ in range(100):
+            result.admitted.record(p99_ms / 1000)
+        return result
+
+    below = level(4, 800, 0)
+    ok, detail = saturation_verdict([below, level(16, 2000, 5), level(48, 2300, 120)])
+    assert ok, detail
+    ok, detail = saturation_verdict([below, level(16, 2000, 5), level(48, 6000, 10)])
+    assert not ok and "x3" in detail, detail
+    ok, detail = saturation_verdict([below, level(16, 900, 0), level(48, 2000, 40)])
+    assert not ok and "--levels" in detail, detail
+    assert level(16, 100, 25).shed_rate == 0.2
+    report.add(name, True)
+
+
+def test_resilience_verdicts():
+    """Resilience checks: hedged p99 below single-attempt p99, breaker failures fast, recovery seen"""
+    name = "Flow11: Resilience verdicts"
+
+    def phase(label: str, ok_ms: list[float], failed_ms: list[float] = (), recovered: bool | None = None):
+        result = ResiliencePhase(label, recovered=recovered)
+        for ms in ok_ms:
+            result.record(200, ms / 1000, True)
+        for ms in failed_ms:
+            result.record(503, ms / 1000, False)
+        return result
+
+    single = phase("single", [900] * 95 + [5900] * 5)
+    hedged = phase("hedged", [900] * 95 + [1500] * 5)
+    down = phase("upstream down", [], [250, 3, 2, 2, 3, 2], recovered=True)
+    verdicts = resilience_verdicts([single, hedged, down], fail_fast_ms=50)
+    assert all(ok for _, ok, _ in verdicts), verdicts
+
+    slow_down = phase("upstream down", [], [250, 300, 280], recovered=False)
+    verdicts = dict((label, ok) for label, ok, _ in resilience_verdicts([single, single, slow_down], fail_fast_ms=50))
+    assert verdicts == {"Resilience: hedging cuts p99": False, "Resilience: breaker fails fast": False,
+                        "Resilience: breaker recovers": False}, verdicts
+    assert down.statuses == {503: 6} and single.ok.count == 100
+    report.add(name, True)
+
+
+def test_flaky_verdicts():
+    """Flaky-network checks: resuming uses fewer upstream calls per finished analysis and finishes them all"""
+    name = "Flow11: Flaky network verdicts"
+
+    def phase(label: str, analyses: int, completed: int, upstream_calls: int) -> FlakyPhase:
+        result = FlakyPhase(label, analyses=analyses, connections=upstream_calls, upstream_calls=upstream_calls)
+        for _ in range(completed):
+            result.completed.record(2.0)
+        return result
+
+    restart = phase("restart", 50, 48, 71)
+    resume = phase("resume", 50, 50, 50)
+    assert round(restart.calls_per_analysis, 2) == 1.48 and resume.calls_per_analysis == 1.0
+    assert all(ok for _, ok, _ in flaky_verdicts(restart, resume))
+
+    lost = phase("resume", 50, 45, 70)
+    verdicts = dict((label, ok) for label, ok, _ in flaky_verdicts(restart, lost))
+    assert verdicts == {"Flaky network: resume saves upstream calls": False,
+                        "Flaky network: resumed analyses complete": False}, verdicts
+    assert phase("resume", 0, 0, 0).calls_per_analysis == float("inf")
+    report.add(name, True)
+
+
 # ---------------------------------------------------------------------------
 # Live mode tests (only run when BASE_URL is set)
 # ---------------------------------------------------------------------------
 
-def run_live_tests():
-    """Run tests against a real running server."""
-    client = httpx.Client(base_url=BASE_URL, timeout=10.0)
+def _live_client() -> "httpx.Client":
+    return httpx.Client(base_url=BASE_URL, timeout=10.0, event_hooks=timing_hooks(report))
+
+
+def _live_register(client: "httpx.Client") -> dict[str, str]:
+    """Mint a fresh user for one live flow; returns its email, password and token."""
     unique = uuid.uuid4().hex[:8]
-    email = f"e2e-test-{unique}@example.com"
-    password = "TestPass123!"
-    user_name = f"E2E-{unique}"
-    token = None
-
-    # --- Auth Flow ---
-    # Register
-    resp = client.post(f"{API_PREFIX}/auth/register", json={
-        "email": email, "password": password, "name": user_name,
-    })
+    user = {"email": f"e2e-test-{unique}@example.com", "password": "TestPass123!", "name": f"E2E-{unique}"}
+    resp = client.post(f"{API_PREFIX}/auth/register", json=user)
     assert resp.status_code == 201, f"Register failed: {resp.status_code} {resp.text}"
     data = resp.json()
     assert_success_envelope(data, "Live: Register")
-    token = data["data"]["token"]
-    report.add("Live: Register success", True)
+    return {**user, "token": data["data"]["token"]}
+
+
+def run_live_auth_flow():
+    """Live: Auth flow"""
+    with _live_client() as client:
+        user = _live_register(client)
+        email, password, token = user["email"], user["password"], user["token"]
+        report.add("Live: Register success", True)
+
+        # Duplicate register
+        resp = client.post(f"{API_PREFIX}/auth/register", json={
+            "email": email, "password": password, "name": user["name"],
+        })
+        assert resp.status_code == 409
+        assert_failure_envelope(resp.json(), "Live: Register duplicate")
+        report.add("Live: Register duplicate → 409", True)
+
+        # Login
+        resp = client.post(f"{API_PREFIX}/auth/login", json={
+            "email": email, "password": password,
+        })
+        assert resp.status_code == 200
+        data = resp.json()
+        assert_success_envelope(data, "Live: Login")
+        assert "passwordHash" not in data["data"].get("user", {})
+        report.add("Live: Login success", True)
+
+        # Login wrong password
+        resp = client.post(f"{API_PREFIX}/auth/login", json={
+            "email": email, "password": "WrongPass999!",
+        })
+        assert resp.status_code == 401
+        report.add("Live: Login wrong password → 401", True)
+
+        # Me with token
+        headers = {"Authorization": f"Bearer {token}"}
+        resp = client.get(f"{API_PREFIX}/auth/me", headers=headers)
+        assert resp.status_code == 200
+        assert_success_envelope(resp.json(), "Live: Me")
+        assert resp.json()["data"]["usageByFeature"] == {"feynman": 0, "layers": 0, "rehearsal": 0}
+        report.add("Live: Me (valid token)", True)
+
+        # Request ID echoed (ours when well-formed, a fresh one otherwise) and a Server-Timing split
+        resp = client.get(f"{API_PREFIX}/auth/me", headers={**headers, REQUEST_ID_HEADER: "e2e-correlate-1"})
+        assert resp.headers.get(REQUEST_ID_HEADER) == "e2e-correlate-1", resp.headers.get(REQUEST_ID_HEADER)
+        server = parse_server_timing(resp.headers.get("server-timing"))
+        assert server and set(SERVER_PHASES) <= set(server) and server["db"] > 0, server
+        resp = client.get(f"{API_PREFIX}/auth/me", headers={**headers, REQUEST_ID_HEADER: "bad id; injected"})
+        assert resp.headers.get(REQUEST_ID_HEADER) not in (None, "", "bad id; injected")
+        report.add("Live: Request ID echo and Server-Timing", True)
+
+        # Me without token
+        resp = client.get(f"{API_PREFIX}/auth/me")
+        assert resp.status_code == 401
+        report.add("Live: Me (no token) → 401", True)
+
+        # Me with invalid token
+        resp = client.get(f"{API_PREFIX}/auth/me", headers={"Authorization": "Bearer invalid-token"})
+        assert resp.status_code == 401
+        report.add("Live: Me (invalid token) → 401", True)
+
+
+def run_live_feynman_flow():
+    """Live: Feynman flow"""
+    with _live_client() as client:
+        headers = {"Authorization": f"Bearer {_live_register(client)['token']}"}
+
+        # Create session
+        resp = client.post(f"{API_PREFIX}/feynman/session", headers=headers, json={})
+        if resp.status_code == 200:
+            assert_success_envelope(resp.json(), "Live: Feynman session")
+            report.add("Live: Feynman create session", True)
+        else:
+            report.add("Live: Feynman create session", False, f"Status: {resp.status_code}")
+
+        # No auth
+        resp = client.post(f"{API_PREFIX}/feynman/session", json={})
+        assert resp.status_code == 401
+        report.add("Live: Feynman session (no auth) → 401", True)
+
+        # History
+        resp = client.get(f"{API_PREFIX}/feynman/history", headers=headers)
+        assert resp.status_code == 200
+        assert_paginated_envelope(resp.json(), "Live: Feynman history")
+        report.add("Live: Feynman history", True)
+
+        # History, cursor form: one row per page, walked to the end
+        client.post(f"{API_PREFIX}/feynman/session", headers=headers, json={})
+        seen: list[str] = []
+        cursor = ""
+        while cursor is not None and len(seen) < 10:
+            resp = client.get(f"{API_PREFIX}/feynman/history", headers=headers, params={"cursor": cursor, "limit": 1})
+            assert resp.status_code == 200
+            body = resp.json()
+            assert_paginated_envelope(body, "Live: Feynman history (cursor)")
+            assert body["pagination"]["page"] is None and body["pagination"]["total"] is None
+            seen += [row["id"] for row in body["data"]]
+            cursor = body["pagination"]["nextCursor"]
+        assert len(seen) == 2 and len(set(seen)) == 2, f"cursor walk returned {seen}"
+        resp = client.get(f"{API_PREFIX}/feynman/history", headers=headers, params={"cursor": "not-a-cursor"})
+        assert resp.status_code == 400 and resp.json()["error"]["code"] == "INVALID_CURSOR"
+        report.add("Live: Feynman history (cursor)", True)
+
+        # A reconnect for a stream this server no longer has is refused rather than started afresh
+        resp = client.post(f"{API_PREFIX}/feynman/analyze", headers={**headers, LAST_EVENT_ID_HEADER: "gone:3"},
+                           json={"sessionId": "gone", "starStory": SAMPLE_STAR_STORY})
+        assert resp.status_code == 410 and resp.json()["error"]["code"] == "STREAM_EXPIRED", resp.status_code
+        report.add("Live: Feynman resume of unknown stream → 410", True)
+
+
+def run_live_layers_flow():
+    """Live: Layers flow"""
+    with _live_client() as client:
+        headers = {"Authorization": f"Bearer {_live_register(client)['token']}"}
+
+        resp = client.post(f"{API_PREFIX}/layers/session", headers=headers, json={})
+        if resp.status_code == 200:
+            report.add("Live: Layers create session", True)
+        else:
+            report.add("Live: Layers create session", False, f"Status: {resp.status_code}")
+
+        resp = client.get(f"{API_PREFIX}/layers/history", headers=headers)
+        assert resp.status_code == 200
+        report.add("Live: Layers history", True)
+
+
+def run_live_rehearsal_flow():
+    """Live: Rehearsal flow"""
+    with _live_client() as client:
+        headers = {"Authorization": f"Bearer {_live_register(client)['token']}"}
+
+        resp = client.post(f"{API_PREFIX}/rehearsal/session", headers=headers, json={
+            "scenario": "E2E test interview", "interviewerStyle": "behavioral",
+        })
+        session_id = None
+        if resp.status_code == 200:
+            session_id = resp.json()["data"]["sessionId"]
+            report.add("Live: Rehearsal create session", True)
+        else:
+            report.add("Live: Rehearsal create session", False, f"Status: {resp.status_code}")
+
+        # Invalid style
+        resp = client.post(f"{API_PREFIX}/rehearsal/session", headers=headers, json={
+            "scenario": "Test", "interviewerStyle": "invalid_style",
+        })
+        assert resp.status_code == 400
+        report.add("Live: Rehearsal invalid style → 400", True)
+
+        # End is queued, not generated inline
+        if session_id:
+            resp = client.post(f"{API_PREFIX}/rehearsal/end/{session_id}", headers=headers)
+            if resp.status_code in (200, 202):
+                report.add("Live: Rehearsal end → queued", True)
+            else:
+                report.add("Live: Rehearsal end → queued", False, f"Status: {resp.status_code}")
+
+            resp = client.get(f"{API_PREFIX}/rehearsal/feedback/{session_id}", headers=headers)
+            if resp.status_code in (200, 202):
+                report.add("Live: Rehearsal feedback poll", True)
+            else:
+                report.add("Live: Rehearsal feedback poll", False, f"Status: {resp.status_code}")
+
+        # History
+        resp = client.get(f"{API_PREFIX}/rehearsal/history", headers=headers)
+        assert resp.status_code == 200
+        assert_paginated_envelope(resp.json(), "Live: Rehearsal history")
+        report.add("Live: Rehearsal history", True)
+
+
+LIVE_FLOWS = [
+    run_live_auth_flow,
+    run_live_feynman_flow,
+    run_live_layers_flow,
+    run_live_rehearsal_flow,
+]
+
+
+def run_live_tests(workers: int = 1, pool: str = "thread"):
+    """Run tests against a real running server; each flow registers its own user."""
+    run_isolated(LIVE_FLOWS, workers, pool)
 
-    # Duplicate register
-    resp = client.post(f"{API_PREFIX}/auth/register", json={
-        "email": email, "password": password, "name": user_name,
-    })
-    assert resp.status_code == 409
-    assert_failure_envelope(resp.json(), "Live: Register duplicate")
-    report.add("Live: Register duplicate → 409", True)
 
-    # Login
-    resp = client.post(f"{API_PREFIX}/auth/login", json={
-        "email": email, "password": password,
-    })
-    assert resp.status_code == 200
-    data = resp.json()
-    assert_success_envelope(data, "Live: Login")
-    assert "passwordHash" not in data["data"].get("user", {})
-    report.add("Live: Login success", True)
+# ---------------------------------------------------------------------------
+# Load mode (--load): concurrent virtual users over httpx.AsyncClient
+# ---------------------------------------------------------------------------
+
+@dataclass
+class LoadConfig:
+    users: int = 10            # max concurrent virtual users
+    arrival_rate: float = 0.0  # new users/sec (open model); 0 = closed model with `users` looping VUs
+    ramp_up: float = 0.0       # seconds to ramp up to full users / arrival rate
+    duration: float = 60.0     # seconds; no new iterations start after this
+    think_time: float = 0.0    # pause between iterations of a looping VU
+    timeout: float = 30.0      # per-request timeout
+
+
+@dataclass
+class LoadStats:
+    users_started: int = 0
+    arrivals_dropped: int = 0
+
+    def print_summary(self, cfg: LoadConfig):
+        print(f"\n  Load: {self.users_started} users started ({cfg})")
+        if self.arrivals_dropped:
+            print(f"  Arrivals dropped (all VU slots busy): {self.arrivals_dropped}")
+
+
+async def _timed_request(
+    client: "httpx.AsyncClient",
+    endpoint: str,
+    method: str,
+    path: str,
+    **kwargs: Any,
+) -> "httpx.Response | None":
+    """Issue one request and record its latency under `endpoint` (status 0 on transport error)."""
+    request_id = new_request_id()
+    kwargs["headers"] = {**kwargs.get("headers", {}), REQUEST_ID_HEADER: request_id}
+    start = time.perf_counter()
+    try:
+        resp = await client.request(method, f"{API_PREFIX}{path}", **kwargs)
+    except httpx.HTTPError:
+        report.record_timing(endpoint, 0, time.perf_counter() - start)
+        report.record_trace(endpoint, 0, time.perf_counter() - start, request_id, None)
+        return None
+    elapsed = time.perf_counter() - start
+    report.record_timing(endpoint, resp.status_code, elapsed)
+    report.record_trace(endpoint, resp.status_code, elapsed, request_id,
+                        parse_server_timing(resp.headers.get("server-timing")))
+    report.record_cache(endpoint, resp.headers.get("x-cache"))
+    report.record_size(endpoint, len(resp.content))
+    return resp
+
 
-    # Login wrong password
-    resp = client.post(f"{API_PREFIX}/auth/login", json={
-        "email": email, "password": "WrongPass999!",
+async def _load_register(client: "httpx.AsyncClient") -> str | None:
+    """Register a fresh user and return its token (None if registration failed)."""
+    unique = uuid.uuid4().hex[:12]
+    resp = await _timed_request(client, "POST /auth/register", "POST", "/auth/register", json={
+        "email": f"load-{unique}@example.com",
+        "password": "LoadPass123!",
+        "name": f"Load-{unique[:8]}",
     })
-    assert resp.status_code == 401
-    report.add("Live: Login wrong password → 401", True)
+    if resp is None or resp.status_code != 201:
+        return None
+    return resp.json()["data"]["token"]
+
+
+# A small scenario set, so repeated sessions exercise the opening-question cache
+LOAD_SCENARIOS = ["Frontend engineer interview", "Backend engineer interview", "Product manager interview"]
+INTERVIEWER_STYLES = ["behavioral", "technical", "stress"]
 
-    # Me with token
+
+async def _load_flows(client: "httpx.AsyncClient", token: str):
+    """One pass through the Feynman → Layers → Rehearsal flows as an authenticated user."""
     headers = {"Authorization": f"Bearer {token}"}
-    resp = client.get(f"{API_PREFIX}/auth/me", headers=headers)
-    assert resp.status_code == 200
-    assert_success_envelope(resp.json(), "Live: Me")
-    report.add("Live: Me (valid token)", True)
 
-    # Me without token
-    resp = client.get(f"{API_PREFIX}/auth/me")
-    assert resp.status_code == 401
-    report.add("Live: Me (no token) → 401", True)
+    await _timed_request(client, "GET /auth/me", "GET", "/auth/me", headers=headers)
 
-    # Me with invalid token
-    resp = client.get(f"{API_PREFIX}/auth/me", headers={"Authorization": "Bearer invalid-token"})
-    assert resp.status_code == 401
-    report.add("Live: Me (invalid token) → 401", True)
+    # Feynman
+    await _timed_request(client, "POST /feynman/session", "POST", "/feynman/session", headers=headers, json={})
+    await _timed_request(client, "GET /feynman/history", "GET", "/feynman/history", headers=headers)
+    await _timed_request(client, "GET /feynman/history (cursor)", "GET", "/feynman/history?cursor=", headers=headers)
 
-    # --- Feynman Flow ---
-    # Create session
-    resp = client.post(f"{API_PREFIX}/feynman/session", headers=headers, json={})
-    if resp.status_code == 200:
-        assert_success_envelope(resp.json(), "Live: Feynman session")
-        report.add("Live: Feynman create session", True)
-    else:
-        report.add("Live: Feynman create session", False, f"Status: {resp.status_code}")
+    # Layers
+    await _timed_request(client, "POST /layers/session", "POST", "/layers/session", headers=headers, json={})
+    await _timed_request(client, "GET /layers/history", "GET", "/layers/history", headers=headers)
 
-    # No auth
-    resp = client.post(f"{API_PREFIX}/feynman/session", json={})
-    assert resp.status_code == 401
-    report.add("Live: Feynman session (no auth) → 401", True)
+    # Rehearsal
+    await _timed_request(client, "POST /rehearsal/session", "POST", "/rehearsal/session", headers=headers, json={
+        "scenario": random.choice(LOAD_SCENARIOS),
+        "interviewerStyle": random.choice(INTERVIEWER_STYLES),
+    })
+    await _timed_request(client, "GET /rehearsal/history", "GET", "/rehearsal/history", headers=headers)
+
+
+async def _looping_user(client: "httpx.AsyncClient", stats: LoadStats, cfg: LoadConfig, deadline: float):
+    """Closed-model VU: register once, then loop the flows until the deadline."""
+    stats.users_started += 1
+    token = await _load_register(client)
+    if token is None:
+        return
+    while time.perf_counter() < deadline:
+        await _load_flows(client, token)
+        if cfg.think_time:
+            await asyncio.sleep(cfg.think_time)
+
+
+async def _arriving_user(client: "httpx.AsyncClient", stats: LoadStats, slots: asyncio.Semaphore):
+    """Open-model VU: a new user that registers, runs the flows once and leaves."""
+    try:
+        stats.users_started += 1
+        token = await _load_register(client)
+        if token is not None:
+            await _load_flows(client, token)
+    finally:
+        slots.release()
+
+
+async def run_load_test(cfg: LoadConfig) -> LoadStats:
+    """Drive concurrent virtual users through all flows, recording latencies into `report`.
+
+    Closed model (arrival_rate == 0): `users` VUs start evenly spread over
+    `ramp_up` seconds and loop until `duration` elapses.
+
+    Open model (arrival_rate > 0): new users arrive as a Poisson process whose
+    rate ramps linearly to `arrival_rate` over `ramp_up` seconds; at most
+    `users` are in flight and arrivals beyond that are dropped and counted.
+    """
+    stats = LoadStats()
+    limits = httpx.Limits(max_connections=cfg.users, max_keepalive_connections=cfg.users)
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=cfg.timeout, limits=limits) as client:
+        deadline = time.perf_counter() + cfg.duration
+        tasks: list[asyncio.Task[None]] = []
+
+        if cfg.arrival_rate <= 0:
+            for i in range(cfg.users):
+                tasks.append(asyncio.create_task(_looping_user(client, stats, cfg, deadline)))
+                if cfg.ramp_up and i < cfg.users - 1:
+                    await asyncio.sleep(cfg.ramp_up / cfg.users)
+        else:
+            slots = asyncio.Semaphore(cfg.users)
+            start = time.perf_counter()
+            while True:
+                await asyncio.sleep(random.expovariate(cfg.arrival_rate))
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                # Thinning: accept a peak-rate arrival with probability rate(t) / peak
+                if cfg.ramp_up and random.random() > (now - start) / cfg.ramp_up:
+                    continue
+                if slots.locked():
+                    stats.arrivals_dropped += 1
+                    continue
+                await slots.acquire()
+                tasks.append(asyncio.create_task(_arriving_user(client, stats, slots)))
+
+        await asyncio.gather(*tasks)
+
+    return stats
 
-    # History
-    resp = client.get(f"{API_PREFIX}/feynman/history", headers=headers)
-    assert resp.status_code == 200
-    assert_paginated_envelope(resp.json(), "Live: Feynman history")
-    report.add("Live: Feynman history", True)
 
-    # --- Layers Flow ---
-    resp = client.post(f"{API_PREFIX}/layers/session", headers=headers, json={})
+# ---------------------------------------------------------------------------
+# SSE streaming client and latency benchmark (--stream-bench)
+# ---------------------------------------------------------------------------
+
+SSE_TERMINAL_EVENTS = ("done", "error")
+# Sent after the terminal event: request ID and server-side phase split
+SSE_TIMING_EVENT = "timing"
+LAST_EVENT_ID_HEADER = "Last-Event-ID"
+# Typed parts the analyzers emit as soon as the model closes each JSON value
+SSE_PART_EVENTS = ("score", "improvement", "layer")
+
+SAMPLE_STAR_STORY = (
+    "情境：我们团队负责的订单系统在大促期间频繁超时。任务：我需要在两周内把 P99 延迟降到 200ms 以内。"
+    "行动：我定位到数据库慢查询，增加了复合索引并引入本地缓存。结果：P99 从 1.2s 降到 150ms，大促零故障。"
+)
+SAMPLE_CONFUSION = "工作五年了，技术上没有明显短板，但每次晋升答辩都说不清自己的价值，感觉一直在原地打转。"
+
+
+def normalize_analysis_input(text: str) -> str:
+    """Python mirror of normalizeInput() in analysis-cache.ts: NFKC, trim, collapse whitespace."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text).strip())
+
+
+def analysis_input(text: str, repeat: bool) -> str:
+    """A resubmission of `text` (should hit the result cache) or a fresh variant (always a miss)."""
+    if not repeat:
+        return f"{text}（{uuid.uuid4().hex[:8]}）"
+    # What a user resending after a refresh might produce: stray whitespace, half-width punctuation
+    variant = text.replace("：", ":").replace("，", ",") if random.random() < 0.5 else text
+    return f"  {variant}\n"
+
+
+@dataclass
+class SSEEvent:
+    event: str
+    data: Any
+    id: str | None = None
+
+
+class SSEParser:
+    """Incremental text/event-stream parser: feed raw bytes, get complete events."""
+
+    def __init__(self):
+        self._buffer = b""
+        self._event = "message"
+        self._data: list[str] = []
+        self._id: str | None = None
+
+    def feed(self, chunk: bytes) -> list[SSEEvent]:
+        self._buffer += chunk
+        events: list[SSEEvent] = []
+        # Only split on complete lines so multi-byte characters never straddle a decode
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for raw_line in lines:
+            line = raw_line.decode("utf-8").rstrip("\r")
+            if not line:
+                if self._data:
+                    joined = "\n".join(self._data)
+                    try:
+                        data: Any = json.loads(joined)
+                    except ValueError:
+                        data = joined
+                    events.append(SSEEvent(self._event, data, self._id))
+                self._event, self._data = "message", []
+                continue
+            if line.startswith(":"):
+                continue  # comment / heartbeat
+            field_name, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if field_name == "event":
+                self._event = value
+            elif field_name == "data":
+                self._data.append(value)
+            elif field_name == "id":
+                self._id = value
+        return events
+
+
+@dataclass
+class StreamTiming:
+    endpoint: str
+    status: int | None = None
+    ttfb: float | None = None         # request sent → response headers (setupSSE)
+    ttfc: float | None = None         # request sent → first content event (chunk/layer/...)
+    ttfp: float | None = None         # request sent → first structured part (score/improvement/layer)
+    gaps: list[float] = field(default_factory=list)  # between consecutive content events
+    total: float = 0.0                # request sent → stream closed
+    events: list[SSEEvent] = field(default_factory=list)
+    bytes: int = 0                    # raw body bytes, heartbeats included
+    error: str = ""
+    request_id: str = ""
+    server: dict[str, float] | None = None  # phases from the final `timing` event (kept out of `events`)
+    resumes: int = 0                  # reconnects with Last-Event-ID after a dropped connection
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200 and not self.error and bool(self.events) and self.events[-1].event == "done"
+
+    @property
+    def usage(self) -> dict[str, Any] | None:
+        """Token usage the backend attached to the done event, if any."""
+        if self.ok and isinstance(self.events[-1].data, dict):
+            return self.events[-1].data.get("usage")
+        return None
+
+    @property
+    def jitter(self) -> float:
+        """Standard deviation of the inter-chunk gaps."""
+        if len(self.gaps) < 2:
+            return 0.0
+        mean = sum(self.gaps) / len(self.gaps)
+        return (sum((g - mean) ** 2 for g in self.gaps) / len(self.gaps)) ** 0.5
+
+
+async def stream_sse(
+    client: "httpx.AsyncClient",
+    endpoint: str,
+    path: str,
+    headers: dict[str, str],
+    body: dict[str, Any],
+    resume_attempts: int = 0,
+    drop_rate: float = 0.0,
+) -> StreamTiming:
+    """POST to a streaming route and time the SSE frames as they arrive.
+
+    A connection that ends before the terminal event is re-sent with
+    Last-Event-ID up to `resume_attempts` times. `drop_rate` is the chance the
+    client itself hangs up each connection after 1-3 content events, to
+    simulate a flaky network.
+    """
+    timing = StreamTiming(endpoint, request_id=new_request_id())
+    last_content: float | None = None
+    last_event_id: str | None = None
+    start = time.perf_counter()
+    for attempt in range(resume_attempts + 1):
+        request_headers = {**headers, REQUEST_ID_HEADER: timing.request_id}
+        if attempt > 0:
+            request_headers[LAST_EVENT_ID_HEADER] = last_event_id
+            timing.resumes += 1
+            timing.error = ""
+        drop_after = random.randint(1, 3) if random.random() < drop_rate else None
+        parser = SSEParser()  # a dropped connection can leave half a frame behind
+        try:
+            async with client.stream("POST", f"{API_PREFIX}{path}", json=body, headers=request_headers) as resp:
+                if attempt == 0:
+                    timing.status = resp.status_code
+                    timing.ttfb = time.perf_counter() - start
+                    timing.server = parse_server_timing(resp.headers.get("server-timing"))  # refused before streaming
+                elif resp.status_code != 200:
+                    timing.error = f"resume refused: HTTP {resp.status_code}"
+                    break
+                received = 0
+                async for chunk in resp.aiter_raw():
+                    now = time.perf_counter()
+                    timing.bytes += len(chunk)
+                    for event in parser.feed(chunk):
+                        if event.id:
+                            last_event_id = event.id
+                        if event.event == SSE_TIMING_EVENT and isinstance(event.data, dict):
+                            timing.server = {**event.data.get("phases", {}), "total": event.data.get("totalMs", 0.0)}
+                            continue
+                        timing.events.append(event)
+                        if event.event in SSE_TERMINAL_EVENTS:
+                            if event.event == "error":
+                                timing.error = str(event.data)
+                            continue
+                        received += 1
+                        if event.event in SSE_PART_EVENTS and timing.ttfp is None:
+                            timing.ttfp = now - start
+                        if timing.ttfc is None:
+                            timing.ttfc = now - start
+                        else:
+                            timing.gaps.append(now - last_content)
+                        last_content = now
+                    if drop_after is not None and received >= drop_after:
+                        timing.error = "client dropped the connection"
+                        break
+        except httpx.HTTPError as e:
+            timing.error = f"{type(e).__name__}: {e}"
+        finished = bool(timing.events) and timing.events[-1].event in SSE_TERMINAL_EVENTS
+        if finished or timing.status != 200 or last_event_id is None:
+            break
+    timing.total = time.perf_counter() - start
+    report.record_trace(endpoint, timing.status or 0, timing.total, timing.request_id, timing.server)
+    if timing.usage:
+        report.record_usage(endpoint, timing.usage)
+    return timing
+
+
+def print_stream_summary(timings: list[StreamTiming]):
+    by_endpoint: dict[str, list[StreamTiming]] = {}
+    for t in timings:
+        by_endpoint.setdefault(t.endpoint, []).append(t)
+
+    print("\n" + "=" * 70)
+    print("  SSE Streaming Latency Report (ms)")
+    print("=" * 70)
+    for endpoint in sorted(by_endpoint):
+        group = by_endpoint[endpoint]
+        ok = [t for t in group if t.ok]
+        print(f"  {endpoint}  ({len(ok)}/{len(group)} ok)")
+        print(f"    {'metric':<12}{'p50':>10}{'p95':>10}{'p99':>10}")
+        metrics = {name: LatencyHistogram() for name in ("ttfb", "ttfc", "ttfp", "gap", "jitter", "total")}
+        for t in ok:
+            if t.ttfb is not None:
+                metrics["ttfb"].record(t.ttfb)
+            if t.ttfc is not None:
+                metrics["ttfc"].record(t.ttfc)
+            if t.ttfp is not None:
+                metrics["ttfp"].record(t.ttfp)
+            for gap in t.gaps:
+                metrics["gap"].record(gap)
+            metrics["jitter"].record(t.jitter)
+            metrics["total"].record(t.total)
+        for metric, hist in metrics.items():
+            p50, p95, p99 = (hist.percentile(p) for p in (50, 95, 99))
+            print(f"    {metric:<12}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}")
+        for t in group:
+            if not t.ok:
+                print(f"    [-] status={t.status} {t.error or 'stream ended without done event'}")
+    print("=" * 70)
+
+
+async def _stream_iteration(
+    client: "httpx.AsyncClient", headers: dict[str, str], cache_mix: float = 0.0,
+) -> list[StreamTiming]:
+    """Create one session per feature and time its streaming endpoint.
+
+    A `cache_mix` share of the Feynman/Layers inputs are resubmissions of the
+    sample text (result-cache hits once warm); the rest are unique.
+    """
+    timings: list[StreamTiming] = []
+    repeat = random.random() < cache_mix
+
+    resp = await client.post(f"{API_PREFIX}/feynman/session", headers=headers, json={})
     if resp.status_code == 200:
-        report.add("Live: Layers create session", True)
-    else:
-        report.add("Live: Layers create session", False, f"Status: {resp.status_code}")
+        session_id = resp.json()["data"]["sessionId"]
+        timings.append(await stream_sse(client, "POST /feynman/analyze", "/feynman/analyze", headers, {
+            "sessionId": session_id, "starStory": analysis_input(SAMPLE_STAR_STORY, repeat),
+        }))
 
-    resp = client.get(f"{API_PREFIX}/layers/history", headers=headers)
-    assert resp.status_code == 200
-    report.add("Live: Layers history", True)
+    resp = await client.post(f"{API_PREFIX}/layers/session", headers=headers, json={})
+    if resp.status_code == 200:
+        session_id = resp.json()["data"]["sessionId"]
+        timings.append(await stream_sse(client, "POST /layers/analyze", "/layers/analyze", headers, {
+            "sessionId": session_id, "inputText": analysis_input(SAMPLE_CONFUSION, repeat),
+        }))
 
-    # --- Rehearsal Flow ---
-    resp = client.post(f"{API_PREFIX}/rehearsal/session", headers=headers, json={
-        "scenario": "E2E test interview", "interviewerStyle": "behavioral",
+    resp = await client.post(f"{API_PREFIX}/rehearsal/session", headers=headers, json={
+        "scenario": "Backend engineer interview", "interviewerStyle": "behavioral",
     })
     if resp.status_code == 200:
-        session_data = resp.json()["data"]
-        report.add("Live: Rehearsal create session", True)
-    else:
-        report.add("Live: Rehearsal create session", False, f"Status: {resp.status_code}")
+        session_id = resp.json()["data"]["sessionId"]
+        timings.append(await stream_sse(client, "POST /rehearsal/message", "/rehearsal/message", headers, {
+            "sessionId": session_id, "content": SAMPLE_STAR_STORY,
+        }))
+
+    return timings
+
 
-    # Invalid style
-    resp = client.post(f"{API_PREFIX}/rehearsal/session", headers=headers, json={
-        "scenario": "Test", "interviewerStyle": "invalid_style",
+async def register_async(client: "httpx.AsyncClient", prefix: str) -> str:
+    """Register a throwaway user for a benchmark worker and return its token."""
+    unique = uuid.uuid4().hex[:12]
+    resp = await client.post(f"{API_PREFIX}/auth/register", json={
+        "email": f"{prefix}-{unique}@example.com", "password": "BenchPass123!", "name": f"{prefix}-{unique[:8]}",
     })
-    assert resp.status_code == 400
-    report.add("Live: Rehearsal invalid style → 400", True)
+    if resp.status_code != 201:
+        raise RuntimeError(f"Register failed: {resp.status_code} {resp.text}")
+    return resp.json()["data"]["token"]
+
+
+async def run_stream_benchmark(
+    iterations: int, concurrency: int, cache_mix: float = 0.0, coalesce: bool = True,
+) -> list[StreamTiming]:
+    """Run `iterations` passes over the three streaming routes, `concurrency` at a time.
+
+    With `coalesce=False` every request asks for one SSE frame per delta (`X-SSE-Coalesce: off`).
+    """
+    timings: list[StreamTiming] = []
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=httpx.Timeout(10.0, read=180.0),
+                                 event_hooks=timing_hooks(report, asynchronous=True)) as client:
+        tokens = [await register_async(client, "stream") for _ in range(concurrency)]
+
+        queue: asyncio.Queue[int] = asyncio.Queue()
+        for i in range(iterations):
+            queue.put_nowait(i)
+
+        async def worker(token: str):
+            headers = {"Authorization": f"Bearer {token}"}
+            if not coalesce:
+                headers["X-SSE-Coalesce"] = "off"
+            while not queue.empty():
+                queue.get_nowait()
+                timings.extend(await _stream_iteration(client, headers, cache_mix))
+
+        await asyncio.gather(*(worker(t) for t in tokens))
+    return timings
+
+
+def read_process_cpu(pid: int) -> float | None:
+    """User + system CPU seconds of a local process from /proc/PID/stat (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # comm may contain spaces; fields after the closing paren start at `state`
+            fields = f.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
 
-    # History
-    resp = client.get(f"{API_PREFIX}/rehearsal/history", headers=headers)
-    assert resp.status_code == 200
-    assert_paginated_envelope(resp.json(), "Live: Rehearsal history")
-    report.add("Live: Rehearsal history", True)
 
-    client.close()
+@dataclass
+class CoalesceRun:
+    """One --stream-bench pass with SSE frame coalescing on or off."""
+    mode: str
+    timings: list[StreamTiming]
+    wall: float                       # seconds for the whole pass
+    client_cpu: float                 # harness process CPU seconds
+    server_cpu: float | None = None   # backend CPU seconds, with --server-pid
+
+    @property
+    def ok(self) -> list[StreamTiming]:
+        return [t for t in self.timings if t.ok]
+
+    def per_stream(self, total: float | None) -> float | None:
+        return total / len(self.ok) if total is not None and self.ok else None
+
+    @property
+    def frames_per_sec(self) -> float:
+        return sum(len(t.events) for t in self.ok) / self.wall if self.wall else 0.0
+
+
+async def run_coalesce_benchmark(
+    iterations: int, concurrency: int, cache_mix: float, modes: list[str], server_pid: int | None,
+) -> list[CoalesceRun]:
+    """Run the stream benchmark once per coalescing mode, sampling CPU around each pass."""
+    runs: list[CoalesceRun] = []
+    for mode in modes:
+        server_before = read_process_cpu(server_pid) if server_pid else None
+        cpu_before, wall_before = time.process_time(), time.perf_counter()
+        timings = await run_stream_benchmark(iterations, concurrency, cache_mix, coalesce=mode == "on")
+        run = CoalesceRun(mode, timings, time.perf_counter() - wall_before, time.process_time() - cpu_before)
+        server_after = read_process_cpu(server_pid) if server_pid else None
+        if server_before is not None and server_after is not None:
+            run.server_cpu = server_after - server_before
+        runs.append(run)
+    return runs
+
+
+def print_coalesce_summary(runs: list[CoalesceRun]):
+    def cell(value: float | None, scale: float = 1.0) -> str:
+        return f"{value * scale:>12.1f}" if value is not None else f"{'-':>12}"
+
+    print("\n" + "=" * 70)
+    print("  SSE Frame Coalescing (per ok stream)")
+    print("=" * 70)
+    print(f"  {'coalesce':<10}{'streams':>8}{'frames':>12}{'KB':>12}{'frames/s':>12}"
+          f"{'client ms':>12}{'server ms':>12}")
+    for run in runs:
+        frames = run.per_stream(sum(len(t.events) for t in run.ok))
+        kb = run.per_stream(sum(t.bytes for t in run.ok) / 1024)
+        print(f"  {run.mode:<10}{len(run.ok):>8}{cell(frames)}{cell(kb)}{run.frames_per_sec:>12.1f}"
+              f"{cell(run.per_stream(run.client_cpu), 1000)}{cell(run.per_stream(run.server_cpu), 1000)}")
+    print("=" * 70)
+
+
+# ---------------------------------------------------------------------------
+# Rehearsal soak test (--soak): per-round cost growth over full interviews
+# ---------------------------------------------------------------------------
+
+SOAK_ANSWERS = [
+    "我在上一家公司负责支付网关的稳定性，主导了限流和降级方案的落地。",
+    "当时最大的挑战是跨团队协调，我先拉齐了各方的 SLA 目标，再拆分里程碑。",
+    "结果是全年可用性从 99.9% 提升到 99.99%，故障平均恢复时间缩短了 60%。",
+    "如果重来一次，我会更早引入压测，把容量评估前置到设计阶段。",
+]
+
+
+@dataclass
+class RoundSample:
+    round: int
+    ok: bool
+    ttfc: float | None        # time to first interviewer chunk on /rehearsal/message
+    total: float              # full /rehearsal/message stream duration
+    read_latency: float       # GET /rehearsal/session/:id — reads the whole messages JSON row
+    transcript_bytes: int     # size of that row as returned to the client
+    prompt_tokens: int = 0    # upstream prompt size for the turn: uncached + cache read + cache write
+    cache_read: int = 0       # of which served from the upstream prompt cache
+
+
+async def _soak_session(client: "httpx.AsyncClient", headers: dict[str, str], rounds: int) -> list[RoundSample]:
+    """Play one interview to the end (or `rounds` candidate turns) and sample every round."""
+    resp = await client.post(f"{API_PREFIX}/rehearsal/session", headers=headers, json={
+        "scenario": "Soak test: senior backend engineer", "interviewerStyle": "behavioral",
+    })
+    if resp.status_code != 200:
+        return [RoundSample(0, False, None, 0.0, 0.0, 0)]
+    session_id = resp.json()["data"]["sessionId"]
+
+    samples: list[RoundSample] = []
+    for round_number in range(1, rounds + 1):
+        timing = await stream_sse(client, "POST /rehearsal/message", "/rehearsal/message", headers, {
+            "sessionId": session_id, "content": SOAK_ANSWERS[(round_number - 1) % len(SOAK_ANSWERS)],
+        })
+        start = time.perf_counter()
+        read = await client.get(f"{API_PREFIX}/rehearsal/session/{session_id}", headers=headers)
+        read_latency = time.perf_counter() - start
+
+        usage = timing.usage or {}
+        samples.append(RoundSample(
+            round_number, timing.ok, timing.ttfc, timing.total, read_latency,
+            len(read.content) if read.status_code == 200 else 0,
+            prompt_tokens=sum(int(usage.get(k) or 0) for k in ("inputTokens", "cacheReadTokens", "cacheWriteTokens")),
+            cache_read=int(usage.get("cacheReadTokens") or 0),
+        ))
+        if not timing.ok or timing.events[-1].data.get("isInterviewEnd"):
+            break
+    return samples
+
+
+async def run_rehearsal_soak(sessions: int, concurrency: int, rounds: int) -> list[RoundSample]:
+    """Run `sessions` full interviews, `concurrency` at a time, one user per worker."""
+    samples: list[RoundSample] = []
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=httpx.Timeout(10.0, read=180.0),
+                                 event_hooks=timing_hooks(report, asynchronous=True)) as client:
+        tokens = [await register_async(client, "soak") for _ in range(concurrency)]
+        remaining = sessions
+
+        async def worker(token: str):
+            nonlocal remaining
+            headers = {"Authorization": f"Bearer {token}"}
+            while remaining > 0:
+                remaining -= 1
+                samples.extend(await _soak_session(client, headers, rounds))
+
+        await asyncio.gather(*(worker(t) for t in tokens))
+    return samples
+
+
+def growth_exponent(points: list[tuple[int, float]]) -> float:
+    """Least-squares slope of log(value) vs log(round): ~1 linear growth, ~2 quadratic."""
+    pts = [(math.log(x), math.log(y)) for x, y in points if x > 0 and y > 0]
+    if len(pts) < 2:
+        return 0.0
+    mean_x = sum(x for x, _ in pts) / len(pts)
+    mean_y = sum(y for _, y in pts) / len(pts)
+    var_x = sum((x - mean_x) ** 2 for x, _ in pts)
+    return sum((x - mean_x) * (y - mean_y) for x, y in pts) / var_x if var_x else 0.0
+
+
+def print_soak_summary(samples: list[RoundSample], csv_path: str | None = None):
+    by_round: dict[int, list[RoundSample]] = {}
+    for sample in samples:
+        if sample.round:
+            by_round.setdefault(sample.round, []).append(sample)
+
+    rows = []
+    for round_number in sorted(by_round):
+        group = by_round[round_number]
+        ok = [r for r in group if r.ok]
+        ttfc, total, read = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+        for r in ok:
+            if r.ttfc is not None:
+                ttfc.record(r.ttfc)
+            total.record(r.total)
+            read.record(r.read_latency)
+        rows.append({
+            "round": round_number,
+            "sessions": len(group),
+            "failed": len(group) - len(ok),
+            "ttfcP50Ms": ttfc.percentile(50), "ttfcP95Ms": ttfc.percentile(95),
+            "totalP50Ms": total.percentile(50), "totalP95Ms": total.percentile(95),
+            "readP50Ms": read.percentile(50), "readP95Ms": read.percentile(95),
+            "transcriptBytes": sum(r.transcript_bytes for r in ok) // len(ok) if ok else 0,
+            "promptTokens": sum(r.prompt_tokens for r in ok) // len(ok) if ok else 0,
+            "promptCached": (sum(r.cache_read for r in ok) / prompt) if (prompt := sum(r.prompt_tokens for r in ok)) else 0.0,
+        })
+
+    print("\n" + "=" * 100)
+    print("  Rehearsal Soak Report  (ms; read = GET /rehearsal/session/:id, bytes = stored transcript)")
+    print("=" * 100)
+    print(f"  {'round':>5}{'n':>5}{'fail':>5}{'ttfc p50':>10}{'ttfc p95':>10}{'read p50':>10}{'read p95':>10}{'bytes':>9}"
+          f"{'prompt':>8}{'cached':>8}  ttfc p50")
+    scale = max((row["ttfcP50Ms"] for row in rows), default=0) or 1
+    for row in rows:
+        bar = "#" * round(row["ttfcP50Ms"] / scale * 30)
+        print(f"  {row['round']:>5}{row['sessions']:>5}{row['failed']:>5}{row['ttfcP50Ms']:>10.1f}{row['ttfcP95Ms']:>10.1f}"
+              f"{row['readP50Ms']:>10.1f}{row['readP95Ms']:>10.1f}{row['transcriptBytes']:>9}"
+              f"{row['promptTokens']:>8}{row['promptCached'] * 100:>7.0f}%  {bar}")
+    print("-" * 100)
+    for label, key in (("time-to-first-chunk", "ttfcP50Ms"), ("session read", "readP50Ms"),
+                       ("transcript bytes", "transcriptBytes")):
+        exponent = growth_exponent([(row["round"], row[key]) for row in rows])
+        print(f"  Growth exponent ({label} vs round): {exponent:.2f}  (≈1 linear, ≈2 quadratic)")
+    print("=" * 100)
+
+    if csv_path:
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["round"])
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Per-round soak data written to {csv_path}")
+
+
+# ---------------------------------------------------------------------------
+# Feedback latency (--feedback-bench): end → feedback ready under concurrency
+# ---------------------------------------------------------------------------
+
+# Pseudo-endpoint for the end-to-feedback wait, so it lands in the latency table, exports and baselines
+FEEDBACK_READY_ENDPOINT = "ASYNC /rehearsal/feedback"
+
+
+@dataclass
+class FeedbackSample:
+    ok: bool
+    end_latency: float             # POST /rehearsal/end/:id response time; should stay flat under load
+    ready_latency: float | None    # end request sent → feedback available to the client
+    polls: int = 0                 # GET /rehearsal/feedback/:id calls in poll mode
+    error: str | None = None
+
+
+async def wait_for_feedback_stream(
+    client: "httpx.AsyncClient", headers: dict[str, str], session_id: str,
+) -> tuple[Any, str | None]:
+    """Subscribe to /rehearsal/feedback/:id/stream; returns (feedback, error)."""
+    parser = SSEParser()
+    async with client.stream("GET", f"{API_PREFIX}/rehearsal/feedback/{session_id}/stream",
+                             headers=headers) as resp:
+        if resp.status_code != 200:
+            return None, f"HTTP {resp.status_code}"
+        async for chunk in resp.aiter_raw():
+            for event in parser.feed(chunk):
+                if event.event == "done":
+                    return event.data.get("feedback"), None
+                if event.event == "error":
+                    return None, str(event.data)
+    return None, "stream closed before feedback"
+
+
+async def wait_for_feedback_poll(
+    client: "httpx.AsyncClient", headers: dict[str, str], session_id: str, interval: float, timeout: float,
+) -> tuple[Any, str | None, int]:
+    """Poll /rehearsal/feedback/:id until it stops returning 202; returns (feedback, error, polls)."""
+    deadline = time.perf_counter() + timeout
+    polls = 0
+    while time.perf_counter() < deadline:
+        polls += 1
+        resp = await client.get(f"{API_PREFIX}/rehearsal/feedback/{session_id}", headers=headers)
+        if resp.status_code == 200:
+            return resp.json()["data"], None, polls
+        if resp.status_code != 202:
+            return None, f"HTTP {resp.status_code}", polls
+        await asyncio.sleep(interval)
+    return None, "timed out", polls
+
+
+async def _feedback_session(
+    client: "httpx.AsyncClient", headers: dict[str, str], rounds: int, wait: str, poll_interval: float,
+) -> FeedbackSample:
+    """Play `rounds` turns, end the interview and time how long the feedback takes to arrive."""
+    resp = await client.post(f"{API_PREFIX}/rehearsal/session", headers=headers, json={
+        "scenario": random.choice(LOAD_SCENARIOS), "interviewerStyle": random.choice(INTERVIEWER_STYLES),
+    })
+    if resp.status_code != 200:
+        return FeedbackSample(False, 0.0, None, error=f"create session: HTTP {resp.status_code}")
+    session_id = resp.json()["data"]["sessionId"]
+
+    for round_number in range(rounds):
+        timing = await stream_sse(client, "POST /rehearsal/message", "/rehearsal/message", headers, {
+            "sessionId": session_id, "content": SOAK_ANSWERS[round_number % len(SOAK_ANSWERS)],
+        })
+        if not timing.ok or timing.events[-1].data.get("isInterviewEnd"):
+            break
+
+    start = time.perf_counter()
+    resp = await client.post(f"{API_PREFIX}/rehearsal/end/{session_id}", headers=headers)
+    end_latency = time.perf_counter() - start
+    if resp.status_code not in (200, 202):
+        return FeedbackSample(False, end_latency, None, error=f"end: HTTP {resp.status_code}")
+
+    polls = 0
+    try:
+        if wait == "poll":
+            feedback, error, polls = await wait_for_feedback_poll(client, headers, session_id, poll_interval, 300.0)
+        else:
+            feedback, error = await wait_for_feedback_stream(client, headers, session_id)
+    except httpx.HTTPError as e:
+        feedback, error = None, f"{type(e).__name__}: {e}"
+
+    ready_latency = time.perf_counter() - start
+    report.record_timing(FEEDBACK_READY_ENDPOINT, 0 if error else 200, ready_latency)
+    return FeedbackSample(error is None and feedback is not None, end_latency,
+                          ready_latency if error is None else None, polls, error)
+
+
+async def run_feedback_benchmark(
+    sessions: int, concurrency: int, rounds: int, wait: str = "stream", poll_interval: float = 1.0,
+) -> list[FeedbackSample]:
+    """End `sessions` interviews, `concurrency` at a time, and wait for each one's feedback."""
+    samples: list[FeedbackSample] = []
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=httpx.Timeout(10.0, read=300.0),
+                                 event_hooks=timing_hooks(report, asynchronous=True)) as client:
+        tokens = [await register_async(client, "feedback") for _ in range(concurrency)]
+        remaining = sessions
+
+        async def worker(token: str):
+            nonlocal remaining
+            headers = {"Authorization": f"Bearer {token}"}
+            while remaining > 0:
+                remaining -= 1
+                samples.append(await _feedback_session(client, headers, rounds, wait, poll_interval))
+
+        await asyncio.gather(*(worker(t) for t in tokens))
+    return samples
+
+
+def print_feedback_summary(samples: list[FeedbackSample]):
+    ends, ready = LatencyHistogram(), LatencyHistogram()
+    for s in samples:
+        ends.record(s.end_latency)
+        if s.ready_latency is not None:
+            ready.record(s.ready_latency)
+    failed = [s for s in samples if not s.ok]
+    polls = [s.polls for s in samples if s.polls]
+
+    print("\n" + "=" * 70)
+    print("  Feedback Latency Report (ms)")
+    print("=" * 70)
+    print(f"  {'':<22}{'count':>7}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+    for label, hist in (("end response", ends), ("end → feedback ready", ready)):
+        print(f"  {label:<22}{hist.count:>7}{hist.percentile(50):>10.1f}{hist.percentile(90):>10.1f}"
+              f"{hist.percentile(99):>10.1f}{hist.percentile(100):>10.1f}")
+    print("-" * 70)
+    line = f"  Sessions: {len(samples)}  |  Failed: {len(failed)}"
+    if polls:
+        line += f"  |  Polls/session: {sum(polls) / len(polls):.1f}"
+    print(line)
+    for s in failed[:5]:
+        print(f"    {s.error}")
+    print("=" * 70)
+    if failed:
+        report.add("Feedback benchmark", False, f"{len(failed)}/{len(samples)} sessions got no feedback")
+
+
+# ---------------------------------------------------------------------------
+# Login storm (--login-storm): password hashing load vs. unrelated endpoints
+# ---------------------------------------------------------------------------
+
+STORM_PROBES = [("GET /health", "/health"), ("GET /feynman/history", f"{API_PREFIX}/feynman/history")]
+STORM_PHASES = ("calm", "storm")
+
+
+@dataclass
+class LoginStormStats:
+    probes: dict[tuple[str, str], LatencyHistogram] = field(default_factory=dict)
+    logins: dict[int, int] = field(default_factory=dict)   # status → count, 0 = transport error
+    login_latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+    storm_seconds: float = 0.0
+
+    def probe(self, endpoint: str, phase: str) -> LatencyHistogram:
+        return self.probes.setdefault((endpoint, phase), LatencyHistogram())
+
+    def slowdown(self, endpoint: str, percentile: float = 95) -> float | None:
+        """Storm / calm latency ratio at `percentile`; None without samples in both phases."""
+        calm, storm = self.probe(endpoint, "calm"), self.probe(endpoint, "storm")
+        if not calm.count or not storm.count or not calm.percentile(percentile):
+            return None
+        return storm.percentile(percentile) / calm.percentile(percentile)
+
+
+async def _storm_probe(
+    client: "httpx.AsyncClient", stats: LoginStormStats, headers: dict[str, str], phase: list[str],
+    interval: float, stop: asyncio.Event,
+):
+    """Sample the probe endpoints every `interval` seconds, tagged with the current phase."""
+    while not stop.is_set():
+        for endpoint, url in STORM_PROBES:
+            start = time.perf_counter()
+            try:
+                resp = await client.get(url, headers=headers)
+                status = resp.status_code
+            except httpx.HTTPError:
+                status = 0
+            elapsed = time.perf_counter() - start
+            report.record_timing(endpoint, status, elapsed)
+            if status == 200:
+                stats.probe(endpoint, phase[0]).record(elapsed)
+        await asyncio.sleep(interval)
+
+
+async def _storm_login(client: "httpx.AsyncClient", stats: LoginStormStats, email: str, deadline: float):
+    """Log in back to back until the deadline; every success costs the server one bcrypt compare."""
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            resp = await client.post(f"{API_PREFIX}/auth/login", json={"email": email, "password": "StormPass123!"})
+            status = resp.status_code
+        except httpx.HTTPError:
+            status = 0
+        elapsed = time.perf_counter() - start
+        report.record_timing("POST /auth/login", status, elapsed)
+        stats.logins[status] = stats.logins.get(status, 0) + 1
+        if status == 200:
+            stats.login_latency.record(elapsed)
+        elif status in (429, 503):
+            # Shed or rate limited: back off briefly instead of spinning on rejections
+            await asyncio.sleep(0.05)
+
+
+async def run_login_storm(concurrency: int, duration: float, calm: float, interval: float) -> LoginStormStats:
+    """Probe /health and history for `calm` seconds, then again while `concurrency` clients hammer login."""
+    stats = LoginStormStats()
+    limits = httpx.Limits(max_connections=concurrency + 4, max_keepalive_connections=concurrency + 4)
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=httpx.Timeout(30.0), limits=limits) as client:
+        email = f"storm-{uuid.uuid4().hex[:12]}@example.com"
+        resp = await client.post(f"{API_PREFIX}/auth/register", json={
+            "email": email, "password": "StormPass123!", "name": "storm",
+        })
+        if resp.status_code != 201:
+            raise RuntimeError(f"Register failed: {resp.status_code} {resp.text}")
+        headers = {"Authorization": f"Bearer {resp.json()['data']['token']}"}
+
+        phase, stop = ["calm"], asyncio.Event()
+        probe = asyncio.create_task(_storm_probe(client, stats, headers, phase, interval, stop))
+        await asyncio.sleep(calm)
+
+        phase[0] = "storm"
+        start = time.perf_counter()
+        await asyncio.gather(*(_storm_login(client, stats, email, start + duration) for _ in range(concurrency)))
+        stats.storm_seconds = time.perf_counter() - start
+
+        stop.set()
+        await probe
+    return stats
+
+
+def print_login_storm_summary(stats: LoginStormStats):
+    print("\n" + "=" * 70)
+    print("  Login Storm: probe latency, calm vs. storm (ms)")
+    print("=" * 70)
+    print(f"  {'probe':<24}{'phase':<8}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for endpoint, _ in STORM_PROBES:
+        for phase in STORM_PHASES:
+            hist = stats.probe(endpoint, phase)
+            print(f"  {endpoint:<24}{phase:<8}{hist.count:>7}{hist.percentile(50):>10.1f}"
+                  f"{hist.percentile(95):>10.1f}{hist.percentile(99):>10.1f}")
+        ratio = stats.slowdown(endpoint)
+        print(f"  {'':<24}{'p95 x':<8}{f'{ratio:.2f}' if ratio is not None else '-':>7}")
+    print("-" * 70)
+    total = sum(stats.logins.values())
+    codes = "  ".join(f"{code or 'ERR'}:{n}" for code, n in sorted(stats.logins.items()))
+    rate = total / stats.storm_seconds if stats.storm_seconds else 0.0
+    print(f"  Logins: {total} ({rate:.1f}/s)  {codes}")
+    if stats.login_latency.count:
+        print(f"  Login 200 latency p50={stats.login_latency.percentile(50):.1f}ms "
+              f"p99={stats.login_latency.percentile(99):.1f}ms")
+    print("=" * 70)
+    if stats.logins.get(0):
+        report.add("Login storm", False, f"{stats.logins[0]} logins failed at the transport level")
+
+
+# ---------------------------------------------------------------------------
+# History depth (--history-bench): offset vs cursor paging as history grows
+# ---------------------------------------------------------------------------
+
+HISTORY_PAGE_LIMIT = 20
+HISTORY_PROBES = ("first page + count", "first page", "deepest page (offset)", "deepest page (cursor)")
+
+
+@dataclass
+class DepthSample:
+    depth: int
+    latency: dict[str, LatencyHistogram] = field(default_factory=lambda: {p: LatencyHistogram() for p in HISTORY_PROBES})
+    page_bytes: dict[str, int] = field(default_factory=dict)
+
+    def p50(self, probe: str) -> float:
+        return self.latency[probe].percentile(50)
+
+
+async def _seed_feynman_sessions(
+    client: "httpx.AsyncClient", headers: dict[str, str], count: int, analyzed: int = 0,
+):
+    """Create `count` Feynman sessions, 8 at a time; the first `analyzed` also get a result.
+
+    Analyzed sessions resubmit the sample story, so after the first one they are
+    result-cache replays; they run 2 at a time to stay under the per-user stream cap.
+    """
+    slots = asyncio.Semaphore(8)
+    streams = asyncio.Semaphore(2)
+
+    async def create(analyze: bool):
+        async with slots:
+            resp = await client.post(f"{API_PREFIX}/feynman/session", headers=headers, json={})
+            if resp.status_code != 200:
+                raise RuntimeError(f"Seeding history failed: {resp.status_code} {resp.text[:200]}")
+        if analyze:
+            async with streams:
+                timing = await stream_sse(client, "POST /feynman/analyze", "/feynman/analyze", headers, {
+                    "sessionId": resp.json()["data"]["sessionId"],
+                    "starStory": analysis_input(SAMPLE_STAR_STORY, True),
+                })
+            if not timing.ok:
+                raise RuntimeError(f"Seeding analysis failed: {timing.status} {timing.error}")
+
+    await asyncio.gather(*(create(i < analyzed) for i in range(count)))
+
+
+async def _last_page_cursor(client: "httpx.AsyncClient", headers: dict[str, str]) -> str:
+    """Follow nextCursor to the last page and return the cursor that fetches it."""
+    cursor = ""
+    while True:
+        resp = await client.get(f"{API_PREFIX}/feynman/history", headers=headers,
+                                params={"cursor": cursor, "limit": HISTORY_PAGE_LIMIT})
+        resp.raise_for_status()
+        next_cursor = resp.json()["pagination"].get("nextCursor")
+        if next_cursor is None:
+            return cursor
+        cursor = next_cursor
+
+
+async def run_history_benchmark(depths: list[int], samples: int, analyzed_share: float = 0.0) -> list[DepthSample]:
+    """Grow one user's Feynman history to each depth and time first and deepest pages in both forms.
+
+    `analyzed_share` of the seeded sessions carry an analysis result, so page
+    sizes reflect what a real history row costs to ship.
+    """
+    results: list[DepthSample] = []
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=60.0) as client:
+        headers = {"Authorization": f"Bearer {await register_async(client, 'history')}"}
+        seeded = 0
+        for depth in sorted(depths):
+            added = depth - seeded
+            await _seed_feynman_sessions(client, headers, added, round(added * analyzed_share))
+            seeded = depth
+            deepest_page = -(-depth // HISTORY_PAGE_LIMIT)
+            cursor = await _last_page_cursor(client, headers)
+            probes = {
+                "first page + count": {"page": 1, "limit": HISTORY_PAGE_LIMIT},
+                "first page": {"cursor": "", "limit": HISTORY_PAGE_LIMIT},
+                "deepest page (offset)": {"page": deepest_page, "limit": HISTORY_PAGE_LIMIT, "count": "false"},
+                "deepest page (cursor)": {"cursor": cursor, "limit": HISTORY_PAGE_LIMIT},
+            }
+            sample = DepthSample(depth)
+            for _ in range(samples):
+                for probe, params in probes.items():
+                    start = time.perf_counter()
+                    resp = await client.get(f"{API_PREFIX}/feynman/history", headers=headers, params=params)
+                    elapsed = time.perf_counter() - start
+                    resp.raise_for_status()
+                    sample.latency[probe].record(elapsed)
+                    sample.page_bytes[probe] = len(resp.content)
+                    endpoint = f"GET /feynman/history [{probe}]"
+                    report.record_timing(endpoint, resp.status_code, elapsed)
+                    report.record_size(endpoint, len(resp.content))
+            results.append(sample)
+    return results
+
+
+def print_history_summary(samples: list[DepthSample]):
+    print("\n" + "=" * 96)
+    print(f"  History Depth Report  (p50 ms, {HISTORY_PAGE_LIMIT} rows per page)")
+    print("=" * 96)
+    print(f"  {'depth':>7}" + "".join(f"{probe:>22}" for probe in HISTORY_PROBES))
+    for sample in samples:
+        print(f"  {sample.depth:>7}" + "".join(f"{sample.p50(probe):>22.2f}" for probe in HISTORY_PROBES))
+    print("-" * 96)
+    print("  Bytes per page")
+    for sample in samples:
+        print(f"  {sample.depth:>7}" + "".join(f"{sample.page_bytes.get(probe, 0):>22}" for probe in HISTORY_PROBES))
+    print("-" * 96)
+    exponents = {
+        probe: growth_exponent([(sample.depth, sample.p50(probe)) for sample in samples]) for probe in HISTORY_PROBES
+    }
+    for probe, exponent in exponents.items():
+        print(f"  Growth exponent ({probe} vs depth): {exponent:.2f}  (≈0 flat, ≈1 linear)")
+    print("=" * 96)
+
+    # Keyset pages should cost the same at any depth; allow noise, not proportional growth
+    flat = exponents["deepest page (cursor)"] < 0.3 and exponents["first page"] < 0.3
+    report.add("History depth: cursor pages stay flat", flat,
+               "" if flat else f"exponents {', '.join(f'{p}={e:.2f}' for p, e in exponents.items())}")
+
+
+# ---------------------------------------------------------------------------
+# Core-scaling sweep (--scale-sweep): the --load workload at 1, 2, 4, ... cluster workers
+# ---------------------------------------------------------------------------
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class ScaleRun:
+    workers: int
+    requests: int
+    errors: int
+    elapsed: float
+    p50_ms: float
+    p99_ms: float
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+
+def scale_run_from_report(workers: int, run_report: TestReport) -> ScaleRun:
+    """Fold one run's per-endpoint histograms into overall request count, errors and percentiles."""
+    overall = LatencyHistogram()
+    errors = 0
+    for (_, status), hist in run_report.timings.items():
+        overall.merge(hist)
+        if is_error_status(status):
+            errors += hist.count
+    return ScaleRun(workers, overall.count, errors, run_report.elapsed, overall.percentile(50), overall.percentile(99))
+
+
+def scaling_efficiency(runs: list[ScaleRun]) -> list[tuple[float, float]]:
+    """(speedup, efficiency) per run against the first: 1.0 efficiency = throughput grows with workers."""
+    if not runs or not runs[0].throughput:
+        return [(0.0, 0.0) for _ in runs]
+    base = runs[0]
+    return [
+        (run.throughput / base.throughput, run.throughput / base.throughput / (run.workers / base.workers))
+        for run in runs
+    ]
+
+
+def _backend_healthy() -> bool:
+    try:
+        with urlopen(f"{BASE_URL}/health", timeout=1) as resp:
+            return resp.status == 200
+    except OSError:
+        return False
+
+
+def start_backend(
+    command: str, cwd: str, workers: int, timeout: float = 60.0, extra_env: dict[str, str] | None = None,
+) -> subprocess.Popen:
+    """Launch the backend with CLUSTER_WORKERS=workers on BASE_URL's port and wait for /health."""
+    env = {**os.environ, **(extra_env or {}), "CLUSTER_WORKERS": str(workers),
+           "PORT": str(httpx.URL(BASE_URL).port or 80)}
+    # Measure the server, not the per-IP limiter every virtual user shares
+    env.setdefault("RATE_LIMIT_MAX", "1000000")
+    env.setdefault("AUTH_RATE_LIMIT_MAX", "1000000")
+    proc = subprocess.Popen(shlex.split(command), cwd=cwd, env=env, stdout=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + timeout
+    while not _backend_healthy():
+        if proc.poll() is not None:
+            raise RuntimeError(f"backend exited with {proc.returncode} before becoming healthy")
+        if time.monotonic() > deadline:
+            stop_backend(proc)
+            raise RuntimeError(f"backend not healthy after {timeout:.0f}s")
+        time.sleep(0.2)
+    return proc
+
+
+def stop_backend(proc: subprocess.Popen, timeout: float = 60.0):
+    """SIGTERM (graceful drain), then SIGKILL if it does not exit in time."""
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def run_scale_sweep(worker_counts: list[int], cfg: LoadConfig, command: str, cwd: str) -> list[ScaleRun]:
+    """Restart the backend at each worker count and run the same load against it."""
+    runs: list[ScaleRun] = []
+    for workers in worker_counts:
+        print(f"  {workers} worker(s): starting backend...")
+        proc = start_backend(command, cwd, workers)
+        run_report = TestReport()
+        token = _current_report.set(run_report)
+        try:
+            asyncio.run(run_load_test(cfg))
+        finally:
+            _current_report.reset(token)
+            stop_backend(proc)
+        runs.append(scale_run_from_report(workers, run_report))
+    return runs
+
+
+def print_scale_summary(runs: list[ScaleRun], csv_path: str | None = None):
+    rows = [
+        {
+            "workers": run.workers, "requests": run.requests, "throughput": run.throughput,
+            "speedup": speedup, "efficiency": efficiency,
+            "p50Ms": run.p50_ms, "p99Ms": run.p99_ms, "errorRate": run.error_rate,
+        }
+        for run, (speedup, efficiency) in zip(runs, scaling_efficiency(runs))
+    ]
+
+    print("\n" + "=" * 90)
+    print("  Core Scaling Sweep  (efficiency 1.00 = throughput grows linearly with workers)")
+    print("=" * 90)
+    print(f"  {'workers':>7}{'requests':>10}{'req/s':>9}{'speedup':>9}{'effic.':>8}{'p50 ms':>9}{'p99 ms':>9}{'err%':>7}")
+    for row in rows:
+        print(f"  {row['workers']:>7}{row['requests']:>10}{row['throughput']:>9.1f}{row['speedup']:>8.2f}x"
+              f"{row['efficiency']:>8.2f}{row['p50Ms']:>9.1f}{row['p99Ms']:>9.1f}{row['errorRate'] * 100:>7.2f}")
+    print("=" * 90)
+
+    if csv_path:
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["workers"])
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"  Sweep data written to {csv_path}")
+
+    for run in runs:
+        ok = run.requests > 0 and run.error_rate < 0.01
+        report.add(f"Scale sweep: {run.workers} worker(s)", ok,
+                   "" if ok else f"{run.requests} requests, {run.error_rate:.1%} errors")
+
+
+# ---------------------------------------------------------------------------
+# Shared limits (--limits-check): rate limits must hold across backend processes
+# ---------------------------------------------------------------------------
+
+@dataclass
+class LimitCheck:
+    name: str
+    allowed: int                  # requests the backends let through
+    rejected: int                 # 429s carrying the expected error code
+    limit: int
+    other: dict[int, int] = field(default_factory=dict)   # unexpected statuses, 0 = transport error
+    detail: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return not self.other and 0 < self.allowed <= self.limit and self.rejected > 0
+
+
+def usage_tokens(usage: dict[str, Any] | None) -> int:
+    """Tokens a done event's usage charges against the per-user budget (all four counters)."""
+    return sum(int((usage or {}).get(key, 0)) for key in TOKEN_FIELDS[1:])
+
+
+def _tally(check: LimitCheck, status: int, code: str | None, expected_code: str | None):
+    if status == 429 and (expected_code is None or code == expected_code):
+        check.rejected += 1
+    elif 200 <= status < 300 or (status in (400, 401) and expected_code is None):
+        check.allowed += 1
+    else:
+        check.other[status] = check.other.get(status, 0) + 1
+
+
+async def _check_auth_limit(clients: list["httpx.AsyncClient"], limit: int) -> LimitCheck:
+    """Send limit + 5 logins round-robin over the targets; a shared store lets only `limit` through."""
+    check = LimitCheck("POST /auth/login per-IP limit", 0, 0, limit)
+    email = f"limits-{uuid.uuid4().hex[:12]}@example.com"
+    for i in range(limit + 5):
+        try:
+            resp = await clients[i % len(clients)].post(f"{API_PREFIX}/auth/login", json={
+                "email": email, "password": "WrongPass123!",
+            })
+        except httpx.HTTPError:
+            _tally(check, 0, None, None)
+            continue
+        _tally(check, resp.status_code, None, None)
+    return check
+
+
+async def _open_stream(client: "httpx.AsyncClient", headers: dict[str, str]) -> tuple[int, str | None, int]:
+    """Start one Feynman analysis; returns (status, error code, tokens charged by its done event)."""
+    resp = await client.post(f"{API_PREFIX}/feynman/session", headers=headers, json={})
+    if resp.status_code != 200:
+        return resp.status_code, None, 0
+    session_id = resp.json()["data"]["sessionId"]
+    body = {"sessionId": session_id, "starStory": analysis_input(SAMPLE_STAR_STORY, False)}
+    async with client.stream("POST", f"{API_PREFIX}/feynman/analyze", headers=headers, json=body) as stream:
+        if stream.status_code != 200:
+            await stream.aread()
+            return stream.status_code, stream.json().get("error", {}).get("code"), 0
+        parser, tokens = SSEParser(), 0
+        async for chunk in stream.aiter_raw():
+            for event in parser.feed(chunk):
+                if event.event == "done" and isinstance(event.data, dict):
+                    tokens = usage_tokens(event.data.get("usage"))
+        return 200, None, tokens
+
+
+async def _check_stream_cap(clients: list["httpx.AsyncClient"], headers: dict[str, str], cap: int) -> LimitCheck:
+    """Open 2 × cap + 1 streams for one user at once, spread over the targets."""
+    check = LimitCheck("Concurrent AI streams per user", 0, 0, cap)
+    results = await asyncio.gather(
+        *(_open_stream(clients[i % len(clients)], headers) for i in range(2 * cap + 1)),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            _tally(check, 0, None, "TOO_MANY_STREAMS")
+        else:
+            _tally(check, result[0], result[1], "TOO_MANY_STREAMS")
+    return check
+
+
+async def _check_token_budget(
+    clients: list["httpx.AsyncClient"], headers: dict[str, str], budget: int, max_streams: int = 50,
+) -> LimitCheck:
+    """Run streams one at a time, alternating targets, until the budget rejects one."""
+    check = LimitCheck("AI token budget per user", 0, 0, max_streams)
+    spent = 0
+    for i in range(max_streams):
+        try:
+            status, code, tokens = await _open_stream(clients[i % len(clients)], headers)
+        except httpx.HTTPError:
+            _tally(check, 0, None, "TOKEN_BUDGET_EXCEEDED")
+            break
+        _tally(check, status, code, "TOKEN_BUDGET_EXCEEDED")
+        if status == 429:
+            break
+        spent += tokens
+    check.detail = f"{spent} tokens spent before rejection (budget {budget})"
+    # Rejected too early means a process undercounted; never rejected means usage was not shared
+    if check.rejected and spent < budget:
+        check.other[429] = check.other.get(429, 0) + 1
+    return check
+
+
+async def run_limits_check(
+    targets: list[str], auth_limit: int, stream_cap: int, token_budget: int,
+) -> list[LimitCheck]:
+    """Check the auth rate limit, per-user stream cap and (optionally) token budget across `targets`."""
+    clients = [httpx.AsyncClient(base_url=t, timeout=httpx.Timeout(10.0, read=180.0)) for t in targets]
+    try:
+        headers = {"Authorization": f"Bearer {await register_async(clients[0], 'limits')}"}
+        checks = [await _check_stream_cap(clients, headers, stream_cap)]
+        if token_budget:
+            checks.append(await _check_token_budget(clients, headers, token_budget))
+        # Last: it burns this IP's login allowance for the window
+        checks.append(await _check_auth_limit(clients, auth_limit))
+    finally:
+        for client in clients:
+            await client.aclose()
+    return checks
+
+
+def print_limits_summary(checks: list[LimitCheck], targets: list[str]):
+    print("\n" + "=" * 70)
+    print(f"  Shared Limits across {len(targets)} target(s)")
+    print("=" * 70)
+    print(f"  {'check':<34}{'allowed':>9}{'limit':>7}{'429':>6}  result")
+    for check in checks:
+        verdict = "ok" if check.ok else "FAIL"
+        print(f"  {check.name:<34}{check.allowed:>9}{check.limit:>7}{check.rejected:>6}  {verdict}")
+        if check.other:
+            print(f"    unexpected statuses: {check.other}")
+        if check.detail:
+            print(f"    {check.detail}")
+    print("=" * 70)
+    for check in checks:
+        report.add(f"Limits: {check.name}", check.ok,
+                   "" if check.ok else f"allowed={check.allowed} limit={check.limit} 429={check.rejected} "
+                                       f"other={check.other}")
+
+
+# ---------------------------------------------------------------------------
+# Saturation (--saturation): admitted latency once offered load passes the AI scheduler's capacity
+# ---------------------------------------------------------------------------
+
+# SSE error events the scheduler sends when a call queued after the stream opened is shed
+AI_BUSY_MESSAGES = ("当前 AI 请求较多", "AI 请求排队超时")
+# Past saturation the queue is full, so admitted waits are capped; allow noise, not growth
+SATURATION_P99_GROWTH = 1.5
+
+
+@dataclass
+class SaturationLevel:
+    concurrency: int
+    admitted: LatencyHistogram = field(default_factory=LatencyHistogram)
+    shed: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+    @property
+    def shed_rate(self) -> float:
+        offered = self.admitted.count + self.shed + self.failed
+        return self.shed / offered if offered else 0.0
+
+    @property
+    def goodput(self) -> float:
+        return self.admitted.count / self.seconds if self.seconds else 0.0
+
+
+def saturation_verdict(levels: list[SaturationLevel]) -> tuple[bool, str]:
+    """Admitted p99 at the highest level vs. the first level that shed load; needs two shedding levels."""
+    saturated = [level for level in levels if level.shed and level.admitted.count]
+    if len(saturated) < 2:
+        return False, "fewer than two levels shed load; raise --levels past AI_MAX_CONCURRENT + AI_QUEUE_LIMIT"
+    first, last = saturated[0], saturated[-1]
+    before, after = first.admitted.percentile(99), last.admitted.percentile(99)
+    growth = after / before if before else math.inf
+    detail = (f"admitted p99 {before:.0f}ms at {first.concurrency} → {after:.0f}ms at {last.concurrency} "
+              f"(x{growth:.2f})")
+    return growth <= SATURATION_P99_GROWTH, detail
+
+
+async def _saturation_worker(
+    client: "httpx.AsyncClient", headers: dict[str, str], level: SaturationLevel, deadline: float,
+):
+    """Run fresh (uncached) Feynman analyses back to back until the deadline."""
+    while time.perf_counter() < deadline:
+        resp = await client.post(f"{API_PREFIX}/feynman/session", headers=headers, json={})
+        if resp.status_code != 200:
+            level.failed += 1
+            await asyncio.sleep(0.1)
+            continue
+        timing = await stream_sse(client, "POST /feynman/analyze", "/feynman/analyze", headers, {
+            "sessionId": resp.json()["data"]["sessionId"],
+            "starStory": analysis_input(SAMPLE_STAR_STORY, False),
+        })
+        report.record_timing("POST /feynman/analyze", timing.status or 0, timing.total)
+        if timing.ok:
+            level.admitted.record(timing.total)
+        elif timing.status == 429 or any(m in (timing.error or "") for m in AI_BUSY_MESSAGES):
+            level.shed += 1
+            # Shed: back off briefly instead of spinning on rejections
+            await asyncio.sleep(0.2)
+        else:
+            level.failed += 1
+
+
+async def run_saturation(concurrencies: list[int], duration: float) -> list[SaturationLevel]:
+    """Hold each concurrency level of in-flight analyses for `duration` seconds.
+
+    Two workers share a user, so the per-user stream cap (2) is never what turns them away.
+    """
+    peak = max(concurrencies)
+    limits = httpx.Limits(max_connections=peak + 4, max_keepalive_connections=peak + 4)
+    levels: list[SaturationLevel] = []
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=httpx.Timeout(180.0), limits=limits) as client:
+        tokens = [await register_async(client, "saturation") for _ in range(-(-peak // 2))]
+        for concurrency in sorted(concurrencies):
+            level = SaturationLevel(concurrency)
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                _saturation_worker(client, {"Authorization": f"Bearer {tokens[i // 2]}"}, level, start + duration)
+                for i in range(concurrency)
+            ))
+            level.seconds = time.perf_counter() - start
+            levels.append(level)
+    return levels
+
+
+def print_saturation_summary(levels: list[SaturationLevel]):
+    print("\n" + "=" * 84)
+    print("  Saturation Report  (admitted POST /feynman/analyze, ms)")
+    print("=" * 84)
+    print(f"  {'in flight':>10}{'admitted':>10}{'shed':>8}{'shed%':>8}{'failed':>8}{'ok/s':>8}"
+          f"{'p50':>10}{'p99':>10}{'max':>10}")
+    for level in levels:
+        hist = level.admitted
+        print(f"  {level.concurrency:>10}{hist.count:>10}{level.shed:>8}{level.shed_rate * 100:>8.1f}{level.failed:>8}"
+              f"{level.goodput:>8.2f}{hist.percentile(50):>10.0f}{hist.percentile(99):>10.0f}{hist.max_us / 1000:>10.0f}")
+    print("-" * 84)
+    ok, detail = saturation_verdict(levels)
+    print(f"  {detail}")
+    print("=" * 84)
+    report.add("Saturation: admitted p99 stays bounded", ok, "" if ok else detail)
+
+
+# ---------------------------------------------------------------------------
+# Upstream resilience (--resilience-bench): hedging against a stalling upstream, breaker fail-fast
+# ---------------------------------------------------------------------------
+
+@dataclass
+class ResiliencePhase:
+    name: str
+    ok: LatencyHistogram = field(default_factory=LatencyHistogram)
+    failed: LatencyHistogram = field(default_factory=LatencyHistogram)
+    statuses: dict[int, int] = field(default_factory=dict)  # 0 = transport error
+    recovered: bool | None = None
+
+    def record(self, status: int, seconds: float, ok: bool):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        (self.ok if ok else self.failed).record(seconds)
+
+
+def resilience_verdicts(
+    phases: list[ResiliencePhase], fail_fast_ms: float,
+) -> list[tuple[str, bool, str]]:
+    """(check, passed, detail) for the single / hedged / upstream-down phases, in that order."""
+    single, hedged, down = phases
+    before, after = single.ok.percentile(99), hedged.ok.percentile(99)
+    fast = down.failed.percentile(50)
+    return [
+        ("Resilience: hedging cuts p99", hedged.ok.count > 0 and after < before,
+         f"p99 {before:.0f}ms single → {after:.0f}ms hedged"),
+        ("Resilience: breaker fails fast", down.failed.count > 0 and fast <= fail_fast_ms,
+         f"median failure {fast:.0f}ms with the upstream down (limit {fail_fast_ms:.0f}ms)"),
+        ("Resilience: breaker recovers", bool(down.recovered), "first request after the cooldown"),
+    ]
+
+
+async def _resilience_requests(phase: ResiliencePhase, requests: int, concurrency: int):
+    """`requests` fresh Feynman analyses, `concurrency` at a time, one user per worker.
+
+    Each worker moves to a new user before the per-user AI route limit (20/min) would reject it.
+    """
+    limits = httpx.Limits(max_connections=concurrency + 4, max_keepalive_connections=concurrency + 4)
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=httpx.Timeout(180.0), limits=limits) as client:
+        remaining = [requests]
+
+        async def worker():
+            sent = 0
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                if sent % 15 == 0:
+                    headers = {"Authorization": f"Bearer {await register_async(client, 'resilience')}"}
+                sent += 1
+                resp = await client.post(f"{API_PREFIX}/feynman/session", headers=headers, json={})
+                if resp.status_code != 200:
+                    phase.record(resp.status_code, resp.elapsed.total_seconds(), False)
+                    continue
+                timing = await stream_sse(client, "POST /feynman/analyze", "/feynman/analyze", headers, {
+                    "sessionId": resp.json()["data"]["sessionId"],
+                    "starStory": analysis_input(SAMPLE_STAR_STORY, False),
+                })
+                report.record_timing(f"POST /feynman/analyze [{phase.name}]", timing.status or 0, timing.total)
+                phase.record(timing.status or 0, timing.total, timing.ok)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def run_resilience_bench(
+    command: str, cwd: str, mock: MockConfig, requests: int, concurrency: int,
+    hedge_delay_ms: int, first_token_timeout_ms: int, cooldown_ms: int = 2000,
+) -> list[ResiliencePhase]:
+    """Same workload against a faulty mock upstream: single attempt, hedged, then with the upstream down.
+
+    The harness owns both ends: it serves the mock upstream and restarts the
+    backend with each phase's AI_* settings.
+    """
+    phases: list[ResiliencePhase] = []
+    with MockUpstreamThread(mock) as upstream:
+        base_env = {
+            "ANTHROPIC_BASE_URL": upstream.base_url,
+            "ANTHROPIC_API_KEY": "mock",
+            "AI_FIRST_TOKEN_TIMEOUT_MS": str(first_token_timeout_ms),
+            "AI_BREAKER_COOLDOWN_MS": str(cooldown_ms),
+        }
+        faults = {"error_rate": mock.error_rate, "error_mode": mock.error_mode}
+        settings = [
+            # Injected stalls must not trip the breaker while tail latency is measured
+            ("single", {"AI_HEDGE_DELAY_MS": "0", "AI_BREAKER_THRESHOLD": "1000000"}),
+            ("hedged", {"AI_HEDGE_DELAY_MS": str(hedge_delay_ms), "AI_BREAKER_THRESHOLD": "1000000"}),
+            ("upstream down", {"AI_HEDGE_DELAY_MS": str(hedge_delay_ms)}),
+        ]
+        for label, env in settings:
+            print(f"  {label}: starting backend...")
+            phase = ResiliencePhase(label)
+            proc = start_backend(command, cwd, 1, extra_env={**base_env, **env})
+            try:
+                if label == "upstream down":
+                    upstream.config.update({"error_rate": 1.0, "error_mode": "status"})
+                    asyncio.run(_resilience_requests(phase, requests, concurrency))
+                    upstream.config.update({**faults, "error_rate": 0.0})
+                    time.sleep(cooldown_ms / 1000 + 0.5)
+                    probe = ResiliencePhase("probe")
+                    asyncio.run(_resilience_requests(probe, 1, 1))
+                    phase.recovered = probe.ok.count == 1
+                    upstream.config.update(faults)
+                else:
+                    asyncio.run(_resilience_requests(phase, requests, concurrency))
+            finally:
+                stop_backend(proc)
+            phases.append(phase)
+    return phases
+
+
+def print_resilience_summary(phases: list[ResiliencePhase], fail_fast_ms: float):
+    print("\n" + "=" * 90)
+    print("  Upstream Resilience Report  (POST /feynman/analyze, ms)")
+    print("=" * 90)
+    print(f"  {'phase':<16}{'ok':>6}{'failed':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'fail p50':>10}  statuses")
+    for phase in phases:
+        codes = " ".join(f"{code or 'ERR'}:{n}" for code, n in sorted(phase.statuses.items()))
+        print(f"  {phase.name:<16}{phase.ok.count:>6}{phase.failed.count:>8}"
+              f"{phase.ok.percentile(50):>9.0f}{phase.ok.percentile(95):>9.0f}{phase.ok.percentile(99):>9.0f}"
+              f"{phase.ok.max_us / 1000:>9.0f}{phase.failed.percentile(50):>10.0f}  {codes}")
+    print("-" * 90)
+    for check, ok, detail in resilience_verdicts(phases, fail_fast_ms):
+        print(f"  {'[+]' if ok else '[-]'} {check}: {detail}")
+        report.add(check, ok, "" if ok else detail)
+    print("=" * 90)
+
+
+# ---------------------------------------------------------------------------
+# Flaky connections (--flaky-bench): restarting dropped streams vs resuming them with Last-Event-ID
+# ---------------------------------------------------------------------------
+
+FLAKY_MAX_RECONNECTS = 4
+AI_ROUTE_LIMIT_PER_MINUTE = 20
+
+
+@dataclass
+class FlakyPhase:
+    name: str
+    analyses: int = 0
+    completed: LatencyHistogram = field(default_factory=LatencyHistogram)  # first request → done
+    connections: int = 0
+    upstream_calls: int = 0  # mock upstream requests during the phase
+
+    @property
+    def calls_per_analysis(self) -> float:
+        return self.upstream_calls / self.completed.count if self.completed.count else float("inf")
+
+
+def flaky_verdicts(restart: FlakyPhase, resume: FlakyPhase) -> list[tuple[str, bool, str]]:
+    """(check, passed, detail): resuming needs fewer upstream calls per analysis, and every analysis finishes."""
+    return [
+        ("Flaky network: resume saves upstream calls",
+         resume.completed.count > 0 and resume.calls_per_analysis < restart.calls_per_analysis,
+         f"{restart.calls_per_analysis:.2f} upstream calls per analysis restarting → "
+         f"{resume.calls_per_analysis:.2f} resuming"),
+        ("Flaky network: resumed analyses complete", resume.analyses > 0 and resume.completed.count == resume.analyses,
+         f"{resume.completed.count}/{resume.analyses} completed"),
+    ]
+
+
+async def _flaky_analyses(phase: FlakyPhase, requests: int, concurrency: int, drop_rate: float, resume: bool):
+    """`requests` fresh Feynman analyses over connections that drop at `drop_rate`.
+
+    Restarting re-sends the analysis from scratch; resuming reconnects with
+    Last-Event-ID. Either way at most FLAKY_MAX_RECONNECTS times.
+    """
+    limits = httpx.Limits(max_connections=concurrency + 4, max_keepalive_connections=concurrency + 4)
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=httpx.Timeout(180.0), limits=limits) as client:
+        remaining = [requests]
+
+        async def worker():
+            used = AI_ROUTE_LIMIT_PER_MINUTE
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                # Every connection, reconnects included, counts against the per-user AI route limit
+                if used + FLAKY_MAX_RECONNECTS + 1 > AI_ROUTE_LIMIT_PER_MINUTE:
+                    headers = {"Authorization": f"Bearer {await register_async(client, 'flaky')}"}
+                    used = 0
+                resp = await client.post(f"{API_PREFIX}/feynman/session", headers=headers, json={})
+                if resp.status_code != 200:
+                    continue
+                phase.analyses += 1
+                body = {"sessionId": resp.json()["data"]["sessionId"],
+                        "starStory": analysis_input(SAMPLE_STAR_STORY, False)}
+                start = time.perf_counter()
+                for _ in range(1 if resume else FLAKY_MAX_RECONNECTS + 1):
+                    timing = await stream_sse(client, "POST /feynman/analyze", "/feynman/analyze", headers, body,
+                                              resume_attempts=FLAKY_MAX_RECONNECTS if resume else 0,
+                                              drop_rate=drop_rate)
+                    phase.connections += 1 + timing.resumes
+                    used += 1 + timing.resumes
+                    if timing.ok:
+                        phase.completed.record(time.perf_counter() - start)
+                        break
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def run_flaky_bench(
+    command: str, cwd: str, mock: MockConfig, requests: int, concurrency: int, drop_rate: float,
+) -> list[FlakyPhase]:
+    """The same dropped connections with SSE resume off (SSE_RESUME_GRACE_MS=0) and on.
+
+    The harness serves the mock upstream and counts the calls reaching it,
+    restarting the backend for each phase.
+    """
+    phases: list[FlakyPhase] = []
+    with MockUpstreamThread(mock) as upstream:
+        # Hedged attempts would add upstream calls that have nothing to do with the client
+        base_env = {"ANTHROPIC_BASE_URL": upstream.base_url, "ANTHROPIC_API_KEY": "mock", "AI_HEDGE_DELAY_MS": "0"}
+        for label, resume, env in (("restart", False, {"SSE_RESUME_GRACE_MS": "0"}), ("resume", True, {})):
+            print(f"  {label}: starting backend...")
+            phase = FlakyPhase(label)
+            proc = start_backend(command, cwd, 1, extra_env={**base_env, **env})
+            try:
+                calls_before = upstream.stats.requests
+                asyncio.run(_flaky_analyses(phase, requests, concurrency, drop_rate, resume))
+                phase.upstream_calls = upstream.stats.requests - calls_before
+            finally:
+                stop_backend(proc)
+            phases.append(phase)
+    return phases
+
+
+def print_flaky_summary(phases: list[FlakyPhase]):
+    print("\n" + "=" * 84)
+    print("  Flaky Connection Report  (POST /feynman/analyze)")
+    print("=" * 84)
+    print(f"  {'phase':<10}{'done':>8}{'conns':>8}{'upstream':>10}{'per done':>10}{'p50 ms':>9}{'p95 ms':>9}")
+    for phase in phases:
+        print(f"  {phase.name:<10}{f'{phase.completed.count}/{phase.analyses}':>8}{phase.connections:>8}"
+              f"{phase.upstream_calls:>10}{phase.calls_per_analysis:>10.2f}"
+              f"{phase.completed.percentile(50):>9.0f}{phase.completed.percentile(95):>9.0f}")
+    print("-" * 84)
+    for check, ok, detail in flaky_verdicts(*phases):
+        print(f"  {'[+]' if ok else '[-]'} {check}: {detail}")
+        report.add(check, ok, "" if ok else detail)
+    print("=" * 84)
+
+
+# ---------------------------------------------------------------------------
+# Legacy transcript backfill: sessions stored in the old JSON column, copied at startup
+# ---------------------------------------------------------------------------
+
+LEGACY_TRANSCRIPT = [
+    {"role": "assistant", "content": "请做个自我介绍。", "timestamp": "2025-06-01T08:00:00.000Z"},
+    {"role": "user", "content": "我是一名后端工程师。", "timestamp": "2025-06-01T08:01:00.000Z"},
+    {"role": "assistant", "content": "讲讲你最有挑战的项目。", "timestamp": "2025-06-01T08:01:04.000Z"},
+]
+# Raw `messages` column values; only the first holds turns to copy
+LEGACY_COLUMNS = {
+    "transcript": json.dumps(LEGACY_TRANSCRIPT, ensure_ascii=False),
+    "empty": "[]",
+    "malformed": '{"role": "user"}',
+}
+
+
+def database_path(server_cwd: str) -> str:
+    """The backend's SQLite file: DATABASE_URL resolved against prisma/ the way Prisma does, else prisma/dev.db."""
+    location = os.environ.get("DATABASE_URL", "file:./dev.db").removeprefix("file:").split("?")[0]
+    return location if os.path.isabs(location) else os.path.normpath(os.path.join(server_cwd, "prisma", location))
+
+
+def _seed_legacy_sessions(db: str, user_id: str) -> dict[str, str]:
+    """Insert one session per LEGACY_COLUMNS entry as the old code stored them; returns label → session id."""
+    ids = {label: f"legacy-{label}-{uuid.uuid4().hex[:12]}" for label in LEGACY_COLUMNS}
+    conn = sqlite3.connect(db)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO rehearsal_sessions (id, user_id, scenario, interviewer_style, message_count, messages, "
+                "status, created_at) VALUES (?, ?, 'Backend engineer interview', 'technical', 0, ?, 'active', ?)",
+                [(ids[label], user_id, column, int(time.time() * 1000)) for label, column in LEGACY_COLUMNS.items()],
+            )
+    finally:
+        conn.close()
+    return ids
+
+
+def _stored_session(db: str, session_id: str) -> tuple[int, str | None, list[tuple[int, str, str]]]:
+    """(message_count, raw `messages` column, rehearsal_messages rows as (seq, role, content))."""
+    conn = sqlite3.connect(db)
+    try:
+        count, column = conn.execute(
+            "SELECT message_count, messages FROM rehearsal_sessions WHERE id = ?", (session_id,),
+        ).fetchone()
+        rows = conn.execute(
+            "SELECT seq, role, content FROM rehearsal_messages WHERE session_id = ? ORDER BY seq", (session_id,),
+        ).fetchall()
+    finally:
+        conn.close()
+    return count, column, rows
+
+
+def run_backfill_check(command: str, cwd: str, db: str) -> list[tuple[str, bool, str]]:
+    """Seed legacy sessions, then start the backend twice and check what its startup copy did.
+
+    A first start only registers the user that owns the seeded sessions.
+    The next start copies them; the one after must leave them as they are.
+    Returns (check, passed, detail) rows.
+    """
+    proc = start_backend(command, cwd, 1)
+    try:
+        with _live_client() as client:
+            token = _live_register(client)["token"]
+            user_id = client.get(f"{API_PREFIX}/auth/me", headers=auth_headers(token)).json()["data"]["id"]
+        ids = _seed_legacy_sessions(db, user_id)
+    finally:
+        stop_backend(proc)
+
+    expected_rows = [(seq, m["role"], m["content"]) for seq, m in enumerate(LEGACY_TRANSCRIPT)]
+    checks: list[tuple[str, bool, str]] = []
+    for start in ("first", "second"):
+        proc = start_backend(command, cwd, 1)
+        try:
+            with _live_client() as client:
+                resp = client.get(f"{API_PREFIX}/rehearsal/session/{ids['transcript']}", headers=auth_headers(token))
+        finally:
+            stop_backend(proc)
+
+        count, column, rows = _stored_session(db, ids["transcript"])
+        checks.append((f"Backfill ({start} start): transcript copied into rehearsal_messages",
+                       rows == expected_rows and count == len(LEGACY_TRANSCRIPT) and column is None,
+                       f"message_count={count}, {len(rows)} rows, messages column {'cleared' if column is None else 'kept'}"))
+
+        session = resp.json()["data"] if resp.status_code == 200 else {}
+        served = [{k: m.get(k) for k in ("role", "content", "timestamp")} for m in session.get("messages", [])]
+        checks.append((f"Backfill ({start} start): session detail serves the copied turns",
+                       served == LEGACY_TRANSCRIPT and session.get("messageCount") == len(LEGACY_TRANSCRIPT)
+                       and "legacyMessages" not in session,
+                       f"HTTP {resp.status_code}, {len(served)} turns, messageCount={session.get('messageCount')}"))
+
+        for label in ("empty", "malformed"):
+            count, column, rows = _stored_session(db, ids[label])
+            checks.append((f"Backfill ({start} start): {label} transcript marked handled",
+                           count == 0 and column is None and not rows,
+                           f"message_count={count}, {len(rows)} rows, "
+                           f"messages column {'cleared' if column is None else 'kept, rescanned every start'}"))
+    return checks
+
+
+def print_backfill_summary(checks: list[tuple[str, bool, str]], db: str):
+    print("\n" + "=" * 84)
+    print(f"  Legacy Transcript Backfill  ({db})")
+    print("=" * 84)
+    for check, ok, detail in checks:
+        print(f"  {'[+]' if ok else '[-]'} {check}: {detail}")
+        report.add(check, ok, "" if ok else detail)
+    print("=" * 84)
+
+
+# ---------------------------------------------------------------------------
+# Server-side metrics: /metrics scraped before and after a live run
+# ---------------------------------------------------------------------------
+
+MetricKey = tuple[str, tuple[tuple[str, str], ...]]
+_METRIC_LINE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$")
+_LABEL_PAIR = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+PHASES = ("auth", "db", "upstream", "serialize")
+
+
+def parse_metrics(text: str) -> dict[MetricKey, float]:
+    """Prometheus text exposition → {(sample name, sorted labels): value}."""
+    samples: dict[MetricKey, float] = {}
+    for line in text.splitlines():
+        match = _METRIC_LINE.match(line.strip())
+        if not match or line.startswith("#"):
+            continue
+        name, labels, value = match.groups()
+        pairs = tuple(sorted(
+            (k, v.replace('\\"', '"').replace("\\n", "\n").replace("\\\\", "\\"))
+            for k, v in _LABEL_PAIR.findall(labels or "")
+        ))
+        samples[(name, pairs)] = float(value.replace("+Inf", "inf"))
+    return samples
+
+
+def scrape_metrics() -> dict[MetricKey, float] | None:
+    """GET /metrics (Bearer $METRICS_TOKEN if set); None if the server does not serve it."""
+    headers = {"Authorization": f"Bearer {os.environ['METRICS_TOKEN']}"} if os.environ.get("METRICS_TOKEN") else {}
+    try:
+        resp = httpx.get(f"{BASE_URL}/metrics", headers=headers, timeout=10)
+    except httpx.HTTPError:
+        return None
+    return parse_metrics(resp.text) if resp.status_code == 200 else None
+
+
+def metrics_delta(before: dict[MetricKey, float], after: dict[MetricKey, float]) -> dict[MetricKey, float]:
+    """Counter growth between two scrapes (gauges come out as their change, which the breakdown ignores)."""
+    return {key: value - before.get(key, 0.0) for key, value in after.items()}
+
+
+def phase_breakdown(delta: dict[MetricKey, float]) -> dict[str, dict[str, float]]:
+    """Per "METHOD /route": request count and mean ms total / auth / db / upstream / serialize / other.
+
+    Summed over statuses and cluster workers; the /metrics scrapes themselves are left out.
+    """
+    totals: dict[str, dict[str, float]] = {}
+    for (name, labels), value in delta.items():
+        label = dict(labels)
+        route = label.get("route", "")
+        if route == "/metrics" or not route:
+            continue
+        endpoint = f"{label.get('method', '')} {route.removeprefix(API_PREFIX)}"
+        entry = totals.setdefault(endpoint, {"count": 0.0, "total": 0.0, **dict.fromkeys(PHASES, 0.0)})
+        if name == "mingjing_http_request_duration_seconds_count":
+            entry["count"] += value
+        elif name == "mingjing_http_request_duration_seconds_sum":
+            entry["total"] += value
+        elif name == "mingjing_http_request_phase_seconds_total" and label.get("phase") in PHASES:
+            entry[label["phase"]] += value
+
+    breakdown: dict[str, dict[str, float]] = {}
+    for endpoint, entry in sorted(totals.items()):
+        count = entry["count"]
+        if count <= 0:
+            continue
+        mean = {key: entry[key] / count * 1000 for key in ("total", *PHASES)}
+        breakdown[endpoint] = {
+            "count": count,
+            "meanMs": mean["total"],
+            **{f"{phase}Ms": mean[phase] for phase in PHASES},
+            "otherMs": max(0.0, mean["total"] - sum(mean[phase] for phase in PHASES)),
+        }
+    return breakdown
+
+
+def _metric_total(delta: dict[MetricKey, float], name: str, **match: str) -> float:
+    return sum(v for (n, labels), v in delta.items() if n == name and all(dict(labels).get(k) == m
+                                                                         for k, m in match.items()))
+
+
+def print_server_breakdown(delta: dict[MetricKey, float]):
+    breakdown = phase_breakdown(delta)
+    print("\n" + "=" * 100)
+    print("  Server Time Breakdown (mean ms per request, from /metrics before/after the run)")
+    print("=" * 100)
+    print(f"  {'endpoint':<36}{'count':>7}{'total':>10}{'auth':>8}{'db':>9}{'upstream':>10}{'serialize':>10}"
+          f"{'other':>10}")
+    for endpoint, e in breakdown.items():
+        print(f"  {endpoint:<36}{e['count']:>7.0f}{e['meanMs']:>10.1f}{e['authMs']:>8.1f}{e['dbMs']:>9.1f}"
+              f"{e['upstreamMs']:>10.1f}{e['serializeMs']:>10.2f}{e['otherMs']:>10.1f}")
+    print("-" * 100)
+    queries = _metric_total(delta, "mingjing_prisma_query_duration_seconds_count")
+    query_s = _metric_total(delta, "mingjing_prisma_query_duration_seconds_sum")
+    calls = _metric_total(delta, "mingjing_ai_time_to_first_token_seconds_count")
+    ttft_s = _metric_total(delta, "mingjing_ai_time_to_first_token_seconds_sum")
+    print(f"  Prisma: {queries:.0f} queries, mean {query_s / queries * 1000 if queries else 0:.2f}ms  |  "
+          f"AI: {calls:.0f} calls, mean TTFT {ttft_s / calls * 1000 if calls else 0:.0f}ms, "
+          f"{_metric_total(delta, 'mingjing_ai_tokens_total', type='output'):.0f} output tokens")
+    rejected: dict[str, float] = {}
+    for (name, labels), value in delta.items():
+        if name == "mingjing_rate_limit_rejections_total" and value > 0:
+            code = dict(labels).get("code", "?")
+            rejected[code] = rejected.get(code, 0.0) + value
+    if rejected:
+        print("  Rejections: " + "  ".join(f"{code}:{n:.0f}" for code, n in sorted(rejected.items())))
+    print("=" * 100)
+
+
+# ---------------------------------------------------------------------------
+# Performance baseline and regression gate (--save-baseline / --baseline)
+# ---------------------------------------------------------------------------
+
+@dataclass
+class RegressionThresholds:
+    max_p95_increase: float = 0.20     # fail if p95 grows by more than 20% ...
+    p95_slack_ms: float = 5.0          # ... and by more than this many ms (ignores jitter on fast routes)
+    max_throughput_drop: float = 0.20  # fail if req/s falls by more than 20%
+    max_bytes_increase: float = 0.20   # fail if the mean response body grows by more than 20%
+    min_samples: int = 20              # endpoints with fewer samples (either run) are not compared
+
+
+@dataclass
+class Regression:
+    endpoint: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def change(self) -> float:
+        return (self.current - self.baseline) / self.baseline if self.baseline else float("inf")
+
+
+BASELINE_METRICS = ("count", "p50Ms", "p95Ms", "p99Ms", "throughput", "errorRate", "meanBytes")
+
+
+def save_baseline(path: str, summary: dict[str, dict[str, Any]], run_config: str):
+    with open(path, "w") as f:
+        json.dump({
+            "generatedAt": datetime.now(timezone.utc).isoformat(),
+            "config": run_config,
+            "endpoints": {ep: {m: e[m] for m in BASELINE_METRICS if m in e} for ep, e in summary.items()},
+        }, f, ensure_ascii=False, indent=2)
+
+
+def load_baseline(path: str) -> dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_to_baseline(
+    summary: dict[str, dict[str, Any]],
+    baseline: dict[str, Any],
+    thresholds: RegressionThresholds,
+) -> list[Regression]:
+    """Return every endpoint whose p95, throughput or response size regressed past the thresholds."""
+    regressions: list[Regression] = []
+    for endpoint, base in baseline["endpoints"].items():
+        current = summary.get(endpoint)
+        if current is None or min(current["count"], base["count"]) < thresholds.min_samples:
+            continue
+        p95_limit = max(base["p95Ms"] * (1 + thresholds.max_p95_increase), base["p95Ms"] + thresholds.p95_slack_ms)
+        if current["p95Ms"] > p95_limit:
+            regressions.append(Regression(endpoint, "p95Ms", base["p95Ms"], current["p95Ms"]))
+        if current["throughput"] < base["throughput"] * (1 - thresholds.max_throughput_drop):
+            regressions.append(Regression(endpoint, "throughput", base["throughput"], current["throughput"]))
+        if "meanBytes" in base and current.get("meanBytes", 0) > base["meanBytes"] * (1 + thresholds.max_bytes_increase):
+            regressions.append(Regression(endpoint, "meanBytes", base["meanBytes"], current["meanBytes"]))
+    return regressions
+
+
+def print_baseline_comparison(
+    summary: dict[str, dict[str, Any]],
+    baseline: dict[str, Any],
+    regressions: list[Regression],
+    run_config: str,
+):
+    regressed = {(r.endpoint, r.metric) for r in regressions}
+
+    print("\n" + "=" * 124)
+    print(f"  Baseline Comparison  (baseline from {baseline.get('generatedAt', '?')})")
+    if baseline.get("config") != run_config:
+        print(f"  [!] Run config differs from baseline: {baseline.get('config')}")
+    print("=" * 124)
+    print(f"  {'endpoint':<36}{'p95 base':>10}{'p95 now':>10}{'Δ':>8}{'rps base':>10}{'rps now':>10}{'Δ':>8}"
+          f"{'B base':>10}{'B now':>10}{'Δ':>8}")
+    for endpoint, base in baseline["endpoints"].items():
+        current = summary.get(endpoint)
+        if current is None:
+            print(f"  {endpoint:<36}  (not exercised in this run)")
+            continue
+        cells = []
+        for metric in ("p95Ms", "throughput", "meanBytes"):
+            if metric not in base or metric not in current:
+                cells.append(f"{'-':>10}{'-':>10}{'':>8}")
+                continue
+            b, c = base[metric], current[metric]
+            delta = f"{(c - b) / b * 100:+.0f}%" if b else "n/a"
+            mark = "!" if (endpoint, metric) in regressed else " "
+            cells.append(f"{b:>10.1f}{c:>10.1f}{delta:>7}{mark}")
+        print(f"  {endpoint:<36}{''.join(cells)}")
+    print("-" * 124)
+    print(f"  Regressions: {len(regressions)}")
+    for r in regressions:
+        print(f"  [-] {r.endpoint} {r.metric}: {r.baseline:.1f} → {r.current:.1f} ({r.change * 124:+.0f}%)")
+    print("=" * 124)
 
 
 # ---------------------------------------------------------------------------
 # Runner
 # ---------------------------------------------------------------------------
 
-def run_contract_tests():
+def _run_one(test_fn: Callable[[], None]) -> TestReport:
+    """Run one test or live flow against its own TestReport (executes inside a pool worker)."""
+    isolated = TestReport()
+    token = _current_report.set(isolated)
+    try:
+        test_fn()
+    except AssertionError as e:
+        isolated.add(test_fn.__doc__ or test_fn.__name__, False, str(e))
+    except Exception as e:
+        isolated.add(test_fn.__doc__ or test_fn.__name__, False, f"Exception: {e}")
+    finally:
+        _current_report.reset(token)
+    return isolated
+
+
+def run_isolated(tests: list[Callable[[], None]], workers: int = 1, pool: str = "thread"):
+    """Fan tests out over a thread/process pool and merge their reports in list order.
+
+    Every test writes to a private TestReport, so the merged result is identical
+    to a serial run regardless of which worker finished first.
+    """
+    if workers <= 1:
+        reports = [_run_one(fn) for fn in tests]
+    else:
+        executor_cls = ProcessPoolExecutor if pool == "process" else ThreadPoolExecutor
+        with executor_cls(max_workers=workers) as executor:
+            reports = list(executor.map(_run_one, tests))
+    for isolated in reports:
+        report.merge(isolated)
+
+
+def run_contract_tests(workers: int = 1, pool: str = "thread"):
     """Run all contract (mock) tests."""
     tests = [
         # Flow 1: Auth
@@ -714,6 +3995,7 @@ def run_contract_tests():
         test_auth_login_success,
         test_auth_login_wrong_password,
         test_auth_me_valid_token,
+        test_usage_flush_with_deleted_user,
         test_auth_me_no_token,
         test_auth_me_invalid_token,
         # Flow 2: Feynman
@@ -722,6 +4004,7 @@ def run_contract_tests():
         test_feynman_analyze_missing_star_story,
         test_feynman_history_auth,
         test_feynman_session_isolation,
+        test_feynman_analyze_cache_replay,
         # Flow 3: Layers
         test_layers_create_session_auth,
         test_layers_analyze_missing_input_text,
@@ -733,38 +4016,414 @@ def run_contract_tests():
         test_rehearsal_end_session,
         test_rehearsal_feedback_ready,
         test_rehearsal_feedback_generating,
+        test_rehearsal_end_queue_full,
+        test_rehearsal_feedback_stream,
         test_rehearsal_history,
         # Flow 5: Response format
         test_success_response_format,
         test_failure_response_format,
         test_paginated_response_format,
+        test_paginated_cursor_format,
         test_error_codes_enumeration,
+        # Flow 6: SSE streaming
+        test_sse_parser_fragmented_frames,
+        test_sse_stream_event_sequence,
+        test_sse_coalesced_frames,
+        test_sse_structured_parts,
+        test_sse_resume_after_drop,
+        # Flow 7: Mock upstream
+        test_mock_upstream_analyzer_payloads,
+        test_mock_upstream_error_injection,
+        test_mock_upstream_prompt_cache,
+        # Flow 8: Latency reporting
+        test_latency_histogram_precision,
+        test_report_endpoint_summary_and_export,
+        test_report_cache_hit_rate,
+        test_report_prompt_cache_usage,
+        test_report_response_sizes,
+        test_metrics_phase_breakdown,
+        test_slowest_requests_with_server_timing,
+        # Flow 9: Regression gate
+        test_baseline_regression_gate,
+        # Flow 10: Rehearsal soak
+        test_soak_growth_exponent,
+        # Flow 11: Login storm
+        test_login_storm_slowdown,
+        test_limit_check_verdicts,
+        test_scale_sweep_efficiency,
+        test_saturation_verdict,
+        test_resilience_verdicts,
+        test_flaky_verdicts,
     ]
 
-    for test_fn in tests:
+    run_isolated(tests, workers, pool)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Mingjing E2E contract, live and load tests")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="run contract tests and live flows on N parallel workers (default: 1)")
+    parser.add_argument("--pool", choices=["thread", "process"], default="thread",
+                        help="worker pool type for --workers (default: thread)")
+    parser.add_argument("--load", action="store_true",
+                        help="run concurrent load generation against BASE_URL instead of live tests")
+    parser.add_argument("--stream-bench", action="store_true",
+                        help="benchmark SSE time-to-first-chunk and inter-chunk gaps against BASE_URL")
+    parser.add_argument("--iterations", type=int, default=10,
+                        help="passes over the streaming routes in --stream-bench (default: 10)")
+    parser.add_argument("--coalesce", choices=["on", "off", "both"], default="on",
+                        help="SSE frame coalescing for --stream-bench; 'both' runs off then on and compares "
+                             "frames and CPU per stream (default: on, the server default)")
+    parser.add_argument("--server-pid", type=int, default=None,
+                        help="backend PID to sample CPU from /proc during --stream-bench (local Linux servers)")
+    parser.add_argument("--cache-mix", type=float, default=0.0,
+                        help="share of --stream-bench analyses that resubmit the same text, exercising the "
+                             "result cache (default: 0, every input unique)")
+    parser.add_argument("--soak", action="store_true",
+                        help="play full rehearsal interviews and chart per-round latency/payload growth")
+    parser.add_argument("--sessions", type=int, default=20, help="interviews to play in --soak (default: 20)")
+    parser.add_argument("--rounds", type=int, default=10,
+                        help="max candidate turns per interview in --soak; 10 reaches MAX_MESSAGES (default: 10)")
+    parser.add_argument("--soak-csv", metavar="PATH", default=None, help="write per-round --soak data as CSV")
+    parser.add_argument("--feedback-bench", action="store_true",
+                        help="end --sessions interviews after --rounds turns and time end → feedback ready")
+    parser.add_argument("--feedback-wait", choices=["stream", "poll"], default="stream",
+                        help="wait for feedback via the SSE notification or by polling (default: stream)")
+    parser.add_argument("--poll-interval", type=float, default=1.0,
+                        help="seconds between feedback polls with --feedback-wait poll (default: 1)")
+    parser.add_argument("--login-storm", action="store_true",
+                        help="hammer /auth/login with --users clients for --duration seconds while probing "
+                             "/health and history latency")
+    parser.add_argument("--calm-seconds", type=float, default=5.0,
+                        help="probe-only phase before the --login-storm starts (default: 5)")
+    parser.add_argument("--probe-interval", type=float, default=0.1,
+                        help="seconds between --login-storm probes (default: 0.1)")
+    parser.add_argument("--history-bench", action="store_true",
+                        help="grow one user's history to each of --depths and time offset vs cursor pages")
+    parser.add_argument("--depths", default="20,200,2000",
+                        help="history sizes for --history-bench (default: 20,200,2000)")
+    parser.add_argument("--analyzed-share", type=float, default=0.0,
+                        help="share of --history-bench sessions seeded with an analysis result (0-1, default: 0)")
+    parser.add_argument("--scale-sweep", metavar="N,N,...", default=None,
+                        help="restart the backend with CLUSTER_WORKERS at each count and run the --load "
+                             "workload against it, e.g. 1,2,4")
+    parser.add_argument("--server-cmd", default="node dist/index.js",
+                        help="command that starts the backend for --scale-sweep (default: node dist/index.js)")
+    parser.add_argument("--server-cwd", default=BACKEND_DIR,
+                        help="working directory for --server-cmd (default: the backend directory)")
+    parser.add_argument("--sweep-csv", metavar="PATH", default=None, help="write --scale-sweep rows as CSV")
+    parser.add_argument("--limits-check", action="store_true",
+                        help="verify the auth rate limit and per-user AI limits hold across --targets")
+    parser.add_argument("--targets", default=None,
+                        help="comma-separated backend URLs for --limits-check (default: BASE_URL)")
+    parser.add_argument("--auth-limit", type=int, default=10,
+                        help="AUTH_RATE_LIMIT_MAX the backends run with (default: 10)")
+    parser.add_argument("--stream-cap", type=int, default=2,
+                        help="AI_MAX_CONCURRENT_STREAMS the backends run with (default: 2)")
+    parser.add_argument("--token-budget", type=int, default=0,
+                        help="AI_TOKEN_BUDGET the backends run with; 0 skips the budget check (default: 0)")
+    parser.add_argument("--saturation", action="store_true",
+                        help="hold each of --levels concurrent fresh analyses for --duration seconds and check "
+                             "admitted p99 stays bounded once the AI scheduler sheds load")
+    parser.add_argument("--levels", default="4,16,48",
+                        help="in-flight analyses per --saturation step (default: 4,16,48)")
+    parser.add_argument("--resilience-bench", action="store_true",
+                        help="start a faulty mock upstream and the backend (--server-cmd), and compare "
+                             "single-attempt vs hedged tail latency, then breaker fail-fast with the upstream down")
+    parser.add_argument("--flaky-bench", action="store_true",
+                        help="start the mock upstream and the backend (--server-cmd), drop stream connections "
+                             "at --drop-rate, and compare upstream calls when restarting vs resuming")
+    parser.add_argument("--backfill-check", action="store_true",
+                        help="seed rehearsal sessions in the old JSON transcript column of the backend's SQLite "
+                             "database, start the backend (--server-cmd) and check the startup copy")
+    parser.add_argument("--database", metavar="PATH", default=None,
+                        help="SQLite file for --backfill-check (default: DATABASE_URL, else prisma/dev.db "
+                             "under --server-cwd)")
+    parser.add_argument("--drop-rate", type=float, default=0.3,
+                        help="share of --flaky-bench stream connections the client drops (default: 0.3)")
+    parser.add_argument("--requests", type=int, default=100,
+                        help="analyses per --resilience-bench/--flaky-bench phase, --users at a time (default: 100)")
+    parser.add_argument("--hedge-delay", type=int, default=500,
+                        help="AI_HEDGE_DELAY_MS for the hedged --resilience-bench phase (default: 500)")
+    parser.add_argument("--first-token-timeout", type=int, default=5000,
+                        help="AI_FIRST_TOKEN_TIMEOUT_MS for --resilience-bench (default: 5000)")
+    parser.add_argument("--fail-fast-ms", type=float, default=50.0,
+                        help="median failure latency the open breaker must beat (default: 50)")
+    parser.add_argument("--users", type=int, default=10, help="max concurrent virtual users (default: 10)")
+    parser.add_argument("--arrival-rate", type=float, default=0.0,
+                        help="new users per second (open model); 0 = closed model (default: 0)")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="ramp-up seconds (default: 0)")
+    parser.add_argument("--duration", type=float, default=60.0, help="load duration in seconds (default: 60)")
+    parser.add_argument("--think-time", type=float, default=0.0,
+                        help="seconds between iterations of a closed-model VU (default: 0)")
+    parser.add_argument("--export", metavar="PATH", default=None,
+                        help="write per-endpoint latency percentiles to PATH (.json or .csv)")
+    parser.add_argument("--save-baseline", metavar="PATH", default=None,
+                        help="save this run's per-endpoint p50/p95/p99 and req/s as a baseline")
+    parser.add_argument("--baseline", metavar="PATH", default=None,
+                        help="compare against a saved baseline and exit 1 on regression")
+    parser.add_argument("--max-p95-increase", type=float, default=0.20,
+                        help="allowed relative p95 increase vs baseline (default: 0.20)")
+    parser.add_argument("--p95-slack-ms", type=float, default=5.0,
+                        help="absolute p95 increase always tolerated, in ms (default: 5)")
+    parser.add_argument("--max-throughput-drop", type=float, default=0.20,
+                        help="allowed relative req/s drop vs baseline (default: 0.20)")
+    parser.add_argument("--min-samples", type=int, default=20,
+                        help="skip endpoints with fewer samples than this (default: 20)")
+    parser.add_argument("--mock-upstream", type=int, metavar="PORT", default=None,
+                        help="serve the mock Anthropic API on PORT for the run "
+                             "(start the backend with ANTHROPIC_BASE_URL=http://127.0.0.1:PORT)")
+    add_mock_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def describe_run(args: argparse.Namespace) -> str:
+    """Workload description stored with baselines; comparisons warn when it differs."""
+    if args.load:
+        return (f"load users={args.users} arrival_rate={args.arrival_rate} "
+                f"ramp_up={args.ramp_up} duration={args.duration} think_time={args.think_time}")
+    if args.stream_bench:
+        return (f"stream-bench iterations={args.iterations} users={args.users} cache_mix={args.cache_mix} "
+                f"coalesce={args.coalesce}")
+    if args.soak:
+        return f"soak sessions={args.sessions} users={args.users} rounds={args.rounds}"
+    if args.history_bench:
+        return (f"history-bench depths={args.depths} iterations={args.iterations} "
+                f"analyzed_share={args.analyzed_share}")
+    if args.scale_sweep:
+        return (f"scale-sweep workers={args.scale_sweep} users={args.users} arrival_rate={args.arrival_rate} "
+                f"duration={args.duration}")
+    if args.limits_check:
+        return f"limits-check targets={args.targets or BASE_URL}"
+    if args.resilience_bench:
+        return (f"resilience-bench requests={args.requests} users={args.users} hedge_delay={args.hedge_delay} "
+                f"first_token_timeout={args.first_token_timeout} error_rate={args.error_rate} "
+                f"error_mode={args.error_mode}")
+    if args.backfill_check:
+        return "backfill-check"
+    if args.flaky_bench:
+        return f"flaky-bench requests={args.requests} users={args.users} drop_rate={args.drop_rate}"
+    if args.saturation:
+        return f"saturation levels={args.levels} duration={args.duration}"
+    if args.login_storm:
+        return f"login-storm users={args.users} duration={args.duration} calm={args.calm_seconds}"
+    if args.feedback_bench:
+        return (f"feedback-bench sessions={args.sessions} users={args.users} rounds={args.rounds} "
+                f"wait={args.feedback_wait}")
+    return "live"
+
+
+def run_live_modes(args: argparse.Namespace):
+    if args.load:
+        cfg = LoadConfig(
+            users=args.users,
+            arrival_rate=args.arrival_rate,
+            ramp_up=args.ramp_up,
+            duration=args.duration,
+            think_time=args.think_time,
+        )
+        print(f"\nRunning load test ({cfg})...")
+        try:
+            stats = asyncio.run(run_load_test(cfg))
+        except Exception as e:
+            report.add("Load test", False, f"Fatal: {e}")
+        else:
+            stats.print_summary(cfg)
+    elif args.stream_bench:
+        modes = ["off", "on"] if args.coalesce == "both" else [args.coalesce]
+        print(f"\nRunning SSE streaming benchmark ({args.iterations} iterations, {args.users} concurrent, "
+              f"cache mix {args.cache_mix:.0%}, coalesce {'/'.join(modes)})...")
+        try:
+            runs = asyncio.run(run_coalesce_benchmark(
+                args.iterations, args.users, args.cache_mix, modes, args.server_pid,
+            ))
+        except Exception as e:
+            report.add("Stream benchmark", False, f"Fatal: {e}")
+        else:
+            for run in runs:
+                print_stream_summary(run.timings)
+            print_coalesce_summary(runs)
+    elif args.soak:
+        print(f"\nRunning rehearsal soak ({args.sessions} sessions, {args.users} concurrent, ≤{args.rounds} rounds)...")
+        try:
+            samples = asyncio.run(run_rehearsal_soak(args.sessions, args.users, args.rounds))
+        except Exception as e:
+            report.add("Rehearsal soak", False, f"Fatal: {e}")
+        else:
+            print_soak_summary(samples, args.soak_csv)
+    elif args.feedback_bench:
+        print(f"\nRunning feedback benchmark ({args.sessions} sessions, {args.users} concurrent, "
+              f"{args.rounds} rounds, wait={args.feedback_wait})...")
+        try:
+            samples = asyncio.run(run_feedback_benchmark(
+                args.sessions, args.users, args.rounds, args.feedback_wait, args.poll_interval,
+            ))
+        except Exception as e:
+            report.add("Feedback benchmark", False, f"Fatal: {e}")
+        else:
+            print_feedback_summary(samples)
+    elif args.history_bench:
+        depths = [int(n) for n in args.depths.split(",") if n.strip()]
+        print(f"\nRunning history depth benchmark (depths {depths}, {args.iterations} samples per probe)...")
+        try:
+            samples = asyncio.run(run_history_benchmark(depths, args.iterations, args.analyzed_share))
+        except Exception as e:
+            report.add("History benchmark", False, f"Fatal: {e}")
+        else:
+            print_history_summary(samples)
+    elif args.scale_sweep:
+        counts = [int(n) for n in args.scale_sweep.split(",") if n.strip()]
+        cfg = LoadConfig(
+            users=args.users,
+            arrival_rate=args.arrival_rate,
+            ramp_up=args.ramp_up,
+            duration=args.duration,
+            think_time=args.think_time,
+        )
+        print(f"\nRunning core-scaling sweep over {counts} workers ({cfg})...")
         try:
-            test_fn()
-        except AssertionError as e:
-            report.add(test_fn.__doc__ or test_fn.__name__, False, str(e))
+            runs = run_scale_sweep(counts, cfg, args.server_cmd, args.server_cwd)
         except Exception as e:
-            report.add(test_fn.__doc__ or test_fn.__name__, False, f"Exception: {e}")
+            report.add("Scale sweep", False, f"Fatal: {e}")
+        else:
+            print_scale_summary(runs, args.sweep_csv)
+    elif args.limits_check:
+        targets = [t.strip().rstrip("/") for t in (args.targets or BASE_URL).split(",") if t.strip()]
+        print(f"\nRunning shared limits check against {', '.join(targets)}...")
+        try:
+            checks = asyncio.run(run_limits_check(targets, args.auth_limit, args.stream_cap, args.token_budget))
+        except Exception as e:
+            report.add("Limits check", False, f"Fatal: {e}")
+        else:
+            print_limits_summary(checks, targets)
+    elif args.resilience_bench:
+        print(f"\nRunning upstream resilience benchmark ({args.requests} analyses per phase, {args.users} at a time, "
+              f"mock {args.error_mode} faults at {args.error_rate:.0%})...")
+        try:
+            phases = run_resilience_bench(
+                args.server_cmd, args.server_cwd, config_from_args(args), args.requests, args.users,
+                args.hedge_delay, args.first_token_timeout,
+            )
+        except Exception as e:
+            report.add("Resilience benchmark", False, f"Fatal: {e}")
+        else:
+            print_resilience_summary(phases, args.fail_fast_ms)
+    elif args.flaky_bench:
+        print(f"\nRunning flaky connection benchmark ({args.requests} analyses per phase, {args.users} at a time, "
+              f"{args.drop_rate:.0%} of connections dropped)...")
+        try:
+            phases = run_flaky_bench(
+                args.server_cmd, args.server_cwd, config_from_args(args), args.requests, args.users, args.drop_rate,
+            )
+        except Exception as e:
+            report.add("Flaky connection benchmark", False, f"Fatal: {e}")
+        else:
+            print_flaky_summary(phases)
+    elif args.backfill_check:
+        db = args.database or database_path(args.server_cwd)
+        print(f"\nRunning legacy transcript backfill check against {db}...")
+        try:
+            checks = run_backfill_check(args.server_cmd, args.server_cwd, db)
+        except Exception as e:
+            report.add("Backfill check", False, f"Fatal: {e}")
+        else:
+            print_backfill_summary(checks, db)
+    elif args.saturation:
+        concurrencies = [int(n) for n in args.levels.split(",") if n.strip()]
+        print(f"\nRunning saturation test ({concurrencies} in flight, {args.duration:g}s each)...")
+        try:
+            levels = asyncio.run(run_saturation(concurrencies, args.duration))
+        except Exception as e:
+            report.add("Saturation test", False, f"Fatal: {e}")
+        else:
+            print_saturation_summary(levels)
+    elif args.login_storm:
+        print(f"\nRunning login storm ({args.users} concurrent logins for {args.duration:g}s "
+              f"after {args.calm_seconds:g}s calm)...")
+        try:
+            stats = asyncio.run(run_login_storm(args.users, args.duration, args.calm_seconds, args.probe_interval))
+        except Exception as e:
+            report.add("Login storm", False, f"Fatal: {e}")
+        else:
+            print_login_storm_summary(stats)
+    elif LIVE_MODE:
+        print("\nRunning live integration tests...")
+        try:
+            run_live_tests(args.workers, args.pool)
+        except Exception as e:
+            report.add("Live tests", False, f"Fatal: {e}")
 
 
 def main():
+    args = parse_args()
+
+    live_modes = (args.load, args.stream_bench, args.soak, args.feedback_bench, args.login_storm, args.limits_check,
+                  args.history_bench, args.saturation)
+    if any(live_modes) and not LIVE_MODE:
+        print("--load/--stream-bench/--soak/--feedback-bench/--login-storm/--limits-check/--history-bench/"
+              "--saturation require BASE_URL to point at a running server")
+        sys.exit(2)
+    starts_backend = args.scale_sweep or args.resilience_bench or args.flaky_bench or args.backfill_check
+    if starts_backend and not LIVE_MODE:
+        print("--scale-sweep/--resilience-bench/--flaky-bench/--backfill-check require BASE_URL for the backend they "
+              "start to listen on")
+        sys.exit(2)
+    if starts_backend and _backend_healthy():
+        print(f"--scale-sweep/--resilience-bench/--flaky-bench/--backfill-check start their own backend; stop the "
+              f"server already answering on {BASE_URL}")
+        sys.exit(2)
+    if (args.resilience_bench or args.flaky_bench) and args.mock_upstream is not None:
+        print("--resilience-bench/--flaky-bench serve their own mock upstream; drop --mock-upstream")
+        sys.exit(2)
+
     print(f"Mode: {'LIVE (BASE_URL={BASE_URL})' if LIVE_MODE else 'CONTRACT (mock)'}")
     print()
 
-    run_contract_tests()
+    # Backends the sweep/resilience/flaky/backfill modes start are gone by the end of the run
+    scrape = LIVE_MODE and not starts_backend
+    metrics_before = scrape_metrics() if scrape else None
 
-    if LIVE_MODE:
-        print("\nRunning live integration tests...")
-        try:
-            run_live_tests()
-        except Exception as e:
-            report.add("Live tests", False, f"Fatal: {e}")
+    run_contract_tests(args.workers, args.pool)
+
+    if args.mock_upstream is not None:
+        with MockUpstreamThread(config_from_args(args), port=args.mock_upstream) as server:
+            print(f"\nMock Anthropic upstream on {server.base_url} ({server.config})")
+            run_live_modes(args)
+            print(f"Mock upstream stats: {server.stats}")
+    else:
+        run_live_modes(args)
+
+    if scrape:
+        metrics_after = scrape_metrics()
+        if metrics_before is None or metrics_after is None:
+            report.add("Metrics: /metrics scrape", False, "not served, or METRICS_TOKEN does not match the server's")
+        else:
+            report.add("Metrics: /metrics scrape", True)
+            print_server_breakdown(metrics_delta(metrics_before, metrics_after))
 
     failed = report.print_summary()
-    sys.exit(1 if failed > 0 else 0)
+    if args.export:
+        report.export(args.export)
+        print(f"Latency summary written to {args.export}")
+
+    regressions: list[Regression] = []
+    run_config = describe_run(args)
+    if args.baseline:
+        baseline = load_baseline(args.baseline)
+        thresholds = RegressionThresholds(
+            max_p95_increase=args.max_p95_increase,
+            p95_slack_ms=args.p95_slack_ms,
+            max_throughput_drop=args.max_throughput_drop,
+            min_samples=args.min_samples,
+        )
+        summary = report.endpoint_summary()
+        regressions = compare_to_baseline(summary, baseline, thresholds)
+        print_baseline_comparison(summary, baseline, regressions, run_config)
+    if args.save_baseline:
+        save_baseline(args.save_baseline, report.endpoint_summary(), run_config)
+        print(f"Baseline written to {args.save_baseline}")
+
+    sys.exit(1 if failed > 0 or regressions else 0)
 
 
 if __name__ == "__main__":
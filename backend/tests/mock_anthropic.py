@@ -0,0 +1,512 @@
+"""
+Mock Anthropic Messages API for Offline Performance Runs
+=========================================================
+
+A dependency-free asyncio stand-in for `POST /v1/messages` (streaming and
+non-streaming) so the backend can be load-tested without a real model:
+
+- Configurable first-token delay, token rate and chunk size
+- Error injection: HTTP errors before the stream, SSE errors mid-stream,
+  or stalled connections
+- Prompt caching: `cache_control` breakpoints are honoured with a 5-minute
+  prefix cache, reported as cache_creation/cache_read_input_tokens; an
+  optional prefill cost makes cache hits show up in time-to-first-token
+- Canned JSON payloads matching what feynman-analyzer.ts, layers-analyzer.ts
+  and rehearsal-feedback.ts parse; plain interviewer questions otherwise
+- Runtime control: GET /_mock/stats, POST /_mock/config, POST /_mock/reset
+
+Usage:
+  # Standalone
+  python mock_anthropic.py --port 4010 --token-rate 80 --first-token-delay 0.4
+
+  # Then point the backend at it
+  ANTHROPIC_BASE_URL=http://127.0.0.1:4010 ANTHROPIC_API_KEY=mock pnpm dev
+
+  # Or let the harness start it for the duration of a run
+  BASE_URL=http://localhost:3001 python e2e_flows.py --load --mock-upstream 4010
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+@dataclass
+class MockConfig:
+    first_token_delay: float = 0.3   # seconds before the first text delta
+    token_rate: float = 60.0         # characters per second streamed after the first token
+    chunk_size: int = 8              # characters per content_block_delta
+    error_rate: float = 0.0          # probability a request fails
+    error_mode: str = "status"       # status | midstream | stall
+    error_status: int = 529          # HTTP status for error_mode=status (529 = overloaded)
+    interview_rounds: int = 8        # candidate turns before the interviewer emits [INTERVIEW_END]
+    prefill_ms_per_1k: float = 0.0   # extra first-token delay per 1k uncached input tokens
+    cache_min_tokens: int = 1024     # shortest prefix that can be cached (matches the real API)
+    cache_ttl: float = 300.0         # seconds a cached prefix lives after its last use
+    seed: int | None = None          # fixes payload variants and error draws for reproducible runs
+
+    def update(self, values: dict[str, Any]):
+        known = {f.name for f in fields(self)}
+        for key, value in values.items():
+            if key not in known:
+                raise ValueError(f"Unknown mock config key: {key}")
+            setattr(self, key, value)
+
+
+@dataclass
+class MockStats:
+    requests: int = 0
+    streamed: int = 0
+    errors: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+    by_kind: dict[str, int] = field(default_factory=dict)
+
+
+# ---------------------------------------------------------------------------
+# Canned payloads (shapes parsed by the backend analyzers)
+# ---------------------------------------------------------------------------
+
+def feynman_payload(rng: random.Random) -> dict[str, Any]:
+    udi, ddi, cci = (rng.randint(55, 95) for _ in range(3))
+    return {
+        "scores": {"udi": udi, "ddi": ddi, "cci": cci, "total": round(udi * 0.4 + ddi * 0.3 + cci * 0.3)},
+        "analysis": {
+            "udi": {"score": udi, "feedback": "STAR 要素基本完整，行动部分的因果链可以更清晰。", "issues": ["任务目标缺少背景约束"]},
+            "ddi": {"score": ddi, "feedback": "有量化结果，但缺少对比基线。", "issues": ["结果数据缺少时间维度"]},
+            "cci": {"score": cci, "feedback": "个人贡献与团队贡献的边界不够明确。", "issues": ["未说明关键决策由谁做出"]},
+        },
+        "improvements": [
+            {"issue": "个人角色模糊", "suggestion": "用“我”明确每个关键动作", "example": "我主导了索引方案的设计与压测。"},
+            {"issue": "缺少基线数据", "suggestion": "补充优化前的指标", "example": "优化前 P99 为 1.2s，优化后降至 150ms。"},
+        ],
+        "summary": "故事结构完整，数据有说服力。建议进一步明确个人贡献与决策依据。",
+    }
+
+
+def layers_payload(rng: random.Random) -> dict[str, Any]:
+    titles = ["Event Layer", "Emotion Layer", "Need Layer", "Belief Layer"]
+    return {
+        "layers": [
+            {
+                "layerIndex": i,
+                "title": title,
+                "content": f"第 {i + 1} 层分析：围绕用户描述的困惑展开。",
+                "keyInsights": [f"洞察 {i + 1}.1", f"洞察 {i + 1}.2"],
+                "editableFields": [f"关键词 {i + 1}"],
+            }
+            for i, title in enumerate(titles)
+        ],
+        "suggestions": [
+            {"action": "整理三个可量化的项目成果", "rationale": "让价值表达有据可依", "priority": "high"},
+            {"action": "与上级对齐晋升标准", "rationale": "减少信息不对称", "priority": rng.choice(["medium", "low"])},
+        ],
+    }
+
+
+def feedback_payload(rng: random.Random) -> dict[str, Any]:
+    clarity, depth, adapt, impression = (rng.randint(55, 95) for _ in range(4))
+    total = round(clarity * 0.25 + depth * 0.30 + adapt * 0.25 + impression * 0.20)
+    names = ["Expression Clarity", "Content Depth", "Adaptability", "Overall Impression"]
+    return {
+        "scores": {
+            "expressionClarity": clarity,
+            "contentDepth": depth,
+            "adaptability": adapt,
+            "overallImpression": impression,
+            "total": total,
+        },
+        "dimensions": [
+            {"name": name, "score": score, "feedback": "表现稳定。", "suggestion": "多用具体数据支撑观点。"}
+            for name, score in zip(names, (clarity, depth, adapt, impression))
+        ],
+        "highlights": ["回答结构清晰", "能主动举例"],
+        "improvements": ["追问下的回答略显犹豫"],
+        "summary": "整体表现良好，建议在压力追问下保持节奏。",
+    }
+
+
+INTERVIEW_QUESTIONS = [
+    "请先简单介绍一下你自己，以及最近一段最有代表性的项目经历。",
+    "在这个项目中，你个人承担的最关键的决策是什么？",
+    "如果重来一次，你会在哪个环节做不同的选择？为什么？",
+    "说说一次你和团队成员意见不一致的经历，你是怎么处理的？",
+    "你如何衡量这项工作的最终成果？有哪些具体数据？",
+    "面对紧急上线压力时，你通常如何取舍质量与进度？",
+]
+
+
+def _system_text(system: Any) -> str:
+    if isinstance(system, list):
+        return "".join(block.get("text", "") for block in system if isinstance(block, dict))
+    return system or ""
+
+
+def classify(request: dict[str, Any]) -> str:
+    """Tell which backend caller a Messages request came from by its system prompt."""
+    system = _system_text(request.get("system"))
+    if "STAR story" in system and "udi" in system:
+        return "feynman"
+    if "four progressive layers" in system or "Four-Layer" in system:
+        return "layers"
+    if "reviewing a completed mock interview" in system:
+        return "feedback"
+    return "interviewer"
+
+
+def build_response_text(request: dict[str, Any], cfg: MockConfig, rng: random.Random) -> tuple[str, str]:
+    """Return (kind, full response text) for a Messages request."""
+    kind = classify(request)
+    if kind == "feynman":
+        return kind, "```json\n" + json.dumps(feynman_payload(rng), ensure_ascii=False, indent=2) + "\n```"
+    if kind == "layers":
+        return kind, json.dumps(layers_payload(rng), ensure_ascii=False, indent=2)
+    if kind == "feedback":
+        return kind, json.dumps(feedback_payload(rng), ensure_ascii=False, indent=2)
+
+    # Interviewer: the first two messages are the scenario prefix/ack pair from rehearsal-interviewer.ts
+    candidate_turns = sum(1 for m in request.get("messages", []) if m.get("role") == "user") - 1
+    if candidate_turns >= cfg.interview_rounds:
+        return kind, "感谢你今天的分享，我们的面试就到这里。[INTERVIEW_END]"
+    return kind, rng.choice(INTERVIEW_QUESTIONS)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def prompt_blocks(request: dict[str, Any]) -> list[tuple[str, bool]]:
+    """Flatten system + messages into (text, has cache_control) blocks in prompt order."""
+    blocks: list[tuple[str, bool]] = []
+    system = request.get("system")
+    if isinstance(system, list):
+        blocks += [(b.get("text", ""), "cache_control" in b) for b in system if isinstance(b, dict)]
+    elif system:
+        blocks.append((system, False))
+    for message in request.get("messages", []):
+        content = message.get("content", "")
+        prefix = message.get("role", "") + ":"
+        if isinstance(content, list):
+            for b in content:
+                if isinstance(b, dict):
+                    blocks.append((prefix + b.get("text", ""), "cache_control" in b))
+                    prefix = ""
+        else:
+            blocks.append((prefix + content, False))
+    return blocks
+
+
+class PromptCache:
+    """Prefix cache keyed by a running hash of the blocks up to each breakpoint."""
+
+    def __init__(self):
+        self._entries: dict[str, float] = {}
+
+    def lookup(self, model: str, blocks: list[tuple[str, bool]], cfg: MockConfig) -> tuple[int, int, int]:
+        """Return (uncached input, cache read, cache write) token counts for one request."""
+        now = time.monotonic()
+        digest = hashlib.sha1(model.encode())
+        prefixes: list[tuple[str, int, bool]] = []  # (hash, tokens so far, is breakpoint)
+        tokens = 0
+        for text, breakpoint in blocks:
+            digest.update(text.encode())
+            tokens += estimate_tokens(text)
+            prefixes.append((digest.copy().hexdigest(), tokens, breakpoint))
+        total = tokens
+
+        last_breakpoint = max((i for i, p in enumerate(prefixes) if p[2]), default=-1)
+        if last_breakpoint < 0:
+            return total, 0, 0
+
+        # Like the real API, a hit may land on any block boundary up to the last breakpoint
+        read = 0
+        for key, upto, _ in reversed(prefixes[:last_breakpoint + 1]):
+            if self._entries.get(key, 0) > now:
+                read = upto
+                self._entries[key] = now + cfg.cache_ttl
+                break
+
+        written = read
+        for key, upto, breakpoint in prefixes[:last_breakpoint + 1]:
+            if breakpoint and upto > read and upto >= cfg.cache_min_tokens:
+                self._entries[key] = now + cfg.cache_ttl
+                written = upto
+        return total - written, read, written - read
+
+    def clear(self):
+        self._entries.clear()
+
+
+# ---------------------------------------------------------------------------
+# HTTP server
+# ---------------------------------------------------------------------------
+
+class MockAnthropicServer:
+    def __init__(self, config: MockConfig | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockConfig()
+        self.stats = MockStats()
+        self.host = host
+        self.port = port
+        self._rng = random.Random(self.config.seed)
+        self.prompt_cache = PromptCache()
+        self._server: asyncio.base_events.Server | None = None
+        self._connections: set[asyncio.Task[None]] = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for task in self._connections:
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    # -- request handling ----------------------------------------------------
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        assert task is not None
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers: dict[str, str] = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0"))
+                body = await reader.readexactly(length) if length else b""
+
+                keep_alive = await self._route(method, path.split("?")[0], body, writer)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter) -> bool:
+        if method == "GET" and path == "/_mock/stats":
+            return await self._send_json(writer, 200, asdict(self.stats))
+        if method == "POST" and path == "/_mock/config":
+            try:
+                self.config.update(json.loads(body or b"{}"))
+            except ValueError as e:
+                return await self._send_json(writer, 400, {"error": str(e)})
+            self._rng = random.Random(self.config.seed)
+            return await self._send_json(writer, 200, asdict(self.config))
+        if method == "POST" and path == "/_mock/reset":
+            self.stats = MockStats()
+            self.prompt_cache.clear()
+            return await self._send_json(writer, 200, asdict(self.stats))
+        if method == "POST" and path.endswith("/v1/messages"):
+            return await self._messages(json.loads(body or b"{}"), writer)
+        return await self._send_json(writer, 404, _api_error("not_found_error", f"No route for {method} {path}"))
+
+    async def _messages(self, request: dict[str, Any], writer: asyncio.StreamWriter) -> bool:
+        cfg = self.config
+        self.stats.requests += 1
+        kind, text = build_response_text(request, cfg, self._rng)
+        self.stats.by_kind[kind] = self.stats.by_kind.get(kind, 0) + 1
+
+        model = request.get("model", "mock-model")
+        input_tokens, cache_read, cache_write = self.prompt_cache.lookup(model, prompt_blocks(request), cfg)
+        output_tokens = estimate_tokens(text)
+        self.stats.input_tokens += input_tokens
+        self.stats.cache_read_tokens += cache_read
+        self.stats.cache_write_tokens += cache_write
+        usage = {"input_tokens": input_tokens, "cache_creation_input_tokens": cache_write,
+                 "cache_read_input_tokens": cache_read}
+        # Cached prefix tokens skip prefill, so only the rest adds to time-to-first-token
+        first_token_delay = cfg.first_token_delay + cfg.prefill_ms_per_1k * (input_tokens + cache_write) / 1_000_000
+
+        fail = cfg.error_rate > 0 and self._rng.random() < cfg.error_rate
+        if fail and cfg.error_mode == "status":
+            self.stats.errors += 1
+            return await self._send_json(writer, cfg.error_status, _api_error("overloaded_error", "Mock upstream overloaded"))
+        if fail and cfg.error_mode == "stall":
+            self.stats.errors += 1
+            await asyncio.sleep(3600)
+            return False
+
+        message_id = f"msg_mock_{uuid.uuid4().hex[:16]}"
+
+        if not request.get("stream"):
+            await asyncio.sleep(first_token_delay + len(text) / max(cfg.token_rate, 1e-6))
+            self.stats.output_tokens += output_tokens
+            return await self._send_json(writer, 200, {
+                "id": message_id, "type": "message", "role": "assistant", "model": model,
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn", "stop_sequence": None,
+                "usage": {**usage, "output_tokens": output_tokens},
+            })
+
+        self.stats.streamed += 1
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        await self._sse(writer, "message_start", {
+            "type": "message_start",
+            "message": {
+                "id": message_id, "type": "message", "role": "assistant", "model": model, "content": [],
+                "stop_reason": None, "stop_sequence": None,
+                "usage": {**usage, "output_tokens": 1},
+            },
+        })
+        await self._sse(writer, "content_block_start", {
+            "type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""},
+        })
+        await self._sse(writer, "ping", {"type": "ping"})
+
+        await asyncio.sleep(first_token_delay)
+        step = max(1, cfg.chunk_size)
+        interval = step / max(cfg.token_rate, 1e-6)
+        for offset in range(0, len(text), step):
+            await self._sse(writer, "content_block_delta", {
+                "type": "content_block_delta", "index": 0,
+                "delta": {"type": "text_delta", "text": text[offset:offset + step]},
+            })
+            if fail and offset + step >= len(text) // 2:
+                # error_mode=midstream: fail once roughly half the text has been sent
+                self.stats.errors += 1
+                await self._sse(writer, "error", _api_error("overloaded_error", "Mock upstream failed mid-stream"))
+                return False
+            await asyncio.sleep(interval)
+
+        self.stats.output_tokens += output_tokens
+        await self._sse(writer, "content_block_stop", {"type": "content_block_stop", "index": 0})
+        await self._sse(writer, "message_delta", {
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": output_tokens},
+        })
+        await self._sse(writer, "message_stop", {"type": "message_stop"})
+        return False
+
+    # -- wire helpers --------------------------------------------------------
+
+    @staticmethod
+    async def _sse(writer: asyncio.StreamWriter, event: str, data: dict[str, Any]):
+        writer.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode())
+        await writer.drain()
+
+    @staticmethod
+    async def _send_json(writer: asyncio.StreamWriter, status: int, body: dict[str, Any]) -> bool:
+        payload = json.dumps(body, ensure_ascii=False).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
+        return True
+
+
+def _api_error(error_type: str, message: str) -> dict[str, Any]:
+    return {"type": "error", "error": {"type": error_type, "message": message}}
+
+
+# ---------------------------------------------------------------------------
+# Background runner (used by e2e_flows.py)
+# ---------------------------------------------------------------------------
+
+class MockUpstreamThread:
+    """Run a MockAnthropicServer on its own event loop in a daemon thread."""
+
+    def __init__(self, config: MockConfig | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.server = MockAnthropicServer(config, host, port)
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="mock-anthropic", daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self.server.start())
+        self._ready.set()
+        self._loop.run_forever()
+
+    def __enter__(self) -> MockAnthropicServer:
+        self._thread.start()
+        self._ready.wait(timeout=5)
+        return self.server
+
+    def __exit__(self, *exc: Any):
+        asyncio.run_coroutine_threadsafe(self.server.stop(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        if not self._thread.is_alive():
+            self._loop.close()
+
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    return MockConfig(
+        first_token_delay=args.first_token_delay,
+        token_rate=args.token_rate,
+        chunk_size=args.chunk_size,
+        error_rate=args.error_rate,
+        error_mode=args.error_mode,
+        error_status=args.error_status,
+        prefill_ms_per_1k=args.prefill_ms_per_1k,
+        seed=args.seed,
+    )
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    group = parser.add_argument_group("mock upstream")
+    group.add_argument("--first-token-delay", type=float, default=0.3, help="seconds before first delta (default: 0.3)")
+    group.add_argument("--token-rate", type=float, default=60.0, help="characters streamed per second (default: 60)")
+    group.add_argument("--chunk-size", type=int, default=8, help="characters per delta (default: 8)")
+    group.add_argument("--error-rate", type=float, default=0.0, help="probability a request fails (default: 0)")
+    group.add_argument("--error-mode", choices=["status", "midstream", "stall"], default="status")
+    group.add_argument("--error-status", type=int, default=529, help="HTTP status for --error-mode status")
+    group.add_argument("--prefill-ms-per-1k", type=float, default=0.0,
+                       help="extra first-token delay per 1k uncached input tokens, in ms (default: 0)")
+    group.add_argument("--seed", type=int, default=None, help="RNG seed for reproducible runs")
+
+
+async def _serve_forever(server: MockAnthropicServer):
+    await server.start()
+    print(f"Mock Anthropic upstream listening on {server.base_url}  (config: {server.config})")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Anthropic Messages API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4010)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve_forever(MockAnthropicServer(config_from_args(args), args.host, args.port)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,21 @@ export interface SSEEvent {
   data: unknown
 }
 
+// Waits before each reconnect of a dropped stream; the server keeps generating meanwhile
+const RESUME_DELAYS_MS = [500, 1500, 3000]
+
+interface StreamState {
+  lastEventId: string | null
+  finished: boolean
+}
+
 /**
  * fetch-based SSE client — supports POST + Authorization header
  * (EventSource only supports GET without custom headers)
+ *
+ * If the connection drops before a `done` or `error` event, the request is
+ * sent again with Last-Event-ID so the server replays what was missed from the
+ * same generation rather than starting a new one.
  */
 export async function streamFetch(
   url: string,
@@ -14,28 +26,58 @@ export async function streamFetch(
   onChunk: (event: string, data: unknown) => void,
   signal?: AbortSignal,
 ): Promise<void> {
-  const response = await fetch(url, {
-    method: 'POST',
-    headers: {
-      'Content-Type': 'application/json',
-      Authorization: `Bearer ${token}`,
-    },
-    body: JSON.stringify(body),
-    signal,
-  })
+  const state: StreamState = { lastEventId: null, finished: false }
 
-  if (!response.ok) {
-    const errorText = await response.text()
-    let message = `请求失败 (${response.status})`
-    try {
-      const parsed = JSON.parse(errorText) as { error?: { message?: string } }
-      if (parsed.error?.message) {
-        message = parsed.error.message
-      }
-    } catch {
-      // use default message
+  for (let attempt = 0; ; attempt++) {
+    const dropped = await readStream(url, body, token, onChunk, state, signal)
+    if (!dropped) return
+    if (!state.lastEventId || attempt >= RESUME_DELAYS_MS.length) {
+      throw new Error('连接已断开，请重试')
     }
-    throw new Error(message)
+    await new Promise((resolve) => setTimeout(resolve, RESUME_DELAYS_MS[attempt]))
+    if (signal?.aborted) return
+  }
+}
+
+async function errorMessage(response: Response): Promise<string> {
+  const errorText = await response.text()
+  let message = `请求失败 (${response.status})`
+  try {
+    const parsed = JSON.parse(errorText) as { error?: { message?: string } }
+    if (parsed.error?.message) {
+      message = parsed.error.message
+    }
+  } catch {
+    // use default message
+  }
+  return message
+}
+
+/** One connection. Resolves true if it dropped before the stream finished and may be resumed. */
+async function readStream(
+  url: string,
+  body: unknown,
+  token: string,
+  onChunk: (event: string, data: unknown) => void,
+  state: StreamState,
+  signal?: AbortSignal,
+): Promise<boolean> {
+  const headers: Record<string, string> = {
+    'Content-Type': 'application/json',
+    Authorization: `Bearer ${token}`,
+  }
+  if (state.lastEventId) headers['Last-Event-ID'] = state.lastEventId
+
+  let response: Response
+  try {
+    response = await fetch(url, { method: 'POST', headers, body: JSON.stringify(body), signal })
+  } catch (error) {
+    if (signal?.aborted || !state.lastEventId) throw error
+    return true
+  }
+
+  if (!response.ok) {
+    throw new Error(await errorMessage(response))
   }
 
   const reader = response.body?.getReader()
@@ -45,6 +87,9 @@ export async function streamFetch(
 
   const decoder = new TextDecoder()
   let buffer = ''
+  // Event fields can arrive in different reads than their data line
+  let currentEvent = 'message'
+  let currentId: string | null = null
 
   try {
     while (true) {
@@ -57,13 +102,16 @@ export async function streamFetch(
       // Keep the last incomplete line in buffer
       buffer = lines.pop() ?? ''
 
-      let currentEvent = 'message'
-
       for (const line of lines) {
-        if (line.startsWith('event: ')) {
+        if (line.startsWith('id: ')) {
+          currentId = line.slice(4).trim()
+        } else if (line.startsWith('event: ')) {
           currentEvent = line.slice(7).trim()
         } else if (line.startsWith('data: ')) {
           const rawData = line.slice(6)
+          // Only a delivered event counts as received for a resume
+          if (currentId) state.lastEventId = currentId
+          if (currentEvent === 'done' || currentEvent === 'error') state.finished = true
           try {
             const parsed: unknown = JSON.parse(rawData)
             onChunk(currentEvent, parsed)
@@ -71,11 +119,16 @@ export async function streamFetch(
             onChunk(currentEvent, rawData)
           }
           currentEvent = 'message'
+          currentId = null
         }
         // Skip empty lines and comments
       }
     }
+  } catch (error) {
+    if (signal?.aborted) throw error
+    return !state.finished
   } finally {
     reader.releaseLock()
   }
+  return !state.finished
 }
@@ -5,18 +5,33 @@ import { StarInput } from '@/components/feynman/StarInput'
 import { AnalysisResult } from '@/components/feynman/AnalysisResult'
 import { ImprovementCards } from '@/components/feynman/ImprovementCards'
 import { AnalysisLoadingSkeleton } from '@/components/shared/LoadingSkeleton'
+import { ScoreRadar } from '@/components/shared/ScoreRadar'
 import { apiClient } from '@/lib/api-client'
 import { streamFetch } from '@/lib/sse-client'
 import { cn } from '@/lib/utils'
-import type { FeynmanAnalysisResult, FeynmanHistoryItem } from '@/types/feynman'
+import type {
+  FeynmanAnalysisResult,
+  FeynmanHistoryItem,
+  FeynmanImprovement,
+  FeynmanScores,
+} from '@/types/feynman'
 import type { PaginatedResponse } from '@/types/api'
 
 type PageState = 'idle' | 'analyzing' | 'done'
 
+const RADAR_DIMENSIONS = [
+  { key: 'udi', label: 'UDI' },
+  { key: 'ddi', label: 'DDI' },
+  { key: 'cci', label: 'CCI' },
+] as const
+
 export function FeynmanPage() {
   const [state, setState] = useState<PageState>('idle')
   const [analysisResult, setAnalysisResult] = useState<FeynmanAnalysisResult | null>(null)
   const [streamText, setStreamText] = useState('')
+  // Filled from score / improvement events while the analysis is still streaming
+  const [partialScores, setPartialScores] = useState<Partial<FeynmanScores>>({})
+  const [partialImprovements, setPartialImprovements] = useState<FeynmanImprovement[]>([])
   const [error, setError] = useState<string | null>(null)
   const [showHistory, setShowHistory] = useState(false)
   const [selectedHistory, setSelectedHistory] = useState<FeynmanAnalysisResult | null>(null)
@@ -24,7 +39,7 @@ export function FeynmanPage() {
   const historyQuery = useQuery({
     queryKey: ['feynman-history'],
     queryFn: () =>
-      apiClient<PaginatedResponse<FeynmanHistoryItem>['data']>('/feynman/history?page=1&limit=10'),
+      apiClient<PaginatedResponse<FeynmanHistoryItem>['data']>('/feynman/history?page=1&limit=10&count=false'),
     enabled: showHistory,
   })
 
@@ -33,6 +48,8 @@ export function FeynmanPage() {
     setAnalysisResult(null)
     setSelectedHistory(null)
     setStreamText('')
+    setPartialScores({})
+    setPartialImprovements([])
     setError(null)
 
     try {
@@ -56,6 +73,12 @@ export function FeynmanPage() {
             if (chunk.content) {
               setStreamText((prev) => prev + chunk.content)
             }
+          } else if (event === 'score') {
+            const part = data as { dimension: keyof FeynmanScores; score: number }
+            setPartialScores((prev) => ({ ...prev, [part.dimension]: part.score }))
+          } else if (event === 'improvement') {
+            const part = data as { improvement: FeynmanImprovement }
+            setPartialImprovements((prev) => [...prev, part.improvement])
           } else if (event === 'done') {
             const result = data as { type: string } & FeynmanAnalysisResult
             setAnalysisResult({
@@ -131,7 +154,17 @@ export function FeynmanPage() {
 
           {state === 'analyzing' && (
             <div className="space-y-4">
-              <AnalysisLoadingSkeleton />
+              {partialScores.udi === undefined ? (
+                <AnalysisLoadingSkeleton />
+              ) : (
+                <ScoreRadar
+                  dimensions={RADAR_DIMENSIONS.map((d) => ({
+                    label: d.label,
+                    value: partialScores[d.key] ?? 0,
+                  }))}
+                />
+              )}
+              <ImprovementCards improvements={partialImprovements} />
               {streamText && (
                 <div className="rounded-lg border bg-muted/30 p-4">
                   <p className="text-xs font-medium text-muted-foreground">AI 分析进度</p>
@@ -229,9 +262,9 @@ function HistoryList({
               })}
             </p>
           </div>
-          {item.scores && (
-            <span className={cn('text-lg font-bold', getScoreColor(item.scores.total))}>
-              {item.scores.total}
+          {item.totalScore != null && (
+            <span className={cn('text-lg font-bold', getScoreColor(item.totalScore))}>
+              {item.totalScore}
             </span>
           )}
         </button>
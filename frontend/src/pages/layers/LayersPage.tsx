@@ -35,7 +35,7 @@ export function LayersPage() {
   const historyQuery = useQuery({
     queryKey: ['layers', 'history'],
     queryFn: async () => {
-      const response = await fetch('/api/v1/layers/history?page=1&limit=10', {
+      const response = await fetch('/api/v1/layers/history?page=1&limit=10&count=false', {
         headers: {
           Authorization: `Bearer ${localStorage.getItem('token')}`,
         },
@@ -219,12 +219,12 @@ export function RehearsalPage() {
     setIsFeedbackLoading(true)
 
     try {
-      // Trigger feedback generation
+      // Queue feedback generation (returns immediately)
       await apiClient<{ feedbackId: string }>(`/rehearsal/end/${sessionId}`, {
         method: 'POST',
       })
 
-      // Poll for feedback
+      // Poll for feedback; 202 responses carry { status: 'generating' }
       let attempts = 0
       const poll = async () => {
         if (attempts >= MAX_FEEDBACK_POLL_ATTEMPTS) {
@@ -232,7 +232,12 @@ export function RehearsalPage() {
         }
 
         try {
-          const result = await apiClient<RehearsalFeedback>(`/rehearsal/feedback/${sessionId}`)
+          const result = await apiClient<RehearsalFeedback | { status: 'generating' }>(
+            `/rehearsal/feedback/${sessionId}`,
+          )
+          if ('status' in result) {
+            throw new Error('反馈正在生成中')
+          }
           setFeedback(result)
           setIsFeedbackLoading(false)
         } catch {
@@ -274,7 +279,7 @@ export function RehearsalPage() {
       const token = localStorage.getItem('token')
       if (!token) return
 
-      const response = await fetch('/api/v1/rehearsal/history?page=1&limit=10', {
+      const response = await fetch('/api/v1/rehearsal/history?page=1&limit=10&count=false', {
         headers: { Authorization: `Bearer ${token}` },
       })
       const result = (await response.json()) as PaginatedResponse<RehearsalHistoryItem>
@@ -453,9 +458,9 @@ function HistoryItem({ item }: { item: RehearsalHistoryItem }) {
         </div>
       </div>
       <div className="flex items-center gap-2">
-        {item.feedback?.scores.total != null && (
-          <span className={cn('text-sm font-medium', getScoreColor(item.feedback.scores.total))}>
-            {item.feedback.scores.total}分
+        {item.totalScore != null && (
+          <span className={cn('text-sm font-medium', getScoreColor(item.totalScore))}>
+            {item.totalScore}分
           </span>
         )}
         <span
@@ -16,10 +16,14 @@ export interface PaginatedResponse<T> {
   success: true
   data: T[]
   pagination: {
-    page: number
+    /** null for `?cursor=` requests */
+    page: number | null
     limit: number
-    total: number
-    totalPages: number
+    /** null when the request skipped the count (`count=false`, or cursor paging without `count=true`) */
+    total: number | null
+    totalPages: number | null
+    /** Pass as `?cursor=` for the next page; null on the last page */
+    nextCursor: string | null
   }
 }
 
@@ -3,6 +3,7 @@ export interface User {
   email: string
   name: string
   usageCount?: number
+  usageByFeature?: Record<'feynman' | 'layers' | 'rehearsal', number>
   createdAt?: string
 }
 
@@ -40,6 +40,6 @@ export interface FeynmanSession {
 export interface FeynmanHistoryItem {
   id: string
   title?: string
-  scores?: FeynmanScores
+  totalScore: number | null
   createdAt: string
 }
@@ -33,7 +33,7 @@ export interface RehearsalSession {
   interviewerStyle: InterviewerStyle
   messages: ChatMessage[]
   feedback?: RehearsalFeedback
-  status: 'active' | 'completed'
+  status: 'active' | 'completed' | 'generating' | 'failed'
   createdAt: string
 }
 
@@ -41,7 +41,7 @@ export interface RehearsalHistoryItem {
   id: string
   scenario: string
   interviewerStyle: InterviewerStyle
-  status: 'active' | 'completed'
-  feedback?: { scores: { total: number } }
+  status: 'active' | 'completed' | 'generating' | 'failed'
+  totalScore: number | null
   createdAt: string
 }